@@ -0,0 +1,217 @@
+"""
+Admission control for the database-bound public endpoints (/submitRegistration, /login).
+
+Every request is checked before the view runs, so a shed request never opens a database connection:
+  1. a per-worker concurrency cap (non-blocking semaphore): if this worker already has
+     max_concurrent requests in flight, answer 503 at once instead of queueing on Postgres;
+  2. token buckets per client IP and one global bucket per endpoint: over the rate, answer 429.
+Both answers carry Retry-After.
+
+The buckets and the decision counters live in a small SQLite file (on /dev/shm by default), so all
+gunicorn workers on the host share them; each check is one short BEGIN IMMEDIATE transaction.
+If the store is unavailable the limiter fails open and only the concurrency cap applies.
+"""
+import math
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from functools import wraps
+
+from flask import make_response, request
+
+STORE_SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS bucket (
+        bucket_key TEXT PRIMARY KEY,
+        tokens REAL NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS decision_count (
+        endpoint TEXT NOT NULL,
+        decision TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (endpoint, decision)
+    );
+"""
+
+# Per-IP buckets that have been full and idle this long are dropped (checked on ~1% of requests).
+IDLE_BUCKET_SECONDS = 600
+
+
+def default_store_path():
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(directory, 'landbank_admission.sqlite3')
+
+
+class TokenBucketStore:
+    """Token buckets and decision counters in a SQLite file shared by every process on the host."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connect().executescript(STORE_SCHEMA_SQL)
+
+    def _connect(self):
+        # One connection per thread, reopened after a fork (gunicorn --preload) since SQLite handles
+        # must not cross process boundaries.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=0.5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=OFF;")  # counters and buckets may be lost on a crash; that is fine
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def take(self, buckets, endpoint):
+        """
+        Takes one token from every (key, rate_per_second, burst) bucket, or from none of them.
+        Returns 0 when admitted, else the seconds until the emptiest bucket has a token again.
+        """
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE;")
+        try:
+            levels = []
+            for key, rate, burst in buckets:
+                row = conn.execute("SELECT tokens, updated_at FROM bucket WHERE bucket_key = ?;", (key,)).fetchone()
+                tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+                levels.append((key, rate, tokens))
+            short = [(1 - tokens) / rate for _, rate, tokens in levels if tokens < 1]
+            admitted = not short
+            for key, _, tokens in levels:
+                conn.execute("INSERT OR REPLACE INTO bucket (bucket_key, tokens, updated_at) VALUES (?, ?, ?);",
+                             (key, tokens - 1 if admitted else tokens, now))
+            self._count(conn, endpoint, 'admitted' if admitted else 'rate_limited')
+            if random.random() < 0.01:
+                conn.execute("DELETE FROM bucket WHERE bucket_key LIKE 'ip:%' AND updated_at < ?;",
+                             (now - IDLE_BUCKET_SECONDS,))
+            conn.execute("COMMIT;")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK;")
+            raise
+        return 0 if admitted else max(short)
+
+    def _count(self, conn, endpoint, decision):
+        conn.execute("""
+            INSERT INTO decision_count (endpoint, decision, count) VALUES (?, ?, 1)
+            ON CONFLICT (endpoint, decision) DO UPDATE SET count = count + 1;
+        """, (endpoint, decision))
+
+    def count(self, endpoint, decision):
+        conn = self._connect()
+        self._count(conn, endpoint, decision)
+
+    def decision_counts(self):
+        rows = self._connect().execute("SELECT endpoint, decision, count FROM decision_count ORDER BY endpoint, decision;")
+        counts = {}
+        for endpoint, decision, count in rows:
+            counts.setdefault(endpoint, {})[decision] = count
+        return counts
+
+
+class AdmissionController:
+    """Per-worker gatekeeper; see the module docstring. `limits` maps endpoint -> dict of rates/bursts."""
+
+    def __init__(self, config):
+        self.config = config
+        self.limits = config['limits']
+        self._slots = threading.BoundedSemaphore(config['max_concurrent'])
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self.store = None
+        self._store_error_logged = False
+        try:
+            self.store = TokenBucketStore(config['store_path'] or default_store_path())
+        except sqlite3.Error as err:
+            print(f"Admission store unavailable, rate limits disabled: {err}")
+
+    def client_ip(self):
+        # Each proxy appends the address it received the request from, so only the entries our own
+        # proxies added can be trusted: the client's is trusted_proxy_hops from the right. Anything
+        # further left was sent by the client and would let it pick a fresh per-IP bucket.
+        if self.config['trust_forwarded_for']:
+            hops = self.config['trusted_proxy_hops']
+            entries = [entry.strip() for entry in request.headers.get('X-Forwarded-For', '').split(',')]
+            if hops > 0 and len(entries) >= hops and entries[-hops]:
+                return entries[-hops]
+        return request.remote_addr or 'unknown'
+
+    def _take_tokens(self, endpoint):
+        if self.store is None:
+            return 0
+        limits = self.limits[endpoint]
+        buckets = [
+            (f"global:{endpoint}", limits['global_rate'], limits['global_burst']),
+            (f"ip:{endpoint}:{self.client_ip()}", limits['ip_rate'], limits['ip_burst']),
+        ]
+        try:
+            return self.store.take(buckets, endpoint)
+        except sqlite3.Error as err:
+            # Fail open: a broken limiter must not take the endpoints down with it.
+            if not self._store_error_logged:
+                print(f"Admission store error, admitting without rate limits: {err}")
+                self._store_error_logged = True
+            return 0
+
+    def _count(self, endpoint, decision):
+        if self.store is not None:
+            try:
+                self.store.count(endpoint, decision)
+            except sqlite3.Error:
+                pass
+
+    def guard(self, endpoint, on_shed, methods=('POST',)):
+        """
+        Decorates a view. Requests with a method in `methods` must pass the concurrency cap and the
+        token buckets for `endpoint`; otherwise on_shed(status, retry_after) builds the response,
+        which is sent with that status and a Retry-After header.
+        """
+        def decorator(view):
+            @wraps(view)
+            def guarded(*args, **kwargs):
+                if request.method not in methods:
+                    return view(*args, **kwargs)
+                if not self._slots.acquire(blocking=False):
+                    self._count(endpoint, 'over_capacity')
+                    return self._shed(on_shed, 503, self.config['busy_retry_after_seconds'])
+                try:
+                    wait = self._take_tokens(endpoint)
+                    if wait:
+                        return self._shed(on_shed, 429, wait)
+                    with self._lock:
+                        self._in_flight += 1
+                    try:
+                        return view(*args, **kwargs)
+                    finally:
+                        with self._lock:
+                            self._in_flight -= 1
+                finally:
+                    self._slots.release()
+            return guarded
+        return decorator
+
+    def _shed(self, on_shed, status, retry_after):
+        response = make_response(on_shed(status, retry_after), status)
+        response.headers['Retry-After'] = str(max(int(math.ceil(retry_after)), 1))
+        return response
+
+    def metrics(self):
+        """Host-wide decision counters plus this worker's in-flight count and limits."""
+        counts = {}
+        if self.store is not None:
+            try:
+                counts = self.store.decision_counts()
+            except sqlite3.Error as err:
+                print(f"Error reading admission metrics: {err}")
+        with self._lock:
+            in_flight = self._in_flight
+        return {
+            'decisions': counts,
+            'worker': {'pid': os.getpid(), 'in_flight': in_flight, 'max_concurrent': self.config['max_concurrent']},
+            'limits': self.limits,
+            'rate_limiting_enabled': self.store is not None,
+        }
@@ -1,39 +1,204 @@
 import psycopg2 
-from flask import Flask, render_template, request, redirect, url_for, session, flash
-import uuid 
+from flask import (Flask, render_template, request, redirect, url_for, session, flash, jsonify, has_request_context,
+                   Response, stream_with_context)
 import os 
+import time
+import hmac
 import psycopg2.extras 
 
-from db_config import get_db_url
+from db_config import (get_db_url, get_replica_urls, get_shard_urls, replica_config, partition_config, admission_config,
+                       pool_config, compression_config, outbox_config, live_config,
+                       profile_cache_config, batch_config, availability_config, ReplicaRouter)
+from connection_pool import ConnectionPool, PooledConnection
+from admission import AdmissionController
+from compression import CompressionMiddleware
+from availability import AvailabilityIndex
+import dashboard_stats
+from uuid7 import uuid7, UUID7_FUNCTION_SQL
+import income
+import partitioning
+import search_index
+import pep_screening
+import duplicate_detection
+import review_queue
+import jobs
+import prepared
+import print_documents
+import repository
+import sharding
+import outbox
+import live_updates
+import profile_cache
+import concurrency
+import validation
+import customer_batch
+import archive
 
 app = Flask(__name__)
+# gzip/brotli for HTML and JSON responses, streamed ones included (see compression.py)
+app.wsgi_app = CompressionMiddleware(app.wsgi_app, compression_config)
+# With the hash-partitioned customer graph, username/email lookups go through the registry tables
+customer_tables_partitioned = partition_config['customer_partitions'] > 0
 app.secret_key = os.environ.get('SECRET_KEY', 'your_super_secret_key_here') 
 debug_mode = os.environ.get('FLASK_DEBUG', 'True') == 'True'
 
-def get_db_connection():
-    """Establishes and returns a database connection using psycopg2 for PostgreSQL."""
+replica_router = ReplicaRouter(get_replica_urls())
+connection_pool = ConnectionPool(get_db_url(), pool_config['min_connections'],
+                                 pool_config['max_connections']) if pool_config['max_connections'] > 0 else None
+# Optional hash sharding of the customer graph (see sharding.py). None means one database.
+shard_router = sharding.ShardRouter(get_shard_urls(), get_db_url()) if get_shard_urls() else None
+# Databases whose outbox notifications carry customer changes: the primary, or every shard
+change_sources = shard_router.shard_urls if shard_router else {'primary': get_db_url()}
+# Pushes customer-table deltas to open admin dashboards (see live_updates.py); one listener per database.
+live_broadcaster = live_updates.ChangeBroadcaster(change_sources, live_config, outbox_config['heartbeat_seconds'])
+# Recently loaded customer profiles, invalidated on writes and by outbox notifications (see profile_cache.py)
+customer_profile_cache = profile_cache.ProfileCache(change_sources, profile_cache_config)
+
+def get_db_connection(read_only=False, cust_no=None):
+    """
+    Establishes and returns a database connection using psycopg2 for PostgreSQL.
+    With read_only=True the connection may come from a read replica (see db_config.ReplicaRouter),
+    unless this session wrote recently; it falls back to the primary when no replica is usable.
+    When sharded, work on one customer passes cust_no and gets a connection to that customer's
+    shard (replicas are not used for shards); everything else goes to the directory database.
+    """
+    if shard_router and cust_no is not None:
+        return _get_shard_connection(cust_no, read_only)
+    if read_only and replica_router.has_replicas() and not _session_wrote_recently():
+        conn = _get_replica_connection()
+        if conn:
+            return conn
     try:
+        if connection_pool:
+            # Pooled: conn.close() returns the connection (and its prepared statements) to the pool
+            return connection_pool.connect()
         conn_url = get_db_url()
-        conn = psycopg2.connect(conn_url)
+        conn = psycopg2.connect(conn_url, connection_factory=PooledConnection)
         print("Successfully connected to PostgreSQL database.")
         return conn
     except psycopg2.Error as err:
         print(f"Error connecting to PostgreSQL database: {err}")
         return None
 
+def _get_shard_connection(cust_no, read_only):
+    """Returns a connection to the shard owning cust_no, or None (also while a write's slot is being moved)."""
+    try:
+        return shard_router.connect_for(cust_no, for_write=not read_only)
+    except sharding.SlotUnavailable as err:
+        print(f"Shard write refused: {err}")
+    except psycopg2.Error as err:
+        print(f"Error connecting to shard database: {err}")
+    return None
+
+def _get_replica_connection():
+    """Returns a read-only connection to the first healthy, up-to-date replica, or None."""
+    for replica_url in replica_router.candidates():
+        try:
+            conn = psycopg2.connect(replica_url, connect_timeout=replica_config['connect_timeout'])
+        except psycopg2.Error as err:
+            print(f"Error connecting to read replica: {err}")
+            replica_router.eject(replica_url)
+            continue
+        try:
+            if replica_router.is_lag_acceptable(replica_url, conn):
+                conn.set_session(readonly=True)
+                return conn
+            print("Read replica is lagging; trying the next one.")
+        except psycopg2.Error as err:
+            print(f"Error checking read replica lag: {err}")
+            replica_router.eject(replica_url)
+        conn.close()
+    return None
+
+def _session_wrote_recently():
+    """True while the current session is inside its read-your-writes window."""
+    if not has_request_context():
+        return False
+    last_write_at = session.get('last_write_at')
+    return bool(last_write_at) and time.time() - last_write_at < replica_config['read_your_writes_seconds']
+
+def _mark_session_write():
+    """Records that this session just committed a write, pinning its reads to the primary for a while."""
+    session['last_write_at'] = time.time()
+
+def _get_read_connection():
+    return get_db_connection(read_only=True)
+
+# Rate limits and a concurrency cap in front of /submitRegistration and /login (see admission.py)
+admission = AdmissionController(admission_config)
+
+def _registration_shed_response(status, retry_after):
+    return jsonify(success=False, message='The service is busy. Please try again shortly.', retry_after=retry_after)
+
+def _login_shed_response(status, retry_after):
+    flash('Too many login attempts right now. Please wait a moment and try again.', 'warning')
+    return render_template('login.html')
+
+# Per-worker Bloom filter of taken emails/usernames, built lazily on first use and rebuilt
+# every availability_config['rebuild_seconds'] (see availability.py)
+availability_index = AvailabilityIndex(use_registries=customer_tables_partitioned, sharded=shard_router is not None,
+                                       rebuild_seconds=availability_config['rebuild_seconds'])
+
+# Per-worker n-gram/phonetic index of public official names for online PEP screening (see pep_screening.py)
+official_index = pep_screening.OfficialIndex()
+
+def _screen_customer(cursor, cust_no, custname):
+    """Screens a customer name against public officials and queues matches for review in the caller's transaction."""
+    if official_index.is_stale():
+        index_conn = _get_read_connection()
+        if index_conn:
+            try:
+                official_index.build(index_conn)
+            except psycopg2.Error as err:
+                print(f"Error building official screening index: {err}")
+            finally:
+                index_conn.close()
+    pep_screening.record_matches(cursor, cust_no, custname, official_index.screen(custname), 'online')
+
+def _new_cust_no():
+    """The cust_no for a new customer, generated up front so a sharded write knows its shard before the first insert."""
+    return shard_router.new_cust_no() if shard_router else uuid7()
+
+def _claim_email(email_address, cust_no):
+    """
+    When sharded, reserves the email in the directory's global registry before the shard transaction.
+    Raises IntegrityError (customer_email_address_key) if another customer holds it. Returns the
+    claim to hand to _release_email() if the write does not commit, or None.
+    """
+    if shard_router and shard_router.claim_email(email_address, cust_no):
+        return (email_address, cust_no)
+    return None
+
+def _release_email(claim):
+    if shard_router and claim:
+        try:
+            shard_router.release_email(*claim)
+        except psycopg2.Error as err:
+            print(f"Error releasing email claim: {err}")
+
+def _username_owner(username):
+    """When sharded, the cust_no holding username (so login can go to its shard); otherwise None."""
+    return shard_router.username_owner(username) if shard_router else None
+
+def _replicate_official(gov_int_name, official_position, branch_orgname):
+    """When sharded, makes the official exist on every shard first, so the in-transaction lookup links the shared row."""
+    if shard_router and (gov_int_name or official_position):
+        shard_router.replicate_official(gov_int_name, official_position, branch_orgname)
+
 # --- Function to Ensure Database Schema (for development/initial setup) ---
-def _ensure_database_schema():
+def _ensure_database_schema(db_url=None):
     """
     Ensures that necessary tables exist and have appropriate types for PostgreSQL.
     This function should typically be run only once, or managed by a proper migration tool.
     For development, it runs on app startup.
     
     This version includes logic to ALTER specific column types if they are not as expected.
+    db_url selects another database (a shard); by default the primary/directory database is used.
     """
     conn = None
     cursor = None
     try:
-        conn = get_db_connection()
+        conn = psycopg2.connect(db_url, connection_factory=PooledConnection) if db_url else get_db_connection()
         if not conn:
             print("Failed to get database connection for schema update.")
             return
@@ -48,17 +213,22 @@ def _ensure_database_schema():
         schema_sql = {
             'occupation': """
                 CREATE TABLE IF NOT EXISTS occupation (
-                    occ_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                    occ_id UUID PRIMARY KEY DEFAULT uuid_generate_v7(),
                     occ_type VARCHAR(255),
                     bus_nature VARCHAR(255)
                 );
             """,
             'financial_record': """
                 CREATE TABLE IF NOT EXISTS financial_record (
-                    fin_code UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                    fin_code UUID PRIMARY KEY DEFAULT uuid_generate_v7(),
                     source_wealth TEXT,
                     mon_income TEXT, 
-                    ann_income TEXT 
+                    ann_income TEXT,
+                    source_wealth_items TEXT[],
+                    mon_income_min NUMERIC(14, 2),
+                    mon_income_max NUMERIC(14, 2),
+                    ann_income_min NUMERIC(14, 2),
+                    ann_income_max NUMERIC(14, 2)
                 );
             """,
             'bank_details': """
@@ -70,7 +240,7 @@ def _ensure_database_schema():
             """,
             'public_official_details': """
                 CREATE TABLE IF NOT EXISTS public_official_details (
-                    gov_int_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                    gov_int_id UUID PRIMARY KEY DEFAULT uuid_generate_v7(),
                     gov_int_name VARCHAR(255),
                     official_position VARCHAR(255),
                     branch_orgname VARCHAR(255)
@@ -78,7 +248,7 @@ def _ensure_database_schema():
             """,
             'customer': """
                 CREATE TABLE IF NOT EXISTS customer (
-                    cust_no UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                    cust_no UUID PRIMARY KEY DEFAULT uuid_generate_v7(),
                     custname VARCHAR(255),
                     datebirth DATE,
                     nationality VARCHAR(255),
@@ -94,13 +264,14 @@ def _ensure_database_schema():
                     occ_id UUID,
                     fin_code UUID,
                     registration_status VARCHAR(50) DEFAULT 'Pending', 
+                    registered_at TIMESTAMPTZ DEFAULT now(),
                     FOREIGN KEY (occ_id) REFERENCES occupation (occ_id) ON DELETE SET NULL,
                     FOREIGN KEY (fin_code) REFERENCES financial_record (fin_code) ON DELETE SET NULL
                 );
             """,
             'employer_details': """
                 CREATE TABLE IF NOT EXISTS employer_details (
-                    emp_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                    emp_id UUID PRIMARY KEY DEFAULT uuid_generate_v7(),
                     occ_id UUID REFERENCES occupation (occ_id) ON DELETE SET NULL,
                     tin_id VARCHAR(50),
                     empname VARCHAR(255),
@@ -168,6 +339,14 @@ def _ensure_database_schema():
             print(f"  - WARNING: Could not enable 'uuid-ossp' extension (might already exist or permission issue): {e}")
             conn.rollback() 
 
+        # Time-ordered UUID generator used as the default for all UUID primary keys (see uuid7.py)
+        try:
+            cursor.execute(UUID7_FUNCTION_SQL)
+            print("  - Ensured 'uuid_generate_v7()' function exists.")
+        except psycopg2.Error as e:
+            print(f"  - ERROR creating 'uuid_generate_v7()' function: {e}")
+            conn.rollback()
+
         for table_name, create_sql in schema_sql.items():
             try:
                 print(f"  - Ensuring table: {table_name}")
@@ -216,6 +395,39 @@ def _ensure_database_schema():
                 conn.commit()
                 print("  - Successfully added 'registration_status' to 'customer' table.")
 
+            # Check and add registered_at to customer if it doesn't exist.
+            # Existing rows keep NULL (registration date unknown); only new rows get now().
+            cursor.execute("""
+                SELECT column_name FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = 'customer' AND column_name = 'registered_at';
+            """)
+            if not cursor.fetchone():
+                print("  - Adding 'registered_at' column to 'customer' table...")
+                cursor.execute("ALTER TABLE customer ADD COLUMN registered_at TIMESTAMPTZ;")
+                cursor.execute("ALTER TABLE customer ALTER COLUMN registered_at SET DEFAULT now();")
+                conn.commit()
+                print("  - Successfully added 'registered_at' to 'customer' table.")
+
+            # Switch existing random (v4) key defaults to time-ordered v7 keys.
+            # Already-stored keys are left alone; rekey_uuid7.py can rewrite them online.
+            uuid_key_columns = [
+                ('occupation', 'occ_id'),
+                ('financial_record', 'fin_code'),
+                ('public_official_details', 'gov_int_id'),
+                ('customer', 'cust_no'),
+                ('employer_details', 'emp_id'),
+            ]
+            for table_name, column_name in uuid_key_columns:
+                cursor.execute("""
+                    SELECT column_default FROM information_schema.columns
+                    WHERE table_schema = current_schema() AND table_name = %s AND column_name = %s;
+                """, (table_name, column_name))
+                current_default = cursor.fetchone()
+                if current_default and 'uuid_generate_v7' not in (current_default[0] or ''):
+                    print(f"  - Setting '{table_name}.{column_name}' default to uuid_generate_v7()...")
+                    cursor.execute(f"ALTER TABLE {table_name} ALTER COLUMN {column_name} SET DEFAULT uuid_generate_v7();")
+                    conn.commit()
+
         except psycopg2.Error as alter_err:
             print(f"  - ERROR during ALTER TABLE for schema updates: {alter_err}")
             conn.rollback()
@@ -224,6 +436,136 @@ def _ensure_database_schema():
             conn.rollback()
         # --- END ALTER TABLE LOGIC ---
 
+        # --- Indexes behind the occupation/financial/employer foreign keys ---
+        # Deleting a customer's occupation or financial record checks every row that references it;
+        # without these that is a sequential scan of customer per deleted row (delete_customer, sharding.py moves).
+        try:
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_customer_occ_id ON customer (occ_id);
+                CREATE INDEX IF NOT EXISTS idx_customer_fin_code ON customer (fin_code);
+                CREATE INDEX IF NOT EXISTS idx_employer_details_occ_id ON employer_details (occ_id);
+                CREATE INDEX IF NOT EXISTS idx_employment_details_emp_id ON employment_details (emp_id);
+            """)
+            print("  - Ensured foreign-key lookup indexes.")
+        except psycopg2.Error as index_err:
+            print(f"  - ERROR creating foreign-key lookup indexes: {index_err}")
+            conn.rollback()
+
+        # --- Row version on customer: bumped by a trigger on every UPDATE, so any change to the row
+        # (edits, review decisions) gives it a new version (see profile_cache.py) ---
+        try:
+            cursor.execute("""
+                ALTER TABLE customer ADD COLUMN IF NOT EXISTS row_version BIGINT NOT NULL DEFAULT 1;
+                CREATE OR REPLACE FUNCTION customer_row_version_trg() RETURNS trigger AS $$
+                BEGIN
+                    NEW.row_version := OLD.row_version + 1;
+                    RETURN NEW;
+                END;
+                $$ LANGUAGE plpgsql;
+                DROP TRIGGER IF EXISTS customer_row_version ON customer;
+                CREATE TRIGGER customer_row_version BEFORE UPDATE ON customer
+                    FOR EACH ROW EXECUTE FUNCTION customer_row_version_trg();
+            """)
+            print("  - Ensured 'customer.row_version' and its trigger.")
+        except psycopg2.Error as version_err:
+            print(f"  - ERROR ensuring customer row version: {version_err}")
+            conn.rollback()
+
+        # --- Structured income/source-of-wealth columns (see income.py; backfill with `python income.py`) ---
+        try:
+            income.ensure_schema(cursor)
+            print("  - Ensured structured income columns and indexes on 'financial_record'.")
+        except psycopg2.Error as income_err:
+            print(f"  - ERROR ensuring structured income columns: {income_err}")
+            conn.rollback()
+
+        # --- Customer search documents (see search_index.py; rebuild with `python search_index.py`) ---
+        try:
+            search_index.ensure_schema(cursor)
+            print("  - Ensured 'customer_search' table and indexes.")
+        except psycopg2.Error as search_err:
+            print(f"  - ERROR ensuring customer search table (pg_trgm may need to be installed): {search_err}")
+            conn.rollback()
+
+        # --- PEP screening review table (see pep_screening.py; nightly run: `python pep_screening.py batch`) ---
+        try:
+            pep_screening.ensure_schema(cursor)
+            print("  - Ensured 'pep_screening_match' table.")
+        except psycopg2.Error as pep_err:
+            print(f"  - ERROR ensuring PEP screening table: {pep_err}")
+            conn.rollback()
+
+        # --- Duplicate detection (see duplicate_detection.py; full run: `python duplicate_detection.py full`) ---
+        try:
+            duplicate_detection.ensure_schema(cursor)
+            print("  - Ensured 'customer_blocking_key' and 'merge_candidate' tables.")
+        except psycopg2.Error as dup_err:
+            print(f"  - ERROR ensuring duplicate detection tables: {dup_err}")
+            conn.rollback()
+
+        # --- Background job queue (see jobs.py; workers: `python jobs.py work`) ---
+        try:
+            jobs.ensure_schema(cursor)
+            print("  - Ensured 'background_job' table.")
+        except psycopg2.Error as job_err:
+            print(f"  - ERROR ensuring background job table: {job_err}")
+            conn.rollback()
+
+        # --- Registration review queue leases (see review_queue.py) ---
+        try:
+            review_queue.ensure_schema(cursor)
+            print("  - Ensured 'registration_review_lease' table and pending queue index.")
+        except psycopg2.Error as queue_err:
+            print(f"  - ERROR ensuring review queue schema: {queue_err}")
+            conn.rollback()
+
+        # --- Transactional outbox for the customer change feed (see outbox.py) ---
+        try:
+            outbox.ensure_schema(cursor)
+            print("  - Ensured 'customer_outbox' tables.")
+        except psycopg2.Error as outbox_err:
+            print(f"  - ERROR ensuring customer outbox: {outbox_err}")
+            conn.rollback()
+
+        # --- Cold archive of inactive customers (see archive.py; run: `python archive.py run`) ---
+        try:
+            archive.ensure_schema(cursor)
+            print("  - Ensured 'customer_archive' tables and 'customer.status_changed_at'.")
+        except psycopg2.Error as archive_err:
+            print(f"  - ERROR ensuring customer archive: {archive_err}")
+            conn.rollback()
+
+        # --- Dashboard statistics (summary table + triggers, see dashboard_stats.py) ---
+        try:
+            dashboard_stats.ensure_schema(cursor)
+            print("  - Ensured dashboard statistics table and triggers.")
+            if dashboard_stats.is_empty(cursor):
+                repaired = dashboard_stats.reconcile(conn, repair=True)
+                conn.autocommit = True
+                print(f"  - Seeded {len(repaired)} dashboard statistic(s) from existing customers.")
+        except psycopg2.Error as stats_err:
+            print(f"  - ERROR ensuring dashboard statistics: {stats_err}")
+            conn.rollback()
+            conn.autocommit = True
+
+        # --- Optional hash partitioning of the customer graph (see partitioning.py) ---
+        if customer_tables_partitioned:
+            try:
+                if not partitioning.is_partitioned(cursor):
+                    cursor.execute("SELECT EXISTS (SELECT 1 FROM customer);")
+                    if cursor.fetchone()[0]:
+                        # Moving existing data takes exclusive locks; leave that to the CLI in a maintenance window.
+                        print("  - WARNING: CUSTOMER_PARTITIONS is set but the customer tables hold data and are not partitioned. "
+                              "Run `python partitioning.py migrate` in a maintenance window.")
+                    else:
+                        partitioning.migrate(conn, partition_config['customer_partitions'])
+                        conn.autocommit = True
+                        print(f"  - Partitioned customer tables into {partition_config['customer_partitions']} hash partitions.")
+            except psycopg2.Error as part_err:
+                print(f"  - ERROR partitioning customer tables: {part_err}")
+                conn.rollback()
+                conn.autocommit = True
+
         print("\nPostgreSQL database schema check/update completed.")
     except psycopg2.Error as err:
         print(f"Error during PostgreSQL database schema update: {err}")
@@ -234,6 +576,8 @@ def _ensure_database_schema():
             cursor.close()
         if conn:
             conn.close()
+        # Tables may have changed shape: make pooled connections re-prepare their statements
+        prepared.invalidate_all()
 
     # --- DEBUG: Print all registered Flask endpoints after schema setup ---
     print("\n--- Flask URL Map Endpoints (after schema setup) ---")
@@ -294,8 +638,49 @@ def registration3():
     """Renders the third step of the registration form."""
     return render_template('registration3.html')
 
+@app.route('/checkAvailability', methods=['GET'])
+def check_availability():
+    """
+    Lets the registration steps check an email and/or username before the final submit.
+    Answers from the in-memory filter when it can; only "maybe taken" values hit the database.
+    The answer is advisory: a value taken through another worker since this worker's filter was
+    last rebuilt can still read as available, and the unique constraints decide at submit time.
+    """
+    email = request.args.get('email')
+    username = request.args.get('username')
+    if not email and not username:
+        return jsonify(success=False, message='Provide an email or username to check.'), 400
+
+    availability_index.ensure_built(_get_read_connection)
+    result = {'success': True}
+    if email:
+        result['email_available'] = availability_index.is_email_available(email, _get_read_connection)
+    if username:
+        result['username_available'] = availability_index.is_username_available(username, _get_read_connection)
+    if None in (result.get('email_available', True), result.get('username_available', True)):
+        return jsonify(success=False, message='Availability could not be determined.'), 503
+    return jsonify(result), 200
+
+
+# Registration graph inserts, prepared once per pooled connection (see prepared.py)
+prepared.register('insert_occupation', "INSERT INTO occupation (occ_type, bus_nature) VALUES (%s, %s) RETURNING occ_id;")
+prepared.register('insert_financial_record', """
+    INSERT INTO financial_record (source_wealth, mon_income, ann_income, source_wealth_items, mon_income_min, mon_income_max, ann_income_min, ann_income_max)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s) RETURNING fin_code;""")
+prepared.register('insert_customer', """
+    INSERT INTO customer (cust_no, custname, datebirth, nationality, citizenship, custsex, placebirth, civilstatus, num_children, mmaiden_name, cust_address, email_address, contact_no, occ_id, fin_code, registration_status)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING cust_no;""")
+prepared.register('insert_employer_details', "INSERT INTO employer_details (occ_id, tin_id, empname, emp_address, phonefax_no, job_title, emp_date) VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING emp_id;")
+prepared.register('insert_employment_link', "INSERT INTO employment_details (cust_no, emp_id) VALUES (%s, %s);")
+prepared.register('insert_spouse', "INSERT INTO spouse (cust_no, sp_name, sp_datebirth, sp_profession) VALUES (%s, %s, %s, %s);")
+prepared.register('insert_company_affiliation', "INSERT INTO company_affiliation (cust_no, depositor_role, dep_compname) VALUES (%s, %s, %s);")
+prepared.register('insert_existing_bank', "INSERT INTO existing_bank (cust_no, bank_code, acc_type) VALUES (%s, %s, %s);")
+prepared.register('find_public_official', "SELECT gov_int_id FROM public_official_details WHERE gov_int_name = %s AND official_position = %s;")
+prepared.register('insert_public_official', "INSERT INTO public_official_details (gov_int_name, official_position, branch_orgname) VALUES (%s, %s, %s) RETURNING gov_int_id;")
+prepared.register('insert_po_relationship', "INSERT INTO cust_po_relationship (cust_no, gov_int_id, relation_desc) VALUES (%s, %s, %s);")
 
 @app.route('/submitRegistration', methods=['POST'])
+@admission.guard('register', _registration_shed_response)
 def submit_registration():
     """
     Receives all registration data as JSON from the frontend (registration.js)
@@ -304,14 +689,13 @@ def submit_registration():
     """
     conn = None
     cursor = None
+    email_claim = None
     try:
-        # Get JSON data sent from the frontend
-        data = request.get_json()
-        r1 = data.get('registration1', {})
-        r2 = data.get('registration2', {})
-        r3 = data.get('registration3', {})
+        # Get JSON data sent from the frontend; every field is checked before a connection is taken
+        payload = validation.validate_registration(request.get_json(silent=True))
 
-        conn = get_db_connection()
+        cust_no = _new_cust_no()
+        conn = get_db_connection(cust_no=cust_no)
         if not conn:
             raise Exception("Database connection failed")
 
@@ -319,102 +703,63 @@ def submit_registration():
         conn.autocommit = False # Start a transaction
 
         # --- 1. Insert into occupation table ---
-        occ_type = r2.get('occupation')
-        bus_nature = r2.get('natureOfBusiness')
-        sql_occ = "INSERT INTO occupation (occ_type, bus_nature) VALUES (%s, %s) RETURNING occ_id;"
-        cursor.execute(sql_occ, (occ_type, bus_nature))
+        prepared.execute(cursor, 'insert_occupation', (payload.occ_type, payload.bus_nature))
         occ_id = cursor.fetchone()[0] # Fetch the generated UUID
 
         # --- 2. Insert into financial_record table ---
-        source_wealth_list = r2.get('sourceOfWealth', [])
-        source_wealth = ', '.join(source_wealth_list) if isinstance(source_wealth_list, list) else source_wealth_list
-        mon_income = r2.get('monthlyIncome')
-        ann_income = r2.get('annualIncome')
-        sql_fin = "INSERT INTO financial_record (source_wealth, mon_income, ann_income) VALUES (%s, %s, %s) RETURNING fin_code;"
-        cursor.execute(sql_fin, (source_wealth, mon_income, ann_income))
+        fin_structured = income.financial_record_values(payload.source_wealth_items, payload.mon_income, payload.ann_income)
+        prepared.execute(cursor, 'insert_financial_record',
+                         (payload.source_wealth, payload.mon_income, payload.ann_income) + fin_structured)
         fin_code = cursor.fetchone()[0] # Fetch the generated UUID
 
         # --- 3. Insert into customer table ---
-        custname = f"{r1.get('firstName', '')} {r1.get('lastName', '')}"
-        datebirth = r1.get('dob')
-        nationality = r1.get('nationality')
-        citizenship = r1.get('citizenship')
-        custsex = r1.get('sex')
-        placebirth = r1.get('placeOfBirth')
-        civilstatus = r1.get('civilStatus')
-        num_children = int(r1.get('children', 0) or 0)
-        mmaiden_name = r1.get('motherMaidenName')
-        cust_address = r1.get('address')
-        email_address = r1.get('email')
-        contact_no = r1.get('telephone')
-        # New customer registration always defaults to 'Pending'
-        registration_status = 'Pending' 
-
-        sql_cust = """INSERT INTO customer (custname, datebirth, nationality, citizenship, custsex, placebirth, civilstatus, num_children, mmaiden_name, cust_address, email_address, contact_no, occ_id, fin_code, registration_status)
-                      VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING cust_no;"""
+        custname = payload.custname
+        email_address = payload.email_address
+
+        # New customer registration always defaults to 'Pending' (set by validation)
         customer_data = (
-            custname, datebirth, nationality, citizenship, custsex,
-            placebirth, civilstatus, num_children, mmaiden_name,
-            cust_address, email_address, contact_no, occ_id, fin_code,
-            registration_status
+            str(cust_no), custname, payload.datebirth, payload.nationality, payload.citizenship, payload.custsex,
+            payload.placebirth, payload.civilstatus, payload.num_children, payload.mmaiden_name,
+            payload.cust_address, email_address, payload.contact_no, occ_id, fin_code,
+            payload.registration_status
         )
-        cursor.execute(sql_cust, customer_data)
+        email_claim = _claim_email(email_address, cust_no)  # global uniqueness when sharded
+        prepared.execute(cursor, 'insert_customer', customer_data)
         cust_no = cursor.fetchone()[0] # Fetch the generated UUID for cust_no
         print(f"--- DEBUG: Successfully inserted customer. New cust_no: {cust_no} (Type: {type(cust_no)}) ---")
 
         # --- 4. Insert into employer_details and employment_details if applicable ---
-        if r2.get('occupation') == 'Employed':
-            tin_id = r2.get('tinId', '')
-            empname = r2.get('companyName', '')
-            emp_address = r2.get('employerAddress', '')
-            phonefax_no = r2.get('employerPhone', '')
-            emp_date_str = r2.get('employmentDate')
-            emp_date = emp_date_str if emp_date_str else None # Handle empty date string
-            job_title = r2.get('jobTitle', '')
-
-            sql_emp_details = "INSERT INTO employer_details (occ_id, tin_id, empname, emp_address, phonefax_no, job_title, emp_date) VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING emp_id;"
-            cursor.execute(sql_emp_details, (occ_id, tin_id, empname, emp_address, phonefax_no, job_title, emp_date))
+        if payload.occ_type == 'Employed':
+            prepared.execute(cursor, 'insert_employer_details',
+                             (occ_id, payload.tin_id, payload.empname, payload.emp_address, payload.phonefax_no,
+                              payload.job_title, payload.emp_date))
             emp_id = cursor.fetchone()[0] # Fetch the generated UUID
 
-            sql_emp_link = "INSERT INTO employment_details (cust_no, emp_id) VALUES (%s, %s)"
-            cursor.execute(sql_emp_link, (cust_no, emp_id))
+            prepared.execute(cursor, 'insert_employment_link', (cust_no, emp_id))
 
-        # --- 5. Insert into spouse table if married ---
-        if r1.get('civilStatus') == 'Married':
-            sp_name = f"{r1.get('spouseFirstName', '')} {r1.get('spouseLastName', '')}"
-            sp_datebirth_str = r1.get('spouseDob')
-            sp_datebirth = sp_datebirth_str if sp_datebirth_str else None # Handle empty date string
-            sp_profession = r1.get('spouseProfession')
-
-            if sp_name.strip() and sp_profession and sp_datebirth: # Only insert if all spouse fields are non-empty
-                sql_spouse = "INSERT INTO spouse (cust_no, sp_name, sp_datebirth, sp_profession) VALUES (%s, %s, %s, %s);"
-                cursor.execute(sql_spouse, (cust_no, sp_name, sp_datebirth, sp_profession))
+        # --- 5. Insert into spouse table if married (validation clears the spouse fields otherwise) ---
+        if payload.sp_name:
+            prepared.execute(cursor, 'insert_spouse', (cust_no, payload.sp_name, payload.sp_datebirth, payload.sp_profession))
 
         # --- 6. Insert into company_affiliation if applicable ---
-        depositor_role = r3.get('depositorRole')
-        dep_compname = r3.get('companyName')
-        if depositor_role or dep_compname:
-            sql_company = "INSERT INTO company_affiliation (cust_no, depositor_role, dep_compname) VALUES (%s, %s, %s);"
-            cursor.execute(sql_company, (cust_no, depositor_role, dep_compname))
+        if payload.depositor_role or payload.dep_compname:
+            prepared.execute(cursor, 'insert_company_affiliation', (cust_no, payload.depositor_role, payload.dep_compname))
 
         # --- 7. Insert into existing_bank if applicable ---
-        bank_code = r3.get('bankCode')
-        acc_type = r3.get('accountType')
-        if bank_code and acc_type:
+        if payload.bank_code and payload.acc_type:
             # You might want to validate bank_code against your bank_details table here
-            sql_bank = "INSERT INTO existing_bank (cust_no, bank_code, acc_type) VALUES (%s, %s, %s);"
-            cursor.execute(sql_bank, (cust_no, bank_code, acc_type))
+            prepared.execute(cursor, 'insert_existing_bank', (cust_no, payload.bank_code, payload.acc_type))
             
         # --- 8. Insert into public_official_details and cust_po_relationship if applicable ---
-        gov_int_name = r3.get('governmentOfficialName')
-        official_position = r3.get('officialPosition')
-        branch_orgname = r3.get('branchOrgName')
-        relation_desc = r3.get('relationshipNature')
+        gov_int_name = payload.gov_int_name
+        official_position = payload.official_position
+        branch_orgname = payload.branch_orgname
+        relation_desc = payload.relation_desc
 
         if gov_int_name or official_position or branch_orgname or relation_desc:
+            _replicate_official(gov_int_name, official_position, branch_orgname)
             # Check if this public official already exists to avoid duplicates
-            cursor.execute("SELECT gov_int_id FROM public_official_details WHERE gov_int_name = %s AND official_position = %s;",
-                           (gov_int_name, official_position))
+            prepared.execute(cursor, 'find_public_official', (gov_int_name, official_position))
             existing_po = cursor.fetchone()
             
             gov_int_id = None
@@ -422,20 +767,29 @@ def submit_registration():
                 gov_int_id = existing_po[0]
             else:
                 # If not, insert new public official
-                sql_po = "INSERT INTO public_official_details (gov_int_name, official_position, branch_orgname) VALUES (%s, %s, %s) RETURNING gov_int_id;"
-                cursor.execute(sql_po, (gov_int_name, official_position, branch_orgname))
+                prepared.execute(cursor, 'insert_public_official', (gov_int_name, official_position, branch_orgname))
                 gov_int_id = cursor.fetchone()[0]
 
             # Link customer to public official
             if gov_int_id:
-                sql_po_rel = "INSERT INTO cust_po_relationship (cust_no, gov_int_id, relation_desc) VALUES (%s, %s, %s);"
-                cursor.execute(sql_po_rel, (cust_no, gov_int_id, relation_desc))
+                prepared.execute(cursor, 'insert_po_relationship', (cust_no, gov_int_id, relation_desc))
+
 
+        # --- 9. Screen the customer against public officials (PEP) ---
+        _screen_customer(cursor, cust_no, custname)
 
+        search_index.refresh_document(cursor, cust_no)
+        outbox.record(cursor, outbox.CREATED, cust_no)
+        jobs.enqueue(cursor, 'duplicate_check', {'cust_no': str(cust_no)})
         conn.commit() # Commit all changes if everything is successful
+        email_claim = None
+        _mark_session_write()
+        availability_index.add_email(email_address)
         flash('Registration successful! Please proceed to login.', 'success')
         return jsonify(success=True, cust_no=str(cust_no)), 200
 
+    except validation.ValidationError as err:
+        return jsonify(success=False, message='Some fields are missing or invalid.', errors=err.errors), 400
     except psycopg2.IntegrityError as err:
         conn.rollback()
         print(f"Database Integrity Error during registration: {err}")
@@ -472,9 +826,33 @@ def submit_registration():
             cursor.close()
         if conn:
             conn.close()
-
+        _release_email(email_claim)  # the registration did not commit
+
+
+# Fetch user credentials along with customer and user_role details.
+# In the partitioned layout the username registry supplies cust_no first, so the
+# credentials/customer probes are pruned to one partition each at run time.
+LOGIN_SQL = prepared.register('login_credentials', """
+    SELECT 
+        cred.cust_no, cred.username, cred.password, 
+        c.custname, c.registration_status,
+        CASE 
+            WHEN EXISTS (SELECT 1 FROM admins WHERE cust_no = cred.cust_no) THEN 'Admin'
+            ELSE 'Customer'
+        END as user_role
+""" + ("""
+    FROM credentials_username_registry ur
+    JOIN credentials cred ON cred.cust_no = ur.cust_no AND cred.username = ur.username
+    JOIN customer c ON c.cust_no = ur.cust_no
+    WHERE ur.username = %s;
+""" if customer_tables_partitioned else """
+    FROM credentials cred
+    JOIN customer c ON cred.cust_no = c.cust_no
+    WHERE cred.username = %s;
+"""))
 
 @app.route('/login', methods=['GET', 'POST'])
+@admission.guard('login', _login_shed_response)
 def login():
     """Handles user login."""
     if request.method == 'POST':
@@ -483,26 +861,15 @@ def login():
         conn = None
         cursor = None
         try:
-            conn = get_db_connection()
+            conn = get_db_connection(cust_no=_username_owner(username))  # the user's shard when sharded
             if not conn:
                 flash('Database connection failed.', 'danger')
                 return redirect(url_for('login'))
 
             cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor) # Use DictCursor for easy column access
             
-            # Fetch user credentials along with customer and user_role details
-            cursor.execute("""
-                SELECT 
-                    cred.cust_no, cred.username, cred.password, 
-                    c.custname, c.registration_status,
-                    CASE 
-                        WHEN EXISTS (SELECT 1 FROM admins WHERE cust_no = cred.cust_no) THEN 'Admin'
-                        ELSE 'Customer'
-                    END as user_role
-                FROM credentials cred
-                JOIN customer c ON cred.cust_no = c.cust_no
-                WHERE cred.username = %s;
-            """, (username,))
+            # Fetch user credentials along with customer and user_role details (LOGIN_SQL, prepared)
+            prepared.execute(cursor, 'login_credentials', (username,))
             user = cursor.fetchone()
 
             if user:
@@ -579,15 +946,24 @@ def admin_dashboard_page():
     conn = None
     cursor = None
     customers = []
+    # Taken before the list is read, so the live stream replays anything that changes in between
     try:
-        conn = get_db_connection()
+        live_event_id = live_broadcaster.head_id()
+    except psycopg2.Error as err:
+        print(f"Live updates unavailable: {err}")
+        live_event_id = None
+    try:
+        if shard_router:
+            # Every shard's list, merged by name (see sharding.list_customers)
+            return render_template('admin_dashboard.html', customers=sharding.list_customers(shard_router),
+                                   live_event_id=live_event_id)
+        conn = get_db_connection(read_only=True)
         if not conn:
             flash('Database connection failed.', 'danger')
-            return render_template('admin_dashboard.html', customers=[])
+            return render_template('admin_dashboard.html', customers=[], live_event_id=None)
 
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cursor.execute("SELECT cust_no, custname, email_address, contact_no, registration_status FROM customer ORDER BY custname;")
-        customers = cursor.fetchall()
+        cursor = conn.cursor()
+        customers = repository.list_customers(cursor)
     except psycopg2.Error as err:
         print(f"Database error fetching customers: {err}")
         flash(f'Error loading customers: {err}', 'danger')
@@ -599,56 +975,519 @@ def admin_dashboard_page():
             cursor.close()
         if conn:
             conn.close()
-    return render_template('admin_dashboard.html', customers=customers)
+    return render_template('admin_dashboard.html', customers=customers, live_event_id=live_event_id)
 
 
-@app.route('/admin/customer/<uuid:cust_no>')
+def _live_connect(name):
+    """Connection for live-update replays from the outbox of one source ('primary' or a shard name)."""
+    if shard_router:
+        return shard_router.connect(name)
+    conn = get_db_connection()
+    if not conn:
+        raise psycopg2.OperationalError('Database connection failed.')
+    return conn
+
+@app.route('/admin/live')
 @login_required
 @roles_required('Admin')
-def admin_customer_details(cust_no):
+def admin_live_updates():
+    """Server-Sent Events stream of customer-table deltas for the dashboard (see live_updates.py)."""
+    try:
+        subscriber = live_broadcaster.subscribe(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    except live_updates.TooManySubscribers as err:
+        print(f"Live updates refused: {err}")
+        return jsonify(success=False, message='Too many live dashboards open; retrying shortly.'), 503, {'Retry-After': '5'}
+    except psycopg2.Error as err:
+        print(f"Live updates unavailable: {err}")
+        return jsonify(success=False, message='Live updates are unavailable.'), 503, {'Retry-After': '5'}
+    response = Response(live_broadcaster.stream(subscriber, _live_connect), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(lambda: live_broadcaster.unsubscribe(subscriber))
+    return response
+
+
+@app.route('/admin/stats')
+@login_required
+@roles_required('Admin')
+def admin_dashboard_stats():
+    """Returns the dashboard statistics as JSON, read from the trigger-maintained summary table."""
     conn = None
     cursor = None
-    customer = {}
     try:
-        conn = get_db_connection()
+        days = min(max(int(request.args.get('days', 30)), 1), 366)
+    except ValueError:
+        return jsonify(success=False, message='days must be a number.'), 400
+    try:
+        if shard_router:
+            return jsonify(success=True, stats=sharding.fetch_stats(shard_router, days=days)), 200
+        conn = get_db_connection(read_only=True)
         if not conn:
-            flash('Database connection failed.', 'danger')
-            return redirect(url_for('admin_dashboard_page'))
+            return jsonify(success=False, message='Database connection failed.'), 503
+        cursor = conn.cursor()
+        stats = dashboard_stats.fetch_stats(cursor, days=days)
+        return jsonify(success=True, stats=stats), 200
+    except psycopg2.Error as err:
+        print(f"Database error fetching dashboard statistics: {err}")
+        return jsonify(success=False, message='Error loading statistics.'), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+@app.route('/admin/search')
+@login_required
+@roles_required('Admin')
+def admin_search_customers():
+    """Ranked customer search by name, email, phone, employer, spouse, maiden name or address fragments."""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify(success=False, message='Provide a search term.'), 400
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+    except ValueError:
+        return jsonify(success=False, message='limit must be a number.'), 400
+    conn = None
+    cursor = None
+    try:
+        if shard_router:
+            rows = sharding.search(shard_router, query, limit=limit)
+        else:
+            conn = get_db_connection(read_only=True)
+            if not conn:
+                return jsonify(success=False, message='Database connection failed.'), 503
+            cursor = conn.cursor()
+            rows = search_index.search(cursor, query, limit=limit)
+        results = [
+            {'cust_no': str(cust_no), 'custname': custname, 'email_address': email_address,
+             'contact_no': contact_no, 'registration_status': registration_status, 'score': round(score, 4)}
+            for cust_no, custname, email_address, contact_no, registration_status, score in rows
+        ]
+        return jsonify(success=True, results=results), 200
+    except psycopg2.Error as err:
+        print(f"Database error during customer search: {err}")
+        return jsonify(success=False, message='Error searching customers.'), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
 
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        # Fetch all related details using LEFT JOINs
+@app.route('/admin/pep_matches')
+@login_required
+@roles_required('Admin')
+def admin_pep_matches():
+    """Lists PEP screening matches awaiting review (or another review_status), highest score first."""
+    review_status = request.args.get('status', 'Pending')
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection(read_only=True)
+        if not conn:
+            return jsonify(success=False, message='Database connection failed.'), 503
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         cursor.execute("""
-            SELECT
-                c.cust_no, c.custname, c.datebirth, c.nationality, c.citizenship, c.custsex, c.placebirth,
-                c.civilstatus, c.num_children, c.mmaiden_name, c.cust_address, c.email_address,
-                c.contact_no, c.registration_status,
-                o.occ_type, o.bus_nature,
-                f.source_wealth, f.mon_income, f.ann_income,
-                e.tin_id, e.empname, e.emp_address, e.phonefax_no, e.job_title, e.emp_date,
-                s.sp_name, s.sp_datebirth, s.sp_profession,
-                comp.depositor_role, comp.dep_compname,
-                eb.bank_code, eb.acc_type,
-                po.gov_int_name, po.official_position, po.branch_orgname,
-                cpr.relation_desc
-            FROM customer c
-            LEFT JOIN occupation o ON c.occ_id = o.occ_id
-            LEFT JOIN financial_record f ON c.fin_code = f.fin_code
-            LEFT JOIN employment_details emd ON c.cust_no = emd.cust_no
-            LEFT JOIN employer_details e ON emd.emp_id = e.emp_id
-            LEFT JOIN spouse s ON c.cust_no = s.cust_no
-            LEFT JOIN company_affiliation comp ON c.cust_no = comp.cust_no
-            LEFT JOIN existing_bank eb ON c.cust_no = eb.cust_no
-            LEFT JOIN cust_po_relationship cpr ON c.cust_no = cpr.cust_no
-            LEFT JOIN public_official_details po ON cpr.gov_int_id = po.gov_int_id
-            WHERE c.cust_no = %s;
-        """, (str(cust_no),))
-        
-        customer = cursor.fetchone()
+            SELECT match_id::text, cust_no::text, gov_int_id::text, customer_name, official_name,
+                   score::float AS score, source, review_status, screened_at
+            FROM pep_screening_match
+            WHERE review_status = %s
+            ORDER BY score DESC, screened_at
+            LIMIT 200;
+        """, (review_status,))
+        return jsonify(success=True, matches=cursor.fetchall()), 200
+    except psycopg2.Error as err:
+        print(f"Database error fetching PEP matches: {err}")
+        return jsonify(success=False, message='Error loading PEP matches.'), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+@app.route('/admin/merge_candidates')
+@login_required
+@roles_required('Admin')
+def admin_merge_candidates():
+    """Lists likely duplicate customer pairs awaiting review (or another review_status), highest score first."""
+    review_status = request.args.get('status', 'Pending')
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection(read_only=True)
+        if not conn:
+            return jsonify(success=False, message='Database connection failed.'), 503
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cursor.execute("""
+            SELECT m.candidate_id::text, m.score::float AS score, m.matched_fields, m.review_status, m.detected_at,
+                   a.cust_no::text AS cust_no_a, a.custname AS custname_a, a.email_address AS email_address_a,
+                   b.cust_no::text AS cust_no_b, b.custname AS custname_b, b.email_address AS email_address_b
+            FROM merge_candidate m
+            JOIN customer a ON a.cust_no = m.cust_no_a
+            JOIN customer b ON b.cust_no = m.cust_no_b
+            WHERE m.review_status = %s
+            ORDER BY m.score DESC, m.detected_at
+            LIMIT 200;
+        """, (review_status,))
+        return jsonify(success=True, candidates=cursor.fetchall()), 200
+    except psycopg2.Error as err:
+        print(f"Database error fetching merge candidates: {err}")
+        return jsonify(success=False, message='Error loading merge candidates.'), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+@app.route('/admin/review_queue')
+@login_required
+@roles_required('Admin')
+def admin_review_queue():
+    """One page of pending registrations, oldest first. Pass next_after back as after_at/after_no for the next page."""
+    try:
+        limit = min(max(int(request.args.get('limit', review_queue.DEFAULT_PAGE_SIZE)), 1), review_queue.MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify(success=False, message='limit must be a number.'), 400
+    after_at = request.args.get('after_at')
+    after_no = request.args.get('after_no')
+    after = (after_at, after_no) if after_at and after_no else None
+    conn = None
+    cursor = None
+    try:
+        # Primary, not a replica: reviewers need to see leases and decisions made seconds ago.
+        conn = get_db_connection()
+        if not conn:
+            return jsonify(success=False, message='Database connection failed.'), 503
+        cursor = conn.cursor()
+        rows = review_queue.fetch_page(cursor, after=after, limit=limit)
+        queue = [
+            {'cust_no': cust_no, 'custname': custname, 'email_address': email_address, 'contact_no': contact_no,
+             'registered_at': registered_at.isoformat() if registered_at else None,
+             'claimed_by': reviewer, 'lease_expires_at': lease_expires_at.isoformat() if lease_expires_at else None}
+            for cust_no, custname, email_address, contact_no, registered_at, _, reviewer, lease_expires_at in rows
+        ]
+        next_after = {'after_at': rows[-1][5], 'after_no': rows[-1][0]} if len(rows) == limit else None
+        return jsonify(success=True, queue=queue, next_after=next_after), 200
+    except psycopg2.Error as err:
+        print(f"Database error fetching review queue: {err}")
+        return jsonify(success=False, message='Error loading the review queue.'), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
 
-        if not customer:
+@app.route('/admin/review_queue/<action>', methods=['POST'])
+@login_required
+@roles_required('Admin')
+def admin_review_queue_action(action):
+    """
+    claim:   lease the next batch of pending registrations to the current admin ({"limit": n}).
+    approve / reject: decide the selected, claimed registrations in one UPDATE ({"cust_nos": [...]}).
+    release: give back claimed registrations ({"cust_nos": [...]}, or all when omitted).
+    """
+    if action not in ('claim', 'approve', 'reject', 'release'):
+        return jsonify(success=False, message='Unknown review action.'), 404
+    payload = request.get_json(silent=True) or {}
+    cust_nos = payload.get('cust_nos', request.form.getlist('cust_nos') or None)
+    if cust_nos is not None:
+        try:
+            cust_nos = review_queue.parse_cust_nos(cust_nos)
+        except ValueError as err:
+            return jsonify(success=False, message=str(err)), 400
+    if action in ('approve', 'reject') and not cust_nos:
+        return jsonify(success=False, message='Select at least one registration.'), 400
+    reviewer = session['username']
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        if not conn:
+            return jsonify(success=False, message='Database connection failed.'), 503
+        cursor = conn.cursor()
+        if action == 'claim':
+            try:
+                limit = min(max(int(payload.get('limit', review_queue.DEFAULT_PAGE_SIZE)), 1), review_queue.MAX_PAGE_SIZE)
+            except (TypeError, ValueError):
+                return jsonify(success=False, message='limit must be a number.'), 400
+            claimed = review_queue.claim(cursor, reviewer, limit=limit)
+            conn.commit()
+            return jsonify(success=True, claimed=claimed), 200
+        if action == 'release':
+            released = review_queue.release(cursor, reviewer, cust_nos)
+            conn.commit()
+            return jsonify(success=True, released=released), 200
+
+        updated = review_queue.decide(cursor, reviewer, cust_nos, action)
+        for decided in updated:
+            outbox.record(cursor, outbox.UPDATED, decided)
+        conn.commit()
+        for decided in updated:
+            customer_profile_cache.invalidate(decided)
+        _mark_session_write()
+        skipped = sorted(set(cust_nos) - set(updated))
+        return jsonify(success=True, updated=updated, skipped=skipped), 200
+    except psycopg2.Error as err:
+        if conn:
+            conn.rollback()
+        print(f"Database error during review queue {action}: {err}")
+        return jsonify(success=False, message=f'Error during {action}.'), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+@app.route('/admin/jobs/stats')
+@login_required
+@roles_required('Admin')
+def admin_job_stats():
+    """Background job queue depth and wait/run latency percentiles as JSON."""
+    try:
+        window = min(max(int(request.args.get('minutes', 60)), 1), 1440)
+    except ValueError:
+        return jsonify(success=False, message='minutes must be a number.'), 400
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection(read_only=True)
+        if not conn:
+            return jsonify(success=False, message='Database connection failed.'), 503
+        cursor = conn.cursor()
+        return jsonify(success=True, metrics=jobs.fetch_metrics(cursor, window_minutes=window)), 200
+    except psycopg2.Error as err:
+        print(f"Database error fetching job metrics: {err}")
+        return jsonify(success=False, message='Error loading job metrics.'), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+@app.route('/admin/admission')
+@login_required
+@roles_required('Admin')
+def admin_admission_metrics():
+    """Admission decisions (admitted / rate_limited / over_capacity) per endpoint, plus this worker's load."""
+    return jsonify(success=True, metrics=admission.metrics()), 200
+
+
+@app.route('/admin/profile_cache')
+@login_required
+@roles_required('Admin')
+def admin_profile_cache_metrics():
+    """This worker's profile cache: hits, misses, hit rate, entries and estimated bytes (see profile_cache.py)."""
+    return jsonify(success=True, metrics=customer_profile_cache.metrics()), 200
+
+
+# --- Customer change feed (see outbox.py) ---
+def _feed_authorized():
+    """Feed clients send `Authorization: Bearer <OUTBOX_FEED_TOKEN>`; a logged-in admin may also read it."""
+    token = outbox_config['feed_token']
+    auth = request.headers.get('Authorization', '')
+    if token and auth.startswith('Bearer ') and hmac.compare_digest(auth[len('Bearer '):].encode(), token.encode()):
+        return True
+    return session.get('logged_in') and session.get('user_role') == 'Admin'
+
+def _feed_db_url():
+    """The database whose outbox is read: the ?shard= named shard when sharded, else the primary (None if unknown)."""
+    if shard_router:
+        return shard_router.shard_urls.get(request.args.get('shard'))
+    return get_db_url()
+
+def _feed_connection(db_url):
+    """
+    A dedicated (unpooled) connection that listens for changes: long-polls and streams hold it while they
+    wait, which would starve the pool.
+    """
+    conn = psycopg2.connect(db_url)
+    outbox.listen(conn)
+    return conn
+
+def _feed_start(conn, consumer):
+    """The position to read after: ?after=, else Last-Event-ID, else the consumer's committed offset."""
+    after = request.args.get('after') or request.headers.get('Last-Event-ID')
+    if after is not None:
+        return int(after)
+    return outbox.get_offset(conn, consumer) if consumer else 0
+
+@app.route('/feed/customers')
+def customer_feed():
+    """
+    Customer changes after a position as NDJSON, oldest first, at most ?limit= per response. With no new
+    events the request waits up to ?wait= seconds (long poll). X-Next-Position is the `after` for the next
+    request; consumers that keep their offset here POST it to /feed/customers/offsets once processed.
+    """
+    if not _feed_authorized():
+        return jsonify(success=False, message='Not authorized.'), 401
+    db_url = _feed_db_url()
+    if not db_url:
+        return jsonify(success=False, message='Unknown or missing shard.'), 400
+    consumer = request.args.get('consumer')
+    try:
+        limit = min(max(int(request.args.get('limit', outbox_config['max_batch'])), 1), outbox_config['max_batch'])
+        wait = min(max(float(request.args.get('wait', outbox_config['long_poll_seconds'])), 0),
+                   outbox_config['long_poll_seconds'])
+    except ValueError:
+        return jsonify(success=False, message='limit and wait must be numbers.'), 400
+    conn = None
+    try:
+        conn = _feed_connection(db_url)
+        after = _feed_start(conn, consumer)
+        rows = outbox.wait_and_fetch(conn, after, limit, wait)
+        next_position = rows[-1][0] if rows else after
+        body = ''.join(line + '\n' for _, line in rows)
+        return Response(body, mimetype='application/x-ndjson', headers={'X-Next-Position': str(next_position)})
+    except ValueError:
+        return jsonify(success=False, message='after must be a position number.'), 400
+    except psycopg2.Error as err:
+        print(f"Database error reading the customer feed: {err}")
+        return jsonify(success=False, message='Error reading the customer feed.'), 500
+    finally:
+        if conn:
+            conn.close()
+
+@app.route('/feed/customers/offsets', methods=['POST'])
+def customer_feed_offsets():
+    """Commits a consumer's offset: JSON {"consumer": ..., "position": ...}. Offsets never move backwards."""
+    if not _feed_authorized():
+        return jsonify(success=False, message='Not authorized.'), 401
+    db_url = _feed_db_url()
+    if not db_url:
+        return jsonify(success=False, message='Unknown or missing shard.'), 400
+    data = request.get_json(silent=True) or {}
+    consumer = data.get('consumer')
+    position = data.get('position')
+    if not consumer or not isinstance(position, int) or position < 0:
+        return jsonify(success=False, message='consumer and a non-negative integer position are required.'), 400
+    conn = None
+    try:
+        conn = psycopg2.connect(db_url)
+        return jsonify(success=True, consumer=consumer, position=outbox.commit_offset(conn, consumer, position)), 200
+    except psycopg2.Error as err:
+        print(f"Database error committing feed offset: {err}")
+        return jsonify(success=False, message='Error committing the offset.'), 500
+    finally:
+        if conn:
+            conn.close()
+
+@app.route('/feed/customers/stream')
+def customer_feed_stream():
+    """
+    The feed as Server-Sent Events: one `customer` event per change with id = position, so a reconnecting
+    EventSource resumes from Last-Event-ID. A comment line is sent as a heartbeat when idle.
+    """
+    if not _feed_authorized():
+        return jsonify(success=False, message='Not authorized.'), 401
+    db_url = _feed_db_url()
+    if not db_url:
+        return jsonify(success=False, message='Unknown or missing shard.'), 400
+    consumer = request.args.get('consumer')
+    try:
+        conn = _feed_connection(db_url)
+    except psycopg2.Error as err:
+        print(f"Database error opening the customer feed stream: {err}")
+        return jsonify(success=False, message='Error reading the customer feed.'), 500
+    try:
+        after = _feed_start(conn, consumer)
+    except (ValueError, psycopg2.Error):
+        conn.close()
+        return jsonify(success=False, message='after must be a position number.'), 400
+
+    def generate(after):
+        try:
+            yield 'retry: 2000\n\n'
+            while True:
+                rows = outbox.wait_and_fetch(conn, after, outbox_config['max_batch'], outbox_config['heartbeat_seconds'])
+                if not rows:
+                    yield ': heartbeat\n\n'
+                    continue
+                yield ''.join(f"id: {position}\nevent: customer\ndata: {line}\n\n" for position, line in rows)
+                after = rows[-1][0]
+        except psycopg2.Error as err:
+            print(f"Database error streaming the customer feed: {err}")
+        finally:
+            conn.close()
+
+    return Response(stream_with_context(generate(after)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def _load_profile(cust_no):
+    """
+    The customer's CustomerProfile (or None), from the profile cache or else the profile join
+    (repository.CUSTOMER_PROFILE_SQL, prepared), which then fills the cache.
+    """
+    profile = customer_profile_cache.get(cust_no)
+    if profile is not None:
+        return profile
+    conn = get_db_connection(read_only=True, cust_no=cust_no)
+    if not conn:
+        raise psycopg2.OperationalError('Database connection failed.')
+    try:
+        with conn.cursor() as cursor:
+            profile = repository.fetch_profile(cursor, cust_no)
+    finally:
+        conn.close()
+    customer_profile_cache.put(cust_no, profile)
+    return profile
+
+
+def _load_archived_profile(cust_no):
+    """(CustomerProfile, archived_at) of a customer moved to the cold archive (see archive.py), or None."""
+    conn = get_db_connection(read_only=True, cust_no=cust_no)
+    if not conn:
+        raise psycopg2.OperationalError('Database connection failed.')
+    try:
+        with conn.cursor() as cursor:
+            return archive.fetch_profile(cursor, cust_no)
+    finally:
+        conn.close()
+
+
+def _wants_json():
+    """True for API clients (JSON body or Accept: application/json) rather than browser forms."""
+    return request.is_json or request.accept_mimetypes.best == 'application/json'
+
+@app.route('/admin/customer/<uuid:cust_no>')
+@login_required
+@roles_required('Admin')
+def admin_customer_details(cust_no):
+    customer = {}
+    try:
+        profile = _load_profile(cust_no)
+        archived_at = None
+        if not profile:
+            # Not in the live tables: it may have been archived (read-only, so no ETag)
+            archived = _load_archived_profile(cust_no)
+            if archived:
+                profile, archived_at = archived
+
+        if _wants_json():
+            # JSON view for the dashboard modals and API clients; the ETag is the row_version to
+            # send back with an edit (If-Match or the row_version field)
+            if not profile:
+                return jsonify(success=False, message='Customer not found.'), 404
+            if archived_at:
+                return jsonify(success=True, archived=True, archived_at=archived_at.isoformat(),
+                               **repository.profile_document(profile)), 200
+            return (jsonify(success=True, **repository.profile_document(profile)), 200,
+                    {'ETag': concurrency.etag(profile.row_version)})
+
+        if not profile:
             flash('Customer not found.', 'danger')
             return redirect(url_for('admin_dashboard_page'))
-        
+        customer = profile._asdict()  # the page adds display-only fields below
+        if archived_at:
+            customer['archived_at'] = archived_at
+            flash(f'This customer was archived on {archived_at:%Y-%m-%d} and is read-only.', 'info')
+
         # Format dates for display
         if customer.get('datebirth'):
             customer['datebirth_formatted'] = customer['datebirth'].strftime('%Y-%m-%d')
@@ -659,19 +1498,50 @@ def admin_customer_details(cust_no):
 
     except psycopg2.Error as err:
         print(f"Database error fetching customer details: {err}")
+        if _wants_json():
+            return jsonify(success=False, message='Error loading the customer.'), 500
         flash(f'An error occurred: {err}', 'danger')
         return redirect(url_for('admin_dashboard_page'))
     except Exception as e:
         print(f"Error fetching customer details: {e}")
         flash('An unexpected error occurred.', 'danger')
         return redirect(url_for('admin_dashboard_page'))
+    return render_template('admin_customer_details.html', customer=customer)
+
+
+@app.route('/admin/customer/<uuid:cust_no>/print')
+@login_required
+@roles_required('Admin')
+def admin_customer_print(cust_no):
+    """Printable information sheet for one customer; print_documents.py renders the same template in bulk."""
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection(read_only=True, cust_no=cust_no)
+        if not conn:
+            flash('Database connection failed.', 'danger')
+            return redirect(url_for('admin_dashboard_page'))
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        sheet = print_documents.fetch_sheet(cursor, cust_no)
+    except psycopg2.Error as err:
+        print(f"Database error fetching customer sheet: {err}")
+        flash(f'An error occurred: {err}', 'danger')
+        return redirect(url_for('admin_dashboard_page'))
     finally:
         if cursor:
             cursor.close()
         if conn:
             conn.close()
-    return render_template('admin_customer_details.html', customer=customer)
+    if not sheet:
+        flash('Customer not found.', 'danger')
+        return redirect(url_for('admin_dashboard_page'))
+    return render_template(print_documents.TEMPLATE_NAME, c=sheet, generated_at=time.strftime('%Y-%m-%d %H:%M'))
+
 
+def _flash_validation_errors(err):
+    """One flash message listing every invalid field of a rejected admin form."""
+    flash('Please correct these fields: ' + '; '.join(f"{field} {message}" for field, message in err.errors.items()),
+          'danger')
 
 @app.route('/admin/add_customer', methods=['GET', 'POST'])
 @login_required
@@ -679,39 +1549,21 @@ def admin_customer_details(cust_no):
 def admin_add_customer():
     conn = None
     cursor = None
+    email_claim = None
     if request.method == 'POST':
         try:
-            # Collect data from form
-            first_name = request.form.get('firstName')
-            last_name = request.form.get('lastName')
-            custname = f"{first_name} {last_name}".strip() if first_name and last_name else request.form.get('custname')
-            if not custname: # Fallback if combination is empty or not provided
-                custname = request.form.get('custname', 'N/A') # Ensure it's never empty
-
-            datebirth = request.form.get('dob')
-            nationality = request.form.get('nationality')
-            citizenship = request.form.get('citizenship')
-            custsex = request.form.get('sex')
-            placebirth = request.form.get('placeOfBirth')
-            civilstatus = request.form.get('civilStatus')
-            num_children = int(request.form.get('children', 0) or 0)
-            mmaiden_name = request.form.get('motherMaidenName')
-            cust_address = request.form.get('address')
-            email_address = request.form.get('email')
-            contact_no = request.form.get('telephone')
-            registration_status = request.form.get('registrationStatus', 'Pending') # Default to Pending
-
-            # Occupation details
-            occ_type = request.form.get('occupation')
-            bus_nature = request.form.get('natureOfBusiness')
-
-            # Financial details
-            source_wealth_list = request.form.getlist('sourceOfWealth')
-            source_wealth = ', '.join(source_wealth_list) if isinstance(source_wealth_list, list) else request.form.get('sourceOfWealth', '')
-            mon_income = request.form.get('monthlyIncome')
-            ann_income = request.form.get('annualIncome')
-
-            conn = get_db_connection()
+            # Collect data from form (checked and normalized before a connection is taken)
+            payload = validation.validate_customer_form(request.form)
+            custname = payload.custname
+            email_address = payload.email_address
+            occ_type = payload.occ_type
+            bus_nature = payload.bus_nature
+            source_wealth = payload.source_wealth
+            mon_income = payload.mon_income
+            ann_income = payload.ann_income
+
+            cust_no = _new_cust_no()
+            conn = get_db_connection(cust_no=cust_no)
             if not conn:
                 flash('Database connection failed.', 'danger')
                 return redirect(url_for('admin_add_customer'))
@@ -732,8 +1584,10 @@ def admin_add_customer():
 
             fin_code = None
             if source_wealth or mon_income or ann_income:
-                cursor.execute("INSERT INTO financial_record (source_wealth, mon_income, ann_income) VALUES (%s, %s, %s) RETURNING fin_code;",
-                               (source_wealth, mon_income, ann_income))
+                cursor.execute("""
+                    INSERT INTO financial_record (source_wealth, mon_income, ann_income, source_wealth_items, mon_income_min, mon_income_max, ann_income_min, ann_income_max)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s) RETURNING fin_code;
+                """, (source_wealth, mon_income, ann_income) + income.financial_record_values(payload.source_wealth_items, mon_income, ann_income))
                 fin_code_row = cursor.fetchone()
                 if fin_code_row:
                     fin_code = fin_code_row[0]
@@ -742,30 +1596,24 @@ def admin_add_customer():
 
 
             # Insert into customer table
-            sql_cust = """INSERT INTO customer (custname, datebirth, nationality, citizenship, custsex, placebirth, civilstatus, num_children, mmaiden_name, cust_address, email_address, contact_no, occ_id, fin_code, registration_status)
-                          VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING cust_no;"""
+            sql_cust = """INSERT INTO customer (cust_no, custname, datebirth, nationality, citizenship, custsex, placebirth, civilstatus, num_children, mmaiden_name, cust_address, email_address, contact_no, occ_id, fin_code, registration_status)
+                          VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING cust_no;"""
             customer_data = (
-                custname, datebirth, nationality, citizenship, custsex,
-                placebirth, civilstatus, num_children, mmaiden_name,
-                cust_address, email_address, contact_no, occ_id, fin_code, registration_status
+                str(cust_no), custname, payload.datebirth, payload.nationality, payload.citizenship, payload.custsex,
+                payload.placebirth, payload.civilstatus, payload.num_children, payload.mmaiden_name,
+                payload.cust_address, email_address, payload.contact_no, occ_id, fin_code, payload.registration_status
             )
+            email_claim = _claim_email(email_address, cust_no)  # global uniqueness when sharded
             cursor.execute(sql_cust, customer_data)
-            cust_no = cursor.fetchone()[0] # Get the newly generated cust_no
+            cust_no = cursor.fetchone()[0]
 
             # Employer details if applicable
             if occ_type == 'Employed' and occ_id:
-                tin_id = request.form.get('tinId', '')
-                empname = request.form.get('companyName', '')
-                emp_address = request.form.get('employerAddress', '')
-                phonefax_no = request.form.get('employerPhone', '')
-                emp_date_str = request.form.get('employmentDate')
-                emp_date = emp_date_str if emp_date_str else None
-                job_title = request.form.get('jobTitle', '')
-
                 cursor.execute("""
                     INSERT INTO employer_details (occ_id, tin_id, empname, emp_address, phonefax_no, job_title, emp_date)
                     VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING emp_id;
-                """, (occ_id, tin_id, empname, emp_address, phonefax_no, job_title, emp_date))
+                """, (occ_id, payload.tin_id, payload.empname, payload.emp_address, payload.phonefax_no,
+                      payload.job_title, payload.emp_date))
                 emp_id_row = cursor.fetchone()
                 if emp_id_row:
                     emp_id = emp_id_row[0]
@@ -775,22 +1623,16 @@ def admin_add_customer():
                     flash('Failed to create employer details record.', 'warning')
 
 
-            # Spouse details if married
-            if civilstatus == 'Married':
-                sp_name = f"{request.form.get('spouseFirstName', '')} {request.form.get('spouseLastName', '')}".strip()
-                sp_datebirth_str = request.form.get('spouseDob')
-                sp_datebirth = sp_datebirth_str if sp_datebirth_str else None
-                sp_profession = request.form.get('spouseProfession', '')
-
-                if sp_name or sp_datebirth or sp_profession:
-                    cursor.execute("""
-                        INSERT INTO spouse (cust_no, sp_name, sp_datebirth, sp_profession)
-                        VALUES (%s, %s, %s, %s);
-                    """, (cust_no, sp_name, sp_datebirth, sp_profession))
+            # Spouse details if married (validation clears the spouse fields otherwise)
+            if payload.sp_name:
+                cursor.execute("""
+                    INSERT INTO spouse (cust_no, sp_name, sp_datebirth, sp_profession)
+                    VALUES (%s, %s, %s, %s);
+                """, (cust_no, payload.sp_name, payload.sp_datebirth, payload.sp_profession))
 
             # Company affiliation
-            depositor_role = request.form.get('depositorRole')
-            dep_compname = request.form.get('companyNameAffiliation')
+            depositor_role = payload.depositor_role
+            dep_compname = payload.dep_compname
             if depositor_role or dep_compname:
                 cursor.execute("""
                     INSERT INTO company_affiliation (cust_no, depositor_role, dep_compname)
@@ -798,8 +1640,8 @@ def admin_add_customer():
                 """, (cust_no, depositor_role, dep_compname))
 
             # Existing bank details
-            bank_code = request.form.get('bankCode')
-            acc_type = request.form.get('accountType')
+            bank_code = payload.bank_code
+            acc_type = payload.acc_type
             if bank_code and acc_type:
                 # Basic check if bank_code exists in bank_details (foreign key constraint will also catch)
                 cursor.execute("SELECT bank_name FROM bank_details WHERE bank_code = %s;", (bank_code,))
@@ -812,12 +1654,13 @@ def admin_add_customer():
                     flash(f'Bank Code {bank_code} does not exist. Please add it first.', 'danger')
 
             # Public Official relationship
-            gov_int_name = request.form.get('governmentOfficialName')
-            official_position = request.form.get('officialPosition')
-            branch_orgname = request.form.get('branchOrgName')
-            relation_desc = request.form.get('relationshipNature')
+            gov_int_name = payload.gov_int_name
+            official_position = payload.official_position
+            branch_orgname = payload.branch_orgname
+            relation_desc = payload.relation_desc
 
             if gov_int_name or official_position or branch_orgname or relation_desc:
+                _replicate_official(gov_int_name, official_position, branch_orgname)
                 gov_int_id = None
                 cursor.execute("SELECT gov_int_id FROM public_official_details WHERE gov_int_name = %s AND official_position = %s;",
                                (gov_int_name, official_position))
@@ -842,10 +1685,20 @@ def admin_add_customer():
                     """, (cust_no, gov_int_id, relation_desc))
 
 
+            _screen_customer(cursor, cust_no, custname)
+            search_index.refresh_document(cursor, cust_no)
+            outbox.record(cursor, outbox.CREATED, cust_no)
+            jobs.enqueue(cursor, 'duplicate_check', {'cust_no': str(cust_no)})
             conn.commit()
+            email_claim = None
+            _mark_session_write()
+            availability_index.add_email(email_address)
             flash(f'Customer {cust_no} added successfully!', 'success')
             return redirect(url_for('admin_dashboard_page'))
 
+        except validation.ValidationError as err:
+            _flash_validation_errors(err)
+            return redirect(url_for('admin_add_customer'))
         except psycopg2.IntegrityError as err:
             conn.rollback()
             print(f"Database Integrity Error during customer addition: {err}")
@@ -876,18 +1729,219 @@ def admin_add_customer():
                 cursor.close()
             if conn:
                 conn.close()
+            _release_email(email_claim)  # the addition did not commit
 
     return render_template('admin_add_customer.html')
 
 
+def _batch_database(cust_no):
+    """Which database a new customer of a batch is written to: its shard, or the single database."""
+    return shard_router.shard_for(cust_no, for_write=True) if shard_router else 'primary'
+
+def _write_batch_group(items, results):
+    """
+    Writes one database's share of a batch, items being (index, cust_no, payload), in one
+    transaction (see customer_batch.write_group) after dropping registered emails and unknown
+    bank codes. Fills results and returns the committed (index, cust_no, payload) items.
+    """
+    conn = get_db_connection(cust_no=items[0][1])
+    if not conn:
+        for index, _, _ in items:
+            results[index] = {'index': index, 'status': customer_batch.FAILED, 'message': 'Database connection failed.'}
+        return []
+    try:
+        conn.autocommit = False
+        with conn.cursor() as cursor:
+            taken = customer_batch.existing_emails(cursor, [payload.email_address for _, _, payload in items],
+                                                   customer_tables_partitioned)
+            banks = customer_batch.known_bank_codes(cursor, {payload.bank_code for _, _, payload in items
+                                                            if payload.bank_code and payload.acc_type})
+        writable = []
+        for index, cust_no, payload in items:
+            if payload.email_address in taken:
+                results[index] = {'index': index, 'status': customer_batch.DUPLICATE, 'field': 'email_address',
+                                  'message': 'Email address already registered.'}
+            elif payload.bank_code and payload.acc_type and payload.bank_code not in banks:
+                results[index] = {'index': index, 'status': customer_batch.INVALID,
+                                  'errors': {'bankCode': 'unknown bank code'}}
+            else:
+                writable.append((index, cust_no, payload))
+        if not writable:
+            conn.rollback()
+            return []
+        group_results, created = customer_batch.write_group(conn, writable, batch_config['chunk_size'], _screen_customer)
+        conn.commit()
+        results.update(group_results)
+        created = set(created)
+        return [item for item in writable if item[0] in created]
+    except psycopg2.Error as err:
+        conn.rollback()
+        print(f"Database error during batch customer creation: {err}")
+        if debug_mode:
+            raise
+        for index, _, _ in items:
+            if results.get(index, {}).get('status') in (None, customer_batch.CREATED):
+                results[index] = {'index': index, 'status': customer_batch.FAILED,
+                                  'message': 'An error occurred while saving the batch.'}
+        return []
+    finally:
+        conn.close()
+
+@app.route('/admin/customers/batch', methods=['POST'])
+@login_required
+@roles_required('Admin')
+def admin_batch_create_customers():
+    """
+    Creates many customers from one JSON request, {"customers": [...]}, with multi-row inserts in
+    one transaction per database (see customer_batch.py). Every item is validated first; the
+    answer has one result per item, in request order, so a client can resubmit just the failures.
+    """
+    body = request.get_json(silent=True)
+    items = body.get('customers') if isinstance(body, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify(success=False, message='Expected {"customers": [...]} with at least one customer.'), 400
+    if len(items) > batch_config['max_items']:
+        return jsonify(success=False, message=f"At most {batch_config['max_items']} customers per batch."), 413
+
+    results = {}
+    groups = {}
+    claims = {}
+    committed = []
+    first_with_email = {}
+    try:
+        for index, item in enumerate(items):
+            try:
+                payload = customer_batch.validate_item(item)
+            except validation.ValidationError as err:
+                results[index] = {'index': index, 'status': customer_batch.INVALID, 'errors': err.errors}
+                continue
+            if payload.email_address in first_with_email:
+                results[index] = {'index': index, 'status': customer_batch.DUPLICATE, 'field': 'email_address',
+                                  'message': f"Same email address as item {first_with_email[payload.email_address]}."}
+                continue
+            first_with_email[payload.email_address] = index
+            cust_no = _new_cust_no()
+            try:
+                claims[index] = _claim_email(payload.email_address, cust_no)  # global uniqueness when sharded
+            except psycopg2.IntegrityError:
+                results[index] = {'index': index, 'status': customer_batch.DUPLICATE, 'field': 'email_address',
+                                  'message': 'Email address already registered.'}
+                continue
+            if customer_batch.has_official(payload):
+                _replicate_official(payload.gov_int_name, payload.official_position, payload.branch_orgname)
+            groups.setdefault(_batch_database(cust_no), []).append((index, cust_no, payload))
+
+        for group in groups.values():
+            committed.extend(_write_batch_group(group, results))
+    except sharding.SlotUnavailable as err:
+        print(f"Shard write refused: {err}")
+        return jsonify(success=False, message='Customer writes are paused; please retry shortly.'), 503
+    finally:
+        done = {index for index, _, _ in committed}
+        for index, claim in claims.items():
+            if index not in done:
+                _release_email(claim)  # not committed
+
+    if committed:
+        _mark_session_write()
+        for _, _, payload in committed:
+            availability_index.add_email(payload.email_address)
+    print(f"Batch customer creation: {len(committed)} of {len(items)} customers created.")
+    return jsonify(success=True, created=len(committed), results=[results[index] for index in range(len(items))]), 200
+
+
+def _render_edit_form(cust_no):
+    """GET of admin_edit_customer: the form filled from the customer's (possibly cached) profile."""
+    profile = _load_profile(cust_no)
+
+    if not profile:
+        flash('Customer not found.', 'danger')
+        return redirect(url_for('admin_dashboard_page'))
+
+    # The form also needs split names and ISO dates, so it works on a dict copy
+    customer = profile._asdict()
+
+    # Split custname into first and last for form
+    full_name = customer.get('custname', '').strip()
+    name_parts = full_name.rsplit(' ', 1)
+    customer['firstName'] = name_parts[0] if len(name_parts) > 1 else full_name
+    customer['lastName'] = name_parts[1] if len(name_parts) > 1 else ''
+
+    # Split spouse name
+    spouse_full_name = customer.get('sp_name', '').strip()
+    spouse_name_parts = spouse_full_name.rsplit(' ', 1)
+    customer['spouseFirstName'] = spouse_name_parts[0] if len(spouse_name_parts) > 1 else spouse_full_name
+    customer['spouseLastName'] = spouse_name_parts[1] if len(spouse_name_parts) > 1 else ''
+
+    # Format dates for HTML input
+    if customer.get('datebirth'):
+        customer['datebirth'] = customer['datebirth'].isoformat()
+    if customer.get('emp_date'):
+        customer['emp_date'] = customer['emp_date'].isoformat()
+    if customer.get('sp_datebirth'):
+        customer['sp_datebirth'] = customer['sp_datebirth'].isoformat()
+    
+    # Source of wealth list for checkboxes: the array column when backfilled, else split the legacy string
+    if customer.get('source_wealth_items') is not None:
+        customer['sourceOfWealthList'] = list(customer['source_wealth_items'])
+    else:
+        customer['sourceOfWealthList'] = income.parse_source_wealth(customer.get('source_wealth'))
+
+    return render_template('admin_edit_customer.html', customer=customer, cust_no=str(cust_no))
+
+
+def _edit_conflict(conn, cursor, cust_no, expected, submitted):
+    """
+    Answers a stale edit (see concurrency.py): rolls it back and returns 409 with the diff between
+    the version the editor read, the current one and what was submitted. Browsers are sent back to
+    the edit form, which shows the current values, with the changed fields in a flash message.
+    """
+    conn.rollback()
+    current = repository.fetch_profile(cursor, cust_no)
+    if current is None:
+        conn.rollback()
+        if _wants_json():
+            return jsonify(success=False, message='Customer not found.'), 404
+        flash('This customer was deleted while you were editing it.', 'danger')
+        return redirect(url_for('admin_dashboard_page'))
+    base = concurrency.base_snapshot(cursor, cust_no, expected)
+    conn.rollback()
+    customer_profile_cache.invalidate(cust_no, current.row_version)
+    diff = concurrency.conflict_diff(base, current._asdict(), submitted)
+    print(f"Stale edit of customer {cust_no}: expected row_version {expected}, "
+          f"current {current.row_version}; differing fields: {', '.join(diff) or 'none'}")
+    if _wants_json():
+        return (jsonify(success=False, message='The customer was changed by someone else; review the changes and retry.',
+                        row_version=current.row_version, diff=diff),
+                409, {'ETag': concurrency.etag(current.row_version)})
+    flash('This customer was changed by someone else while you were editing'
+          + (f" ({', '.join(diff)})" if diff else '') + '. The form now shows the current values; '
+          'review them and save again.', 'warning')
+    return redirect(url_for('admin_edit_customer', cust_no=cust_no))
+
+
 @app.route('/admin/edit_customer/<uuid:cust_no>', methods=['GET', 'POST'])
-# @login_required # Assuming you have a login_required decorator
-# @roles_required('Admin') # Assuming roles_required decorator
+@login_required
+@roles_required('Admin')
 def admin_edit_customer(cust_no):
     conn = None
     cursor = None
+    email_claim = None
     try:
-        conn = get_db_connection()
+        if request.method == 'GET':
+            return _render_edit_form(cust_no)  # no transaction needed to show the form
+        # Form fields, or the same names as a JSON object from API clients
+        fields = request.get_json(silent=True) if request.is_json else request.form
+        # The version the editor read (hidden form field or If-Match); edits without one are refused
+        expected_version = concurrency.expected_version(fields or {}, request.headers)
+        if expected_version is None:
+            if _wants_json():
+                return jsonify(success=False, message='Send the row_version you read (field or If-Match).'), 428
+            flash('The form is out of date; it has been reloaded. Please make your changes again.', 'warning')
+            return redirect(url_for('admin_edit_customer', cust_no=cust_no))
+        # Checked and normalized before a connection is taken
+        payload = validation.validate_customer_form(fields)
+        conn = get_db_connection(cust_no=cust_no)
         if not conn:
             flash('Database connection failed.', 'danger')
             return redirect(url_for('admin_dashboard_page'))
@@ -896,37 +1950,37 @@ def admin_edit_customer(cust_no):
         conn.autocommit = False # Start a transaction
 
         if request.method == 'POST':
-            # Collect data from form
-            first_name = request.form.get('firstName')
-            last_name = request.form.get('lastName')
-            # Ensure custname is always set, combine first and last if available, else use existing/fallback
-            custname = f"{first_name} {last_name}".strip() if first_name and last_name else request.form.get('custname')
-            if not custname: # Fallback if combination is empty or not provided
-                custname = request.form.get('custname', 'N/A')
-
-            datebirth = request.form.get('dob')
-            nationality = request.form.get('nationality')
-            citizenship = request.form.get('citizenship')
-            custsex = request.form.get('sex')
-            placebirth = request.form.get('placeOfBirth')
-            civilstatus = request.form.get('civilStatus')
-            num_children = int(request.form.get('children', 0) or 0)
-            mmaiden_name = request.form.get('motherMaidenName')
-            cust_address = request.form.get('address')
-            email_address = request.form.get('email')
-            contact_no = request.form.get('telephone')
-            registration_status = request.form.get('registrationStatus') # Get from form
-
-            occ_type = request.form.get('occupation')
-            bus_nature = request.form.get('natureOfBusiness')
-
-            source_wealth_list = request.form.getlist('sourceOfWealth')
-            source_wealth = ', '.join(source_wealth_list) if isinstance(source_wealth_list, list) else request.form.get('sourceOfWealth', '')
-            mon_income = request.form.get('monthlyIncome')
-            ann_income = request.form.get('annualIncome')
-
-            # Fetch current occ_id and fin_code from the customer record
-            cursor.execute("SELECT occ_id, fin_code FROM customer WHERE cust_no = %s;", (str(cust_no),))
+            # Collect data from the validated payload
+            custname = payload.custname
+            datebirth = payload.datebirth
+            nationality = payload.nationality
+            citizenship = payload.citizenship
+            custsex = payload.custsex
+            placebirth = payload.placebirth
+            civilstatus = payload.civilstatus
+            num_children = payload.num_children
+            mmaiden_name = payload.mmaiden_name
+            cust_address = payload.cust_address
+            email_address = payload.email_address
+            contact_no = payload.contact_no
+            registration_status = payload.registration_status
+
+            occ_type = payload.occ_type
+            bus_nature = payload.bus_nature
+
+            source_wealth = payload.source_wealth
+            mon_income = payload.mon_income
+            ann_income = payload.ann_income
+            # Structured income/source columns, written alongside the text columns (see income.py)
+            fin_structured = income.financial_record_values(payload.source_wealth_items, mon_income, ann_income)
+
+            # What the stale-edit diff compares against (profile columns -> submitted values)
+            submitted = payload._asdict()
+
+            # Fetch current occ_id and fin_code from the customer record (no lock: the version check
+            # on the final customer UPDATE catches concurrent edits)
+            cursor.execute("SELECT occ_id, fin_code, email_address, row_version FROM customer WHERE cust_no = %s;",
+                           (str(cust_no),))
             current_customer_fk_info = cursor.fetchone()
             
             if not current_customer_fk_info:
@@ -934,7 +1988,9 @@ def admin_edit_customer(cust_no):
                 conn.rollback()
                 return redirect(url_for('admin_dashboard_page'))
 
-            current_occ_id, current_fin_code = current_customer_fk_info
+            current_occ_id, current_fin_code, current_email, current_version = current_customer_fk_info
+            if current_version != expected_version:
+                return _edit_conflict(conn, cursor, cust_no, expected_version, submitted)
 
             # --- Update Occupation Table (or insert if new) ---
             occ_id_to_use = None
@@ -951,7 +2007,7 @@ def admin_edit_customer(cust_no):
                     # If update failed (occ_id from customer didn't exist in occupation table)
                     # and new occupation data is provided, insert new.
                     if occ_type or bus_nature:
-                        new_occ_id = uuid.uuid4() # Generate new UUID for new occupation
+                        new_occ_id = uuid7() # Generate new UUID for new occupation
                         cursor.execute("""
                             INSERT INTO occupation (occ_id, occ_type, bus_nature) 
                             VALUES (%s, %s, %s) RETURNING occ_id;
@@ -959,19 +2015,10 @@ def admin_edit_customer(cust_no):
                         inserted_occ_row = cursor.fetchone()
                         if inserted_occ_row:
                             occ_id_to_use = inserted_occ_row[0]
-                            # Update customer to link to this new occupation
-                            cursor.execute("""
-                                UPDATE customer SET occ_id = %s WHERE cust_no = %s;
-                            """, (occ_id_to_use, str(cust_no)))
                         else:
                             flash('Failed to insert new occupation record after old one not found.', 'warning')
-                    else:
-                        # If no new occupation data and old occ_id was invalid, set customer's occ_id to NULL
-                        cursor.execute("""
-                            UPDATE customer SET occ_id = NULL WHERE cust_no = %s;
-                        """, (str(cust_no),))
             elif occ_type or bus_nature: # If customer had no occ_id, or old one was invalid, and new data is provided
-                new_occ_id = uuid.uuid4() # Generate new UUID for new occupation
+                new_occ_id = uuid7() # Generate new UUID for new occupation
                 cursor.execute("""
                     INSERT INTO occupation (occ_id, occ_type, bus_nature) 
                     VALUES (%s, %s, %s) RETURNING occ_id;
@@ -979,18 +2026,11 @@ def admin_edit_customer(cust_no):
                 inserted_occ_row = cursor.fetchone()
                 if inserted_occ_row:
                     occ_id_to_use = inserted_occ_row[0]
-                    # Update customer to link to this new occupation
-                    cursor.execute("""
-                        UPDATE customer SET occ_id = %s WHERE cust_no = %s;
-                    """, (occ_id_to_use, str(cust_no)))
                 else:
                     flash('Failed to insert new occupation record.', 'warning')
             else: # No current occ_id, and no new occupation data provided
                 occ_id_to_use = None
-                # Ensure customer's occ_id is NULL if no occupation data
-                cursor.execute("""
-                    UPDATE customer SET occ_id = NULL WHERE cust_no = %s;
-                """, (str(cust_no),))
+            # The customer row gets occ_id/fin_code with the rest of its columns at the end
             current_occ_id = occ_id_to_use # Update current_occ_id for subsequent use (e.g., employer details)
 
 
@@ -998,9 +2038,10 @@ def admin_edit_customer(cust_no):
             fin_code_to_use = None
             if current_fin_code:
                 cursor.execute("""
-                    UPDATE financial_record SET source_wealth = %s, mon_income = %s, ann_income = %s
+                    UPDATE financial_record SET source_wealth = %s, mon_income = %s, ann_income = %s,
+                        source_wealth_items = %s, mon_income_min = %s, mon_income_max = %s, ann_income_min = %s, ann_income_max = %s
                     WHERE fin_code = %s RETURNING fin_code;
-                """, (source_wealth, mon_income, ann_income, current_fin_code))
+                """, (source_wealth, mon_income, ann_income) + fin_structured + (current_fin_code,))
                 updated_fin_row = cursor.fetchone()
                 if updated_fin_row:
                     fin_code_to_use = updated_fin_row[0]
@@ -1008,73 +2049,41 @@ def admin_edit_customer(cust_no):
                     # If update failed (fin_code from customer didn't exist in financial_record table)
                     # and new financial data is provided, insert new.
                     if source_wealth or mon_income or ann_income:
-                        new_fin_code = uuid.uuid4() # Generate new UUID for new financial record
+                        new_fin_code = uuid7() # Generate new UUID for new financial record
                         cursor.execute("""
-                            INSERT INTO financial_record (fin_code, source_wealth, mon_income, ann_income)
-                            VALUES (%s, %s, %s, %s) RETURNING fin_code;
-                        """, (str(new_fin_code), source_wealth, mon_income, ann_income))
+                            INSERT INTO financial_record (fin_code, source_wealth, mon_income, ann_income, source_wealth_items, mon_income_min, mon_income_max, ann_income_min, ann_income_max)
+                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING fin_code;
+                        """, (str(new_fin_code), source_wealth, mon_income, ann_income) + fin_structured)
                         inserted_fin_row = cursor.fetchone()
                         if inserted_fin_row:
                             fin_code_to_use = inserted_fin_row[0]
-                            # Update customer to link to this new financial record
-                            cursor.execute("""
-                                UPDATE customer SET fin_code = %s WHERE cust_no = %s;
-                            """, (fin_code_to_use, str(cust_no)))
                         else:
                             flash('Failed to insert new financial record after old one not found.', 'warning')
-                    else:
-                        # If no new financial data and old fin_code was invalid, set customer's fin_code to NULL
-                        cursor.execute("""
-                            UPDATE customer SET fin_code = NULL WHERE cust_no = %s;
-                        """, (str(cust_no),))
             elif source_wealth or mon_income or ann_income: # If customer had no fin_code, or old one was invalid, and new data is provided
-                new_fin_code = uuid.uuid4() # Generate new UUID for new financial record
+                new_fin_code = uuid7() # Generate new UUID for new financial record
                 cursor.execute("""
-                    INSERT INTO financial_record (fin_code, source_wealth, mon_income, ann_income)
-                    VALUES (%s, %s, %s, %s) RETURNING fin_code;
-                """, (str(new_fin_code), source_wealth, mon_income, ann_income))
+                    INSERT INTO financial_record (fin_code, source_wealth, mon_income, ann_income, source_wealth_items, mon_income_min, mon_income_max, ann_income_min, ann_income_max)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING fin_code;
+                """, (str(new_fin_code), source_wealth, mon_income, ann_income) + fin_structured)
                 inserted_fin_row = cursor.fetchone()
                 if inserted_fin_row:
                     fin_code_to_use = inserted_fin_row[0]
-                    # Update customer to link to this new financial record
-                    cursor.execute("""
-                        UPDATE customer SET fin_code = %s WHERE cust_no = %s;
-                    """, (fin_code_to_use, str(cust_no)))
                 else:
                     flash('Failed to insert new financial record.', 'warning')
             else: # No current fin_code, and no new financial data provided
                 fin_code_to_use = None
-                # Ensure customer's fin_code is NULL if no financial data
-                cursor.execute("""
-                    UPDATE customer SET fin_code = NULL WHERE cust_no = %s;
-                """, (str(cust_no),))
             current_fin_code = fin_code_to_use # Update current_fin_code for subsequent use if any
 
 
-            # --- Update Customer Table ---
-            cursor.execute("""
-                UPDATE customer
-                SET custname = %s, datebirth = %s, nationality = %s, citizenship = %s, custsex = %s,
-                    placebirth = %s, civilstatus = %s, num_children = %s, mmaiden_name = %s,
-                    cust_address = %s, email_address = %s, contact_no = %s, registration_status = %s,
-                    occ_id = %s, fin_code = %s
-                WHERE cust_no = %s;
-            """, (custname, datebirth, nationality, citizenship, custsex,
-                  placebirth, civilstatus, int(num_children), mmaiden_name,
-                  cust_address, email_address, contact_no, registration_status,
-                  current_occ_id, current_fin_code, # Use the potentially new/updated IDs
-                  str(cust_no)))
-            
             # --- Update Employer Details if applicable ---
             # Only proceed if the occupation type is 'Employed' AND there's a valid occupation ID
             if occ_type == 'Employed' and current_occ_id:
-                tin_id = request.form.get('tinId', '')
-                empname = request.form.get('companyName', '')
-                emp_address = request.form.get('employerAddress', '')
-                phonefax_no = request.form.get('employerPhone', '')
-                emp_date_str = request.form.get('employmentDate')
-                emp_date = emp_date_str if emp_date_str else None
-                job_title = request.form.get('jobTitle', '')
+                tin_id = payload.tin_id
+                empname = payload.empname
+                emp_address = payload.emp_address
+                phonefax_no = payload.phonefax_no
+                emp_date = payload.emp_date
+                job_title = payload.job_title
 
                 # Check if an employer_details record already exists for this occ_id
                 cursor.execute("SELECT emp_id FROM employer_details WHERE occ_id = %s;", (current_occ_id,))
@@ -1098,7 +2107,7 @@ def admin_edit_customer(cust_no):
                         flash('Failed to update existing employer details. Data inconsistency possible.', 'warning')
                 else:
                     # Insert new employer details if not existing and current_occ_id is valid
-                    new_emp_id = uuid.uuid4()
+                    new_emp_id = uuid7()
                     cursor.execute("""
                         INSERT INTO employer_details (emp_id, occ_id, tin_id, empname, emp_address, phonefax_no, job_title, emp_date)
                         VALUES (%s, %s, %s, %s, %s, %s, %s, %s) RETURNING emp_id;
@@ -1131,10 +2140,9 @@ def admin_edit_customer(cust_no):
 
             # --- Update Spouse Details if civil status is Married ---
             if civilstatus == 'Married':
-                sp_name = f"{request.form.get('spouseFirstName', '')} {request.form.get('spouseLastName', '')}".strip()
-                sp_datebirth_str = request.form.get('spouseDob')
-                sp_datebirth = sp_datebirth_str if sp_datebirth_str else None
-                sp_profession = request.form.get('spouseProfession', '')
+                sp_name = payload.sp_name
+                sp_datebirth = payload.sp_datebirth
+                sp_profession = payload.sp_profession
 
                 if sp_name or sp_datebirth or sp_profession: # Only update/insert if spouse data is provided
                     # Check if spouse record already exists for this customer
@@ -1157,8 +2165,8 @@ def admin_edit_customer(cust_no):
                 cursor.execute("DELETE FROM spouse WHERE cust_no = %s;", (str(cust_no),))
 
             # --- Update Company Affiliation ---
-            depositor_role = request.form.get('depositorRole')
-            dep_compname = request.form.get('companyNameAffiliation')
+            depositor_role = payload.depositor_role
+            dep_compname = payload.dep_compname
 
             if depositor_role or dep_compname:
                 cursor.execute("SELECT COUNT(*) FROM company_affiliation WHERE cust_no = %s;", (str(cust_no),))
@@ -1176,8 +2184,8 @@ def admin_edit_customer(cust_no):
                 cursor.execute("DELETE FROM company_affiliation WHERE cust_no = %s;", (str(cust_no),))
 
             # --- Update Existing Bank Details ---
-            bank_code = request.form.get('bankCode')
-            acc_type = request.form.get('accountType')
+            bank_code = payload.bank_code
+            acc_type = payload.acc_type
 
             if bank_code and acc_type: # Bank code is a FK, must exist in bank_details
                 # First, ensure the bank_code exists in bank_details table
@@ -1202,12 +2210,13 @@ def admin_edit_customer(cust_no):
                 cursor.execute("DELETE FROM existing_bank WHERE cust_no = %s;", (str(cust_no),))
 
             # --- Update Public Official Relationship ---
-            gov_int_name = request.form.get('governmentOfficialName')
-            official_position = request.form.get('officialPosition')
-            branch_orgname = request.form.get('branchOrgName')
-            relation_desc = request.form.get('relationshipNature')
+            gov_int_name = payload.gov_int_name
+            official_position = payload.official_position
+            branch_orgname = payload.branch_orgname
+            relation_desc = payload.relation_desc
 
             if gov_int_name or official_position or branch_orgname or relation_desc:
+                _replicate_official(gov_int_name, official_position, branch_orgname)
                 # Check if public official detail exists or insert new
                 gov_int_id_to_use = None
                 cursor.execute("SELECT gov_int_id FROM public_official_details WHERE gov_int_name = %s AND official_position = %s;",
@@ -1217,7 +2226,7 @@ def admin_edit_customer(cust_no):
                 if existing_gov_int:
                     gov_int_id_to_use = existing_gov_int[0]
                 else:
-                    new_gov_int_id = uuid.uuid4()
+                    new_gov_int_id = uuid7()
                     cursor.execute("""
                         INSERT INTO public_official_details (gov_int_id, gov_int_name, official_position, branch_orgname)
                         VALUES (%s, %s, %s, %s) RETURNING gov_int_id;
@@ -1245,78 +2254,56 @@ def admin_edit_customer(cust_no):
             else:
                 # If no public official details, delete any existing relationship
                 cursor.execute("DELETE FROM cust_po_relationship WHERE cust_no = %s;", (str(cust_no),))
-            
+
+            # --- Update Customer Table ---
+            # Last, and only if nobody else changed the customer since the form was loaded: the row
+            # lock is held just until the commit below, and a concurrent edit makes this match nothing.
+            if email_address != current_email:
+                email_claim = _claim_email(email_address, cust_no)  # global uniqueness when sharded
+            cursor.execute("""
+                UPDATE customer
+                SET custname = %s, datebirth = %s, nationality = %s, citizenship = %s, custsex = %s,
+                    placebirth = %s, civilstatus = %s, num_children = %s, mmaiden_name = %s,
+                    cust_address = %s, email_address = %s, contact_no = %s, registration_status = %s,
+                    occ_id = %s, fin_code = %s
+                WHERE cust_no = %s AND row_version = %s
+                RETURNING row_version;
+            """, (custname, datebirth, nationality, citizenship, custsex,
+                  placebirth, civilstatus, num_children, mmaiden_name,
+                  cust_address, email_address, contact_no, registration_status,
+                  current_occ_id, current_fin_code, # Use the potentially new/updated IDs
+                  str(cust_no), expected_version))
+            updated_version = cursor.fetchone()
+            if not updated_version:
+                return _edit_conflict(conn, cursor, cust_no, expected_version, submitted)
+            new_version = updated_version[0]
+
+            _screen_customer(cursor, cust_no, custname)
+            search_index.refresh_document(cursor, cust_no)
+            outbox.record(cursor, outbox.UPDATED, cust_no)
+            jobs.enqueue(cursor, 'duplicate_check', {'cust_no': str(cust_no)})
             conn.commit()
+            email_claim = None
+            customer_profile_cache.invalidate(cust_no, new_version)
+            if email_address != current_email:
+                _release_email((current_email, cust_no))
+            _mark_session_write()
+            availability_index.add_email(email_address)
+            if _wants_json():
+                return (jsonify(success=True, cust_no=str(cust_no), row_version=new_version), 200,
+                        {'ETag': concurrency.etag(new_version)})
             flash(f'Customer {cust_no} updated successfully!', 'success')
             return redirect(url_for('admin_dashboard_page'))
 
-        else: # GET request: Populate form with existing data
-            cursor.execute("""
-                SELECT
-                    c.custname, c.datebirth, c.nationality, c.citizenship, c.custsex, c.placebirth,
-                    c.civilstatus, c.num_children, c.mmaiden_name, c.cust_address, c.email_address,
-                    c.contact_no, c.registration_status,
-                    o.occ_type, o.bus_nature,
-                    f.source_wealth, f.mon_income, f.ann_income,
-                    e.tin_id, e.empname, e.emp_address, e.phonefax_no, e.job_title, e.emp_date,
-                    s.sp_name, s.sp_datebirth, s.sp_profession,
-                    comp.depositor_role, comp.dep_compname,
-                    eb.bank_code, eb.acc_type,
-                    po.gov_int_name, po.official_position, po.branch_orgname,
-                    cpr.relation_desc
-                FROM customer c
-                LEFT JOIN occupation o ON c.occ_id = o.occ_id
-                LEFT JOIN financial_record f ON c.fin_code = f.fin_code
-                LEFT JOIN employment_details emd ON c.cust_no = emd.cust_no
-                LEFT JOIN employer_details e ON emd.emp_id = e.emp_id
-                LEFT JOIN spouse s ON c.cust_no = s.cust_no
-                LEFT JOIN company_affiliation comp ON c.cust_no = comp.cust_no
-                LEFT JOIN existing_bank eb ON c.cust_no = eb.cust_no
-                LEFT JOIN cust_po_relationship cpr ON c.cust_no = cpr.cust_no
-                LEFT JOIN public_official_details po ON cpr.gov_int_id = po.gov_int_id
-                WHERE c.cust_no = %s;
-            """, (str(cust_no),))
-            
-            customer_data = cursor.fetchone()
-
-            if not customer_data:
-                flash('Customer not found.', 'danger')
-                return redirect(url_for('admin_dashboard_page'))
-
-            # Convert row to dictionary for easier access in template
-            columns = [desc[0] for desc in cursor.description]
-            customer = dict(zip(columns, customer_data))
-
-            # Split custname into first and last for form
-            full_name = customer.get('custname', '').strip()
-            name_parts = full_name.rsplit(' ', 1)
-            customer['firstName'] = name_parts[0] if len(name_parts) > 1 else full_name
-            customer['lastName'] = name_parts[1] if len(name_parts) > 1 else ''
-
-            # Split spouse name
-            spouse_full_name = customer.get('sp_name', '').strip()
-            spouse_name_parts = spouse_full_name.rsplit(' ', 1)
-            customer['spouseFirstName'] = spouse_name_parts[0] if len(spouse_name_parts) > 1 else spouse_full_name
-            customer['spouseLastName'] = spouse_name_parts[1] if len(spouse_name_parts) > 1 else ''
-
-            # Format dates for HTML input
-            if customer.get('datebirth'):
-                customer['datebirth'] = customer['datebirth'].isoformat()
-            if customer.get('emp_date'):
-                customer['emp_date'] = customer['emp_date'].isoformat()
-            if customer.get('sp_datebirth'):
-                customer['sp_datebirth'] = customer['sp_datebirth'].isoformat()
-            
-            # Convert source_wealth string back to list for checkboxes if needed, or handle in template
-            if customer.get('source_wealth'):
-                customer['sourceOfWealthList'] = [s.strip() for s in customer['source_wealth'].split(',')]
-            else:
-                customer['sourceOfWealthList'] = []
-
-            return render_template('admin_edit_customer.html', customer=customer, cust_no=str(cust_no))
 
+    except validation.ValidationError as err:
+        if _wants_json():
+            return jsonify(success=False, message='Some fields are missing or invalid.', errors=err.errors), 400
+        _flash_validation_errors(err)
+        return redirect(url_for('admin_edit_customer', cust_no=cust_no))
     except psycopg2.Error as err:
-        conn.rollback()
+        if conn:
+            conn.rollback()
         print(f"Database error during customer edit: {err}")
         if debug_mode:
             raise
@@ -1335,6 +2322,7 @@ def admin_edit_customer(cust_no):
             cursor.close()
         if conn:
             conn.close()
+        _release_email(email_claim)  # the edit did not commit
 
 # --- Customer Dashboard ---
 @app.route('/customer_dashboard')
@@ -1351,7 +2339,7 @@ def delete_customer(cust_no):
     conn = None
     cursor = None
     try:
-        conn = get_db_connection()
+        conn = get_db_connection(cust_no=cust_no)
         if not conn:
             flash('Database connection failed.', 'danger')
             return redirect(url_for('admin_dashboard_page'))
@@ -1360,14 +2348,16 @@ def delete_customer(cust_no):
         conn.autocommit = False # Start a transaction for deletion
 
         # Get related IDs before deleting the customer
-        cursor.execute("SELECT occ_id, fin_code FROM customer WHERE cust_no = %s;", (str(cust_no),))
+        cursor.execute("SELECT occ_id, fin_code, email_address FROM customer WHERE cust_no = %s;", (str(cust_no),))
         customer_fks = cursor.fetchone()
 
         occ_id = None
         fin_code = None
+        email_address = None
         if customer_fks:
             occ_id = customer_fks[0]
             fin_code = customer_fks[1]
+            email_address = customer_fks[2]
 
         # Delete from tables that have foreign keys referencing customer (ON DELETE CASCADE will handle many)
         # For tables with ON DELETE SET NULL, no explicit deletion is needed here,
@@ -1398,7 +2388,12 @@ def delete_customer(cust_no):
             if cursor.fetchone()[0] == 0: 
                 cursor.execute("DELETE FROM occupation WHERE occ_id = %s", (occ_id,))
 
+        if customer_fks:
+            outbox.record(cursor, outbox.DELETED, cust_no)
         conn.commit() 
+        customer_profile_cache.invalidate(cust_no)
+        _release_email((email_address, cust_no))
+        _mark_session_write()
         flash(f'Customer {cust_no} and all related records deleted successfully!', 'success')
         return redirect(url_for('admin_dashboard_page')) 
 
@@ -1428,4 +2423,10 @@ def delete_customer(cust_no):
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000)) 
     _ensure_database_schema() # Ensure schema on startup
+    if shard_router:
+        for shard_url in shard_router.shard_urls.values():
+            if shard_url != get_db_url():
+                _ensure_database_schema(shard_url)
+        sharding.prepare_directory(shard_router)  # slot map and registries; `python sharding.py init` backfills them
+    availability_index.ensure_built(_get_read_connection)
     app.run(debug=debug_mode, host='0.0.0.0', port=port) # Use 0.0.0.0 for Render deployment
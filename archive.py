@@ -0,0 +1,431 @@
+"""
+Hot/cold archival of inactive customers.
+
+    python archive.py run [--days 365] [--batch-size 500] [--pause 1.0] [--max-batches N] [--dry-run]
+    python archive.py stats
+    python archive.py restore CUST_NO [CUST_NO ...]
+
+Customers whose registration_status is 'Inactive' (deactivated by an admin, or rejected in the
+review queue, see review_queue.DECISION_STATUSES) and has not changed for archive_config
+['inactive_days'] are moved out of the customer tables: each customer becomes one row of
+customer_archive holding every row of the customer's graph (customer, occupation,
+financial_record, employer, credentials, spouse, affiliations, banks, official links, PEP
+screening matches) as one zlib-compressed JSON document by table: fetch_profile() builds the
+details page's CustomerProfile from it and restore() puts the rows back. The documents are
+compressed here rather than left to TOAST, which does not compress rows under about 2 kB (most
+customers).
+customer.status_changed_at is set by a trigger whenever the status changes; customers from before
+the column existed fall back to registered_at.
+
+run() works in batches of batch_size customers, one transaction each (rows picked with
+FOR UPDATE SKIP LOCKED, so an admin editing a customer is never blocked and the customer is
+skipped until the next run), sleeping pause_seconds between batches to keep the load on the
+primary low. Rows shared with customers that stay (occupation, financial_record, employer_details)
+are only deleted once nothing references them; public officials are never deleted. Derived rows
+(search documents, blocking keys, merge candidates) go with the customer through ON DELETE
+CASCADE; restore() refreshes the search document and queues a duplicate_check job for the rest.
+PEP matches carry reviewers' decisions (review_status), so they are archived and restored with
+the customer's own rows. Each batch records a customer.archived outbox event per customer, so
+dashboards and profile caches drop them. Every run is logged in customer_archive_run with the
+rows and bytes it moved: bytes_moved is the size of the hot rows deleted (pg_column_size, without
+index entries), archive_bytes the compressed documents written.
+
+With sharding, run it against each shard (DATABASE_URL=<shard URL>): an archived customer stays
+on the shard that owns its slot, and `sharding.py move` takes its customer_archive row along, so
+the details page (which routes by cust_no) finds it there; `archive.py restore` routes each
+customer to that shard the same way (DATABASE_SHARD_URLS set). The directory keeps the archived
+customers' email and username claims. Without sharding, an archived customer's email can be
+registered again, and restore() then fails on the email conflict.
+"""
+import argparse
+import datetime
+import json
+import time
+import zlib
+
+import psycopg2
+import psycopg2.extras
+
+from db_config import get_db_url, get_shard_urls, archive_config
+import jobs
+import outbox
+import search_index
+import sharding
+from repository import CustomerProfile, PROFILE_COLUMNS
+
+SCHEMA_SQL = """
+    ALTER TABLE customer ADD COLUMN IF NOT EXISTS status_changed_at TIMESTAMPTZ;
+    CREATE OR REPLACE FUNCTION customer_status_changed_trg() RETURNS trigger AS $$
+    BEGIN
+        IF NEW.registration_status IS DISTINCT FROM OLD.registration_status THEN
+            NEW.status_changed_at := now();
+        END IF;
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    DROP TRIGGER IF EXISTS customer_status_changed ON customer;
+    CREATE TRIGGER customer_status_changed BEFORE UPDATE OF registration_status ON customer
+        FOR EACH ROW EXECUTE FUNCTION customer_status_changed_trg();
+    CREATE INDEX IF NOT EXISTS idx_customer_archivable
+        ON customer ((COALESCE(status_changed_at, registered_at, '-infinity'::timestamptz)), cust_no)
+        WHERE registration_status = 'Inactive';
+
+    CREATE TABLE IF NOT EXISTS customer_archive (
+        cust_no UUID PRIMARY KEY,
+        custname VARCHAR(255),
+        email_address VARCHAR(255),
+        registration_status VARCHAR(50),
+        registered_at TIMESTAMPTZ,
+        archived_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        graph BYTEA NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_customer_archive_email ON customer_archive (email_address);
+
+    CREATE TABLE IF NOT EXISTS customer_archive_run (
+        run_id BIGSERIAL PRIMARY KEY,
+        started_at TIMESTAMPTZ NOT NULL,
+        finished_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        customers INTEGER NOT NULL,
+        rows_moved BIGINT NOT NULL,
+        bytes_moved BIGINT NOT NULL,
+        archive_bytes BIGINT NOT NULL,
+        tables JSONB NOT NULL
+    );
+"""
+
+INACTIVE_SINCE_SQL = "COALESCE(c.status_changed_at, c.registered_at, '-infinity'::timestamptz)"
+
+_ARCHIVABLE_SQL = f"""
+    FROM customer c
+    WHERE c.registration_status = 'Inactive'
+      AND {INACTIVE_SINCE_SQL} < now() - make_interval(secs => %(seconds)s)
+      {{not_admin}}
+"""
+PICK_SQL = f"""
+    SELECT c.cust_no {_ARCHIVABLE_SQL}
+    ORDER BY {INACTIVE_SINCE_SQL}, c.cust_no
+    LIMIT %(limit)s
+    FOR UPDATE OF c SKIP LOCKED;
+"""
+COUNT_SQL = f"SELECT count(*) {_ARCHIVABLE_SQL};"
+
+# Admin accounts are never archived (LOGIN_SQL takes the role from the admins table, where it exists).
+_NOT_ADMIN_SQL = "AND NOT EXISTS (SELECT 1 FROM admins a WHERE a.cust_no = c.cust_no)"
+
+# Rows outside the customer's own tables that its graph uses, in restore order (the customer row
+# goes after them). `hot` is the customer row being archived.
+_PARENT_TABLES = (
+    ('occupation', "FROM occupation t WHERE t.occ_id = hot.occ_id"),
+    ('financial_record', "FROM financial_record t WHERE t.fin_code = hot.fin_code"),
+    ('public_official_details', "FROM public_official_details t JOIN cust_po_relationship r "
+                                "ON r.gov_int_id = t.gov_int_id WHERE r.cust_no = hot.cust_no"),
+    ('employer_details', "FROM employer_details t JOIN employment_details r "
+                         "ON r.emp_id = t.emp_id WHERE r.cust_no = hot.cust_no"),
+)
+# Tables keyed by cust_no, restored after the customer row.
+_CHILD_TABLES = ('credentials', 'spouse', 'company_affiliation', 'existing_bank', 'employment_details',
+                 'cust_po_relationship', 'pep_screening_match')
+# Restored rows are filtered where they reference rows archive.py does not keep: a PEP match whose
+# official has since been deleted would have gone with it through ON DELETE CASCADE.
+_RESTORE_FILTERS = {
+    'pep_screening_match': "WHERE EXISTS (SELECT 1 FROM public_official_details p WHERE p.gov_int_id = r.gov_int_id)",
+}
+
+_GRAPH_SQL = "jsonb_build_object('customer', to_jsonb(hot), " + ", ".join(
+    f"'{table}', COALESCE((SELECT jsonb_agg(to_jsonb(t)) {source}), '[]'::jsonb)"
+    for table, source in _PARENT_TABLES + tuple(
+        (table, f"FROM {table} t WHERE t.cust_no = hot.cust_no") for table in _CHILD_TABLES)
+) + ")"
+
+GRAPH_SQL = f"""
+    SELECT hot.cust_no, hot.custname, hot.email_address, hot.registration_status, hot.registered_at,
+           {_GRAPH_SQL}::text
+    FROM customer hot
+    WHERE hot.cust_no = ANY(%(keys)s::uuid[]);
+"""
+
+STORE_SQL = """
+    INSERT INTO customer_archive (cust_no, custname, email_address, registration_status, registered_at, graph)
+    VALUES %s
+    ON CONFLICT (cust_no) DO UPDATE
+    SET custname = EXCLUDED.custname, email_address = EXCLUDED.email_address,
+        registration_status = EXCLUDED.registration_status, registered_at = EXCLUDED.registered_at,
+        archived_at = now(), graph = EXCLUDED.graph;
+"""
+
+# (table, DELETE) in foreign-key order. Shared parent rows go only once nothing references them.
+_DELETES = tuple(
+    (table, f"DELETE FROM {table} t WHERE t.cust_no = ANY(%(keys)s::uuid[])")
+    for table in _CHILD_TABLES
+) + (
+    ('employer_details', "DELETE FROM employer_details t WHERE t.emp_id = ANY(%(emp_ids)s::uuid[]) "
+                         "AND NOT EXISTS (SELECT 1 FROM employment_details x WHERE x.emp_id = t.emp_id)"),
+    ('customer', "DELETE FROM customer t WHERE t.cust_no = ANY(%(keys)s::uuid[])"),
+    ('occupation', "DELETE FROM occupation t WHERE t.occ_id = ANY(%(occ_ids)s::uuid[]) "
+                   "AND NOT EXISTS (SELECT 1 FROM customer x WHERE x.occ_id = t.occ_id)"),
+    ('financial_record', "DELETE FROM financial_record t WHERE t.fin_code = ANY(%(fin_codes)s::uuid[]) "
+                         "AND NOT EXISTS (SELECT 1 FROM customer x WHERE x.fin_code = t.fin_code)"),
+)
+
+ZLIB_LEVEL = 6
+
+_DATE_COLUMNS = ('datebirth', 'emp_date', 'sp_datebirth')
+# Graph tables whose first row fills the rest of the profile columns
+_PROFILE_TABLES = ('occupation', 'financial_record', 'employer_details', 'spouse', 'company_affiliation',
+                   'existing_bank')
+
+
+def ensure_schema(cursor):
+    cursor.execute(SCHEMA_SQL)
+
+
+def _policy_sql(cursor, sql):
+    """PICK_SQL or COUNT_SQL, excluding admins when this database has the admins table."""
+    cursor.execute("SELECT to_regclass('admins') IS NOT NULL;")
+    return sql.format(not_admin=_NOT_ADMIN_SQL if cursor.fetchone()[0] else '')
+
+
+def archive_batch(cursor, pick_sql, seconds, limit):
+    """
+    Moves up to `limit` archivable customers in the caller's transaction.
+    Returns (customers, {table: [rows, bytes]}, archive_bytes).
+    """
+    cursor.execute(pick_sql, {'seconds': seconds, 'limit': limit})
+    keys = [str(row[0]) for row in cursor.fetchall()]
+    if not keys:
+        return 0, {}, 0
+    cursor.execute(GRAPH_SQL, {'keys': keys})
+    documents = [row[:5] + (zlib.compress(row[5].encode(), ZLIB_LEVEL),) for row in cursor.fetchall()]
+    psycopg2.extras.execute_values(cursor, STORE_SQL, documents, page_size=len(documents))
+    archive_bytes = sum(len(document[5]) for document in documents)
+
+    cursor.execute("""
+        SELECT COALESCE(array_agg(DISTINCT occ_id::text) FILTER (WHERE occ_id IS NOT NULL), '{}'),
+               COALESCE(array_agg(DISTINCT fin_code::text) FILTER (WHERE fin_code IS NOT NULL), '{}'),
+               (SELECT COALESCE(array_agg(DISTINCT emp_id::text), '{}') FROM employment_details
+                WHERE cust_no = ANY(%(keys)s::uuid[]))
+        FROM customer WHERE cust_no = ANY(%(keys)s::uuid[]);
+    """, {'keys': keys})
+    occ_ids, fin_codes, emp_ids = cursor.fetchone()
+    params = {'keys': keys, 'occ_ids': occ_ids, 'fin_codes': fin_codes, 'emp_ids': emp_ids}
+
+    moved = {}
+    for table, delete_sql in _DELETES:
+        cursor.execute(f"""
+            WITH gone AS ({delete_sql} RETURNING pg_column_size(t.*) AS size)
+            SELECT count(*), COALESCE(sum(size), 0) FROM gone;
+        """, params)
+        rows, size = cursor.fetchone()
+        if rows:
+            moved[table] = [rows, int(size)]
+    outbox.record_many(cursor, outbox.ARCHIVED, keys)
+    return len(keys), moved, archive_bytes
+
+
+def run(conn, days=None, batch_size=None, pause_seconds=None, max_batches=None):
+    """
+    Archives every customer the policy selects (see the module docstring), batch by batch, and
+    logs the run. Returns {'customers', 'rows_moved', 'bytes_moved', 'archive_bytes', 'tables'}.
+    """
+    days = archive_config['inactive_days'] if days is None else days
+    batch_size = batch_size or archive_config['batch_size']
+    pause_seconds = archive_config['pause_seconds'] if pause_seconds is None else pause_seconds
+    started_at = datetime.datetime.now(datetime.timezone.utc)
+    totals = {'customers': 0, 'rows_moved': 0, 'bytes_moved': 0, 'archive_bytes': 0, 'tables': {}}
+    with conn.cursor() as cursor:
+        pick_sql = _policy_sql(cursor, PICK_SQL)
+    conn.commit()
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        try:
+            with conn.cursor() as cursor:
+                customers, moved, archive_bytes = archive_batch(cursor, pick_sql, days * 86400, batch_size)
+            conn.commit()
+        except psycopg2.Error:
+            conn.rollback()
+            raise
+        if not customers:
+            break
+        batches += 1
+        totals['customers'] += customers
+        totals['archive_bytes'] += archive_bytes
+        for table, (rows, size) in moved.items():
+            table_totals = totals['tables'].setdefault(table, [0, 0])
+            table_totals[0] += rows
+            table_totals[1] += size
+            totals['rows_moved'] += rows
+            totals['bytes_moved'] += size
+        print(f"Batch {batches}: archived {customers} customer(s), "
+              f"{sum(rows for rows, _ in moved.values())} row(s), {sum(size for _, size in moved.values()):,} bytes.")
+        if customers < batch_size:
+            break
+        time.sleep(pause_seconds)
+
+    if totals['customers']:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO customer_archive_run (started_at, customers, rows_moved, bytes_moved, archive_bytes, tables)
+                VALUES (%s, %s, %s, %s, %s, %s);
+            """, (started_at, totals['customers'], totals['rows_moved'], totals['bytes_moved'],
+                  totals['archive_bytes'], json.dumps(totals['tables'])))
+        conn.commit()
+    return totals
+
+
+def count_archivable(conn, days=None):
+    """How many customers a run would archive now (--dry-run)."""
+    days = archive_config['inactive_days'] if days is None else days
+    with conn.cursor() as cursor:
+        cursor.execute(_policy_sql(cursor, COUNT_SQL), {'seconds': days * 86400})
+        count = cursor.fetchone()[0]
+    conn.rollback()
+    return count
+
+
+def _load_graph(stored):
+    return json.loads(zlib.decompress(bytes(stored)))
+
+
+def profile_from_graph(graph):
+    """
+    The CustomerProfile of an archived graph: the customer row plus the first row of each related
+    table, as the profile join shows it.
+    """
+    values = dict.fromkeys(PROFILE_COLUMNS)
+    relationship = (graph.get('cust_po_relationship') or [{}])[0]
+    official = next((row for row in graph.get('public_official_details') or []
+                     if row.get('gov_int_id') == relationship.get('gov_int_id')), {})
+    for row in [graph['customer'], official, relationship] + [
+            (graph.get(table) or [{}])[0] for table in _PROFILE_TABLES]:
+        values.update((column, value) for column, value in row.items() if column in values and value is not None)
+    values['cust_no'] = graph['customer']['cust_no']
+    for column in _DATE_COLUMNS:
+        if values[column]:
+            values[column] = datetime.date.fromisoformat(values[column])
+    return CustomerProfile(**values)
+
+
+def fetch_profile(cursor, cust_no):
+    """(CustomerProfile, archived_at) of an archived customer, or None if it is not in the archive."""
+    cursor.execute("SELECT graph, archived_at FROM customer_archive WHERE cust_no = %s;", (str(cust_no),))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    return profile_from_graph(_load_graph(row[0])), row[1]
+
+
+def restore(conn, cust_no):
+    """
+    Moves an archived customer back into the customer tables (status_changed_at reset to now, so
+    the next run does not archive it straight away). Returns False if it is not in the archive.
+    Raises psycopg2.IntegrityError if its email or username has been taken since.
+    """
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT graph FROM customer_archive WHERE cust_no = %s FOR UPDATE;", (str(cust_no),))
+            row = cursor.fetchone()
+            if not row:
+                conn.rollback()
+                return False
+            graph = _load_graph(row[0])
+            for table, _ in _PARENT_TABLES:
+                if graph.get(table):
+                    cursor.execute(f"""
+                        INSERT INTO {table} SELECT * FROM jsonb_populate_recordset(NULL::{table}, %s::jsonb)
+                        ON CONFLICT DO NOTHING;
+                    """, (json.dumps(graph[table]),))
+            cursor.execute("""
+                INSERT INTO customer
+                SELECT * FROM jsonb_populate_record(NULL::customer, %s::jsonb || jsonb_build_object('status_changed_at', now()));
+            """, (json.dumps(graph['customer']),))
+            for table in _CHILD_TABLES:
+                if graph.get(table):
+                    cursor.execute(f"""
+                        INSERT INTO {table} SELECT * FROM jsonb_populate_recordset(NULL::{table}, %s::jsonb) r
+                        {_RESTORE_FILTERS.get(table, '')}
+                        ON CONFLICT DO NOTHING;
+                    """, (json.dumps(graph[table]),))
+            cursor.execute("DELETE FROM customer_archive WHERE cust_no = %s;", (str(cust_no),))
+            search_index.refresh_document(cursor, cust_no)
+            outbox.record(cursor, outbox.CREATED, str(cust_no))
+            jobs.enqueue(cursor, 'duplicate_check', {'cust_no': str(cust_no)})
+        conn.commit()
+        return True
+    except psycopg2.Error:
+        conn.rollback()
+        raise
+
+
+def stats(conn):
+    archivable = count_archivable(conn)
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT count(*), pg_total_relation_size('customer_archive'), pg_total_relation_size('customer'),
+                   (SELECT count(*) FROM customer)
+            FROM customer_archive;
+        """)
+        archived, archive_size, customer_size, hot = cursor.fetchone()
+        cursor.execute("""
+            SELECT started_at, finished_at, customers, rows_moved, bytes_moved, archive_bytes
+            FROM customer_archive_run ORDER BY run_id DESC LIMIT 5;
+        """)
+        runs = cursor.fetchall()
+    conn.rollback()
+    print(f"Hot customers:      {hot:,} ({customer_size / 1e6:,.1f} MB for the customer table and its indexes)")
+    print(f"Archived customers: {archived:,} ({archive_size / 1e6:,.1f} MB for customer_archive)")
+    print(f"Archivable now:     {archivable:,} (Inactive for {archive_config['inactive_days']:g}+ days)")
+    for started_at, finished_at, customers, rows_moved, bytes_moved, archive_bytes in runs:
+        print(f"  run {started_at:%Y-%m-%d %H:%M}: {customers:,} customer(s), {rows_moved:,} row(s), "
+              f"{bytes_moved:,} bytes moved, {archive_bytes:,} archive bytes, "
+              f"{(finished_at - started_at).total_seconds():.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hot/cold archival of inactive customers (see archive.py).")
+    sub = parser.add_subparsers(dest='command', required=True)
+    run_parser = sub.add_parser('run', help='Move archivable customers to customer_archive.')
+    run_parser.add_argument('--days', type=float, default=archive_config['inactive_days'])
+    run_parser.add_argument('--batch-size', type=int, default=archive_config['batch_size'])
+    run_parser.add_argument('--pause', type=float, default=archive_config['pause_seconds'])
+    run_parser.add_argument('--max-batches', type=int)
+    run_parser.add_argument('--dry-run', action='store_true', help='Only count the customers a run would move.')
+    sub.add_parser('stats', help='Hot and archived customer counts and the last runs.')
+    restore_parser = sub.add_parser('restore', help='Move archived customers back.')
+    restore_parser.add_argument('cust_nos', nargs='+')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(get_db_url())
+    try:
+        with conn.cursor() as cursor:
+            ensure_schema(cursor)
+        conn.commit()
+        if args.command == 'run':
+            if args.dry_run:
+                print(f"{count_archivable(conn, args.days):,} customer(s) would be archived.")
+                return
+            totals = run(conn, args.days, args.batch_size, args.pause, args.max_batches)
+            print(f"Archived {totals['customers']:,} customer(s): {totals['rows_moved']:,} row(s), "
+                  f"{totals['bytes_moved']:,} bytes moved out of the hot tables, "
+                  f"{totals['archive_bytes']:,} bytes written to the archive.")
+            for table, (rows, size) in sorted(totals['tables'].items()):
+                print(f"  {table:<24}{rows:>10,} row(s){size:>14,} bytes")
+        elif args.command == 'stats':
+            stats(conn)
+        elif args.command == 'restore':
+            # With shards, each customer is restored on the shard that owns its slot now.
+            router = sharding.ShardRouter(get_shard_urls(), get_db_url()) if get_shard_urls() else None
+            for cust_no in args.cust_nos:
+                target = router.connect_for(cust_no, for_write=True) if router else conn
+                try:
+                    print(f"{cust_no}: {'restored' if restore(target, cust_no) else 'not in the archive'}")
+                except psycopg2.IntegrityError as err:
+                    print(f"{cust_no}: not restored, {str(err).strip().splitlines()[0]}")
+                finally:
+                    if router:
+                        target.close()
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+import hashlib
+import math
+import threading
+import time
+
+import psycopg2
+
+
+class BloomFilter:
+    """
+    A fixed-size Bloom filter over strings.
+    A negative answer from might_contain() is definite; a positive answer only means "maybe".
+    """
+
+    def __init__(self, expected_items, false_positive_rate=0.01):
+        expected_items = max(int(expected_items), 1)
+        # Standard sizing: m = -n ln(p) / (ln 2)^2, k = (m / n) ln 2
+        self.num_bits = max(int(-expected_items * math.log(false_positive_rate) / (math.log(2) ** 2)), 64)
+        self.num_hashes = max(int(round(self.num_bits / expected_items * math.log(2))), 1)
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        # Double hashing (Kirsch-Mitzenmacher): two 64-bit halves of one digest give all k positions.
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, value):
+        for pos in self._positions(value):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def might_contain(self, value):
+        for pos in self._positions(value):
+            if not self.bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+
+class AvailabilityIndex:
+    """
+    Per-worker index of taken emails and usernames.
+    Built with a streaming scan and kept current by this worker's write paths through
+    add_email()/add_username(); values added while a build is scanning are replayed into the new
+    filters when they are swapped in. Other workers, batch jobs and shard writes never reach this
+    worker's filters, so ensure_built() rebuilds them in the background once they are older than
+    rebuild_seconds: a value taken elsewhere can read as available for at most that long.
+    Values are stored exactly as the database stores them, matching the UNIQUE constraints
+    customer_email_address_key and credentials_username_key.
+    """
+
+    # Headroom over the current row count so the filter keeps its error rate as registrations come in.
+    GROWTH_FACTOR = 2
+    FETCH_SIZE = 10000
+
+    def __init__(self, false_positive_rate=0.01, use_registries=False, sharded=False, rebuild_seconds=300):
+        self.false_positive_rate = false_positive_rate
+        self.rebuild_seconds = rebuild_seconds
+        # With the partitioned layout, exact lookups go through the unpartitioned registry tables
+        # so they hit one unique index instead of probing every partition (see partitioning.py).
+        # With shards, the directory's global registries are the only complete source (see sharding.py).
+        if sharded:
+            self.email_table, self.username_table = 'shard_email_registry', 'shard_username_registry'
+        elif use_registries:
+            self.email_table, self.username_table = 'customer_email_registry', 'credentials_username_registry'
+        else:
+            self.email_table, self.username_table = 'customer', 'credentials'
+        self.email_lookup_sql = f"SELECT 1 FROM {self.email_table} WHERE email_address = %s;"
+        self.username_lookup_sql = f"SELECT 1 FROM {self.username_table} WHERE username = %s;"
+        self.emails = None
+        self.usernames = None
+        self.ready = False
+        self.built_at = 0.0
+        self._building = False
+        self._pending_emails = []
+        self._pending_usernames = []
+        self._lock = threading.Lock()
+
+    def _estimate_rows(self, cursor, table_name):
+        # reltuples is a planner estimate, but it is free and good enough to size the filter.
+        # Partitioned parents report no tuples of their own, so their partitions are summed in.
+        cursor.execute("""
+            SELECT COALESCE(sum(GREATEST(reltuples, 0)), 0)::bigint FROM pg_class
+            WHERE oid = %s::regclass OR oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = %s::regclass);
+        """, (table_name, table_name))
+        return max(cursor.fetchone()[0], 1000)
+
+    def _stream_column(self, conn, name, sql, bloom):
+        # Named (server-side) cursor so the scan never materializes the whole column in memory.
+        with conn.cursor(name=name) as stream:
+            stream.itersize = self.FETCH_SIZE
+            stream.execute(sql)
+            for (value,) in stream:
+                if value is not None:
+                    bloom.add(value)
+
+    def _start_recording(self):
+        # Called with the lock held: from now until the swap, adds are also kept for the new filters.
+        self._building = True
+        self._pending_emails = []
+        self._pending_usernames = []
+
+    def build(self, conn):
+        """Scans customer emails and credential usernames into fresh filters and swaps them in."""
+        with self._lock:
+            if not self._building:  # a background rebuild claims the flag in ensure_built()
+                self._start_recording()
+        try:
+            with conn.cursor() as cursor:
+                email_rows = self._estimate_rows(cursor, self.email_table)
+                username_rows = self._estimate_rows(cursor, self.username_table)
+            emails = BloomFilter(email_rows * self.GROWTH_FACTOR, self.false_positive_rate)
+            usernames = BloomFilter(username_rows * self.GROWTH_FACTOR, self.false_positive_rate)
+            self._stream_column(conn, 'availability_emails', f"SELECT email_address FROM {self.email_table};", emails)
+            self._stream_column(conn, 'availability_usernames', f"SELECT username FROM {self.username_table};", usernames)
+            conn.rollback()  # End the read-only transaction opened by the named cursors
+            with self._lock:
+                # Values this worker committed while the scan ran may be missing from its snapshot.
+                for email_address in self._pending_emails:
+                    emails.add(email_address)
+                for username in self._pending_usernames:
+                    usernames.add(username)
+                self.emails = emails
+                self.usernames = usernames
+                self.ready = True
+                self.built_at = time.monotonic()
+        finally:
+            with self._lock:
+                self._building = False
+                self._pending_emails = []
+                self._pending_usernames = []
+        print(f"Availability index built: {emails.count} emails, {usernames.count} usernames.")
+
+    def _build_with(self, connection_factory):
+        conn = connection_factory()
+        if not conn:
+            with self._lock:
+                self._building = False
+            return False
+        try:
+            self.build(conn)
+        except psycopg2.Error as err:
+            print(f"Error building availability index: {err}")
+            return False
+        finally:
+            conn.close()
+        return True
+
+    def ensure_built(self, connection_factory):
+        """
+        Builds the index on first use in this worker. Returns False if the database is unreachable.
+        Once the filters are older than rebuild_seconds, a background thread rebuilds them while
+        the current ones keep answering.
+        """
+        if not self.ready:
+            return self._build_with(connection_factory)
+        if time.monotonic() - self.built_at >= self.rebuild_seconds:
+            with self._lock:
+                if self._building:
+                    return True
+                self._start_recording()  # claimed here so concurrent requests start one rebuild only
+            threading.Thread(target=self._build_with, args=(connection_factory,),
+                             name='availability-rebuild', daemon=True).start()
+        return True
+
+    def add_email(self, email_address):
+        if email_address:
+            with self._lock:
+                if self._building:
+                    self._pending_emails.append(email_address)
+                if self.ready:
+                    self.emails.add(email_address)
+
+    def add_username(self, username):
+        if username:
+            with self._lock:
+                if self._building:
+                    self._pending_usernames.append(username)
+                if self.ready:
+                    self.usernames.add(username)
+
+    def is_email_available(self, email_address, connection_factory):
+        return self._is_available(email_address, self.emails, self.email_lookup_sql, connection_factory)
+
+    def is_username_available(self, username, connection_factory):
+        return self._is_available(username, self.usernames, self.username_lookup_sql, connection_factory)
+
+    def _is_available(self, value, bloom, lookup_sql, connection_factory):
+        """
+        Returns True/False, or None when the answer could not be determined.
+        A filter miss answers "free" without touching the database (definite for everything
+        committed before the last build, see the class docstring); only a "maybe taken" falls
+        through to the unique-index lookup.
+        """
+        if self.ready and not bloom.might_contain(value):
+            return True
+        conn = connection_factory()
+        if not conn:
+            return None
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(lookup_sql, (value,))
+                return cursor.fetchone() is None
+        except psycopg2.Error as err:
+            print(f"Database error during availability lookup: {err}")
+            return None
+        finally:
+            conn.close()
@@ -0,0 +1,150 @@
+"""
+Customer creation throughput: batches with multi-row inserts (customer_batch.py) vs one customer per transaction.
+
+    python benchmarks/bench_batch_create.py [--customers 2000] [--chunk-sizes 10,100,500]
+
+WRITES to the configured database; point DATABASE_URL at a scratch copy. Creates --customers
+customers (employed, married, with a bank account; every third related to a public official)
+through:
+  - one transaction per customer with one INSERT per table, as /submitRegistration and the admin
+    add form do (customer_batch.insert_chunk with a single entry, then COMMIT);
+  - customer_batch.write_group over the whole set in one transaction, at each --chunk-sizes value.
+Reports customers/sec and statements per customer, then deletes everything it created. PEP
+screening is left out of both (it is the same in-process work per customer either way).
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from db_config import get_db_url  # noqa: E402
+from connection_pool import PooledConnection  # noqa: E402
+from uuid7 import uuid7  # noqa: E402
+import customer_batch  # noqa: E402
+
+
+class CountingCursor(psycopg2.extensions.cursor):
+    statements = 0
+
+    def execute(self, query, vars=None):
+        CountingCursor.statements += 1
+        return super().execute(query, vars)
+
+
+def make_payloads(count, tag, bank_code):
+    payloads = []
+    for i in range(count):
+        official = i % 3 == 0
+        payloads.append(customer_batch.validate_item({
+            'registration1': {
+                'firstName': f'Bench{i}', 'lastName': f'Batch{tag}', 'dob': '1988-04-17', 'nationality': 'Filipino',
+                'citizenship': 'Filipino', 'sex': 'Female', 'civilStatus': 'Married', 'children': '2',
+                'address': '12 Mabini St., Quezon City', 'email': f'bench.{tag}.{i}@example.com',
+                'telephone': '0917-555-0101', 'spouseFirstName': 'Jose', 'spouseLastName': f'Batch{tag}',
+                'spouseDob': '1986-09-02',
+            },
+            'registration2': {
+                'occupation': 'Employed', 'natureOfBusiness': 'Information Technology',
+                'sourceOfWealth': ['Salary/Honoraria'], 'monthlyIncome': '50000_01_to_100000',
+                'annualIncome': '600000_01_to_1200000', 'companyName': 'Acme Corp.', 'jobTitle': 'Analyst',
+            },
+            'registration3': dict(
+                {'bankCode': bank_code, 'accountType': 'Savings'},
+                **({'governmentOfficialName': f'Bench Official {tag} {i % 30}', 'officialPosition': 'Mayor',
+                    'relationshipNature': 'Cousin'} if official else {})),
+        }))
+    return payloads
+
+
+def no_screen(cursor, cust_no, custname):
+    pass
+
+
+def run_single(conn, payloads):
+    cust_nos = []
+    with conn.cursor() as cursor:
+        for payload in payloads:
+            cust_no = str(uuid7())
+            customer_batch.insert_chunk(cursor, [(cust_no, payload)], no_screen)
+            conn.commit()
+            cust_nos.append(cust_no)
+    return cust_nos
+
+
+def run_batch(conn, payloads, chunk_size):
+    items = [(index, str(uuid7()), payload) for index, payload in enumerate(payloads)]
+    results, created = customer_batch.write_group(conn, items, chunk_size, no_screen)
+    conn.commit()
+    if len(created) != len(items):
+        print(f"  {len(items) - len(created)} customers failed: {next(iter(results.values()))}")
+    return [cust_no for _, cust_no, _ in items]
+
+
+def cleanup(conn, cust_nos, tags):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT occ_id, fin_code FROM customer WHERE cust_no = ANY(%s::uuid[]);", (cust_nos,))
+        keys = cursor.fetchall()
+        cursor.execute("""
+            DELETE FROM employer_details WHERE emp_id IN
+                (SELECT emp_id FROM employment_details WHERE cust_no = ANY(%s::uuid[]));
+        """, (cust_nos,))
+        cursor.execute("DELETE FROM customer WHERE cust_no = ANY(%s::uuid[]);", (cust_nos,))
+        cursor.execute("DELETE FROM occupation WHERE occ_id = ANY(%s::uuid[]);", ([str(k[0]) for k in keys if k[0]],))
+        cursor.execute("DELETE FROM financial_record WHERE fin_code = ANY(%s::uuid[]);",
+                       ([str(k[1]) for k in keys if k[1]],))
+        cursor.execute("DELETE FROM customer_outbox WHERE cust_no = ANY(%s::uuid[]);", (cust_nos,))
+        cursor.execute("DELETE FROM background_job WHERE job_type = 'duplicate_check' AND payload->>'cust_no' = ANY(%s);",
+                       (cust_nos,))
+        for tag in tags:
+            cursor.execute("DELETE FROM public_official_details WHERE gov_int_name LIKE %s;", (f'Bench Official {tag} %',))
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--customers', type=int, default=2000)
+    parser.add_argument('--chunk-sizes', default='10,100,500')
+    args = parser.parse_args()
+    chunk_sizes = [int(size) for size in args.chunk_sizes.split(',') if size.strip()]
+
+    conn = psycopg2.connect(get_db_url(), connection_factory=PooledConnection)
+    conn.cursor_factory = CountingCursor
+    created = []
+    tags = []
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT bank_code FROM bank_details ORDER BY bank_code LIMIT 1;")
+            row = cursor.fetchone()
+        conn.commit()
+        if not row:
+            print("bank_details is empty; run the app once so the schema and bank list are created.")
+            return
+
+        print(f"{'mode':<26}{'customers':>10}{'seconds':>9}{'customers/sec':>15}{'stmts/customer':>16}")
+        runs = [('one per transaction', None)] + [(f'batch, chunks of {size}', size) for size in chunk_sizes]
+        for label, chunk_size in runs:
+            tag = uuid.uuid4().hex[:8]
+            tags.append(tag)
+            payloads = make_payloads(args.customers, tag, row[0])
+            CountingCursor.statements = 0
+            started = time.perf_counter()
+            if chunk_size is None:
+                created.extend(run_single(conn, payloads))
+            else:
+                created.extend(run_batch(conn, payloads, chunk_size))
+            seconds = time.perf_counter() - started
+            print(f"{label:<26}{len(payloads):>10,}{seconds:>9.2f}{len(payloads) / seconds:>15,.0f}"
+                  f"{CountingCursor.statements / len(payloads):>16.2f}")
+    finally:
+        conn.rollback()
+        cleanup(conn, created, tags)
+        conn.close()
+        print(f"\nRemoved the {len(created):,} benchmark customers.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+CPU cost vs bytes saved of response compression (compression.py) on a 10k-row admin dashboard.
+
+    python benchmarks/bench_compression.py [--rows 10000] [--repeat 5] [--chunk-size 8192]
+
+Renders templates/admin_dashboard.html with synthetic customers (no database needed), then sends
+the page through CompressionMiddleware at several gzip levels and brotli qualities (brotli only if
+the package is installed), both as a buffered response (with Content-Length) and as a streamed one
+(chunks of --chunk-size bytes, no Content-Length, flushed per chunk). For each setting it reports
+the compressed size, the ratio, and the CPU time spent per response.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import uuid
+
+from flask import Flask, render_template
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import compression  # noqa: E402
+from compression import CompressionMiddleware  # noqa: E402
+
+FIRST_NAMES = ['Juan', 'Maria', 'Jose', 'Ana', 'Pedro', 'Rosa', 'Mark', 'Grace', 'Paolo', 'Liza', 'Ramon', 'Cristina']
+LAST_NAMES = ['Dela Cruz', 'Santos', 'Reyes', 'Garcia', 'Mendoza', 'Bautista', 'Villanueva', 'Ramos', 'Aquino']
+STATUSES = ['Active', 'Pending', 'Inactive']
+
+
+def render_dashboard(rows):
+    """The dashboard HTML for `rows` synthetic customers, rendered by a bare app with the real template."""
+    app = Flask(__name__, template_folder=os.path.join(os.path.dirname(compression.__file__), 'templates'))
+    for endpoint, rule in [('logout', '/logout'), ('admin_dashboard_page', '/admin_dashboard'),
+                           ('admin_add_customer', '/admin/add_customer'), ('delete_customer', '/delete_customer'),
+                           ('admin_view_customer', '/admin/view/<cust_no>'),
+                           ('admin_edit_customer', '/admin/edit/<cust_no>')]:
+        app.add_url_rule(rule, endpoint, lambda **kwargs: '')
+    rng = random.Random(7)
+    customers = []
+    for n in range(rows):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        customers.append({
+            'cust_no': str(uuid.UUID(int=rng.getrandbits(128))),
+            'custname': f"{first} {last}",
+            'email_address': f"{first.lower()}.{last.replace(' ', '').lower()}{n}@example.com",
+            'contact_no': f"0917{n:07d}",
+            'status': rng.choice(STATUSES),
+        })
+    with app.test_request_context('/admin_dashboard'):
+        return render_template('admin_dashboard.html', customers=customers).encode('utf-8')
+
+
+def run(page, coding, level, streamed, chunk_size):
+    """One response through the middleware; returns (compressed bytes, CPU seconds)."""
+    def wsgi_app(environ, start_response):
+        headers = [('Content-Type', 'text/html; charset=utf-8')]
+        if streamed:
+            start_response('200 OK', headers)
+            return (page[start:start + chunk_size] for start in range(0, len(page), chunk_size))
+        start_response('200 OK', headers + [('Content-Length', str(len(page)))])
+        return [page]
+
+    config = {'enabled': True, 'min_size': 1024, 'gzip_level': level, 'brotli_quality': level}
+    middleware = CompressionMiddleware(wsgi_app, config)
+    environ = {'REQUEST_METHOD': 'GET', 'HTTP_ACCEPT_ENCODING': coding}
+    started = time.process_time()
+    body = b''.join(middleware(environ, lambda status, headers, exc_info=None: None))
+    return len(body), time.process_time() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--chunk-size', type=int, default=8192)
+    args = parser.parse_args()
+
+    page = render_dashboard(args.rows)
+    print(f"Dashboard with {args.rows} rows: {len(page) / 1024:,.0f} KiB uncompressed")
+    settings = [('gzip', level) for level in (1, 6, 9)]
+    if compression.brotli is not None:
+        settings += [('br', quality) for quality in (1, 4, 6)]
+    else:
+        print("brotli is not installed; gzip only")
+    print(f"{'coding':<8}{'level':>6}{'mode':>10}{'KiB':>10}{'ratio':>8}{'CPU ms':>10}{'KiB saved/CPU ms':>18}")
+    for coding, level in settings:
+        for streamed in (False, True):
+            sizes, cpu = [], []
+            for _ in range(args.repeat):
+                size, seconds = run(page, coding, level, streamed, args.chunk_size)
+                sizes.append(size)
+                cpu.append(seconds)
+            size, milliseconds = sizes[0], min(cpu) * 1000
+            saved = (len(page) - size) / 1024
+            print(f"{coding:<8}{level:>6}{'streamed' if streamed else 'buffered':>10}{size / 1024:>10,.0f}"
+                  f"{len(page) / size:>8.1f}{milliseconds:>10.1f}{saved / max(milliseconds, 0.001):>18,.0f}")
+
+
+if __name__ == '__main__':
+    main()
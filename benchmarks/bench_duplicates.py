@@ -0,0 +1,103 @@
+"""
+Throughput and quality of the full duplicate-detection run (duplicate_detection.find_duplicates).
+
+    python benchmarks/bench_duplicates.py [--customers 1000000] [--duplicate-share 0.02] [--workers 1,2,4,8]
+
+Runs in memory, no database: generates customer records, re-registers a share of them with a new
+email-style variation (abbreviated or reordered name, typo, reformatted phone, dropped maiden
+name), then runs blocking + scoring across a process pool per worker count and reports
+customers/sec, the number of candidate pairs, and recall/precision against the planted duplicates.
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import duplicate_detection  # noqa: E402
+
+FIRST_NAMES = ['Juan', 'Maria', 'Jose', 'Ana', 'Pedro', 'Rosa', 'Mark', 'Grace', 'Paolo', 'Liza', 'Ramon',
+               'Cristina', 'Francisco', 'Teresa', 'Antonio', 'Carmela', 'Rodrigo', 'Imelda', 'Miguel', 'Angelica']
+LAST_NAMES = ['Dela Cruz', 'Santos', 'Reyes', 'Garcia', 'Mendoza', 'Bautista', 'Villanueva', 'Ramos', 'Aquino',
+              'Castillo', 'Delos Santos', 'Fernandez', 'Gonzales', 'Lopez', 'Marquez', 'Navarro', 'Pascual', 'Salazar']
+SYLLABLES = [c + v for c in 'bcdglmnprstvy' for v in 'aeiou'] + ['ng', 'an', 'on', 'in']
+CITIES = ['Quezon City', 'Manila', 'Makati', 'Pasig', 'Cebu City', 'Davao City', 'Iloilo City', 'Baguio']
+
+
+def surname(rng):
+    if rng.random() < 0.3:
+        return rng.choice(LAST_NAMES)
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+
+
+def make_customer(rng):
+    birth = datetime.date(1950, 1, 1) + datetime.timedelta(days=rng.randrange(20000))
+    return (
+        str(uuid.uuid4()),
+        f"{rng.choice(FIRST_NAMES)} {rng.choice(SYLLABLES)[0].upper()}. {surname(rng)}",
+        birth.isoformat(),
+        f"{rng.choice(FIRST_NAMES)} {surname(rng)}",
+        f"09{rng.randrange(10 ** 9):09d}",
+        f"{rng.randint(1, 999)} {surname(rng)} St., {rng.choice(CITIES)}",
+    )
+
+
+def make_duplicate(rng, record):
+    _, custname, datebirth, mmaiden_name, contact_no, cust_address = record
+    if rng.random() < 0.3:
+        custname = custname.replace('Maria', 'Ma.').replace('Francisco', 'Fco.')
+    if rng.random() < 0.3:
+        first, rest = custname.split(' ', 1)
+        custname = f"{rest}, {first}"
+    if rng.random() < 0.3:
+        i = rng.randrange(1, len(custname) - 1)
+        custname = custname[:i] + custname[i + 1:]
+    if rng.random() < 0.5:
+        contact_no = f"+63 {contact_no[1:4]} {contact_no[4:7]} {contact_no[7:]}"
+    if rng.random() < 0.2:
+        mmaiden_name = None
+    if rng.random() < 0.3:
+        contact_no = f"09{rng.randrange(10 ** 9):09d}"  # changed number since the first registration
+    return (str(uuid.uuid4()), custname, datebirth, mmaiden_name, contact_no, cust_address)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--customers', type=int, default=1_000_000)
+    parser.add_argument('--duplicate-share', type=float, default=0.02)
+    parser.add_argument('--workers', default='1,2,4,8')
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    records = [make_customer(rng) for _ in range(args.customers)]
+    planted = set()
+    for original in rng.sample(records, int(args.customers * args.duplicate_share)):
+        duplicate = make_duplicate(rng, original)
+        records.append(duplicate)
+        planted.add(tuple(sorted((original[0], duplicate[0]))))
+    rng.shuffle(records)
+    print(f"{len(records):,} customer records, {len(planted):,} planted duplicates")
+
+    by_id = {record[0]: record for record in records}
+
+    def fetch_records(cust_nos):
+        return [by_id[cust_no] for cust_no in cust_nos]
+
+    for workers in [int(w) for w in args.workers.split(',')]:
+        started = time.perf_counter()
+        customers, rows, oversized = duplicate_detection.find_duplicates(records, fetch_records, workers,
+                                                                         args.chunk_size)
+        seconds = time.perf_counter() - started
+        found = {row[:2] for row in rows}
+        recall = len(found & planted) / len(planted) if planted else 0
+        precision = len(found & planted) / len(found) if found else 0
+        print(f"{workers} worker(s): {customers:,} customers in {seconds:.1f}s ({customers / seconds:,.0f} customers/sec); "
+              f"{len(rows):,} candidates, recall {recall:.3f}, precision {precision:.3f}, {oversized} oversized block(s)")
+
+
+if __name__ == '__main__':
+    main()
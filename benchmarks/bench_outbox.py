@@ -0,0 +1,193 @@
+"""
+Cost and latency of the customer change feed (outbox.py).
+
+    python benchmarks/bench_outbox.py [--transactions 5000] [--threads 8] [--rate 200] [--lag-events 2000] [--backlog 100000]
+
+Needs customers in the configured database (e.g. from seed_data.py) and writes to it, so point it at a
+scratch copy: customer rows are only rewritten with their own values, but the events it produces
+(deleted again at the end) pass through any live feed consumer. Three measurements:
+  - write: --transactions edit-shaped transactions (UPDATE of one customer row) over --threads
+    connections, without and with outbox.record() in the transaction; tx/sec and p50/p95 latency;
+  - lag: a writer commits --lag-events changes at --rate per second while a consumer long-polls
+    with outbox.wait_and_fetch(); end-to-end lag from commit to delivery, p50/p95/max;
+  - drain: --backlog events inserted at once, then read in outbox_config['max_batch'] pages
+    (positions assigned on the way, as a consumer catching up would); events/sec.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from db_config import get_db_url, outbox_config  # noqa: E402
+from connection_pool import PooledConnection  # noqa: E402
+import outbox  # noqa: E402
+
+UPDATE_SQL = "UPDATE customer SET contact_no = contact_no WHERE cust_no = %s;"
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)] if values else 0.0
+
+
+def write_phase(keys, threads, with_outbox):
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(chunk):
+        # PooledConnection, as in the app, so outbox.record() runs as a prepared statement
+        conn = psycopg2.connect(get_db_url(), connection_factory=PooledConnection)
+        own = []
+        try:
+            with conn.cursor() as cursor:
+                for key in chunk:
+                    started = time.perf_counter()
+                    cursor.execute(UPDATE_SQL, (key,))
+                    if with_outbox:
+                        outbox.record(cursor, outbox.UPDATED, key)
+                    conn.commit()
+                    own.append(time.perf_counter() - started)
+        finally:
+            conn.close()
+        with lock:
+            latencies.extend(own)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(keys[i::threads],)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return len(keys) / (time.perf_counter() - started), latencies
+
+
+def lag_phase(keys, rate, head):
+    committed = {}
+    lags = []
+    done = threading.Event()
+
+    def consume():
+        conn = psycopg2.connect(get_db_url())
+        outbox.listen(conn)
+        after = head
+        try:
+            while len(lags) < len(keys) and not (done.is_set() and not committed):
+                rows = outbox.wait_and_fetch(conn, after, outbox_config['max_batch'], 1.0)
+                received = time.time()
+                for position, line in rows:
+                    commit_time = committed.pop(json.loads(line)['cust_no'], None)
+                    if commit_time is not None:
+                        lags.append(received - commit_time)
+                    after = position
+        finally:
+            conn.close()
+
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    conn = psycopg2.connect(get_db_url(), connection_factory=PooledConnection)
+    try:
+        with conn.cursor() as cursor:
+            interval = 1.0 / rate
+            next_at = time.perf_counter()
+            for key in keys:
+                next_at += interval
+                time.sleep(max(next_at - time.perf_counter(), 0))
+                cursor.execute(UPDATE_SQL, (key,))
+                outbox.record(cursor, outbox.UPDATED, key)
+                conn.commit()
+                committed[key] = time.time()
+    finally:
+        conn.close()
+    done.set()
+    consumer.join(timeout=30)
+    return lags
+
+
+def drain_phase(conn, backlog, head):
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO customer_outbox (cust_no, event_type, payload)
+            SELECT c.cust_no, %s, to_jsonb(c) FROM customer c, generate_series(1, %s / GREATEST((SELECT count(*) FROM customer), 1) + 1)
+            LIMIT %s;
+        """, (outbox.UPDATED, backlog, backlog))
+        inserted = cursor.rowcount
+    conn.commit()
+    started = time.perf_counter()
+    after = head
+    read = 0
+    while read < inserted:
+        rows = outbox.fetch(conn, after, outbox_config['max_batch'])
+        if not rows:
+            continue
+        read += len(rows)
+        after = rows[-1][0]
+    return inserted, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--transactions', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--rate', type=float, default=200)
+    parser.add_argument('--lag-events', type=int, default=2000)
+    parser.add_argument('--backlog', type=int, default=100000)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(get_db_url())
+    first_event = None
+    try:
+        with conn.cursor() as cursor:
+            outbox.ensure_schema(cursor)
+            cursor.execute("SELECT cust_no::text FROM customer ORDER BY random() LIMIT %s;",
+                           (max(args.transactions, args.lag_events),))
+            keys = [row[0] for row in cursor.fetchall()]
+            cursor.execute("SELECT COALESCE(max(event_id), 0) FROM customer_outbox;")
+            first_event = cursor.fetchone()[0] + 1
+        conn.commit()
+        if not keys:
+            print("No customers in the database; load some with seed_data.py first.")
+            return
+        outbox.sequence(conn)
+
+        print(f"{'write path':<16}{'tx':>8}{'tx/sec':>10}{'p50 ms':>9}{'p95 ms':>9}")
+        for label, with_outbox in (('plain', False), ('with outbox', True)):
+            tps, latencies = write_phase(keys[:args.transactions], args.threads, with_outbox)
+            print(f"{label:<16}{len(latencies):>8,}{tps:>10,.0f}{percentile(latencies, 50) * 1000:>9.2f}"
+                  f"{percentile(latencies, 95) * 1000:>9.2f}")
+
+        outbox.sequence(conn)
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT last_position FROM customer_outbox_sequence;")
+            head = cursor.fetchone()[0]
+        conn.commit()
+        lags = lag_phase(keys[:args.lag_events], args.rate, head)
+        if lags:
+            print(f"\nend-to-end lag at {args.rate:g} changes/sec ({len(lags):,} delivered): "
+                  f"p50 {percentile(lags, 50) * 1000:.1f} ms, p95 {percentile(lags, 95) * 1000:.1f} ms, "
+                  f"max {max(lags) * 1000:.1f} ms, mean {statistics.mean(lags) * 1000:.1f} ms")
+
+        outbox.sequence(conn)
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT last_position FROM customer_outbox_sequence;")
+            head = cursor.fetchone()[0]
+        conn.commit()
+        inserted, seconds = drain_phase(conn, args.backlog, head)
+        print(f"\ndrain: {inserted:,} events in {seconds:.2f}s ({inserted / seconds:,.0f} events/sec, "
+              f"pages of {outbox_config['max_batch']})")
+    finally:
+        conn.rollback()
+        if first_event is not None:
+            with conn.cursor() as cursor:
+                cursor.execute("DELETE FROM customer_outbox WHERE event_id >= %s;", (first_event,))
+            conn.commit()
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+Insert and lookup latency of the plain vs hash-partitioned customer layout.
+
+    python benchmarks/bench_partitioning.py [--sizes 1000000,10000000,50000000] [--partitions 16] [--samples 2000]
+
+For each size, two scratch schemas (bench_flat, bench_part) get customer, credentials and spouse
+tables shaped like the app's, bulk-loaded with generate_series. Then, per layout:
+  - insert: one registration-shaped transaction (customer + credentials + spouse rows)
+  - lookup: the admin_customer_details-style join by cust_no
+  - login:  credentials by username (through the username registry in the partitioned layout)
+are timed `--samples` times and reported as p50/p95 in milliseconds. Loading 50M rows needs
+tens of GB of disk; the scratch schemas are dropped after each size.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from db_config import get_db_url  # noqa: E402
+
+TABLES_SQL = """
+    CREATE TABLE customer (
+        cust_no UUID NOT NULL, custname VARCHAR(255), datebirth DATE, email_address VARCHAR(255),
+        contact_no VARCHAR(20), registration_status VARCHAR(50) DEFAULT 'Pending', PRIMARY KEY (cust_no)
+    ){partition_clause};
+    CREATE TABLE credentials (
+        cust_no UUID NOT NULL REFERENCES customer (cust_no) ON DELETE CASCADE,
+        username VARCHAR(255) NOT NULL, password VARCHAR(255) NOT NULL, PRIMARY KEY (cust_no, username)
+    ){partition_clause};
+    CREATE TABLE spouse (
+        cust_no UUID NOT NULL REFERENCES customer (cust_no) ON DELETE CASCADE,
+        sp_name VARCHAR(255), sp_datebirth DATE, PRIMARY KEY (cust_no)
+    ){partition_clause};
+"""
+
+LOAD_SQL = """
+    INSERT INTO customer (cust_no, custname, datebirth, email_address, contact_no)
+    SELECT uuid_generate_v7(), 'Customer ' || g, DATE '1960-01-01' + (g % 15000), 'c' || g || '@example.com', '09' || g
+    FROM generate_series(%(start)s, %(stop)s) g;
+"""
+
+
+def setup_schema(cursor, schema, partitions, size):
+    cursor.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE; CREATE SCHEMA {schema}; SET search_path TO {schema}, public;")
+    clause = " PARTITION BY HASH (cust_no)" if partitions else ""
+    cursor.execute(TABLES_SQL.replace('{partition_clause}', clause))
+    for table in ('customer', 'credentials', 'spouse') if partitions else ():
+        for remainder in range(partitions):
+            cursor.execute(f"CREATE TABLE {table}_p{remainder} PARTITION OF {table} "
+                           f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder});")
+    if partitions:
+        cursor.execute("CREATE TABLE credentials_username_registry (username VARCHAR(255) PRIMARY KEY, cust_no UUID NOT NULL);")
+    else:
+        cursor.execute("CREATE UNIQUE INDEX ON credentials (username);")
+        cursor.execute("CREATE UNIQUE INDEX ON customer (email_address);")
+
+    chunk = 1_000_000
+    for start in range(1, size + 1, chunk):
+        cursor.execute(LOAD_SQL, {'start': start, 'stop': min(start + chunk - 1, size)})
+    cursor.execute("INSERT INTO credentials SELECT cust_no, 'user_' || email_address, 'x' FROM customer;")
+    cursor.execute("INSERT INTO spouse SELECT cust_no, 'Spouse of ' || custname, datebirth FROM customer WHERE random() < 0.5;")
+    if partitions:
+        cursor.execute("INSERT INTO credentials_username_registry SELECT username, cust_no FROM credentials;")
+    cursor.execute("ANALYZE;")
+
+
+def percentile(samples, pct):
+    return statistics.quantiles(samples, n=100)[pct - 1] * 1000
+
+
+def time_ops(conn, cursor, partitions, size, samples):
+    cursor.execute("SELECT cust_no FROM customer TABLESAMPLE SYSTEM (1) LIMIT %s;", (samples,))
+    keys = [row[0] for row in cursor.fetchall()]
+    results = {'insert': [], 'lookup': [], 'login': []}
+
+    for i in range(samples):
+        cust_no = str(uuid.uuid4())
+        started = time.perf_counter()
+        cursor.execute("INSERT INTO customer (cust_no, custname, email_address) VALUES (%s, %s, %s);",
+                       (cust_no, 'Bench', f'bench{i}@example.com'))
+        cursor.execute("INSERT INTO credentials VALUES (%s, %s, 'x');", (cust_no, f'bench_user_{i}'))
+        if partitions:
+            cursor.execute("INSERT INTO credentials_username_registry VALUES (%s, %s);", (f'bench_user_{i}', cust_no))
+        cursor.execute("INSERT INTO spouse VALUES (%s, 'Bench Spouse', NULL);", (cust_no,))
+        conn.commit()
+        results['insert'].append(time.perf_counter() - started)
+
+    for cust_no in keys:
+        started = time.perf_counter()
+        cursor.execute("""
+            SELECT c.*, cred.username, s.sp_name FROM customer c
+            LEFT JOIN credentials cred ON cred.cust_no = c.cust_no
+            LEFT JOIN spouse s ON s.cust_no = c.cust_no
+            WHERE c.cust_no = %s;
+        """, (cust_no,))
+        cursor.fetchall()
+        results['lookup'].append(time.perf_counter() - started)
+
+    for _ in range(samples):
+        username = f'user_c{random.randint(1, size)}@example.com'
+        started = time.perf_counter()
+        if partitions:
+            cursor.execute("""
+                SELECT cred.cust_no, cred.password FROM credentials_username_registry ur
+                JOIN credentials cred ON cred.cust_no = ur.cust_no AND cred.username = ur.username
+                WHERE ur.username = %s;
+            """, (username,))
+        else:
+            cursor.execute("SELECT cust_no, password FROM credentials WHERE username = %s;", (username,))
+        cursor.fetchall()
+        results['login'].append(time.perf_counter() - started)
+    conn.commit()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='1000000,10000000,50000000')
+    parser.add_argument('--partitions', type=int, default=16)
+    parser.add_argument('--samples', type=int, default=2000)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(get_db_url())
+    cursor = conn.cursor()
+    try:
+        print(f"{'customers':>11} {'layout':<8} {'op':<7} {'p50 ms':>8} {'p95 ms':>8}")
+        for size in [int(s) for s in args.sizes.split(',')]:
+            for schema, partitions in (('bench_flat', 0), ('bench_part', args.partitions)):
+                setup_schema(cursor, schema, partitions, size)
+                conn.commit()
+                results = time_ops(conn, cursor, partitions, size, args.samples)
+                layout = 'flat' if not partitions else f'hash{partitions}'
+                for op, samples in results.items():
+                    print(f"{size:>11,} {layout:<8} {op:<7} {percentile(samples, 50):>8.3f} {percentile(samples, 95):>8.3f}")
+                cursor.execute(f"DROP SCHEMA {schema} CASCADE;")
+                conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
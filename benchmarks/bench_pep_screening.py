@@ -0,0 +1,105 @@
+"""
+Online latency and nightly batch throughput of the PEP name screening (pep_screening.py).
+
+    python benchmarks/bench_pep_screening.py [--officials 20000] [--customers 1000000] [--workers 1,2,4,8]
+
+Runs entirely in memory, no database: generates official names and customer names (a share of
+them spelling variants of officials: abbreviations, dropped particles, honorifics, typos), then
+  - online: times OfficialIndex.screen() per name and reports p50/p99 in microseconds
+  - batch:  screens all customers through the same process-pool workers run_batch() uses and
+            reports customers/sec per worker count.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import pep_screening  # noqa: E402
+
+FIRST_NAMES = ['Juan', 'Maria', 'Jose', 'Ana', 'Pedro', 'Rosa', 'Mark', 'Grace', 'Paolo', 'Liza', 'Ramon',
+               'Cristina', 'Francisco', 'Teresa', 'Antonio', 'Carmela', 'Rodrigo', 'Imelda', 'Ferdinand', 'Leni']
+LAST_NAMES = ['Dela Cruz', 'Santos', 'Reyes', 'Garcia', 'Mendoza', 'Bautista', 'Villanueva', 'Ramos', 'Aquino',
+              'Castillo', 'Delos Santos', 'Fernandez', 'Gonzales', 'Lopez', 'Marquez', 'Navarro', 'Pascual', 'Salazar']
+TITLES = ['Hon.', 'Atty.', 'Sen.', 'Gov.', 'Mayor', 'Dr.']
+SYLLABLES = [c + v for c in 'bcdglmnprstvy' for v in 'aeiou'] + ['ng', 'an', 'on', 'in']
+
+
+def make_name(rng):
+    # Common surnames alone would make most synthetic customers true homonyms of some official,
+    # so most surnames are generated from syllables.
+    if rng.random() < 0.2:
+        last = rng.choice(LAST_NAMES)
+    else:
+        last = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+    middle = rng.choice(SYLLABLES)[0].upper() + '.'
+    return f"{rng.choice(FIRST_NAMES)} {middle} {last}"
+
+
+def make_variant(rng, name):
+    variant = name.replace('Maria', 'Ma.').replace('Francisco', 'Fco.') if rng.random() < 0.5 else name
+    if rng.random() < 0.3:
+        variant = variant.replace('Dela ', 'de la ').replace('Delos ', 'De los ')
+    if rng.random() < 0.3:
+        i = rng.randrange(1, len(variant) - 1)
+        variant = variant[:i] + variant[i + 1:]  # one dropped letter
+    if rng.random() < 0.3:
+        variant = f"{rng.choice(TITLES)} {variant}"
+    return variant
+
+
+def chunked(rows, size):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--officials', type=int, default=20_000)
+    parser.add_argument('--customers', type=int, default=1_000_000)
+    parser.add_argument('--variant-share', type=float, default=0.01)
+    parser.add_argument('--workers', default='1,2,4,8')
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--samples', type=int, default=10_000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    officials = [(str(uuid.uuid4()), make_name(rng)) for _ in range(args.officials)]
+    customers = [
+        (str(uuid.uuid4()),
+         make_variant(rng, rng.choice(officials)[1]) if rng.random() < args.variant_share else make_name(rng))
+        for _ in range(args.customers)
+    ]
+
+    index = pep_screening.OfficialIndex()
+    started = time.perf_counter()
+    index.load(officials)
+    print(f"Indexed {args.officials:,} officials in {time.perf_counter() - started:.2f}s")
+
+    timings = []
+    for _, name in rng.sample(customers, min(args.samples, len(customers))):
+        started = time.perf_counter()
+        index.screen(name)
+        timings.append((time.perf_counter() - started) * 1_000_000)
+    cuts = statistics.quantiles(timings, n=100)
+    print(f"online screen ({len(timings):,} names): p50 {cuts[49]:.0f} us, p99 {cuts[98]:.0f} us, max {max(timings):.0f} us")
+
+    for workers in [int(w) for w in args.workers.split(',')]:
+        started = time.perf_counter()
+        screened = matched = 0
+        with ProcessPoolExecutor(max_workers=workers, initializer=pep_screening._init_worker,
+                                 initargs=(officials, pep_screening.DEFAULT_THRESHOLD)) as pool:
+            for count, results in pool.map(pep_screening._screen_chunk, chunked(customers, args.chunk_size)):
+                screened += count
+                matched += len(results)
+        seconds = time.perf_counter() - started
+        print(f"batch, {workers} worker(s): {screened:,} customers in {seconds:.1f}s "
+              f"({screened / seconds:,.0f} customers/sec), {matched:,} matches")
+
+
+if __name__ == '__main__':
+    main()
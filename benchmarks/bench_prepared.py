@@ -0,0 +1,78 @@
+"""
+Planning time and latency of the 10-way customer profile join, plain vs prepared (prepared.py).
+
+    python benchmarks/bench_prepared.py [--samples 2000]
+
+Runs against the configured database (read-only) and needs customers in it, e.g. from the synthetic
+data generator. For `--samples` random cust_nos it measures, per mode:
+  - planning time reported by EXPLAIN (ANALYZE, FORMAT JSON), plain SQL vs EXECUTE of the prepared
+    statement (a generic plan is chosen after the first few executions, after which planning is ~0);
+  - end-to-end client latency of the query plus fetch.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from db_config import get_db_url  # noqa: E402
+from connection_pool import PooledConnection  # noqa: E402
+import prepared  # noqa: E402
+from repository import CUSTOMER_PROFILE_SQL  # noqa: E402
+
+
+def summarize(label, samples):
+    cuts = statistics.quantiles(samples, n=100)
+    return f"{label:<28} p50 {cuts[49]:8.3f} ms   p95 {cuts[94]:8.3f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--samples', type=int, default=2000)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(get_db_url(), connection_factory=PooledConnection)
+    conn.set_session(readonly=True, autocommit=True)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT cust_no::text FROM customer TABLESAMPLE SYSTEM (10) LIMIT %s;", (args.samples,))
+        keys = [row[0] for row in cursor.fetchall()]
+        if len(keys) < 2:
+            print("Not enough customers to benchmark; load data first.")
+            return
+
+        plan = {'plain': [], 'prepared': []}
+        latency = {'plain': [], 'prepared': []}
+        explain_execute = "EXPLAIN (ANALYZE, FORMAT JSON) " + prepared.STATEMENTS['customer_profile'].execute_sql
+        for cust_no in keys:
+            cursor.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + CUSTOMER_PROFILE_SQL, (cust_no,))
+            plan['plain'].append(cursor.fetchone()[0][0]['Planning Time'])
+            started = time.perf_counter()
+            cursor.execute(CUSTOMER_PROFILE_SQL, (cust_no,))
+            cursor.fetchall()
+            latency['plain'].append((time.perf_counter() - started) * 1000)
+
+        for cust_no in keys:
+            started = time.perf_counter()
+            prepared.execute(cursor, 'customer_profile', (cust_no,))
+            cursor.fetchall()
+            latency['prepared'].append((time.perf_counter() - started) * 1000)
+            cursor.execute(explain_execute, (cust_no,))
+            plan['prepared'].append(cursor.fetchone()[0][0]['Planning Time'])
+
+        print(f"{len(keys)} profile lookups per mode")
+        for mode in ('plain', 'prepared'):
+            print(summarize(f"{mode} planning time", plan[mode]))
+            print(summarize(f"{mode} query latency", latency[mode]))
+        saved = statistics.median(plan['plain']) - statistics.median(plan['prepared'])
+        print(f"median planning time saved per lookup: {saved:.3f} ms")
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
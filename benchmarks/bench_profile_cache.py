@@ -0,0 +1,87 @@
+"""
+Profile loads through profile_cache.ProfileCache vs the profile join every time.
+
+    python benchmarks/bench_profile_cache.py [--customers 20000] [--requests 50000] [--capacity 5000] [--skew 1.1]
+
+Replays --requests profile loads over --customers customers of the configured database (read-only),
+drawn with a Zipf-like skew (a few customers are opened much more often than the rest, as on the
+admin pages). Each load is what app._load_profile does: the cache first, the prepared profile join
+on a miss. Reports loads/sec and p50/p95 for the uncached and cached runs, the hit rate at
+--capacity entries, and the cache's estimated bytes per profile.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from db_config import get_db_url, profile_cache_config  # noqa: E402
+from connection_pool import PooledConnection  # noqa: E402
+import profile_cache  # noqa: E402
+import repository  # noqa: E402
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)] if values else 0.0
+
+
+def run(cursor, sequence, cache):
+    latencies = []
+    started = time.perf_counter()
+    for key in sequence:
+        load_started = time.perf_counter()
+        profile = cache.get(key) if cache else None
+        if profile is None:
+            profile = repository.fetch_profile(cursor, key)
+            if cache:
+                cache.put(key, profile)
+        latencies.append(time.perf_counter() - load_started)
+    return len(sequence) / (time.perf_counter() - started), latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--customers', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=50000)
+    parser.add_argument('--capacity', type=int, default=5000)
+    parser.add_argument('--skew', type=float, default=1.1)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(get_db_url(), connection_factory=PooledConnection)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT cust_no::text FROM customer ORDER BY random() LIMIT %s;", (args.customers,))
+            keys = [row[0] for row in cursor.fetchall()]
+            if not keys:
+                print("No customers in the database; load some with seed_data.py first.")
+                return
+            weights = [1 / (rank ** args.skew) for rank in range(1, len(keys) + 1)]
+            sequence = random.Random(42).choices(keys, weights, k=args.requests)
+
+            cache = profile_cache.ProfileCache({'primary': get_db_url()},
+                                               dict(profile_cache_config, max_entries=args.capacity))
+            cache.get(keys[0])  # starts the invalidation listener; puts are refused until it is connected
+            deadline = time.monotonic() + 5
+            while not cache.metrics()['listeners_connected'] and time.monotonic() < deadline:
+                time.sleep(0.05)
+
+            print(f"{'loads':<14}{'requests':>10}{'loads/sec':>11}{'p50 ms':>9}{'p95 ms':>9}")
+            for label, use_cache in (('profile join', None), ('cached', cache)):
+                rate, latencies = run(cursor, sequence, use_cache)
+                print(f"{label:<14}{len(latencies):>10,}{rate:>11,.0f}{percentile(latencies, 50) * 1000:>9.3f}"
+                      f"{percentile(latencies, 95) * 1000:>9.3f}")
+        metrics = cache.metrics()
+        print(f"\n{len(set(sequence)):,} distinct customers requested; capacity {args.capacity:,}: "
+              f"hit rate {metrics['hit_rate']:.1%}, {metrics['entries']:,} entries, "
+              f"{metrics['bytes'] / 1e6:.1f} MB ({metrics['bytes'] / max(metrics['entries'], 1):,.0f} B/profile), "
+              f"{metrics['evictions']:,} evictions")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
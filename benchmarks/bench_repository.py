@@ -0,0 +1,106 @@
+"""
+Memory and throughput of 100k-row customer fetches: DictCursor / RealDictCursor rows vs the
+namedtuple rows of repository.py.
+
+    python benchmarks/bench_repository.py [--rows 100000] [--repeat 3]
+
+Runs against the configured database (read-only) and needs at least --rows customers, e.g. from
+seed_data.py. Two projections are measured:
+  - list: the dashboard columns (repository.CustomerListRow);
+  - profile: the full profile join, one row per customer (repository.CustomerProfile, fetched
+    with repository.fetch_profiles in pages of 1000 keys).
+For each row type it reports the best wall time over --repeat runs, rows/sec, and the memory the
+materialized result keeps alive (tracemalloc, measured separately from the timed runs).
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+import psycopg2
+import psycopg2.extras
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from db_config import get_db_url  # noqa: E402
+import repository  # noqa: E402
+
+
+def list_fetch(factory, limit):
+    def fetch(conn):
+        cursor = conn.cursor(cursor_factory=factory) if factory else conn.cursor()
+        cursor.execute(f"SELECT {', '.join(repository.LIST_COLUMNS)} FROM customer ORDER BY cust_no LIMIT %s;",
+                       (limit,))
+        rows = cursor.fetchall()
+        if factory is None:
+            rows = [repository.CustomerListRow._make(row) for row in rows]
+        cursor.close()
+        return rows
+    return fetch
+
+
+def profile_fetch(factory, keys):
+    def fetch(conn):
+        if factory is None:
+            with conn.cursor() as cursor:
+                return list(repository.fetch_profiles(cursor, keys).values())
+        rows = []
+        with conn.cursor(cursor_factory=factory) as cursor:
+            for start in range(0, len(keys), 1000):
+                cursor.execute(repository._PROFILES_SQL, (keys[start:start + 1000],))
+                rows.extend(cursor.fetchall())
+        return rows
+    return fetch
+
+
+def measure(conn, fetch, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = fetch(conn)
+        best = min(best, time.perf_counter() - started)
+        del rows
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    rows = fetch(conn)
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return len(rows), best, retained
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(get_db_url())
+    conn.set_session(readonly=True, autocommit=True)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT cust_no::text FROM customer ORDER BY cust_no LIMIT %s;", (args.rows,))
+            keys = [row[0] for row in cursor.fetchall()]
+        if len(keys) < args.rows:
+            print(f"Only {len(keys)} customers in the database; load more with seed_data.py for a full run.")
+
+        print(f"{'projection':<12}{'row type':<16}{'rows':>9}{'best s':>9}{'rows/sec':>12}{'retained MB':>13}{'B/row':>8}")
+        for projection in ('list', 'profile'):
+            for label, factory in (('DictCursor', psycopg2.extras.DictCursor),
+                                   ('RealDictCursor', psycopg2.extras.RealDictCursor),
+                                   ('repository', None)):
+                if projection == 'list':
+                    fetch = list_fetch(factory, args.rows)
+                else:
+                    fetch = profile_fetch(factory, keys)
+                rows, seconds, retained = measure(conn, fetch, args.repeat)
+                print(f"{projection:<12}{label:<16}{rows:>9,}{seconds:>9.2f}{rows / seconds:>12,.0f}"
+                      f"{retained / 1e6:>13.1f}{retained / max(rows, 1):>8.0f}")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
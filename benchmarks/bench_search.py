@@ -0,0 +1,116 @@
+"""
+p50/p95 latency of the ranked customer search (search_index.search) over N synthetic customers.
+
+    python benchmarks/bench_search.py [--customers 1000000] [--queries 1000]
+
+Builds a scratch schema with a minimal customer table and the real customer_search table and
+indexes (search_index.SCHEMA_SQL), fills both with generated names, emails, phones, employers
+and addresses, then times a mix of queries: full names, surname prefixes, email fragments and
+phone fragments. The scratch schema is dropped at the end. Needs the pg_trgm extension.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from db_config import get_db_url  # noqa: E402
+import search_index  # noqa: E402
+
+FIRST_NAMES = ['juan', 'maria', 'jose', 'ana', 'pedro', 'rosa', 'mark', 'grace', 'paolo', 'liza', 'ramon', 'cristina']
+LAST_NAMES = ['dela cruz', 'santos', 'reyes', 'garcia', 'mendoza', 'bautista', 'villanueva', 'ramos', 'aquino', 'castillo']
+EMPLOYERS = ['landbank', 'jollibee foods', 'ayala land', 'sm prime', 'globe telecom', 'meralco', 'deped', 'petron']
+
+FILL_SQL = """
+    WITH g AS (
+        SELECT n,
+               (%(first)s::text[])[1 + n %% %(nfirst)s] AS first_name,
+               (%(last)s::text[])[1 + (n / 7) %% %(nlast)s] AS last_name,
+               (%(employers)s::text[])[1 + (n / 3) %% %(nemp)s] AS employer
+        FROM generate_series(%(start)s, %(stop)s) n
+    ), c AS (
+        INSERT INTO customer (cust_no, custname, email_address, contact_no, registration_status)
+        SELECT uuid_generate_v7(), first_name || ' ' || last_name,
+               first_name || '.' || replace(last_name, ' ', '') || n || '@example.com',
+               '0917' || lpad(n::text, 7, '0'), 'Pending'
+        FROM g
+        RETURNING cust_no, custname, email_address, contact_no
+    )
+    INSERT INTO customer_search (cust_no, document, search_vector)
+    SELECT c.cust_no,
+           concat_ws(' ', c.custname, c.email_address, c.contact_no, g.employer,
+                     'barangay ' || (random() * 900)::int, 'quezon city'),
+           setweight(to_tsvector('simple', c.custname), 'A') ||
+           setweight(to_tsvector('simple', concat_ws(' ', c.email_address, c.contact_no)), 'B') ||
+           setweight(to_tsvector('simple', g.employer), 'C') ||
+           setweight(to_tsvector('simple', 'quezon city'), 'D')
+    FROM c JOIN g ON c.contact_no = '0917' || lpad(g.n::text, 7, '0');
+"""
+
+
+def make_queries(count, customers):
+    queries = []
+    for _ in range(count):
+        kind = random.random()
+        if kind < 0.3:
+            queries.append(f"{random.choice(FIRST_NAMES)} {random.choice(LAST_NAMES)}")
+        elif kind < 0.6:
+            queries.append(random.choice(LAST_NAMES).split()[-1][:4])
+        elif kind < 0.8:
+            queries.append(f"{random.choice(FIRST_NAMES)}.{random.choice(LAST_NAMES).replace(' ', '')}{random.randint(1, customers)}")
+        else:
+            queries.append(f"0917{random.randint(0, 9999999):07d}"[:9])
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--customers', type=int, default=1_000_000)
+    parser.add_argument('--queries', type=int, default=1000)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(get_db_url())
+    cursor = conn.cursor()
+    try:
+        # pg_trgm must live outside the scratch schema, or dropping the schema would drop it.
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm SCHEMA public;")
+        cursor.execute("DROP SCHEMA IF EXISTS bench_search CASCADE; CREATE SCHEMA bench_search; SET search_path TO bench_search, public;")
+        cursor.execute("""
+            CREATE TABLE customer (cust_no UUID PRIMARY KEY, custname VARCHAR(255), email_address VARCHAR(255),
+                                   contact_no VARCHAR(20), registration_status VARCHAR(50));
+        """)
+        search_index.ensure_schema(cursor)
+        chunk = 200_000
+        for start in range(1, args.customers + 1, chunk):
+            cursor.execute(FILL_SQL, {
+                'first': FIRST_NAMES, 'nfirst': len(FIRST_NAMES), 'last': LAST_NAMES, 'nlast': len(LAST_NAMES),
+                'employers': EMPLOYERS, 'nemp': len(EMPLOYERS), 'start': start, 'stop': min(start + chunk - 1, args.customers),
+            })
+            conn.commit()
+        cursor.execute("ANALYZE customer; ANALYZE customer_search;")
+        conn.commit()
+
+        timings = []
+        for query in make_queries(args.queries, args.customers):
+            started = time.perf_counter()
+            search_index.search(cursor, query)
+            timings.append((time.perf_counter() - started) * 1000)
+        conn.rollback()
+
+        cuts = statistics.quantiles(timings, n=100)
+        print(f"{args.customers:,} customers, {args.queries} queries: "
+              f"p50 {cuts[49]:.2f} ms, p95 {cuts[94]:.2f} ms, max {max(timings):.2f} ms")
+    finally:
+        conn.rollback()
+        cursor.execute("DROP SCHEMA IF EXISTS bench_search CASCADE;")
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
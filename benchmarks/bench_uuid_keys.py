@@ -0,0 +1,80 @@
+"""
+Insert throughput and primary-key index size: random v4 keys vs time-ordered v7 keys.
+
+    python benchmarks/bench_uuid_keys.py [--rows 10000000] [--batch-size 10000]
+
+Creates two scratch tables shaped like `customer`'s key (UUID primary key + a payload column),
+fills each through its column default, and reports rows/sec over the whole run and over the
+last 10% (where v4 suffers most once the index no longer fits in shared_buffers), plus the
+final heap and index sizes. Needs uuid_generate_v7(), so run the app's schema setup first.
+The scratch tables are dropped at the end.
+"""
+import argparse
+import os
+import sys
+import time
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from db_config import get_db_url  # noqa: E402
+
+VARIANTS = {
+    'v4': 'gen_random_uuid()',
+    'v7': 'uuid_generate_v7()',
+}
+
+
+def run_variant(conn, name, default_expr, rows, batch_size):
+    table = f"bench_uuid_{name}"
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {table};")
+        cursor.execute(f"CREATE UNLOGGED TABLE {table} (id UUID PRIMARY KEY DEFAULT {default_expr}, payload TEXT);")
+        conn.commit()
+
+        inserted = 0
+        tail_start_row = int(rows * 0.9)
+        tail_started_at = None
+        started_at = time.perf_counter()
+        while inserted < rows:
+            n = min(batch_size, rows - inserted)
+            if tail_started_at is None and inserted >= tail_start_row:
+                tail_started_at = time.perf_counter()
+            cursor.execute(f"INSERT INTO {table} (payload) SELECT md5(g::text) FROM generate_series(1, %s) g;", (n,))
+            conn.commit()
+            inserted += n
+        finished_at = time.perf_counter()
+
+        cursor.execute("SELECT pg_relation_size(%s), pg_relation_size(%s);", (table, f"{table}_pkey"))
+        heap_bytes, index_bytes = cursor.fetchone()
+        cursor.execute(f"DROP TABLE {table};")
+        conn.commit()
+
+    tail_rows = rows - tail_start_row
+    return {
+        'rows_per_sec': rows / (finished_at - started_at),
+        'tail_rows_per_sec': tail_rows / (finished_at - (tail_started_at or started_at)),
+        'heap_mb': heap_bytes / 1024 / 1024,
+        'index_mb': index_bytes / 1024 / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--batch-size', type=int, default=10_000)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(get_db_url())
+    try:
+        print(f"{'key':<4} {'rows/s':>12} {'last 10% rows/s':>16} {'heap MB':>10} {'pkey MB':>10}")
+        for name, default_expr in VARIANTS.items():
+            result = run_variant(conn, name, default_expr, args.rows, args.batch_size)
+            print(f"{name:<4} {result['rows_per_sec']:>12,.0f} {result['tail_rows_per_sec']:>16,.0f} "
+                  f"{result['heap_mb']:>10,.1f} {result['index_mb']:>10,.1f}")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
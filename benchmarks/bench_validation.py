@@ -0,0 +1,120 @@
+"""
+Cost of validating a customer payload (validation.py) before any database work.
+
+    python benchmarks/bench_validation.py [--iterations 20000] [--with-db] [--db-iterations 500]
+
+Times validate_registration() on a complete registration JSON body and on one with several bad
+fields, and validate_customer_form() on an admin form (werkzeug MultiDict, as request.form is):
+microseconds per payload and payloads/sec. With --with-db it also times what a bad payload cost
+before, on the configured database: begin, insert the occupation row, fail on the malformed date,
+roll back (connection already open, so the pool wait is not included). Nothing is committed.
+"""
+import argparse
+import os
+import sys
+import time
+
+import psycopg2
+from werkzeug.datastructures import MultiDict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from db_config import get_db_url  # noqa: E402
+import validation  # noqa: E402
+
+REGISTRATION = {
+    'registration1': {
+        'firstName': 'Maria', 'lastName': 'Santos', 'dob': '1988-04-17', 'nationality': 'Filipino',
+        'citizenship': 'Filipino', 'sex': 'Female', 'placeOfBirth': 'Quezon City', 'civilStatus': 'Married',
+        'children': '2', 'motherMaidenName': 'Reyes', 'address': '12 Mabini St., Quezon City',
+        'email': 'maria.santos@example.com', 'telephone': '0917-555-0101',
+        'spouseFirstName': 'Jose', 'spouseLastName': 'Santos', 'spouseDob': '1986-09-02',
+        'spouseProfession': 'Engineer',
+    },
+    'registration2': {
+        'occupation': 'Employed', 'natureOfBusiness': 'Information Technology',
+        'sourceOfWealth': ['Salary/Honoraria', 'Business'], 'monthlyIncome': '50000_01_to_100000',
+        'annualIncome': '600000_01_to_1200000', 'tinId': '123-456-789', 'companyName': 'Acme Corp.',
+        'employerAddress': 'Makati City', 'employerPhone': '02-8555-0101', 'employmentDate': '2015-06-01',
+        'jobTitle': 'Analyst',
+    },
+    'registration3': {
+        'depositorRole': 'Owner', 'companyName': 'Santos Trading', 'bankCode': 'LBP',
+        'accountType': 'Savings',
+    },
+}
+
+BAD_REGISTRATION = {
+    'registration1': dict(REGISTRATION['registration1'], dob='1988-02-30', children='two', email='maria@',
+                          spouseFirstName='', spouseLastName=''),
+    'registration2': dict(REGISTRATION['registration2'], companyName=''),
+    'registration3': dict(REGISTRATION['registration3'], accountType=''),
+}
+
+ADMIN_FORM = MultiDict(
+    [(key, value) for key, value in REGISTRATION['registration1'].items()]
+    + [(key, value) for key, value in REGISTRATION['registration2'].items() if key != 'sourceOfWealth']
+    + [('sourceOfWealth', item) for item in REGISTRATION['registration2']['sourceOfWealth']]
+    + [('companyNameAffiliation', 'Santos Trading'), ('registrationStatus', 'Active')]
+)
+
+
+def time_validation(label, validate, payload, iterations):
+    for _ in range(min(iterations, 1000)):  # warm up
+        try:
+            validate(payload)
+        except validation.ValidationError:
+            pass
+    started = time.perf_counter()
+    for _ in range(iterations):
+        try:
+            validate(payload)
+        except validation.ValidationError:
+            pass
+    seconds = time.perf_counter() - started
+    print(f"{label:<28}{iterations:>10,}{seconds / iterations * 1e6:>12.1f}{iterations / seconds:>14,.0f}")
+
+
+def time_failed_transaction(iterations):
+    """The old path for a malformed date: rows written, then the database rejects the value."""
+    conn = psycopg2.connect(get_db_url())
+    try:
+        with conn.cursor() as cursor:
+            started = time.perf_counter()
+            for _ in range(iterations):
+                try:
+                    cursor.execute("INSERT INTO occupation (occ_type, bus_nature) VALUES (%s, %s) RETURNING occ_id;",
+                                   ('Employed', 'Information Technology'))
+                    cursor.fetchone()
+                    cursor.execute("SELECT %s::date;", ('1988-02-30',))
+                except psycopg2.DataError:
+                    pass
+                conn.rollback()
+            seconds = time.perf_counter() - started
+    finally:
+        conn.close()
+    print(f"{'failed transaction (db)':<28}{iterations:>10,}{seconds / iterations * 1e6:>12.1f}"
+          f"{iterations / seconds:>14,.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--with-db', action='store_true')
+    parser.add_argument('--db-iterations', type=int, default=500)
+    args = parser.parse_args()
+
+    try:
+        validation.validate_registration(BAD_REGISTRATION)
+    except validation.ValidationError as err:
+        print(f"bad registration: {len(err.errors)} field errors reported at once\n")
+
+    print(f"{'payload':<28}{'runs':>10}{'us/payload':>12}{'payloads/sec':>14}")
+    time_validation('registration (valid)', validation.validate_registration, REGISTRATION, args.iterations)
+    time_validation('registration (invalid)', validation.validate_registration, BAD_REGISTRATION, args.iterations)
+    time_validation('admin form (valid)', validation.validate_customer_form, ADMIN_FORM, args.iterations)
+    if args.with_db:
+        time_failed_transaction(args.db_iterations)
+
+
+if __name__ == '__main__':
+    main()
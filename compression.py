@@ -0,0 +1,222 @@
+"""
+WSGI middleware that compresses HTML, JSON and other text responses with gzip or brotli.
+
+    app.wsgi_app = CompressionMiddleware(app.wsgi_app, compression_config)
+
+The encoding is negotiated from Accept-Encoding (brotli preferred when the optional `brotli`
+package is installed and the client accepts it). Responses are passed through unchanged when they
+are small (under min_size bytes), not a compressible type, already encoded, HEAD/204/304, or marked
+Cache-Control: no-transform. Bodies are compressed chunk by chunk as the application yields them;
+responses without a Content-Length (stream_with_context, generators) are flushed after each chunk,
+so streamed output reaches the client as it is produced instead of after the whole body.
+"""
+import zlib
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only without it
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    'text/html', 'text/plain', 'text/css', 'text/csv', 'text/javascript', 'text/xml',
+    'application/json', 'application/javascript', 'application/xml', 'application/x-ndjson', 'image/svg+xml',
+)
+# Event streams are long-lived and latency-sensitive; some proxies buffer compressed ones.
+NEVER_COMPRESS_TYPES = ('text/event-stream',)
+
+
+def parse_accept_encoding(header):
+    """Maps each accepted coding to its q-value ('*' included); codings with q=0 are left out."""
+    accepted = {}
+    for item in (header or '').split(','):
+        parts = item.strip().split(';')
+        coding = parts[0].strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in parts[1:]:
+            name, _, value = param.strip().partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted[coding] = quality
+    return accepted
+
+
+def choose_encoding(header):
+    """'br', 'gzip' or None for an Accept-Encoding header; on equal q-values brotli wins."""
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get('*', 0)
+    candidates = [('gzip', accepted.get('gzip', wildcard), 1)]
+    if brotli is not None:
+        candidates.append(('br', accepted.get('br', wildcard), 2))
+    coding, quality, _ = max(candidates, key=lambda candidate: (candidate[1], candidate[2]))
+    return coding if quality > 0 else None
+
+
+class _Compressor:
+    """Uniform compress/flush/finish over zlib (gzip container) and brotli."""
+
+    def __init__(self, coding, gzip_level, brotli_quality):
+        self.coding = coding
+        if coding == 'br':
+            self._impl = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._impl = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        if self.coding == 'br':
+            return self._impl.process(data)
+        return self._impl.compress(data)
+
+    def flush(self):
+        if self.coding == 'br':
+            return self._impl.flush()
+        return self._impl.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.coding == 'br':
+            return self._impl.finish()
+        return self._impl.flush(zlib.Z_FINISH)
+
+
+class CompressionMiddleware:
+    """See the module docstring. `config` is db_config.compression_config."""
+
+    def __init__(self, wsgi_app, config):
+        self.wsgi_app = wsgi_app
+        self.enabled = config['enabled']
+        self.min_size = config['min_size']
+        self.gzip_level = config['gzip_level']
+        self.brotli_quality = config['brotli_quality']
+
+    def __call__(self, environ, start_response):
+        coding = choose_encoding(environ.get('HTTP_ACCEPT_ENCODING')) if self.enabled else None
+        if coding is None or environ.get('REQUEST_METHOD') == 'HEAD':
+            if not self.enabled:
+                return self.wsgi_app(environ, start_response)
+            return self.wsgi_app(environ, self._vary_only(start_response))
+
+        captured = {}
+        early_writes = []
+
+        def capture(status, headers, exc_info=None):
+            if exc_info and captured.get('sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            captured['status'] = status
+            captured['headers'] = headers
+            return early_writes.append  # legacy write(): delivered ahead of the iterable's chunks
+
+        body = self.wsgi_app(environ, capture)
+        return self._respond(body, captured, early_writes, coding, start_response)
+
+    def _vary_only(self, start_response):
+        def wrapped(status, headers, exc_info=None):
+            if self._compressible(headers):
+                headers = _with_vary(headers)
+            return start_response(status, headers, exc_info)
+        return wrapped
+
+    def _compressible(self, headers):
+        content_type = _header(headers, 'Content-Type').split(';')[0].strip().lower()
+        return content_type in COMPRESSIBLE_TYPES and content_type not in NEVER_COMPRESS_TYPES
+
+    def _should_compress(self, status, headers):
+        code = int(status.split(' ', 1)[0])
+        if code < 200 or code in (204, 206, 304):
+            return False
+        if _header(headers, 'Content-Encoding') or 'no-transform' in _header(headers, 'Cache-Control').lower():
+            return False
+        if not self._compressible(headers):
+            return False
+        length = _header(headers, 'Content-Length')
+        return not (length.isdigit() and int(length) < self.min_size)
+
+    def _respond(self, body, captured, early_writes, coding, start_response):
+        iterator = iter(body)
+        try:
+            chunks = list(early_writes)
+            if 'status' not in captured:
+                # start_response may legitimately be deferred until the first chunk is produced
+                for chunk in iterator:
+                    if chunk:
+                        chunks.append(chunk)
+                        break
+            status, headers = captured['status'], captured['headers']
+            streamed = not _header(headers, 'Content-Length').isdigit()
+
+            if self._should_compress(status, headers) and streamed:
+                # Unknown length: buffer up to min_size before deciding, so tiny streams stay plain.
+                buffered = sum(len(chunk) for chunk in chunks)
+                exhausted = False
+                while buffered < self.min_size:
+                    chunk = next(iterator, None)
+                    if chunk is None:
+                        exhausted = True
+                        break
+                    chunks.append(chunk)
+                    buffered += len(chunk)
+                if exhausted:
+                    headers = _with_vary(headers) + [('Content-Length', str(buffered))]
+                    captured['sent'] = True
+                    start_response(status, headers)
+                    yield b''.join(chunks)
+                    return
+            elif not self._should_compress(status, headers):
+                if self._compressible(headers):
+                    headers = _with_vary(headers)
+                captured['sent'] = True
+                start_response(status, headers)
+                for chunk in chunks:
+                    yield chunk
+                for chunk in iterator:
+                    yield chunk
+                return
+
+            compressor = _Compressor(coding, self.gzip_level, self.brotli_quality)
+            headers = [(name, value) for name, value in _with_vary(headers)
+                       if name.lower() not in ('content-length', 'content-md5')]
+            headers = [(name, _weak_etag(value) if name.lower() == 'etag' else value) for name, value in headers]
+            headers.append(('Content-Encoding', coding))
+            captured['sent'] = True
+            start_response(status, headers)
+
+            for chunk in _chain(chunks, iterator):
+                data = compressor.compress(chunk)
+                if streamed:
+                    data += compressor.flush()
+                if data:
+                    yield data
+            yield compressor.finish()
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+
+
+def _chain(first, rest):
+    yield from first
+    yield from rest
+
+
+def _header(headers, name):
+    name = name.lower()
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return ''
+
+
+def _with_vary(headers):
+    vary = _header(headers, 'Vary')
+    if 'accept-encoding' in vary.lower() or vary == '*':
+        return list(headers)
+    others = [(key, value) for key, value in headers if key.lower() != 'vary']
+    return others + [('Vary', f"{vary}, Accept-Encoding" if vary else 'Accept-Encoding')]
+
+
+def _weak_etag(value):
+    # The compressed bytes differ from the identity ones, so a strong validator no longer applies.
+    return value if value.startswith('W/') else f"W/{value}"
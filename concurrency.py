@@ -0,0 +1,98 @@
+"""
+Optimistic concurrency for customer edits.
+
+customer.row_version is bumped by a trigger on every UPDATE of the row (see _ensure_database_schema
+in app.py). The edit form and the JSON view of a customer carry the version that was read (a hidden
+row_version field, or the ETag for If-Match), and the edit applies only if that version is still
+current: the customer row is updated last, with `WHERE row_version = <expected>`. Nothing is locked
+while an admin has the form open, and the row lock is only held for the end of the edit
+transaction. A stale edit is rolled back; the edit form gets a flash message naming the changed
+fields, JSON clients get 409 and the diff:
+
+    {"contact_no": {"was": "0917...", "current": "0918...", "submitted": "0917..."}, ...}
+
+`was` is the customer as of the version the editor read, taken from that version's outbox event
+(outbox.py); `current` is what is committed now; `submitted` is what the stale edit sent (only
+for the fields the edit form posts). If the outbox no longer has the old version (compacted), the
+diff lists the fields where the submitted values differ from the current ones, without `was`.
+"""
+import datetime
+import decimal
+import json
+
+VERSION_FIELD = 'row_version'
+
+BASE_SNAPSHOT_SQL = """
+    SELECT payload FROM customer_outbox
+    WHERE cust_no = %s::uuid AND payload->>'row_version' = %s
+    ORDER BY event_id DESC LIMIT 1;
+"""
+
+# Bookkeeping columns that are not part of the diff
+_SKIPPED = ('cust_no', VERSION_FIELD)
+
+
+def expected_version(form, headers):
+    """
+    The row_version the client read: the form's row_version field, else an If-Match header
+    ('"7"' or 'W/"7"'). None when neither is present or it is not a number.
+    """
+    value = str(form.get(VERSION_FIELD) or headers.get('If-Match', '')).strip()
+    if value.startswith('W/'):
+        value = value[2:]
+    try:
+        return int(value.strip('"'))
+    except ValueError:
+        return None
+
+
+def etag(row_version):
+    return f'"{row_version}"'
+
+
+def _plain(value):
+    """A profile value as it appears in JSON, so database values, snapshots and form input compare."""
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    if value == '':
+        return None
+    return value
+
+
+def base_snapshot(cursor, cust_no, row_version):
+    """The customer's profile as of row_version, from the outbox, or None if it is no longer there."""
+    cursor.execute(BASE_SNAPSHOT_SQL, (str(cust_no), str(row_version)))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    payload = row[0]
+    return json.loads(payload) if isinstance(payload, str) else payload
+
+
+def conflict_diff(base, current, submitted):
+    """
+    The diff for a stale edit (see the module docstring). base is the snapshot at the expected
+    version or None; current is the committed profile as a dict; submitted maps profile columns to
+    the values the edit sent.
+    """
+    diff = {}
+    for field, value in current.items():
+        if field in _SKIPPED:
+            continue
+        now = _plain(value)
+        entry = {'current': now}
+        if field in submitted:
+            entry['submitted'] = _plain(submitted[field])
+        if base is not None:
+            was = _plain(base.get(field))
+            if was == now:
+                continue
+            entry['was'] = was
+        elif 'submitted' not in entry or entry['submitted'] == now:
+            continue
+        diff[field] = entry
+    return diff
@@ -0,0 +1,91 @@
+"""
+Per-process pool of primary-database connections for app.py.
+
+Connections are PooledConnection objects: conn.close() hands the connection back to the pool
+(rolled back and reset to autocommit off) instead of closing it, so the existing
+`finally: conn.close()` blocks in app.py keep working unchanged. Keeping connections open is also
+what makes the server-side prepared statements in prepared.py worth having.
+"""
+import os
+import threading
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """A connection that remembers its prepared statements and returns itself to its pool on close()."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+        self.prepared_generation = 0
+        self.pool = None
+        self.idle_in_pool = False
+
+    def close(self):
+        if self.idle_in_pool:
+            return  # already handed back; a second close() must not close it under the pool
+        pool, self.pool = self.pool, None
+        if pool is not None and not self.closed:
+            pool.release(self)
+        else:
+            super().close()
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of up to max_connections PooledConnections to one database URL.
+    Created lazily per process, so gunicorn workers forked after import each get their own.
+    """
+
+    def __init__(self, db_url, min_connections, max_connections):
+        self.db_url = db_url
+        self.min_connections = min_connections
+        self.max_connections = max_connections
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_pool(self):
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                # Connections inherited across fork belong to the parent; never touch them here.
+                self._pool = psycopg2.pool.ThreadedConnectionPool(
+                    self.min_connections, self.max_connections, self.db_url, connection_factory=PooledConnection,
+                )
+                self._pid = os.getpid()
+                print(f"Opened PostgreSQL connection pool (max {self.max_connections}) in process {self._pid}.")
+            return self._pool
+
+    def connect(self):
+        """Checks out a connection. Raises psycopg2.pool.PoolError at once when all are in use."""
+        pool = self._ensure_pool()
+        conn = pool.getconn()
+        while conn.closed:
+            pool.putconn(conn, close=True)
+            conn = pool.getconn()
+        conn.idle_in_pool = False
+        conn.pool = self
+        return conn
+
+    def release(self, conn):
+        pool = self._pool
+        if pool is None or self._pid != os.getpid():
+            conn.close()
+            return
+        status = conn.info.transaction_status
+        if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+            pool.putconn(conn, close=True)  # broken connection: drop it
+            return
+        try:
+            if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            if conn.autocommit:
+                conn.autocommit = False
+        except psycopg2.Error:
+            pool.putconn(conn, close=True)
+            return
+        conn.idle_in_pool = True
+        pool.putconn(conn)
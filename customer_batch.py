@@ -0,0 +1,226 @@
+"""
+Batch customer creation: many validated customers per transaction, one multi-row INSERT per table.
+
+POST /admin/customers/batch (app.py) takes {"customers": [...]}, each item either a registration
+body ({"registration1": {...}, ...}, as /submitRegistration gets) or an object with the admin
+form's field names, and validates every item first (validation.py). Invalid items and emails
+that repeat within the batch or are already registered are answered without being written; the
+rest go to insert_chunk() in chunks of batch_config['chunk_size'], each chunk under its own
+savepoint in one transaction per database. A chunk writes the occupation, financial_record,
+customer, employer, spouse, affiliation, bank and public-official rows with
+psycopg2.extras.execute_values, with the keys generated here (uuid7) so no RETURNING is needed to
+link the rows, then screens the names and refreshes the search documents, outbox events and
+duplicate-check jobs of the whole chunk in one statement each.
+
+A chunk that fails (an email taken by a concurrent registration since the pre-check, a bank code
+that is not in bank_details) is rolled back to its savepoint and retried one customer at a time,
+each under its own savepoint, so only the offending customers fail. Each item gets a result, in
+request order:
+
+    {"index": 0, "status": "created", "cust_no": "..."}
+    {"index": 1, "status": "duplicate", "field": "email_address", "message": "..."}
+    {"index": 2, "status": "invalid", "errors": {"registration1.dob": "..."}}
+    {"index": 3, "status": "failed", "message": "..."}
+"""
+import psycopg2
+import psycopg2.extras
+
+from uuid7 import uuid7
+import income
+import jobs
+import outbox
+import search_index
+import validation
+
+CREATED = 'created'
+DUPLICATE = 'duplicate'
+INVALID = 'invalid'
+FAILED = 'failed'
+
+OCCUPATION_SQL = "INSERT INTO occupation (occ_id, occ_type, bus_nature) VALUES %s;"
+FINANCIAL_RECORD_SQL = """
+    INSERT INTO financial_record (fin_code, source_wealth, mon_income, ann_income, source_wealth_items,
+                                  mon_income_min, mon_income_max, ann_income_min, ann_income_max) VALUES %s;
+"""
+CUSTOMER_SQL = """
+    INSERT INTO customer (cust_no, custname, datebirth, nationality, citizenship, custsex, placebirth, civilstatus,
+                          num_children, mmaiden_name, cust_address, email_address, contact_no, occ_id, fin_code,
+                          registration_status) VALUES %s;
+"""
+EMPLOYER_SQL = """
+    INSERT INTO employer_details (emp_id, occ_id, tin_id, empname, emp_address, phonefax_no, job_title, emp_date)
+    VALUES %s;
+"""
+EMPLOYMENT_SQL = "INSERT INTO employment_details (cust_no, emp_id) VALUES %s;"
+SPOUSE_SQL = "INSERT INTO spouse (cust_no, sp_name, sp_datebirth, sp_profession) VALUES %s;"
+AFFILIATION_SQL = "INSERT INTO company_affiliation (cust_no, depositor_role, dep_compname) VALUES %s;"
+BANK_SQL = "INSERT INTO existing_bank (cust_no, bank_code, acc_type) VALUES %s;"
+OFFICIAL_SQL = "INSERT INTO public_official_details (gov_int_id, gov_int_name, official_position, branch_orgname) VALUES %s;"
+RELATIONSHIP_SQL = "INSERT INTO cust_po_relationship (cust_no, gov_int_id, relation_desc) VALUES %s;"
+
+# Same match as the single-customer path (find_public_official): name and position, NULLs never match.
+FIND_OFFICIALS_SQL = """
+    SELECT v.name, v.position,
+           (SELECT p.gov_int_id FROM public_official_details p
+            WHERE p.gov_int_name = v.name AND p.official_position = v.position LIMIT 1)
+    FROM (VALUES %s) AS v (name, position);
+"""
+
+# (table, statement) in foreign-key order; each gets the rows insert_chunk() collected for it.
+_TABLES = (
+    ('occupation', OCCUPATION_SQL),
+    ('financial_record', FINANCIAL_RECORD_SQL),
+    ('customer', CUSTOMER_SQL),
+    ('employer_details', EMPLOYER_SQL),
+    ('employment_details', EMPLOYMENT_SQL),
+    ('spouse', SPOUSE_SQL),
+    ('company_affiliation', AFFILIATION_SQL),
+    ('existing_bank', BANK_SQL),
+    ('cust_po_relationship', RELATIONSHIP_SQL),
+)
+
+
+def validate_item(item):
+    """The CustomerPayload of one batch item: registration-shaped if it has registration1, else admin form names."""
+    if isinstance(item, dict) and 'registration1' in item:
+        return validation.validate_registration(item)
+    return validation.validate_customer_form(item)
+
+
+def has_official(payload):
+    return bool(payload.gov_int_name or payload.official_position or payload.branch_orgname or payload.relation_desc)
+
+
+def existing_emails(cursor, emails, partitioned=False):
+    """The subset of emails already registered (the registry table in the partitioned layout)."""
+    if not emails:
+        return set()
+    table = 'customer_email_registry' if partitioned else 'customer'
+    cursor.execute(f"SELECT email_address FROM {table} WHERE email_address = ANY(%s);", (list(emails),))
+    return {row[0] for row in cursor.fetchall()}
+
+
+def known_bank_codes(cursor, codes):
+    """The subset of bank codes present in bank_details."""
+    if not codes:
+        return set()
+    cursor.execute("SELECT bank_code FROM bank_details WHERE bank_code = ANY(%s);", (list(codes),))
+    return {row[0] for row in cursor.fetchall()}
+
+
+def _official_ids(cursor, payloads):
+    """{(name, position): gov_int_id} for the chunk's officials, inserting the ones not found."""
+    branches = {}
+    for payload in payloads:
+        if has_official(payload):
+            branches.setdefault((payload.gov_int_name, payload.official_position), payload.branch_orgname)
+    if not branches:
+        return {}
+    found = psycopg2.extras.execute_values(cursor, FIND_OFFICIALS_SQL, list(branches),
+                                           template="(%s::varchar, %s::varchar)", page_size=len(branches), fetch=True)
+    ids = {}
+    missing = []
+    for name, position, gov_int_id in found:
+        if gov_int_id is None:
+            gov_int_id = str(uuid7())
+            missing.append((gov_int_id, name, position, branches[(name, position)]))
+        ids[(name, position)] = gov_int_id
+    if missing:
+        psycopg2.extras.execute_values(cursor, OFFICIAL_SQL, missing, page_size=len(missing))
+    return ids
+
+
+def insert_chunk(cursor, entries, screen):
+    """
+    Writes entries, a list of (cust_no, CustomerPayload), in the caller's transaction with one
+    INSERT per table, then screen(cursor, cust_no, custname) for each customer and the search,
+    outbox and duplicate-check rows for all of them. Raises psycopg2.Error on any failure.
+    """
+    rows = {table: [] for table, _ in _TABLES}
+    officials = _official_ids(cursor, [payload for _, payload in entries])
+    for cust_no, p in entries:
+        cust_no = str(cust_no)
+        occ_id = fin_code = None
+        if p.occ_type or p.bus_nature:
+            occ_id = str(uuid7())
+            rows['occupation'].append((occ_id, p.occ_type, p.bus_nature))
+        if p.source_wealth or p.mon_income or p.ann_income:
+            fin_code = str(uuid7())
+            rows['financial_record'].append(
+                (fin_code, p.source_wealth, p.mon_income, p.ann_income)
+                + income.financial_record_values(p.source_wealth_items, p.mon_income, p.ann_income))
+        rows['customer'].append((
+            cust_no, p.custname, p.datebirth, p.nationality, p.citizenship, p.custsex, p.placebirth, p.civilstatus,
+            p.num_children, p.mmaiden_name, p.cust_address, p.email_address, p.contact_no, occ_id, fin_code,
+            p.registration_status))
+        if p.occ_type == 'Employed':
+            emp_id = str(uuid7())
+            rows['employer_details'].append(
+                (emp_id, occ_id, p.tin_id, p.empname, p.emp_address, p.phonefax_no, p.job_title, p.emp_date))
+            rows['employment_details'].append((cust_no, emp_id))
+        if p.sp_name:
+            rows['spouse'].append((cust_no, p.sp_name, p.sp_datebirth, p.sp_profession))
+        if p.depositor_role or p.dep_compname:
+            rows['company_affiliation'].append((cust_no, p.depositor_role, p.dep_compname))
+        if p.bank_code and p.acc_type:
+            rows['existing_bank'].append((cust_no, p.bank_code, p.acc_type))
+        if has_official(p):
+            rows['cust_po_relationship'].append(
+                (cust_no, officials[(p.gov_int_name, p.official_position)], p.relation_desc))
+
+    for table, sql in _TABLES:
+        if rows[table]:
+            psycopg2.extras.execute_values(cursor, sql, rows[table], page_size=len(rows[table]))
+
+    cust_nos = [str(cust_no) for cust_no, _ in entries]
+    for cust_no, payload in entries:
+        screen(cursor, cust_no, payload.custname)
+    search_index.refresh_documents(cursor, cust_nos)
+    outbox.record_many(cursor, outbox.CREATED, cust_nos)
+    jobs.enqueue_many(cursor, 'duplicate_check', [{'cust_no': cust_no} for cust_no in cust_nos])
+
+
+def failure_result(index, err):
+    """The per-item result for a customer whose own insert failed."""
+    message = str(err).strip().splitlines()[0] if str(err).strip() else type(err).__name__
+    if isinstance(err, psycopg2.IntegrityError):
+        if 'email_address' in str(err):
+            return {'index': index, 'status': DUPLICATE, 'field': 'email_address',
+                    'message': 'Email address already registered.'}
+        if 'bank_details' in str(err):
+            return {'index': index, 'status': INVALID, 'errors': {'bankCode': 'unknown bank code'}}
+    return {'index': index, 'status': FAILED, 'message': message}
+
+
+def write_group(conn, items, chunk_size, screen):
+    """
+    Inserts items, a list of (index, cust_no, CustomerPayload) for one database, in one transaction:
+    chunk by chunk under savepoints, falling back to one customer per savepoint for a failed chunk.
+    Returns ({index: result}, [indexes committed]). The caller commits.
+    """
+    results = {}
+    created = []
+    with conn.cursor() as cursor:
+        for start in range(0, len(items), chunk_size):
+            chunk = items[start:start + chunk_size]
+            cursor.execute("SAVEPOINT batch_chunk;")
+            try:
+                insert_chunk(cursor, [(cust_no, payload) for _, cust_no, payload in chunk], screen)
+                cursor.execute("RELEASE SAVEPOINT batch_chunk;")
+                created.extend(chunk)
+                continue
+            except psycopg2.Error as err:
+                cursor.execute("ROLLBACK TO SAVEPOINT batch_chunk;")
+                print(f"Batch chunk of {len(chunk)} failed, retrying one by one: {str(err).strip()}")
+            for index, cust_no, payload in chunk:
+                cursor.execute("SAVEPOINT batch_item;")
+                try:
+                    insert_chunk(cursor, [(cust_no, payload)], screen)
+                    cursor.execute("RELEASE SAVEPOINT batch_item;")
+                    created.append((index, cust_no, payload))
+                except psycopg2.Error as err:
+                    cursor.execute("ROLLBACK TO SAVEPOINT batch_item;")
+                    results[index] = failure_result(index, err)
+    for index, cust_no, _ in created:
+        results[index] = {'index': index, 'status': CREATED, 'cust_no': str(cust_no)}
+    return results, [index for index, _, _ in created]
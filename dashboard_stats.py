@@ -0,0 +1,333 @@
+import sys
+
+import psycopg2
+
+from db_config import get_db_url
+import income
+
+# Days are bucketed in the bank's local time regardless of the session TimeZone.
+STATS_TIMEZONE = 'Asia/Manila'
+UNSPECIFIED = 'Unspecified'
+# Sub-rows per (dimension, bucket). Every registration bumps ('registration_status', 'Pending') and
+# today's registrations_per_day row, so a single row per bucket would make concurrent writers queue
+# on its lock until commit; each backend bumps its own slot (pg_backend_pid() % STAT_SLOTS) instead,
+# and readers sum the slots. The slot is fixed per connection rather than random so that a
+# transaction touching a bucket many times (batch inserts) always locks the same row and two
+# transactions cannot take each other's slots in opposite orders.
+STAT_SLOTS = 16
+
+# income_bracket counts customers by the monthly bracket code (income.MONTHLY_INCOME_BRACKETS) their
+# mon_income_min falls in, not by the raw mon_income text: the admin forms and batch creation also
+# accept plain amounts and printed labels, which would each get a bucket of their own.
+_BRACKETS = sorted(income.MONTHLY_INCOME_BRACKETS.items(), key=lambda item: item[1][0])
+INCOME_BRACKET_CODES = tuple(code for code, _ in _BRACKETS)
+INCOME_BRACKET_SQL = "CASE WHEN p_min IS NULL THEN NULL " + " ".join(
+    f"WHEN p_min <= {upper} THEN '{code}'" if upper is not None else f"ELSE '{code}'"
+    for code, (_, upper) in _BRACKETS
+) + " END"
+
+# STAT_SLOTS rows per (dimension, bucket). Kept current by the triggers below in the same
+# transaction as the base-table change, so reading it is a primary-key range scan.
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS dashboard_stat (
+        dimension VARCHAR(50) NOT NULL,
+        bucket TEXT NOT NULL,
+        slot SMALLINT NOT NULL DEFAULT 0,
+        value BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (dimension, bucket, slot)
+    );
+    -- Tables from before the slots: one row per bucket becomes slot 0.
+    ALTER TABLE dashboard_stat ADD COLUMN IF NOT EXISTS slot SMALLINT NOT NULL DEFAULT 0;
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_index WHERE indrelid = 'dashboard_stat'::regclass
+                       AND indisprimary AND indnatts = 3) THEN
+            ALTER TABLE dashboard_stat DROP CONSTRAINT dashboard_stat_pkey,
+                ADD PRIMARY KEY (dimension, bucket, slot);
+        END IF;
+    END;
+    $$;
+
+    CREATE INDEX IF NOT EXISTS idx_customer_occ_id ON customer (occ_id);
+    CREATE INDEX IF NOT EXISTS idx_customer_fin_code ON customer (fin_code);
+
+    CREATE OR REPLACE FUNCTION dashboard_stat_bump(p_dimension TEXT, p_bucket TEXT, p_delta BIGINT)
+    RETURNS void AS $$
+    BEGIN
+        IF p_delta = 0 THEN
+            RETURN;
+        END IF;
+        INSERT INTO dashboard_stat (dimension, bucket, slot, value)
+        VALUES (p_dimension, COALESCE(p_bucket, '{unspecified}'), pg_backend_pid() % {slots}, p_delta)
+        ON CONFLICT (dimension, bucket, slot) DO UPDATE SET value = dashboard_stat.value + EXCLUDED.value;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION dashboard_income_bracket(p_min NUMERIC) RETURNS TEXT AS $$
+        SELECT {income_bracket};
+    $$ LANGUAGE sql IMMUTABLE;
+
+    CREATE OR REPLACE FUNCTION dashboard_stat_move(p_dimension TEXT, p_op TEXT, p_old TEXT, p_new TEXT)
+    RETURNS void AS $$
+    BEGIN
+        IF p_op = 'UPDATE' AND p_old IS NOT DISTINCT FROM p_new THEN
+            RETURN;
+        END IF;
+        IF p_op <> 'INSERT' THEN
+            PERFORM dashboard_stat_bump(p_dimension, p_old, -1);
+        END IF;
+        IF p_op <> 'DELETE' THEN
+            PERFORM dashboard_stat_bump(p_dimension, p_new, 1);
+        END IF;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION dashboard_stat_customer_trg() RETURNS trigger AS $$
+    DECLARE
+        old_status TEXT; new_status TEXT;
+        old_day TEXT; new_day TEXT;
+        old_occ TEXT; new_occ TEXT;
+        old_income TEXT; new_income TEXT;
+    BEGIN
+        IF TG_OP <> 'INSERT' THEN
+            old_status := OLD.registration_status;
+            old_day := to_char(OLD.registered_at AT TIME ZONE '{timezone}', 'YYYY-MM-DD');
+        END IF;
+        IF TG_OP <> 'DELETE' THEN
+            new_status := NEW.registration_status;
+            new_day := to_char(NEW.registered_at AT TIME ZONE '{timezone}', 'YYYY-MM-DD');
+        END IF;
+        -- Only look up the referenced occupation/financial record when the link itself changed;
+        -- changes to those rows are handled by their own triggers.
+        IF TG_OP <> 'UPDATE' OR OLD.occ_id IS DISTINCT FROM NEW.occ_id THEN
+            IF TG_OP <> 'INSERT' THEN
+                SELECT occ_type INTO old_occ FROM occupation WHERE occ_id = OLD.occ_id;
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                SELECT occ_type INTO new_occ FROM occupation WHERE occ_id = NEW.occ_id;
+            END IF;
+        END IF;
+        IF TG_OP <> 'UPDATE' OR OLD.fin_code IS DISTINCT FROM NEW.fin_code THEN
+            IF TG_OP <> 'INSERT' THEN
+                SELECT dashboard_income_bracket(mon_income_min) INTO old_income FROM financial_record
+                WHERE fin_code = OLD.fin_code;
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                SELECT dashboard_income_bracket(mon_income_min) INTO new_income FROM financial_record
+                WHERE fin_code = NEW.fin_code;
+            END IF;
+        END IF;
+        PERFORM dashboard_stat_move('registration_status', TG_OP, old_status, new_status);
+        PERFORM dashboard_stat_move('registrations_per_day', TG_OP, old_day, new_day);
+        PERFORM dashboard_stat_move('occupation_type', TG_OP, old_occ, new_occ);
+        PERFORM dashboard_stat_move('income_bracket', TG_OP, old_income, new_income);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    -- A renamed occupation type moves every customer pointing at it.
+    CREATE OR REPLACE FUNCTION dashboard_stat_occupation_update_trg() RETURNS trigger AS $$
+    DECLARE
+        n BIGINT;
+    BEGIN
+        IF OLD.occ_type IS DISTINCT FROM NEW.occ_type THEN
+            SELECT count(*) INTO n FROM customer WHERE occ_id = NEW.occ_id;
+            PERFORM dashboard_stat_bump('occupation_type', OLD.occ_type, -n);
+            PERFORM dashboard_stat_bump('occupation_type', NEW.occ_type, n);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    -- Runs BEFORE DELETE: the ON DELETE SET NULL update that follows on customer can no
+    -- longer see the occupation row, so the move to Unspecified is accounted for here.
+    CREATE OR REPLACE FUNCTION dashboard_stat_occupation_delete_trg() RETURNS trigger AS $$
+    DECLARE
+        n BIGINT;
+    BEGIN
+        SELECT count(*) INTO n FROM customer WHERE occ_id = OLD.occ_id;
+        PERFORM dashboard_stat_bump('occupation_type', OLD.occ_type, -n);
+        PERFORM dashboard_stat_bump('occupation_type', NULL, n);
+        RETURN OLD;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION dashboard_stat_financial_update_trg() RETURNS trigger AS $$
+    DECLARE
+        n BIGINT;
+    BEGIN
+        IF dashboard_income_bracket(OLD.mon_income_min) IS DISTINCT FROM dashboard_income_bracket(NEW.mon_income_min) THEN
+            SELECT count(*) INTO n FROM customer WHERE fin_code = NEW.fin_code;
+            PERFORM dashboard_stat_bump('income_bracket', dashboard_income_bracket(OLD.mon_income_min), -n);
+            PERFORM dashboard_stat_bump('income_bracket', dashboard_income_bracket(NEW.mon_income_min), n);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION dashboard_stat_financial_delete_trg() RETURNS trigger AS $$
+    DECLARE
+        n BIGINT;
+    BEGIN
+        SELECT count(*) INTO n FROM customer WHERE fin_code = OLD.fin_code;
+        PERFORM dashboard_stat_bump('income_bracket', dashboard_income_bracket(OLD.mon_income_min), -n);
+        PERFORM dashboard_stat_bump('income_bracket', NULL, n);
+        RETURN OLD;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS dashboard_stat_customer ON customer;
+    CREATE TRIGGER dashboard_stat_customer
+        AFTER INSERT OR DELETE OR UPDATE OF registration_status, registered_at, occ_id, fin_code ON customer
+        FOR EACH ROW EXECUTE FUNCTION dashboard_stat_customer_trg();
+
+    DROP TRIGGER IF EXISTS dashboard_stat_occupation_update ON occupation;
+    CREATE TRIGGER dashboard_stat_occupation_update
+        AFTER UPDATE OF occ_type ON occupation
+        FOR EACH ROW EXECUTE FUNCTION dashboard_stat_occupation_update_trg();
+
+    DROP TRIGGER IF EXISTS dashboard_stat_occupation_delete ON occupation;
+    CREATE TRIGGER dashboard_stat_occupation_delete
+        BEFORE DELETE ON occupation
+        FOR EACH ROW EXECUTE FUNCTION dashboard_stat_occupation_delete_trg();
+
+    DROP TRIGGER IF EXISTS dashboard_stat_financial_update ON financial_record;
+    CREATE TRIGGER dashboard_stat_financial_update
+        AFTER UPDATE OF mon_income_min ON financial_record
+        FOR EACH ROW EXECUTE FUNCTION dashboard_stat_financial_update_trg();
+
+    DROP TRIGGER IF EXISTS dashboard_stat_financial_delete ON financial_record;
+    CREATE TRIGGER dashboard_stat_financial_delete
+        BEFORE DELETE ON financial_record
+        FOR EACH ROW EXECUTE FUNCTION dashboard_stat_financial_delete_trg();
+
+    -- income_bracket used to be keyed by the raw mon_income text: recount it once by bracket code.
+    DO $$
+    BEGIN
+        IF EXISTS (SELECT 1 FROM dashboard_stat WHERE dimension = 'income_bracket'
+                   AND bucket NOT IN ({income_buckets})) THEN
+            LOCK TABLE dashboard_stat IN EXCLUSIVE MODE;
+            DELETE FROM dashboard_stat WHERE dimension = 'income_bracket';
+            INSERT INTO dashboard_stat (dimension, bucket, slot, value)
+            SELECT 'income_bracket', COALESCE(dashboard_income_bracket(f.mon_income_min), '{unspecified}'), 0, count(*)
+            FROM customer c LEFT JOIN financial_record f ON c.fin_code = f.fin_code
+            GROUP BY 2;
+        END IF;
+    END;
+    $$;
+""".replace('{timezone}', STATS_TIMEZONE).replace('{unspecified}', UNSPECIFIED).replace('{slots}', str(STAT_SLOTS)).replace('{income_bracket}', INCOME_BRACKET_SQL).replace(
+    '{income_buckets}', ', '.join(f"'{code}'" for code in INCOME_BRACKET_CODES + (UNSPECIFIED,)))
+
+# The same aggregates computed from the base tables, used only by reconcile().
+RECOMPUTE_SQL = """
+    SELECT 'registration_status', COALESCE(registration_status, %(unspecified)s), count(*)
+    FROM customer GROUP BY 2
+    UNION ALL
+    SELECT 'registrations_per_day',
+           COALESCE(to_char(registered_at AT TIME ZONE %(timezone)s, 'YYYY-MM-DD'), %(unspecified)s), count(*)
+    FROM customer GROUP BY 2
+    UNION ALL
+    SELECT 'occupation_type', COALESCE(o.occ_type, %(unspecified)s), count(*)
+    FROM customer c LEFT JOIN occupation o ON c.occ_id = o.occ_id GROUP BY 2
+    UNION ALL
+    SELECT 'income_bracket', COALESCE(dashboard_income_bracket(f.mon_income_min), %(unspecified)s), count(*)
+    FROM customer c LEFT JOIN financial_record f ON c.fin_code = f.fin_code GROUP BY 2;
+"""
+
+
+def ensure_schema(cursor):
+    """Creates the summary table, its triggers, and the FK indexes the triggers count through."""
+    cursor.execute(SCHEMA_SQL)
+
+
+def is_empty(cursor):
+    cursor.execute("SELECT NOT EXISTS (SELECT 1 FROM dashboard_stat);")
+    return cursor.fetchone()[0]
+
+
+def fetch_stats(cursor, days=30):
+    """
+    Reads all dimensions as {dimension: {bucket: value}}.
+    registrations_per_day is limited to the last `days` days; customers without a registration
+    date are reported separately as registrations_undated ({'Unspecified': n}).
+    """
+    cursor.execute("""
+        SELECT CASE WHEN dimension = 'registrations_per_day' AND bucket = %(unspecified)s
+                    THEN 'registrations_undated' ELSE dimension END,
+               bucket, sum(value)::bigint
+        FROM dashboard_stat
+        WHERE dimension <> 'registrations_per_day'
+           OR bucket = %(unspecified)s
+           OR bucket >= to_char((now() AT TIME ZONE %(timezone)s)::date - %(days)s, 'YYYY-MM-DD')
+        GROUP BY 1, 2
+        HAVING sum(value) <> 0
+        ORDER BY 1, 2;
+    """, {'unspecified': UNSPECIFIED, 'timezone': STATS_TIMEZONE, 'days': days})
+    stats = {}
+    for dimension, bucket, value in cursor.fetchall():
+        stats.setdefault(dimension, {})[bucket] = value
+    return stats
+
+
+def reconcile(conn, repair=False):
+    """
+    Compares dashboard_stat against a fresh aggregate of the base tables and returns the list of
+    (dimension, bucket, stored, actual) mismatches. With repair=True the stored values are corrected.
+
+    Check-only runs use one REPEATABLE READ snapshot, which is exact without blocking writers because
+    the triggers update dashboard_stat in the same transaction as the base rows. Repair runs lock
+    dashboard_stat first so no trigger can bump a row between the recount and the overwrite.
+    """
+    conn.autocommit = False
+    if not repair:
+        conn.set_session(isolation_level=psycopg2.extensions.ISOLATION_LEVEL_REPEATABLE_READ)
+    try:
+        with conn.cursor() as cursor:
+            if repair:
+                cursor.execute("LOCK TABLE dashboard_stat IN EXCLUSIVE MODE;")
+            cursor.execute(RECOMPUTE_SQL, {'unspecified': UNSPECIFIED, 'timezone': STATS_TIMEZONE})
+            actual = {(dim, bucket): value for dim, bucket, value in cursor.fetchall()}
+            cursor.execute("SELECT dimension, bucket, sum(value)::bigint FROM dashboard_stat GROUP BY 1, 2;")
+            stored = {(dim, bucket): value for dim, bucket, value in cursor.fetchall()}
+
+            mismatches = []
+            for key in sorted(set(actual) | set(stored)):
+                if actual.get(key, 0) != stored.get(key, 0):
+                    mismatches.append((key[0], key[1], stored.get(key, 0), actual.get(key, 0)))
+
+            if repair and mismatches:
+                for dimension, bucket, _, value in mismatches:
+                    # The corrected total replaces every slot of the bucket.
+                    cursor.execute("DELETE FROM dashboard_stat WHERE dimension = %s AND bucket = %s;",
+                                   (dimension, bucket))
+                    cursor.execute("INSERT INTO dashboard_stat (dimension, bucket, slot, value) VALUES (%s, %s, 0, %s);",
+                                   (dimension, bucket, value))
+                cursor.execute("DELETE FROM dashboard_stat WHERE value = 0;")
+        conn.commit()
+        return mismatches
+    except psycopg2.Error:
+        conn.rollback()
+        raise
+    finally:
+        if not repair:
+            conn.set_session(isolation_level=psycopg2.extensions.ISOLATION_LEVEL_DEFAULT)
+
+
+if __name__ == '__main__':
+    # Consistency check job: python dashboard_stats.py [--repair]
+    # Exits non-zero when drift was found and not repaired, so it can run from cron.
+    repair = '--repair' in sys.argv[1:]
+    conn = psycopg2.connect(get_db_url())
+    try:
+        found = reconcile(conn, repair=repair)
+    finally:
+        conn.close()
+    for dimension, bucket, stored_value, actual_value in found:
+        print(f"  - {dimension} / {bucket}: stored {stored_value}, actual {actual_value}")
+    if not found:
+        print("Dashboard statistics are consistent with the base tables.")
+    elif repair:
+        print(f"Repaired {len(found)} dashboard statistic(s).")
+    else:
+        print(f"Found {len(found)} inconsistent dashboard statistic(s). Re-run with --repair to fix.")
+        sys.exit(1)
@@ -1,4 +1,7 @@
+import itertools
 import os
+import threading
+import time
 
 # Database configuration for local development
 # For Render, a DATABASE_URL environment variable will be used.
@@ -29,6 +32,234 @@ def get_db_url():
         config = local_db_config
         return f"postgresql://{config['user']}:{config['password']}@{config['host']}:{config['port']}/{config['database']}"
 
+# Read replicas are optional. Set DATABASE_REPLICA_URLS to a comma-separated list of
+# postgres:// URLs; read-only views are then spread across them and writes stay on the primary.
+replica_config = {
+    # Replicas further behind the primary than this are skipped and reads fall back to the primary.
+    'max_lag_seconds': float(os.environ.get('REPLICA_MAX_LAG_SECONDS', '5')),
+    # After a session writes, its reads go to the primary for this long so it sees its own changes.
+    'read_your_writes_seconds': float(os.environ.get('READ_YOUR_WRITES_SECONDS', '10')),
+    # A replica that fails to connect is taken out of rotation for this long.
+    'eject_seconds': float(os.environ.get('REPLICA_EJECT_SECONDS', '30')),
+    # How long a measured replication lag is trusted before it is measured again.
+    'lag_check_interval_seconds': float(os.environ.get('REPLICA_LAG_CHECK_INTERVAL_SECONDS', '2')),
+    'connect_timeout': int(os.environ.get('REPLICA_CONNECT_TIMEOUT', '3')),
+}
+
+# Optional hash partitioning of the customer graph (see partitioning.py). 0 means the plain layout.
+# When set, app.py uses the partition-aware lookups, and a fresh (empty) database is partitioned at startup.
+partition_config = {
+    'customer_partitions': int(os.environ.get('CUSTOMER_PARTITIONS', '0')),
+}
+
+# Background job workers (see jobs.py). `python jobs.py work` starts `workers` processes by default.
+job_config = {
+    'workers': int(os.environ.get('JOB_WORKERS', '2')),
+    # Idle workers also wake up on NOTIFY from enqueue(); this is only the fallback poll.
+    'poll_interval_seconds': float(os.environ.get('JOB_POLL_INTERVAL_SECONDS', '5')),
+    # A running job whose worker has not finished it within this long is assumed lost and requeued.
+    'lease_seconds': int(os.environ.get('JOB_LEASE_SECONDS', '300')),
+    # Retry delay is backoff_base_seconds * 2^(attempt - 1), capped at backoff_max_seconds.
+    'backoff_base_seconds': float(os.environ.get('JOB_BACKOFF_BASE_SECONDS', '5')),
+    'backoff_max_seconds': float(os.environ.get('JOB_BACKOFF_MAX_SECONDS', '3600')),
+}
+
+# Admission control for /submitRegistration and /login (see admission.py). Rates are requests per
+# second; bursts are bucket sizes. Global buckets are shared by all workers on the host.
+admission_config = {
+    # DB-bound guarded requests a single worker will run at once before answering 503.
+    'max_concurrent': int(os.environ.get('ADMISSION_MAX_CONCURRENT', '8')),
+    'busy_retry_after_seconds': float(os.environ.get('ADMISSION_BUSY_RETRY_AFTER_SECONDS', '2')),
+    # SQLite file holding the shared buckets; empty means /dev/shm (or the temp dir).
+    'store_path': os.environ.get('ADMISSION_STORE_PATH', ''),
+    # Take the client address from X-Forwarded-For; only enable this behind a proxy that sets it.
+    'trust_forwarded_for': os.environ.get('ADMISSION_TRUST_FORWARDED_FOR', 'False') == 'True',
+    # Proxies in front of the app that append to X-Forwarded-For (Render: 1); the client address is
+    # the entry this many places from the right, entries further left are client-supplied.
+    'trusted_proxy_hops': int(os.environ.get('ADMISSION_TRUSTED_PROXY_HOPS', '1')),
+    'limits': {
+        'register': {
+            'global_rate': float(os.environ.get('REGISTER_GLOBAL_RATE', '20')),
+            'global_burst': float(os.environ.get('REGISTER_GLOBAL_BURST', '40')),
+            'ip_rate': float(os.environ.get('REGISTER_IP_RATE', '0.2')),
+            'ip_burst': float(os.environ.get('REGISTER_IP_BURST', '5')),
+        },
+        'login': {
+            'global_rate': float(os.environ.get('LOGIN_GLOBAL_RATE', '50')),
+            'global_burst': float(os.environ.get('LOGIN_GLOBAL_BURST', '100')),
+            'ip_rate': float(os.environ.get('LOGIN_IP_RATE', '1')),
+            'ip_burst': float(os.environ.get('LOGIN_IP_BURST', '10')),
+        },
+    },
+}
+
+# Per-process pool of primary connections (see connection_pool.py). DB_POOL_MAX=0 turns pooling
+# off and opens one connection per request as before.
+pool_config = {
+    'min_connections': int(os.environ.get('DB_POOL_MIN', '1')),
+    'max_connections': int(os.environ.get('DB_POOL_MAX', '10')),
+}
+
+# Response compression (see compression.py). Brotli is used only when the `brotli` package is installed.
+compression_config = {
+    'enabled': os.environ.get('COMPRESSION_ENABLED', 'True') == 'True',
+    # Bodies smaller than this are sent as they are; compressing them costs more than it saves.
+    'min_size': int(os.environ.get('COMPRESSION_MIN_SIZE', '1024')),
+    'gzip_level': int(os.environ.get('COMPRESSION_GZIP_LEVEL', '6')),
+    'brotli_quality': int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '4')),
+}
+
+# Optional hash sharding of the customer graph across PostgreSQL instances (see sharding.py).
+# Set DATABASE_SHARD_URLS to comma-separated name=url pairs, e.g. "s0=postgres://...,s1=postgres://...";
+# unset means one database as before. The DATABASE_URL database stays the directory: it holds the
+# slot map, the global email/username registries and the master copy of the reference tables.
+shard_config = {
+    # How long a worker trusts its cached slot map. Slot moves wait twice this long before copying
+    # and again before deleting, so every worker has seen each change by then.
+    'map_refresh_seconds': float(os.environ.get('SHARD_MAP_REFRESH_SECONDS', '5')),
+    'connect_timeout': int(os.environ.get('SHARD_CONNECT_TIMEOUT', '3')),
+}
+
+# Customer change feed (see outbox.py). Consumers authenticate with `Authorization: Bearer <feed_token>`
+# or an admin session; an empty token leaves only the admin session.
+outbox_config = {
+    'feed_token': os.environ.get('OUTBOX_FEED_TOKEN', ''),
+    # Most events returned by one long-poll response / written per file-export batch.
+    'max_batch': int(os.environ.get('OUTBOX_MAX_BATCH', '1000')),
+    # How long a long-poll request waits for new events before answering with none.
+    'long_poll_seconds': float(os.environ.get('OUTBOX_LONG_POLL_SECONDS', '25')),
+    # SSE comment line sent on idle streams so proxies keep them open.
+    'heartbeat_seconds': float(os.environ.get('OUTBOX_HEARTBEAT_SECONDS', '15')),
+    # `python outbox.py compact` keeps at least this many days of events.
+    'retain_days': float(os.environ.get('OUTBOX_RETAIN_DAYS', '7')),
+}
+
+# Live admin dashboard updates (see live_updates.py), per worker process.
+live_config = {
+    # Open dashboard streams one worker serves; further ones get 503 and EventSource retries.
+    'max_subscribers': int(os.environ.get('LIVE_MAX_SUBSCRIBERS', '100')),
+    # Recent changes kept in memory to replay to reconnecting dashboards; older gaps replay from the
+    # outbox, and a dashboard further behind than this reloads instead.
+    'replay_events': int(os.environ.get('LIVE_REPLAY_EVENTS', '1000')),
+    # Changes queued for one dashboard before it is disconnected as too slow (it then reconnects and replays).
+    'queue_size': int(os.environ.get('LIVE_QUEUE_SIZE', '256')),
+}
+
+# In-process cache of assembled customer profiles (see profile_cache.py), per worker process.
+profile_cache_config = {
+    # Profiles kept at most; 0 turns the cache off.
+    'max_entries': int(os.environ.get('PROFILE_CACHE_MAX_ENTRIES', '10000')),
+    # Hard cap on the (estimated) memory the cached profiles take.
+    'max_bytes': int(float(os.environ.get('PROFILE_CACHE_MAX_MB', '64')) * 1024 * 1024),
+    # Upper bound on staleness should an invalidation be missed.
+    'ttl_seconds': float(os.environ.get('PROFILE_CACHE_TTL_SECONDS', '300')),
+}
+
+# Batch customer creation (POST /admin/customers/batch, see customer_batch.py).
+batch_config = {
+    # Customers accepted in one request; larger batches get 413.
+    'max_items': int(os.environ.get('BATCH_MAX_ITEMS', '1000')),
+    # Customers written per multi-row statement, each chunk under its own savepoint.
+    'chunk_size': int(os.environ.get('BATCH_CHUNK_SIZE', '100')),
+}
+
+# Hot/cold archival of inactive customers (see archive.py; run: `python archive.py run`).
+archive_config = {
+    # Inactive customers whose status has not changed for this many days move to the archive.
+    'inactive_days': float(os.environ.get('ARCHIVE_INACTIVE_DAYS', '365')),
+    # Customers moved per transaction, and the pause between transactions (throttling).
+    'batch_size': int(os.environ.get('ARCHIVE_BATCH_SIZE', '500')),
+    'pause_seconds': float(os.environ.get('ARCHIVE_PAUSE_SECONDS', '1.0')),
+}
+
+# Per-worker availability filters for /checkAvailability (see availability.py).
+availability_config = {
+    # Filters older than this are rebuilt in the background, picking up emails and usernames taken
+    # through other workers, batch jobs and shards; it bounds how long those can read as available.
+    'rebuild_seconds': float(os.environ.get('AVAILABILITY_REBUILD_SECONDS', '300')),
+}
+
+def get_replica_urls():
+    """
+    Returns the list of read-replica URLs from the DATABASE_REPLICA_URLS environment variable,
+    or an empty list when no replicas are configured.
+    """
+    urls = os.environ.get('DATABASE_REPLICA_URLS', '')
+    return [url.strip() for url in urls.split(',') if url.strip()]
+
+
+def get_shard_urls():
+    """
+    Returns {shard name: URL} from the DATABASE_SHARD_URLS environment variable,
+    or an empty dict when sharding is not configured.
+    """
+    shards = {}
+    for entry in os.environ.get('DATABASE_SHARD_URLS', '').split(','):
+        if entry.strip():
+            name, url = entry.split('=', 1)
+            shards[name.strip()] = url.strip()
+    return shards
+
+
+class ReplicaRouter:
+    """
+    Picks a read replica for read-only work: round-robin over the replicas that are
+    neither ejected (recent connection failure) nor lagging beyond max_lag_seconds.
+    Shared by all requests in a worker, so all state is guarded by a lock.
+    """
+
+    # Works on both primary and standby: 0 on the primary, seconds since last replayed commit on a standby.
+    LAG_SQL = """
+        SELECT CASE WHEN pg_is_in_recovery()
+                    THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+                    ELSE 0 END;
+    """
+
+    def __init__(self, replica_urls, config=None):
+        self.replica_urls = list(replica_urls)
+        self.config = config or replica_config
+        self._cycle = itertools.cycle(range(len(self.replica_urls))) if self.replica_urls else None
+        self._ejected_until = {}
+        self._lag = {}  # url -> (lag_seconds, measured_at)
+        self._lock = threading.Lock()
+
+    def has_replicas(self):
+        return bool(self.replica_urls)
+
+    def candidates(self):
+        """Returns healthy replica URLs, starting from the next one in round-robin order."""
+        if not self.replica_urls:
+            return []
+        now = time.monotonic()
+        with self._lock:
+            start = next(self._cycle)
+            ordered = self.replica_urls[start:] + self.replica_urls[:start]
+            return [url for url in ordered if self._ejected_until.get(url, 0) <= now]
+
+    def eject(self, url):
+        with self._lock:
+            self._ejected_until[url] = time.monotonic() + self.config['eject_seconds']
+        print(f"Replica ejected for {self.config['eject_seconds']}s after a failure.")
+
+    def is_lag_acceptable(self, url, conn):
+        """Checks replication lag on an open replica connection, re-measuring at most every lag_check_interval_seconds."""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._lag.get(url)
+        if cached is None or now - cached[1] > self.config['lag_check_interval_seconds']:
+            with conn.cursor() as cursor:
+                cursor.execute(self.LAG_SQL)
+                lag = float(cursor.fetchone()[0])
+            conn.rollback()
+            with self._lock:
+                self._lag[url] = (lag, now)
+        else:
+            lag = cached[0]
+        return lag <= self.config['max_lag_seconds']
+
+
 if __name__ == '__main__':
     # This block is for testing the configuration loading
     print(f"Database URL to be used: {get_db_url()}")
+    print(f"Read replicas configured: {len(get_replica_urls())}")
+    print(f"Shards configured: {len(get_shard_urls())}")
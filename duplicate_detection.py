@@ -0,0 +1,366 @@
+"""
+Duplicate-customer detection: the same person registered more than once (typically under a
+different email address, the only thing customer enforces as unique).
+
+    python duplicate_detection.py full [--workers 4] [--chunk-size 5000] [--threshold 0.8]
+    python duplicate_detection.py check <cust_no>
+
+Customers are only compared within blocks that share a blocking key, never all-against-all:
+  - name_dob: normalized name tokens (sorted, so "Dela Cruz Juan" == "Juan Dela Cruz") + birth date
+  - sound_dob: Soundex of first and last name token + birth date (spelling variants)
+  - mmaiden: normalized mother's maiden name + Soundex of the first name token
+  - phone: last 10 digits of contact_no
+Keys are kept in customer_blocking_key. Pairs in a block are scored on name, birth date, mother's
+maiden name, phone and address; pairs at or above the threshold become rows in merge_candidate.
+
+New and edited customers are checked incrementally: the write paths in app.py enqueue a
+'duplicate_check' job (jobs.py) that runs check_customer(); `full` re-blocks and re-scores the
+whole base in parallel chunks.
+"""
+import argparse
+import os
+import sys
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import psycopg2
+import psycopg2.extras
+
+from db_config import get_db_url
+from pep_screening import normalize_name, soundex, trigrams
+
+DEFAULT_THRESHOLD = 0.8
+# Blocks larger than this (a shared office phone, a very common name on a common birthday) are
+# not expanded into pairs; the other keys of their members still are.
+MAX_BLOCK_SIZE = 500
+# Field weights; a field missing on either side drops out and the rest are re-normalized.
+WEIGHTS = {'name': 0.45, 'datebirth': 0.25, 'mmaiden_name': 0.15, 'contact_no': 0.1, 'address': 0.05}
+# Without a reasonably similar name, shared phones/addresses are family members, not duplicates.
+MIN_NAME_SIMILARITY = 0.6
+
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS customer_blocking_key (
+        block_key TEXT NOT NULL,
+        cust_no UUID NOT NULL REFERENCES customer (cust_no) ON DELETE CASCADE,
+        PRIMARY KEY (block_key, cust_no)
+    );
+    CREATE INDEX IF NOT EXISTS idx_customer_blocking_key_cust ON customer_blocking_key (cust_no);
+
+    CREATE TABLE IF NOT EXISTS merge_candidate (
+        candidate_id UUID PRIMARY KEY DEFAULT uuid_generate_v7(),
+        cust_no_a UUID NOT NULL REFERENCES customer (cust_no) ON DELETE CASCADE,
+        cust_no_b UUID NOT NULL REFERENCES customer (cust_no) ON DELETE CASCADE,
+        score NUMERIC(5, 4) NOT NULL,
+        matched_fields TEXT[] NOT NULL DEFAULT '{}',
+        review_status VARCHAR(50) NOT NULL DEFAULT 'Pending',
+        detected_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        CHECK (cust_no_a < cust_no_b),
+        UNIQUE (cust_no_a, cust_no_b)
+    );
+    CREATE INDEX IF NOT EXISTS idx_merge_candidate_review ON merge_candidate (review_status, score DESC);
+    CREATE INDEX IF NOT EXISTS idx_merge_candidate_b ON merge_candidate (cust_no_b);
+"""
+
+# As with PEP matches, re-detection refreshes the score but keeps a reviewer's decision.
+UPSERT_CANDIDATES_SQL = """
+    INSERT INTO merge_candidate (cust_no_a, cust_no_b, score, matched_fields)
+    VALUES %s
+    ON CONFLICT (cust_no_a, cust_no_b) DO UPDATE
+    SET score = EXCLUDED.score, matched_fields = EXCLUDED.matched_fields, detected_at = now();
+"""
+
+RECORD_COLUMNS = "cust_no::text, custname, datebirth::text, mmaiden_name, contact_no, cust_address"
+
+
+def normalize_phone(contact_no):
+    digits = ''.join(ch for ch in contact_no or '' if ch.isdigit())
+    return digits[-10:] if len(digits) >= 7 else None
+
+
+def blocking_keys(record):
+    """Blocking keys for a (cust_no, custname, datebirth, mmaiden_name, contact_no, cust_address) record."""
+    _, custname, datebirth, mmaiden_name, contact_no, _ = record
+    tokens = normalize_name(custname)
+    keys = []
+    if tokens and datebirth:
+        keys.append(f"name_dob:{' '.join(sorted(tokens))}|{datebirth}")
+        keys.append(f"sound_dob:{soundex(tokens[0])}{soundex(tokens[-1])}|{datebirth}")
+    maiden_tokens = normalize_name(mmaiden_name)
+    if maiden_tokens and tokens:
+        keys.append(f"mmaiden:{''.join(maiden_tokens)}|{soundex(tokens[0])}")
+    phone = normalize_phone(contact_no)
+    if phone:
+        keys.append(f"phone:{phone}")
+    return keys
+
+
+def _token_grams(tokens):
+    # Per-token trigrams, so "Santos, Maria" and "Maria Santos" compare as equal.
+    grams = set()
+    for token in tokens:
+        grams |= trigrams([token])
+    return grams
+
+
+def _features(record):
+    cust_no, custname, datebirth, mmaiden_name, contact_no, cust_address = record
+    name_tokens = normalize_name(custname)
+    maiden_tokens = normalize_name(mmaiden_name)
+    address_tokens = normalize_name(cust_address)
+    return (
+        cust_no,
+        _token_grams(name_tokens) if name_tokens else None,
+        datebirth,
+        trigrams(maiden_tokens) if maiden_tokens else None,
+        normalize_phone(contact_no),
+        trigrams(address_tokens) if address_tokens else None,
+    )
+
+
+def _dice(a, b):
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+def score_pair(left, right):
+    """Returns (score, matched_fields) for two _features() tuples, or None if the names are too far apart."""
+    _, name_a, dob_a, maiden_a, phone_a, address_a = left
+    _, name_b, dob_b, maiden_b, phone_b, address_b = right
+    if not name_a or not name_b:
+        return None
+    similarities = {'name': _dice(name_a, name_b)}
+    if similarities['name'] < MIN_NAME_SIMILARITY:
+        return None
+    if dob_a and dob_b:
+        similarities['datebirth'] = 1.0 if dob_a == dob_b else 0.0
+    if maiden_a and maiden_b:
+        similarities['mmaiden_name'] = _dice(maiden_a, maiden_b)
+    if phone_a and phone_b:
+        similarities['contact_no'] = 1.0 if phone_a == phone_b else 0.0
+    if address_a and address_b:
+        similarities['address'] = _dice(address_a, address_b)
+    # A name match alone is not evidence of a duplicate; require one more comparable field.
+    if len(similarities) < 2:
+        return None
+    total_weight = sum(WEIGHTS[field] for field in similarities)
+    score = sum(WEIGHTS[field] * value for field, value in similarities.items()) / total_weight
+    return score, sorted(field for field, value in similarities.items() if value >= 0.9)
+
+
+def _ordered_row(left_id, right_id, score, fields):
+    if left_id > right_id:
+        left_id, right_id = right_id, left_id
+    return (left_id, right_id, round(score, 4), fields)
+
+
+def ensure_schema(cursor):
+    cursor.execute(SCHEMA_SQL)
+
+
+def check_customer(cursor, cust_no, threshold=DEFAULT_THRESHOLD):
+    """
+    Incremental check for one new or edited customer, inside the caller's transaction:
+    refreshes its blocking keys, scores it against the other members of its blocks and upserts
+    merge candidates. Returns the number of candidates recorded.
+    """
+    cursor.execute(f"SELECT {RECORD_COLUMNS} FROM customer WHERE cust_no = %s;", (str(cust_no),))
+    record = cursor.fetchone()
+    if not record:
+        return 0
+    keys = blocking_keys(record)
+    cursor.execute("DELETE FROM customer_blocking_key WHERE cust_no = %s;", (record[0],))
+    if not keys:
+        return 0
+    psycopg2.extras.execute_values(
+        cursor, "INSERT INTO customer_blocking_key (block_key, cust_no) VALUES %s ON CONFLICT DO NOTHING;",
+        [(key, record[0]) for key in keys],
+    )
+    cursor.execute(f"""
+        SELECT {', '.join('c.' + column for column in RECORD_COLUMNS.split(', '))}
+        FROM customer c
+        WHERE c.cust_no IN (
+            SELECT k.cust_no FROM customer_blocking_key k
+            WHERE k.block_key = ANY(%s) AND k.cust_no <> %s
+            LIMIT %s
+        );
+    """, (keys, record[0], MAX_BLOCK_SIZE * len(keys)))
+    own = _features(record)
+    rows = []
+    for other in cursor.fetchall():
+        scored = score_pair(own, _features(other))
+        if scored and scored[0] >= threshold:
+            rows.append(_ordered_row(record[0], other[0], *scored))
+    if rows:
+        psycopg2.extras.execute_values(cursor, UPSERT_CANDIDATES_SQL, rows)
+    return len(rows)
+
+
+# --- Full run ---
+
+def _keys_chunk(records):
+    return [(record[0], blocking_keys(record)) for record in records]
+
+
+def _score_blocks(args):
+    """Scores every pair inside each block of a chunk. Returns [(cust_no_a, cust_no_b, score, fields)]."""
+    blocks, records, threshold = args
+    features = {record[0]: _features(record) for record in records}
+    pairs = {}
+    for members in blocks:
+        # Members deleted since their keys were computed are no longer in records.
+        members = [cust_no for cust_no in members if cust_no in features]
+        for i, left_id in enumerate(members):
+            for right_id in members[i + 1:]:
+                key = (left_id, right_id) if left_id < right_id else (right_id, left_id)
+                if key in pairs:
+                    continue
+                scored = score_pair(features[left_id], features[right_id])
+                pairs[key] = _ordered_row(left_id, right_id, *scored) if scored and scored[0] >= threshold else None
+    return [row for row in pairs.values() if row]
+
+
+def find_duplicates(records, fetch_records, workers, chunk_size=5000, threshold=DEFAULT_THRESHOLD, on_keys=None):
+    """
+    Blocks and scores an iterable of customer records across a process pool, in two passes:
+    blocking keys are computed in parallel chunks, keeping only each block's cust_nos; then blocks
+    are grouped into chunks of roughly chunk_size members, whose records are re-read with
+    fetch_records(cust_nos), and scored in parallel. Both passes keep at most 2 x workers chunks in
+    flight, so memory is bounded by the blocks' ids rather than the records. on_keys(rows)
+    receives each chunk's [(block_key, cust_no)] rows as they are computed (the full run persists
+    them). Returns (customers, candidate_rows, oversized_blocks).
+    """
+    blocks = defaultdict(list)
+    customers = 0
+    # The same pair can surface from several blocks, in different chunks.
+    candidates = {}
+
+    def drain_keys(future):
+        nonlocal customers
+        key_rows = []
+        for cust_no, keys in future.result():
+            customers += 1
+            for key in keys:
+                blocks[key].append(cust_no)
+                key_rows.append((key, cust_no))
+        if on_keys:
+            on_keys(key_rows)
+
+    def drain_scores(future):
+        for row in future.result():
+            candidates[row[:2]] = row
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque()
+        chunk = []
+        for record in records:
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                in_flight.append(pool.submit(_keys_chunk, chunk))
+                chunk = []
+                if len(in_flight) >= 2 * workers:
+                    drain_keys(in_flight.popleft())
+        if chunk:
+            in_flight.append(pool.submit(_keys_chunk, chunk))
+        while in_flight:
+            drain_keys(in_flight.popleft())
+
+        oversized = 0
+        current_blocks, current_ids, current_size = [], set(), 0
+
+        def submit_scores():
+            in_flight.append(pool.submit(_score_blocks, (current_blocks, list(fetch_records(list(current_ids))),
+                                                         threshold)))
+            if len(in_flight) >= 2 * workers:
+                drain_scores(in_flight.popleft())
+
+        while blocks:
+            _, members = blocks.popitem()
+            if len(members) < 2:
+                continue
+            if len(members) > MAX_BLOCK_SIZE:
+                oversized += 1
+                continue
+            current_blocks.append(members)
+            current_ids.update(members)
+            current_size += len(members)
+            if current_size >= chunk_size:
+                submit_scores()
+                current_blocks, current_ids, current_size = [], set(), 0
+        if current_blocks:
+            submit_scores()
+        while in_flight:
+            drain_scores(in_flight.popleft())
+    return customers, list(candidates.values()), oversized
+
+
+def run_full(conn, workers, chunk_size, threshold):
+    """Re-blocks every customer and records merge candidates. Returns (customers, candidates, oversized, seconds)."""
+    started = time.perf_counter()
+    read_conn = psycopg2.connect(get_db_url())
+
+    def save_keys(key_rows):
+        # Replace the keys of exactly this chunk's customers, so concurrent incremental checks of
+        # other customers are never lost to a table-wide truncate.
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM customer_blocking_key WHERE cust_no = ANY(%s::uuid[]);",
+                           (list({cust_no for _, cust_no in key_rows}),))
+            psycopg2.extras.execute_values(
+                cursor, "INSERT INTO customer_blocking_key (block_key, cust_no) VALUES %s ON CONFLICT DO NOTHING;",
+                key_rows, page_size=5000,
+            )
+        conn.commit()
+
+    def fetch_records(cust_nos):
+        with read_conn.cursor() as cursor:
+            cursor.execute(f"SELECT {RECORD_COLUMNS} FROM customer WHERE cust_no = ANY(%s::uuid[]);", (cust_nos,))
+            return cursor.fetchall()
+
+    try:
+        with read_conn.cursor(name='duplicate_detection_full') as stream:
+            stream.itersize = chunk_size
+            stream.execute(f"SELECT {RECORD_COLUMNS} FROM customer;")
+            customers, rows, oversized = find_duplicates(stream, fetch_records, workers, chunk_size, threshold,
+                                                         on_keys=save_keys)
+    finally:
+        read_conn.close()
+
+    for start in range(0, len(rows), 5000):
+        with conn.cursor() as cursor:
+            psycopg2.extras.execute_values(cursor, UPSERT_CANDIDATES_SQL, rows[start:start + 5000], page_size=5000)
+        conn.commit()
+    return customers, len(rows), oversized, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detect customers registered more than once.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    full_parser = subparsers.add_parser('full', help="Re-block and re-score the whole customer base.")
+    full_parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    full_parser.add_argument('--chunk-size', type=int, default=5000)
+    full_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    check_parser = subparsers.add_parser('check', help="Check one customer against its blocks.")
+    check_parser.add_argument('cust_no')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(get_db_url())
+    try:
+        if args.command == 'full':
+            customers, candidates, oversized, seconds = run_full(conn, args.workers, args.chunk_size, args.threshold)
+            rate = customers / seconds if seconds else 0
+            print(f"Checked {customers} customer(s) in {seconds:.1f}s ({rate:,.0f} customers/sec); "
+                  f"{candidates} merge candidate(s), {oversized} oversized block(s) skipped.")
+        else:
+            with conn.cursor() as cursor:
+                found = check_customer(cursor, args.cust_no)
+            conn.commit()
+            print(f"{found} merge candidate(s) recorded for {args.cust_no}.")
+    except psycopg2.Error as err:
+        conn.rollback()
+        print(f"Duplicate detection failed: {err}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+import re
+import sys
+from decimal import Decimal, InvalidOperation
+
+import psycopg2
+import psycopg2.extras
+
+from db_config import get_db_url
+
+# Bracket codes posted by registration2.html, mapped to inclusive (lower, upper) bounds in Php.
+# An upper bound of None means open-ended.
+MONTHLY_INCOME_BRACKETS = {
+    '30000_and_below': (Decimal('0'), Decimal('30000.00')),
+    '30000_01_to_50000': (Decimal('30000.01'), Decimal('50000.00')),
+    '50000_01_to_100000': (Decimal('50000.01'), Decimal('100000.00')),
+    '100000_01_to_500000': (Decimal('100000.01'), Decimal('500000.00')),
+    'over_500000': (Decimal('500000.01'), None),
+}
+ANNUAL_INCOME_BRACKETS = {
+    '360000_and_below': (Decimal('0'), Decimal('360000.00')),
+    '360000_01_to_600000': (Decimal('360000.01'), Decimal('600000.00')),
+    '600000_01_to_1200000': (Decimal('600000.01'), Decimal('1200000.00')),
+    '1200000_01_to_6000000': (Decimal('1200000.01'), Decimal('6000000.00')),
+    'over_6000000': (Decimal('6000000.01'), None),
+}
+
+_AMOUNT = r'([\d,]+(?:\.\d+)?)'
+_RANGE_RE = re.compile(rf'^(?:php\s*)?{_AMOUNT}\s*(?:-|to)\s*(?:php\s*)?{_AMOUNT}$')
+_BELOW_RE = re.compile(rf'^(?:php\s*)?{_AMOUNT}\s*(?:and below|below)$')
+_OVER_RE = re.compile(rf'^(?:over|above)\s*(?:php\s*)?{_AMOUNT}$')
+
+# Columns added next to the legacy free-text ones; the TEXT columns are still written as entered.
+SCHEMA_SQL = """
+    ALTER TABLE financial_record ADD COLUMN IF NOT EXISTS source_wealth_items TEXT[];
+    ALTER TABLE financial_record ADD COLUMN IF NOT EXISTS mon_income_min NUMERIC(14, 2);
+    ALTER TABLE financial_record ADD COLUMN IF NOT EXISTS mon_income_max NUMERIC(14, 2);
+    ALTER TABLE financial_record ADD COLUMN IF NOT EXISTS ann_income_min NUMERIC(14, 2);
+    ALTER TABLE financial_record ADD COLUMN IF NOT EXISTS ann_income_max NUMERIC(14, 2);
+    CREATE INDEX IF NOT EXISTS idx_financial_record_source_wealth_items ON financial_record USING GIN (source_wealth_items);
+    CREATE INDEX IF NOT EXISTS idx_financial_record_mon_income_min ON financial_record (mon_income_min);
+    CREATE INDEX IF NOT EXISTS idx_financial_record_ann_income_min ON financial_record (ann_income_min);
+"""
+
+
+def _amount(text):
+    try:
+        return Decimal(text.replace(',', ''))
+    except InvalidOperation:
+        return None
+
+
+def parse_income_bracket(value, brackets):
+    """
+    Returns (lower, upper) Decimal bounds for an income value, or (None, None) if it cannot be read.
+    Accepts the form's bracket codes, the printed labels ("Php 30,000.01-50,000.00",
+    "Php 30,000.00 and below", "Over Php 500,000.00") and plain amounts.
+    """
+    if not value:
+        return (None, None)
+    value = str(value).strip()
+    if value in brackets:
+        return brackets[value]
+    text = value.lower()
+    match = _RANGE_RE.match(text)
+    if match:
+        return (_amount(match.group(1)), _amount(match.group(2)))
+    match = _BELOW_RE.match(text)
+    if match:
+        return (Decimal('0'), _amount(match.group(1)))
+    match = _OVER_RE.match(text)
+    if match:
+        lower = _amount(match.group(1))
+        return (lower + Decimal('0.01') if lower is not None else None, None)
+    amount = _amount(re.sub(r'^php\s*', '', text))
+    return (amount, amount)
+
+
+def parse_source_wealth(value):
+    """Returns the sources of wealth as a list, from either the posted list or a comma-joined string."""
+    if not value:
+        return []
+    if isinstance(value, (list, tuple)):
+        items = value
+    else:
+        items = str(value).split(',')
+    return [item.strip() for item in items if item and item.strip()]
+
+
+def financial_record_values(source_wealth, mon_income, ann_income):
+    """
+    Structured columns for one financial_record write, in SCHEMA_SQL column order:
+    (source_wealth_items, mon_income_min, mon_income_max, ann_income_min, ann_income_max).
+    """
+    mon_min, mon_max = parse_income_bracket(mon_income, MONTHLY_INCOME_BRACKETS)
+    ann_min, ann_max = parse_income_bracket(ann_income, ANNUAL_INCOME_BRACKETS)
+    return (parse_source_wealth(source_wealth), mon_min, mon_max, ann_min, ann_max)
+
+
+def ensure_schema(cursor):
+    cursor.execute(SCHEMA_SQL)
+
+
+def backfill(conn, batch_size=1000):
+    """
+    Fills the structured columns for rows written before they existed, in keyset-paginated batches
+    committed one at a time. Rows are marked done with an empty source_wealth_items array even when
+    nothing could be parsed, so re-runs only look at new legacy rows. Returns the number of rows updated.
+    """
+    last_fin_code = '00000000-0000-0000-0000-000000000000'
+    updated = 0
+    while True:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT fin_code, source_wealth, mon_income, ann_income FROM financial_record
+                WHERE fin_code > %s AND source_wealth_items IS NULL ORDER BY fin_code LIMIT %s;
+            """, (last_fin_code, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                conn.commit()
+                break
+            last_fin_code = rows[-1][0]
+            values = [
+                (fin_code,) + financial_record_values(source_wealth, mon_income, ann_income)
+                for fin_code, source_wealth, mon_income, ann_income in rows
+            ]
+            if values:
+                psycopg2.extras.execute_values(cursor, """
+                    UPDATE financial_record f SET
+                        source_wealth_items = v.source_wealth_items::text[],
+                        mon_income_min = v.mon_income_min::numeric, mon_income_max = v.mon_income_max::numeric,
+                        ann_income_min = v.ann_income_min::numeric, ann_income_max = v.ann_income_max::numeric
+                    FROM (VALUES %s) AS v (fin_code, source_wealth_items, mon_income_min, mon_income_max,
+                                           ann_income_min, ann_income_max)
+                    WHERE f.fin_code = v.fin_code::uuid AND f.source_wealth_items IS NULL;
+                """, values, page_size=len(values))
+                updated += cursor.rowcount
+            conn.commit()
+    return updated
+
+
+if __name__ == '__main__':
+    # Backfill job: python income.py [batch_size]
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    conn = psycopg2.connect(get_db_url())
+    try:
+        print(f"Backfilled structured income columns for {backfill(conn, batch_size=size)} financial record(s).")
+    finally:
+        conn.close()
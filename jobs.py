@@ -0,0 +1,330 @@
+"""
+Durable background jobs stored in PostgreSQL.
+
+    python jobs.py work [--processes 4] [--batch-size 10] [--job-type duplicate_check ...]
+    python jobs.py stats
+    python jobs.py purge [--days 7]
+
+Request handlers enqueue work with enqueue(cursor, ...) inside their own transaction, so a job exists
+if and only if the change that asked for it committed. Worker processes claim due jobs with
+SELECT ... FOR UPDATE SKIP LOCKED (highest priority, i.e. lowest number, first), run the handler
+registered for the job type in a transaction that also marks the job done, and on failure retry
+with exponential backoff until max_attempts, after which the job stays 'failed' for inspection.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import select
+import signal
+import socket
+import sys
+import time
+import traceback
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+
+from db_config import get_db_url, job_config
+import duplicate_detection
+
+# Lower runs first.
+PRIORITY_HIGH = 10
+PRIORITY_NORMAL = 100
+PRIORITY_LOW = 1000
+DEFAULT_MAX_ATTEMPTS = 5
+NOTIFY_CHANNEL = 'background_job'
+
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS background_job (
+        job_id UUID PRIMARY KEY DEFAULT uuid_generate_v7(),
+        job_type VARCHAR(100) NOT NULL,
+        payload JSONB NOT NULL DEFAULT '{}'::jsonb,
+        priority INTEGER NOT NULL DEFAULT 100,
+        status VARCHAR(20) NOT NULL DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL DEFAULT 5,
+        run_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        enqueued_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        started_at TIMESTAMPTZ,
+        finished_at TIMESTAMPTZ,
+        locked_by VARCHAR(255),
+        locked_until TIMESTAMPTZ,
+        last_error TEXT,
+        CHECK (status IN ('queued', 'running', 'done', 'failed'))
+    );
+    -- Only the claimable and the in-flight rows are indexed; done/failed history stays out of the hot path.
+    CREATE INDEX IF NOT EXISTS idx_background_job_due ON background_job (priority, run_at) WHERE status = 'queued';
+    CREATE INDEX IF NOT EXISTS idx_background_job_running ON background_job (locked_until) WHERE status = 'running';
+    CREATE INDEX IF NOT EXISTS idx_background_job_finished ON background_job (finished_at) WHERE status = 'done';
+"""
+
+HANDLERS = {}
+
+
+def handler(job_type):
+    """Registers fn(cursor, payload) as the handler for job_type. It runs inside the job's transaction."""
+    def register(fn):
+        HANDLERS[job_type] = fn
+        return fn
+    return register
+
+
+def ensure_schema(cursor):
+    cursor.execute(SCHEMA_SQL)
+
+
+def enqueue(cursor, job_type, payload=None, priority=PRIORITY_NORMAL, delay_seconds=0,
+            max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """Adds a job in the caller's transaction and wakes idle workers when it commits. Returns the job_id."""
+    cursor.execute("""
+        INSERT INTO background_job (job_type, payload, priority, run_at, max_attempts)
+        VALUES (%s, %s, %s, now() + make_interval(secs => %s), %s)
+        RETURNING job_id::text;
+    """, (job_type, psycopg2.extras.Json(payload or {}), priority, delay_seconds, max_attempts))
+    job_id = cursor.fetchone()[0]
+    # NOTIFY is transactional: it is delivered on commit and dropped on rollback.
+    cursor.execute(f"NOTIFY {NOTIFY_CHANNEL};")
+    return job_id
+
+
+def enqueue_many(cursor, job_type, payloads, priority=PRIORITY_NORMAL, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """enqueue() of one job per payload in a single multi-row insert, with one NOTIFY."""
+    if not payloads:
+        return
+    psycopg2.extras.execute_values(cursor, """
+        INSERT INTO background_job (job_type, payload, priority, run_at, max_attempts) VALUES %s;
+    """, [(job_type, psycopg2.extras.Json(payload), priority, max_attempts) for payload in payloads],
+        template="(%s, %s, %s, now(), %s)", page_size=len(payloads))
+    cursor.execute(f"NOTIFY {NOTIFY_CHANNEL};")
+
+
+def backoff_seconds(attempt, config=None):
+    config = config or job_config
+    # Jittered, so a burst of failures does not retry in lockstep.
+    delay = config['backoff_base_seconds'] * 2 ** (attempt - 1) * random.uniform(0.8, 1.2)
+    return min(delay, config['backoff_max_seconds'])
+
+
+def claim(conn, worker_id, batch_size, job_types=None):
+    """Marks up to batch_size due jobs as running for this worker and returns (job_id, job_type, payload, attempts, max_attempts)."""
+    type_filter = "AND job_type = ANY(%(job_types)s)" if job_types else ""
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            UPDATE background_job j
+            SET status = 'running', attempts = j.attempts + 1, started_at = now(),
+                locked_by = %(worker_id)s, locked_until = now() + make_interval(secs => %(lease)s)
+            WHERE j.job_id IN (
+                SELECT job_id FROM background_job
+                WHERE status = 'queued' AND run_at <= now() {type_filter}
+                ORDER BY priority, run_at
+                LIMIT %(batch_size)s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING j.job_id::text, j.job_type, j.payload, j.attempts, j.max_attempts, j.priority;
+        """, {'worker_id': worker_id, 'lease': job_config['lease_seconds'], 'batch_size': batch_size,
+              'job_types': list(job_types or [])})
+        jobs = cursor.fetchall()
+    conn.commit()
+    # RETURNING order is arbitrary; run the batch in priority order.
+    return [job[:5] for job in sorted(jobs, key=lambda job: job[5])]
+
+
+def requeue_expired(conn):
+    """Puts running jobs whose worker died (lease expired) back in the queue. Returns how many."""
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            UPDATE background_job
+            SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+                run_at = now(), locked_by = NULL, locked_until = NULL,
+                last_error = 'Lease expired (worker lost)', finished_at = CASE WHEN attempts >= max_attempts THEN now() END
+            WHERE job_id IN (
+                SELECT job_id FROM background_job
+                WHERE status = 'running' AND locked_until < now()
+                FOR UPDATE SKIP LOCKED
+            );
+        """)
+        count = cursor.rowcount
+    conn.commit()
+    return count
+
+
+def run_job(conn, job):
+    """Runs one claimed job. The handler's writes and the 'done' mark commit together."""
+    job_id, job_type, payload, attempts, max_attempts = job
+    try:
+        fn = HANDLERS.get(job_type)
+        if fn is None:
+            raise LookupError(f"No handler registered for job type '{job_type}'")
+        with conn.cursor() as cursor:
+            fn(cursor, payload)
+            cursor.execute("""
+                UPDATE background_job
+                SET status = 'done', finished_at = now(), locked_by = NULL, locked_until = NULL, last_error = NULL
+                WHERE job_id = %s;
+            """, (job_id,))
+        conn.commit()
+        return True
+    except Exception:
+        conn.rollback()
+        error = traceback.format_exc(limit=5)
+        final = attempts >= max_attempts
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                UPDATE background_job
+                SET status = %s, last_error = %s, locked_by = NULL, locked_until = NULL,
+                    run_at = now() + make_interval(secs => %s), finished_at = CASE WHEN %s THEN now() END
+                WHERE job_id = %s;
+            """, ('failed' if final else 'queued', error, 0 if final else backoff_seconds(attempts), final, job_id))
+        conn.commit()
+        print(f"Job {job_id} ({job_type}) attempt {attempts}/{max_attempts} failed"
+              f"{'; giving up' if final else '; will retry'}: {error.strip().splitlines()[-1]}")
+        return False
+
+
+def _worker_loop(worker_number, batch_size, job_types):
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+    signal.signal(signal.SIGINT, lambda *_: stopping.append(True))
+
+    conn = psycopg2.connect(get_db_url())
+    listen_conn = psycopg2.connect(get_db_url())
+    listen_conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    listen_conn.cursor().execute(f"LISTEN {NOTIFY_CHANNEL};")
+    print(f"Job worker {worker_number} ({worker_id}) started.")
+    last_reap = 0
+    try:
+        while not stopping:
+            if time.monotonic() - last_reap > job_config['lease_seconds'] / 2:
+                requeue_expired(conn)
+                last_reap = time.monotonic()
+            jobs = claim(conn, worker_id, batch_size, job_types)
+            for job in jobs:
+                run_job(conn, job)
+            if len(jobs) < batch_size and not stopping:
+                # Idle: sleep until an enqueue commits (NOTIFY) or the poll interval passes.
+                if select.select([listen_conn], [], [], job_config['poll_interval_seconds']) != ([], [], []):
+                    listen_conn.poll()
+                    listen_conn.notifies.clear()
+    except psycopg2.Error as err:
+        print(f"Job worker {worker_number} database error: {err}")
+        raise
+    finally:
+        listen_conn.close()
+        conn.close()
+        print(f"Job worker {worker_number} stopped.")
+
+
+def work(processes, batch_size, job_types=None):
+    """Runs `processes` worker processes until SIGINT/SIGTERM; a crashed worker is restarted."""
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+    signal.signal(signal.SIGINT, lambda *_: stopping.append(True))
+
+    def start(number):
+        process = multiprocessing.Process(target=_worker_loop, args=(number, batch_size, job_types), daemon=False)
+        process.start()
+        return process
+
+    workers = {number: start(number) for number in range(processes)}
+    while not stopping:
+        time.sleep(1)
+        for number, process in list(workers.items()):
+            if not process.is_alive() and not stopping:
+                print(f"Job worker {number} exited with code {process.exitcode}; restarting.")
+                time.sleep(1)
+                workers[number] = start(number)
+    for process in workers.values():
+        process.terminate()  # SIGTERM: each worker finishes its current job, then exits
+    for process in workers.values():
+        process.join()
+
+
+def fetch_metrics(cursor, window_minutes=60):
+    """
+    Queue depth per job type and status, the age of the oldest due job, and wait/run latency
+    percentiles (seconds) of the jobs finished in the last window_minutes.
+    """
+    cursor.execute("""
+        SELECT job_type, status, count(*) FROM background_job
+        WHERE status IN ('queued', 'running', 'failed')
+        GROUP BY job_type, status ORDER BY job_type, status;
+    """)
+    depth = {}
+    for job_type, status, count in cursor.fetchall():
+        depth.setdefault(job_type, {})[status] = count
+    cursor.execute("""
+        SELECT COALESCE(EXTRACT(EPOCH FROM now() - min(run_at)), 0)::float
+        FROM background_job WHERE status = 'queued' AND run_at <= now();
+    """)
+    oldest_due_seconds = cursor.fetchone()[0]
+    cursor.execute("""
+        SELECT job_type, count(*),
+               percentile_cont(0.5) WITHIN GROUP (ORDER BY EXTRACT(EPOCH FROM started_at - run_at)),
+               percentile_cont(0.95) WITHIN GROUP (ORDER BY EXTRACT(EPOCH FROM started_at - run_at)),
+               percentile_cont(0.5) WITHIN GROUP (ORDER BY EXTRACT(EPOCH FROM finished_at - started_at)),
+               percentile_cont(0.95) WITHIN GROUP (ORDER BY EXTRACT(EPOCH FROM finished_at - started_at))
+        FROM background_job
+        WHERE status = 'done' AND finished_at > now() - make_interval(mins => %s)
+        GROUP BY job_type ORDER BY job_type;
+    """, (window_minutes,))
+    latency = {
+        job_type: {'completed': count, 'wait_p50': wait_p50, 'wait_p95': wait_p95, 'run_p50': run_p50, 'run_p95': run_p95}
+        for job_type, count, wait_p50, wait_p95, run_p50, run_p95 in cursor.fetchall()
+    }
+    return {'depth': depth, 'oldest_due_seconds': oldest_due_seconds, 'latency': latency,
+            'window_minutes': window_minutes}
+
+
+def purge(conn, days):
+    """Deletes jobs that finished successfully more than `days` days ago. Returns how many."""
+    with conn.cursor() as cursor:
+        cursor.execute("DELETE FROM background_job WHERE status = 'done' AND finished_at < now() - make_interval(days => %s);",
+                       (days,))
+        count = cursor.rowcount
+    conn.commit()
+    return count
+
+
+# --- Handlers ---
+
+@handler('duplicate_check')
+def _duplicate_check(cursor, payload):
+    duplicate_detection.check_customer(cursor, payload['cust_no'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Background job worker and queue tools.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    work_parser = subparsers.add_parser('work', help="Run worker processes.")
+    work_parser.add_argument('--processes', type=int, default=job_config['workers'])
+    work_parser.add_argument('--batch-size', type=int, default=10)
+    work_parser.add_argument('--job-type', action='append', dest='job_types',
+                             help="Only run this job type (repeatable). Default: all registered types.")
+    subparsers.add_parser('stats', help="Print queue depth and job latency.")
+    purge_parser = subparsers.add_parser('purge', help="Delete old completed jobs.")
+    purge_parser.add_argument('--days', type=int, default=7)
+    args = parser.parse_args()
+
+    if args.command == 'work':
+        work(args.processes, args.batch_size, args.job_types)
+        return
+    conn = psycopg2.connect(get_db_url())
+    try:
+        if args.command == 'stats':
+            with conn.cursor() as cursor:
+                print(json.dumps(fetch_metrics(cursor), indent=2))
+        else:
+            print(f"Purged {purge(conn, args.days)} completed job(s).")
+    except psycopg2.Error as err:
+        print(f"Job queue command failed: {err}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
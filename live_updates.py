@@ -0,0 +1,219 @@
+"""
+Live updates of the admin dashboard's customer table over Server-Sent Events.
+
+Each worker process runs one listener thread per database (per shard when sharded) that waits on
+the outbox's NOTIFY channel and reads the new change events from the outbox (see outbox.py). Each
+event becomes a small delta message carrying only the dashboard's columns
+(repository.LIST_COLUMNS), which is fanned out to that worker's open dashboard streams:
+
+    event: customer
+    id: primary:1042
+    data: {"op": "upsert", "cust_no": "...", "row": {"custname": ..., "registration_status": ...}}
+
+`op` is "upsert" or "delete". The id is the outbox position reached on every database ("s0:12,s1:40"
+when sharded). A reconnecting EventSource sends it back as Last-Event-ID, and the stream replays
+what was missed: from the in-memory buffer of the last live_config['replay_events'] changes, or
+else from the outbox. A dashboard that is further behind gets a `reset` event and reloads. The
+dashboard page embeds the position reached when it rendered, so the first connection replays
+whatever changed in between.
+
+A worker serves at most live_config['max_subscribers'] streams. A dashboard whose queue fills up
+(live_config['queue_size']) is disconnected and catches up by replaying. Idle streams get a
+heartbeat comment every outbox_config['heartbeat_seconds'].
+"""
+import collections
+import json
+import queue
+import threading
+import time
+
+import psycopg2
+
+import outbox
+from repository import LIST_COLUMNS
+
+_ROW_COLUMNS = tuple(column for column in LIST_COLUMNS if column != 'cust_no')
+
+
+class TooManySubscribers(Exception):
+    """This worker already serves live_config['max_subscribers'] streams."""
+
+
+class Subscriber:
+    __slots__ = ('queue', 'positions')
+
+    def __init__(self, queue_size, positions):
+        self.queue = queue.Queue(queue_size)
+        self.positions = positions  # {source: last position sent to this client}
+
+
+def delta_message(line):
+    """The dashboard delta for one outbox NDJSON line."""
+    event = json.loads(line)
+    if event['type'] in (outbox.DELETED, outbox.ARCHIVED):
+        return json.dumps({'op': 'delete', 'cust_no': event['cust_no']})
+    data = event['data']
+    return json.dumps({'op': 'upsert', 'cust_no': event['cust_no'],
+                       'row': {column: data.get(column) for column in _ROW_COLUMNS}})
+
+
+class ChangeBroadcaster:
+    """
+    Fans customer changes out to this worker's dashboard streams. sources maps a name to a database
+    URL ({'primary': url}, or the shard URLs). Listener threads start on first use.
+    """
+
+    def __init__(self, sources, config, heartbeat_seconds):
+        self.sources = dict(sources)
+        self.config = config
+        self.heartbeat_seconds = heartbeat_seconds
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._buffers = {name: collections.deque(maxlen=config['replay_events']) for name in self.sources}
+        self._heads = {}  # {source: last position fanned out}
+        self._started = False
+
+    def _start(self):
+        with self._lock:
+            if self._started:
+                return
+            heads = {}
+            for name, url in self.sources.items():
+                conn = psycopg2.connect(url)
+                try:
+                    heads[name] = outbox.head(conn)
+                finally:
+                    conn.close()
+            self._heads = heads
+            for name in self.sources:
+                threading.Thread(target=self._listen, args=(name,), name=f"live-updates-{name}", daemon=True).start()
+            self._started = True
+            print(f"Live updates: listening on {len(self.sources)} database(s).")
+
+    def _listen(self, name):
+        """Listener thread: publishes each batch of new outbox events for one database, reconnecting on errors."""
+        after = self._heads[name]
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(self.sources[name])
+                outbox.listen(conn)
+                while True:
+                    rows = outbox.wait_and_fetch(conn, after, self.config['replay_events'], self.heartbeat_seconds)
+                    if rows:
+                        self._publish(name, [(position, delta_message(line)) for position, line in rows])
+                        after = rows[-1][0]
+            except psycopg2.Error as err:
+                print(f"Live updates listener for '{name}' failed: {err}; reconnecting.")
+                time.sleep(1)
+            finally:
+                if conn:
+                    conn.close()
+
+    def _publish(self, name, messages):
+        with self._lock:
+            self._buffers[name].extend(messages)
+            self._heads[name] = messages[-1][0]
+            for subscriber in list(self._subscribers):
+                try:
+                    for position, message in messages:
+                        subscriber.queue.put_nowait((name, position, message))
+                except queue.Full:
+                    # Too slow: end its stream; the browser reconnects and replays from its last id.
+                    self._subscribers.discard(subscriber)
+                    while not subscriber.queue.empty():
+                        subscriber.queue.get_nowait()
+                    subscriber.queue.put_nowait(None)
+
+    # --- event ids ---
+
+    def head_id(self):
+        """The event id for "everything published so far"; embedded in the dashboard page."""
+        self._start()
+        with self._lock:
+            return self._encode(self._heads)
+
+    @staticmethod
+    def _encode(positions):
+        return ','.join(f"{name}:{positions[name]}" for name in sorted(positions))
+
+    def _decode(self, event_id):
+        try:
+            positions = dict((name, int(position)) for name, position in
+                             (part.split(':', 1) for part in event_id.split(',')))
+        except ValueError:
+            return None
+        return positions if set(positions) == set(self.sources) else None
+
+    # --- subscribers ---
+
+    def subscribe(self, last_event_id=None):
+        """
+        Registers a stream resuming after last_event_id (None: from now). Raises TooManySubscribers or
+        psycopg2.Error. Pair with unsubscribe() when the response closes.
+        """
+        self._start()
+        with self._lock:
+            if len(self._subscribers) >= self.config['max_subscribers']:
+                raise TooManySubscribers(f"{len(self._subscribers)} live dashboard streams already open")
+            positions = (last_event_id and self._decode(last_event_id)) or dict(self._heads)
+            subscriber = Subscriber(self.config['queue_size'], positions)
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def _replay(self, name, after, connect):
+        """
+        The messages after position `after` on one database, or None when more than replay_events are
+        missing (or the id is from another outbox) and the dashboard should reload.
+        """
+        with self._lock:
+            head = self._heads[name]
+            buffered = list(self._buffers[name])
+        if after == head:
+            return []
+        if after > head or head - after > self.config['replay_events']:
+            return None
+        if buffered and buffered[0][0] <= after + 1:
+            return [(position, message) for position, message in buffered if position > after]
+        conn = connect(name)
+        try:
+            rows = outbox.fetch(conn, after, head - after)
+        finally:
+            conn.close()
+        return [(position, delta_message(line)) for position, line in rows]
+
+    def stream(self, subscriber, connect):
+        """
+        The SSE body for a subscriber: replay, then live deltas and heartbeats. connect(name) opens a
+        connection to a source for replays older than the buffer.
+        """
+        yield 'retry: 2000\n\n'
+        for name in sorted(subscriber.positions):
+            try:
+                missed = self._replay(name, subscriber.positions[name], connect)
+            except psycopg2.Error as err:
+                print(f"Live updates replay from '{name}' failed: {err}")
+                missed = None
+            if missed is None:
+                yield 'event: reset\ndata: {}\n\n'
+                return
+            for position, message in missed:
+                subscriber.positions[name] = position
+                yield f"event: customer\nid: {self._encode(subscriber.positions)}\ndata: {message}\n\n"
+        while True:
+            try:
+                item = subscriber.queue.get(timeout=self.heartbeat_seconds)
+            except queue.Empty:
+                yield ': heartbeat\n\n'
+                continue
+            if item is None:
+                return
+            name, position, message = item
+            if position <= subscriber.positions[name]:
+                continue  # already sent while replaying
+            subscriber.positions[name] = position
+            yield f"event: customer\nid: {self._encode(subscriber.positions)}\ndata: {message}\n\n"
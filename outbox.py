@@ -0,0 +1,385 @@
+"""
+Transactional outbox and ordered change feed for customer changes.
+
+    python outbox.py export --consumer files --dir exports/ [--rotate-events 100000] [--follow]
+    python outbox.py compact [--retain-days 7]
+    python outbox.py status
+
+The write paths in app.py (registration, admin add/edit, delete) call record() inside their own
+transaction, so an event exists if and only if the change committed. Each event carries a snapshot
+of the customer's profile after the change (the repository.CUSTOMER_PROFILE_SQL columns), or
+just the cust_no for a delete. archive.py records customer.archived, also with just the cust_no,
+when it moves a customer to the cold archive.
+
+Events are delivered in `position` order. event_id comes from a sequence, which does not follow
+commit order, so positions are assigned after the fact by sequence(): only to events whose writing
+transaction is older than every transaction still running (txid below the snapshot xmin). An event
+that commits later therefore always gets a later position, and a consumer that has read up to
+position N never misses an event at or below N. Readers call sequence() themselves, serialised
+by an advisory lock, so there is no separate relay process.
+
+Consumers keep their offset (last position processed) in customer_outbox_consumer. The app serves
+the feed as NDJSON long-poll (/feed/customers) and Server-Sent Events (/feed/customers/stream,
+event id = position, so Last-Event-ID resumes); `export` writes it to rotated NDJSON files and
+commits the offset only after each file is complete. compact() drops events every consumer has
+read, and events older than the retention that a later event for the same customer supersedes.
+
+With sharding (see sharding.py) each shard has its own outbox; consumers read one feed per shard.
+"""
+import argparse
+import os
+import select
+import time
+
+import psycopg2
+import psycopg2.extensions
+
+from db_config import get_db_url, outbox_config
+import prepared
+from repository import _PROFILE_SELECT
+
+CREATED = 'customer.created'
+UPDATED = 'customer.updated'
+DELETED = 'customer.deleted'
+# Moved to the cold archive (see archive.py); like a delete for readers of the live tables.
+ARCHIVED = 'customer.archived'
+NOTIFY_CHANNEL = 'customer_outbox'
+# Arbitrary application-wide key for pg_try_advisory_xact_lock around sequence().
+SEQUENCE_LOCK_KEY = 4404
+PENDING_RETRY_SECONDS = 0.05
+IDLE_RETRY_SECONDS = 1.0
+
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS customer_outbox (
+        event_id BIGSERIAL PRIMARY KEY,
+        position BIGINT,
+        txid BIGINT NOT NULL DEFAULT txid_current(),
+        cust_no UUID NOT NULL,
+        event_type VARCHAR(32) NOT NULL,
+        payload JSONB NOT NULL,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_customer_outbox_position ON customer_outbox (position);
+    CREATE INDEX IF NOT EXISTS idx_customer_outbox_unsequenced ON customer_outbox (event_id) WHERE position IS NULL;
+    CREATE INDEX IF NOT EXISTS idx_customer_outbox_cust_no ON customer_outbox (cust_no, event_id);
+
+    CREATE TABLE IF NOT EXISTS customer_outbox_sequence (
+        singleton BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (singleton),
+        last_position BIGINT NOT NULL DEFAULT 0
+    );
+    INSERT INTO customer_outbox_sequence (singleton) VALUES (TRUE) ON CONFLICT DO NOTHING;
+
+    CREATE TABLE IF NOT EXISTS customer_outbox_consumer (
+        consumer VARCHAR(100) PRIMARY KEY,
+        last_position BIGINT NOT NULL DEFAULT 0,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+"""
+
+# One statement (prepared on pooled connections: planning the profile join costs more than running it).
+RECORD_SQL = prepared.register('outbox_record', f"""
+    WITH event AS (
+        INSERT INTO customer_outbox (cust_no, event_type, payload)
+        SELECT %s::uuid, %s,
+               COALESCE((SELECT to_jsonb(p) FROM ({_PROFILE_SELECT} WHERE c.cust_no = %s::uuid LIMIT 1) p),
+                        jsonb_build_object('cust_no', %s::uuid))
+        RETURNING event_type, cust_no, payload->>'row_version' AS row_version
+    )
+    SELECT pg_notify('{NOTIFY_CHANNEL}', concat_ws(' ', event_type, cust_no, row_version)) FROM event;
+""")
+
+# record() for many customers in one statement (batch creation), one event per customer in the given order.
+RECORD_MANY_SQL = f"""
+    WITH event AS (
+        INSERT INTO customer_outbox (cust_no, event_type, payload)
+        SELECT k.cust_no, %s,
+               COALESCE((SELECT to_jsonb(p) FROM ({_PROFILE_SELECT} WHERE c.cust_no = k.cust_no LIMIT 1) p),
+                        jsonb_build_object('cust_no', k.cust_no))
+        FROM unnest(%s::uuid[]) WITH ORDINALITY AS k (cust_no, n)
+        ORDER BY k.n
+        RETURNING event_type, cust_no, payload->>'row_version' AS row_version
+    )
+    SELECT pg_notify('{NOTIFY_CHANNEL}', concat_ws(' ', event_type, cust_no, row_version)) FROM event;
+"""
+
+# Numbers the events of transactions that can no longer be overtaken, in event_id order.
+SEQUENCE_SQL = """
+    WITH ready AS (
+        SELECT event_id, row_number() OVER (ORDER BY event_id) AS n
+        FROM customer_outbox
+        WHERE position IS NULL AND txid < txid_snapshot_xmin(txid_current_snapshot())
+        ORDER BY event_id
+        LIMIT %s
+    ), numbered AS (
+        UPDATE customer_outbox o SET position = s.last_position + ready.n
+        FROM ready, customer_outbox_sequence s
+        WHERE o.event_id = ready.event_id
+        RETURNING 1
+    )
+    UPDATE customer_outbox_sequence SET last_position = last_position + (SELECT count(*) FROM numbered)
+    RETURNING (SELECT count(*) FROM numbered);
+"""
+
+# One NDJSON line per event, built by the database so the payload is never decoded and re-encoded.
+FETCH_SQL = """
+    SELECT position, json_build_object(
+        'position', position, 'type', event_type, 'cust_no', cust_no, 'created_at', created_at, 'data', payload
+    )::text
+    FROM customer_outbox
+    WHERE position > %s
+    ORDER BY position
+    LIMIT %s;
+"""
+
+
+def ensure_schema(cursor):
+    cursor.execute(SCHEMA_SQL)
+
+
+def record(cursor, event_type, cust_no):
+    """
+    Adds a change event for cust_no in the caller's transaction, after the change itself (the payload
+    is the profile as the transaction sees it). Listeners on NOTIFY_CHANNEL are woken on commit with
+    "<event_type> <cust_no> [<row_version>]" (no version for deletes).
+    """
+    cust_no = str(cust_no)
+    prepared.execute(cursor, 'outbox_record', (cust_no, event_type, cust_no, cust_no))
+
+
+def record_many(cursor, event_type, cust_nos):
+    """record() for several customers changed in the caller's transaction, in one round trip."""
+    if cust_nos:
+        cursor.execute(RECORD_MANY_SQL, (event_type, [str(cust_no) for cust_no in cust_nos]))
+
+
+def sequence(conn, limit=10000):
+    """
+    Assigns positions to the events that are safe to publish (see the module docstring).
+    Commits on conn. Returns how many were numbered; 0 when another reader holds the lock.
+    """
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_xact_lock(%s);", (SEQUENCE_LOCK_KEY,))
+            if not cursor.fetchone()[0]:
+                conn.rollback()
+                return 0
+            cursor.execute(SEQUENCE_SQL, (limit,))
+            numbered = cursor.fetchone()[0]
+        conn.commit()
+        return numbered
+    except psycopg2.Error:
+        conn.rollback()
+        raise
+
+
+def fetch(conn, after, limit):
+    """Up to `limit` events after position `after` as [(position, ndjson_line)], sequencing new ones first."""
+    sequence(conn)
+    with conn.cursor() as cursor:
+        cursor.execute(FETCH_SQL, (after, limit))
+        rows = cursor.fetchall()
+    conn.rollback()
+    return rows
+
+
+def head(conn):
+    """The last position assigned so far."""
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT last_position FROM customer_outbox_sequence;")
+        row = cursor.fetchone()
+    conn.rollback()
+    return row[0] if row else 0
+
+
+def get_offset(conn, consumer):
+    """The consumer's committed position (0 for a new consumer)."""
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT last_position FROM customer_outbox_consumer WHERE consumer = %s;", (consumer,))
+        row = cursor.fetchone()
+    conn.rollback()
+    return row[0] if row else 0
+
+
+def commit_offset(conn, consumer, position):
+    """Records that consumer has processed everything up to position. Offsets never move backwards."""
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO customer_outbox_consumer (consumer, last_position) VALUES (%s, %s)
+            ON CONFLICT (consumer) DO UPDATE
+            SET last_position = GREATEST(customer_outbox_consumer.last_position, EXCLUDED.last_position),
+                updated_at = now()
+            RETURNING last_position;
+        """, (consumer, position))
+        committed = cursor.fetchone()[0]
+    conn.commit()
+    return committed
+
+
+def listen(conn):
+    """
+    Subscribes conn to NOTIFY_CHANNEL. Notifications arrive while conn is between transactions, and
+    fetch() always ends its transaction, so one connection can both read the feed and wait on it.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(f"LISTEN {NOTIFY_CHANNEL};")
+    conn.commit()
+
+
+def wait_for_events(conn, timeout):
+    """Blocks until a change commits or timeout seconds pass. Returns True if woken by a change."""
+    if not conn.notifies:
+        if select.select([conn], [], [], max(timeout, 0)) == ([], [], []):
+            return False
+        conn.poll()
+    woken = bool(conn.notifies)
+    conn.notifies.clear()
+    return woken
+
+
+def wait_and_fetch(conn, after, limit, timeout):
+    """
+    fetch(), waiting up to timeout seconds for the first event after `after`; conn must be listen()ing.
+    An event can be notified before it may be sequenced (an older transaction is still open), so after
+    a wake-up the feed is re-read every PENDING_RETRY_SECONDS, and every IDLE_RETRY_SECONDS otherwise.
+    """
+    deadline = time.monotonic() + timeout
+    rows = fetch(conn, after, limit)
+    retry = IDLE_RETRY_SECONDS
+    while not rows:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        if wait_for_events(conn, min(remaining, retry)):
+            retry = PENDING_RETRY_SECONDS
+        rows = fetch(conn, after, limit)
+    return rows
+
+
+def compact(conn, retain_days=None, batch_size=10000):
+    """
+    Deletes, in batches of batch_size:
+      - events older than retain_days that every registered consumer has read;
+      - events older than retain_days superseded by a later event for the same customer
+        (a consumer further behind then sees only the customer's latest change).
+    Unsequenced events are never touched. Returns (consumed, superseded) counts.
+    """
+    retain_days = outbox_config['retain_days'] if retain_days is None else retain_days
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT COALESCE(min(last_position), 0) FROM customer_outbox_consumer;")
+        min_offset = cursor.fetchone()[0]
+    conn.commit()
+    deleted = []
+    for where in ("position <= %(min_offset)s",
+                  "position IS NOT NULL AND EXISTS (SELECT 1 FROM customer_outbox later "
+                  "WHERE later.cust_no = o.cust_no AND later.event_id > o.event_id)"):
+        total = 0
+        while True:
+            with conn.cursor() as cursor:
+                cursor.execute(f"""
+                    DELETE FROM customer_outbox WHERE event_id IN (
+                        SELECT event_id FROM customer_outbox o
+                        WHERE created_at < now() - make_interval(secs => %(retain)s) AND {where}
+                        LIMIT %(batch)s);
+                """, {'min_offset': min_offset, 'retain': retain_days * 86400, 'batch': batch_size})
+                count = cursor.rowcount
+            conn.commit()
+            total += count
+            if count < batch_size:
+                break
+        deleted.append(total)
+    return tuple(deleted)
+
+
+def export_files(conn, consumer, out_dir, rotate_events=100000, batch_size=None, follow=False):
+    """
+    Appends the feed after the consumer's offset to NDJSON files in out_dir. Each file is written as
+    .part, fsynced and renamed to customer-events-<first>-<last>.ndjson, and only then is the offset
+    committed, so a crash repeats at most the unfinished file. A file is closed after rotate_events
+    events or when the feed is drained. With follow=True it then waits for more events until
+    interrupted. Returns the number of events written.
+    """
+    batch_size = batch_size or outbox_config['max_batch']
+    os.makedirs(out_dir, exist_ok=True)
+    if follow:
+        listen(conn)
+    written = 0
+    position = get_offset(conn, consumer)
+    while True:
+        rows = wait_and_fetch(conn, position, min(batch_size, rotate_events),
+                              outbox_config['long_poll_seconds'] if follow else 0)
+        if not rows:
+            if not follow:
+                return written
+            continue
+        first = rows[0][0]
+        part_path = os.path.join(out_dir, f"customer-events-{first:012d}.ndjson.part")
+        count = 0
+        with open(part_path, 'w', encoding='utf-8') as part:
+            while rows:
+                part.write(''.join(line + '\n' for _, line in rows))
+                position = rows[-1][0]
+                count += len(rows)
+                if count >= rotate_events:
+                    break
+                rows = fetch(conn, position, min(batch_size, rotate_events - count))
+            part.flush()
+            os.fsync(part.fileno())
+        os.replace(part_path, os.path.join(out_dir, f"customer-events-{first:012d}-{position:012d}.ndjson"))
+        commit_offset(conn, consumer, position)
+        written += count
+        print(f"Exported events {first}..{position} ({count}) for consumer '{consumer}'.")
+
+
+def status(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT count(*), count(*) FILTER (WHERE position IS NULL),
+                   (SELECT last_position FROM customer_outbox_sequence),
+                   extract(epoch FROM now() - min(created_at) FILTER (WHERE position IS NULL))
+            FROM customer_outbox;
+        """)
+        total, pending, head, oldest_pending = cursor.fetchone()
+        print(f"Events stored: {total}, awaiting a position: {pending}"
+              + (f" (oldest {oldest_pending:.1f}s)" if oldest_pending is not None else '')
+              + f", head position: {head or 0}")
+        cursor.execute("SELECT consumer, last_position, updated_at FROM customer_outbox_consumer ORDER BY consumer;")
+        for consumer, last_position, updated_at in cursor.fetchall():
+            print(f"  {consumer:<30} offset {last_position:>12}  lag {max((head or 0) - last_position, 0):>10} events"
+                  f"  (updated {updated_at:%Y-%m-%d %H:%M:%S})")
+    conn.rollback()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Customer change feed (see outbox.py).")
+    sub = parser.add_subparsers(dest='command', required=True)
+    export = sub.add_parser('export', help='Write the feed to rotated NDJSON files.')
+    export.add_argument('--consumer', default='files')
+    export.add_argument('--dir', required=True)
+    export.add_argument('--rotate-events', type=int, default=100000)
+    export.add_argument('--batch-size', type=int, default=outbox_config['max_batch'])
+    export.add_argument('--follow', action='store_true')
+    compact_parser = sub.add_parser('compact', help='Delete consumed and superseded old events.')
+    compact_parser.add_argument('--retain-days', type=float, default=outbox_config['retain_days'])
+    compact_parser.add_argument('--batch-size', type=int, default=10000)
+    sub.add_parser('status', help='Backlog and consumer offsets.')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(get_db_url())
+    try:
+        if args.command == 'export':
+            try:
+                total = export_files(conn, args.consumer, args.dir, args.rotate_events, args.batch_size, args.follow)
+                print(f"Exported {total} event(s).")
+            except KeyboardInterrupt:
+                print("Export stopped.")
+        elif args.command == 'compact':
+            consumed, superseded = compact(conn, args.retain_days, args.batch_size)
+            print(f"Deleted {consumed} consumed and {superseded} superseded event(s).")
+        elif args.command == 'status':
+            status(conn)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
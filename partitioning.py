@@ -0,0 +1,256 @@
+"""
+Optional hash-partitioned layout for the customer graph.
+
+    python partitioning.py migrate --partitions 16
+    python partitioning.py status
+
+Every customer-dependent table is partitioned BY HASH (cust_no) with the same modulus, so a lookup
+by cust_no touches one partition per table and joins between them can run partition-wise.
+Requires PostgreSQL 12+ (foreign keys referencing partitioned tables).
+
+Unique constraints that do not contain cust_no cannot be enforced on a table partitioned by
+cust_no, so customer.email_address and credentials.username move to small unpartitioned
+registry tables kept current by triggers. The registries keep the original constraint names
+(customer_email_address_key, credentials_username_key), so duplicate-email/username handling in
+app.py works unchanged, and they give username/email lookups an index that does not need to
+probe every partition.
+
+The migration runs in one transaction under ACCESS EXCLUSIVE locks: schedule it in a
+maintenance window for large tables. Set CUSTOMER_PARTITIONS so the app uses the
+partition-aware queries afterwards.
+"""
+import argparse
+import re
+
+import psycopg2
+
+from db_config import get_db_url
+
+# Parent first; all share the cust_no hash key.
+PARTITIONED_TABLES = [
+    'customer',
+    'credentials',
+    'spouse',
+    'company_affiliation',
+    'existing_bank',
+    'cust_po_relationship',
+    'employment_details',
+]
+
+# Lookups that no longer pass through the partition key get their own index per partition.
+EXTRA_INDEXES_SQL = """
+    CREATE INDEX IF NOT EXISTS idx_employment_details_emp_id ON employment_details (emp_id);
+    CREATE INDEX IF NOT EXISTS idx_cust_po_relationship_gov_int_id ON cust_po_relationship (gov_int_id);
+"""
+
+REGISTRY_SQL = """
+    CREATE TABLE IF NOT EXISTS customer_email_registry (
+        email_address VARCHAR(255) CONSTRAINT customer_email_address_key PRIMARY KEY,
+        cust_no UUID NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS credentials_username_registry (
+        username VARCHAR(255) CONSTRAINT credentials_username_key PRIMARY KEY,
+        cust_no UUID NOT NULL
+    );
+
+    CREATE OR REPLACE FUNCTION customer_email_registry_trg() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.email_address IS NOT NULL
+           AND (TG_OP = 'DELETE' OR OLD.email_address IS DISTINCT FROM NEW.email_address) THEN
+            DELETE FROM customer_email_registry WHERE email_address = OLD.email_address AND cust_no = OLD.cust_no;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.email_address IS NOT NULL
+           AND (TG_OP = 'INSERT' OR OLD.email_address IS DISTINCT FROM NEW.email_address) THEN
+            INSERT INTO customer_email_registry (email_address, cust_no) VALUES (NEW.email_address, NEW.cust_no);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION credentials_username_registry_trg() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE')
+           AND (TG_OP = 'DELETE' OR OLD.username IS DISTINCT FROM NEW.username) THEN
+            DELETE FROM credentials_username_registry WHERE username = OLD.username AND cust_no = OLD.cust_no;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE')
+           AND (TG_OP = 'INSERT' OR OLD.username IS DISTINCT FROM NEW.username) THEN
+            INSERT INTO credentials_username_registry (username, cust_no) VALUES (NEW.username, NEW.cust_no);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS customer_email_registry ON customer;
+    CREATE TRIGGER customer_email_registry
+        AFTER INSERT OR DELETE OR UPDATE OF email_address ON customer
+        FOR EACH ROW EXECUTE FUNCTION customer_email_registry_trg();
+
+    DROP TRIGGER IF EXISTS credentials_username_registry ON credentials;
+    CREATE TRIGGER credentials_username_registry
+        AFTER INSERT OR DELETE OR UPDATE OF username ON credentials
+        FOR EACH ROW EXECUTE FUNCTION credentials_username_registry_trg();
+"""
+
+# Unique constraints replaced by the registries above.
+REGISTRY_CONSTRAINTS = {'customer_email_address_key', 'credentials_username_key'}
+
+
+def is_partitioned(cursor):
+    cursor.execute("""
+        SELECT EXISTS (
+            SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid
+            WHERE c.relname = 'customer' AND c.relnamespace = current_schema()::regnamespace
+        );
+    """)
+    return cursor.fetchone()[0]
+
+
+def _capture(cursor, table_name):
+    """Collects constraint, index and trigger definitions of one table so they can be replayed."""
+    cursor.execute("""
+        SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = %s::regclass AND contype IN ('p', 'f', 'u') ORDER BY contype DESC, conname;
+    """, (table_name,))
+    constraints = cursor.fetchall()
+    cursor.execute("""
+        SELECT pg_get_indexdef(i.indexrelid) FROM pg_index i
+        WHERE i.indrelid = %s::regclass
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid);
+    """, (table_name,))
+    indexes = [row[0] for row in cursor.fetchall()]
+    cursor.execute("""
+        SELECT pg_get_triggerdef(oid) FROM pg_trigger
+        WHERE tgrelid = %s::regclass AND NOT tgisinternal;
+    """, (table_name,))
+    triggers = [row[0] for row in cursor.fetchall()]
+    return constraints, indexes, triggers
+
+
+def _external_foreign_keys(cursor):
+    """FKs on other tables (e.g. admins) that reference one of the partitioned tables."""
+    cursor.execute("""
+        SELECT child.relname, con.conname, pg_get_constraintdef(con.oid)
+        FROM pg_constraint con JOIN pg_class child ON child.oid = con.conrelid
+        WHERE con.contype = 'f'
+          AND con.confrelid = ANY(SELECT oid FROM pg_class WHERE relname = ANY(%s) AND relnamespace = current_schema()::regnamespace)
+          AND child.relname <> ALL(%s);
+    """, (PARTITIONED_TABLES, PARTITIONED_TABLES))
+    return cursor.fetchall()
+
+
+def migrate(conn, partitions):
+    """
+    Rebuilds the customer graph as hash-partitioned tables in a single transaction:
+    copy into new partitioned tables, drop the old ones, rename, then replay keys,
+    indexes, triggers and external foreign keys. Returns the number of customer rows moved.
+    """
+    conn.autocommit = False
+    cursor = conn.cursor()
+    try:
+        if is_partitioned(cursor):
+            print("Customer tables are already partitioned.")
+            conn.rollback()
+            return 0
+
+        cursor.execute(f"LOCK TABLE {', '.join(PARTITIONED_TABLES)} IN ACCESS EXCLUSIVE MODE;")
+        captured = {table: _capture(cursor, table) for table in PARTITIONED_TABLES}
+        external_fks = _external_foreign_keys(cursor)
+
+        moved = 0
+        for table in PARTITIONED_TABLES:
+            new_table = f"{table}__part"
+            cursor.execute(f"CREATE TABLE {new_table} (LIKE {table} INCLUDING DEFAULTS) PARTITION BY HASH (cust_no);")
+            for remainder in range(partitions):
+                cursor.execute(
+                    f"CREATE TABLE {table}_p{remainder} PARTITION OF {new_table} "
+                    f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder});"
+                )
+            cursor.execute(f"INSERT INTO {new_table} SELECT * FROM {table};")
+            if table == 'customer':
+                moved = cursor.rowcount
+            print(f"  - Copied {cursor.rowcount} row(s) into {partitions} partitions of {table}.")
+
+        cursor.execute(f"DROP TABLE {', '.join(PARTITIONED_TABLES)} CASCADE;")
+        for table in PARTITIONED_TABLES:
+            cursor.execute(f"ALTER TABLE {table}__part RENAME TO {table};")
+
+        # Primary keys first, then foreign keys, since FKs between these tables need the parent's key.
+        for table in PARTITIONED_TABLES:
+            for conname, contype, definition in captured[table][0]:
+                if contype == 'p':
+                    cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT "{conname}" {definition};')
+        for table in PARTITIONED_TABLES:
+            for conname, contype, definition in captured[table][0]:
+                if contype == 'f':
+                    cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT "{conname}" {definition};')
+                elif contype == 'u' and conname not in REGISTRY_CONSTRAINTS:
+                    if not re.search(r'\bcust_no\b', definition):
+                        print(f"  - WARNING: dropping unique constraint {conname} ({definition}); it cannot be enforced per partition.")
+                        continue
+                    cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT "{conname}" {definition};')
+
+        cursor.execute(REGISTRY_SQL)
+        cursor.execute("""
+            INSERT INTO customer_email_registry (email_address, cust_no)
+            SELECT email_address, cust_no FROM customer WHERE email_address IS NOT NULL;
+        """)
+        cursor.execute("""
+            INSERT INTO credentials_username_registry (username, cust_no)
+            SELECT username, cust_no FROM credentials;
+        """)
+
+        for table in PARTITIONED_TABLES:
+            _, indexes, triggers = captured[table]
+            for definition in indexes + triggers:
+                cursor.execute(definition + ';')
+        cursor.execute(EXTRA_INDEXES_SQL)
+
+        for child_table, conname, definition in external_fks:
+            cursor.execute(f'ALTER TABLE {child_table} ADD CONSTRAINT "{conname}" {definition};')
+
+        conn.commit()
+        return moved
+    except psycopg2.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def status(cursor):
+    """Returns [(table, partition_count, total_rows_estimate)] for the customer graph."""
+    cursor.execute("""
+        SELECT parent.relname, count(child.oid), COALESCE(sum(child.reltuples), 0)::bigint
+        FROM pg_class parent
+        LEFT JOIN pg_inherits inh ON inh.inhparent = parent.oid
+        LEFT JOIN pg_class child ON child.oid = inh.inhrelid
+        WHERE parent.relname = ANY(%s) AND parent.relnamespace = current_schema()::regnamespace
+        GROUP BY parent.relname ORDER BY parent.relname;
+    """, (PARTITIONED_TABLES,))
+    return cursor.fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hash-partition the customer tables by cust_no.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    migrate_parser = subparsers.add_parser('migrate', help="Convert the customer graph to partitioned tables.")
+    migrate_parser.add_argument('--partitions', type=int, default=16)
+    subparsers.add_parser('status', help="Show partition counts per table.")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(get_db_url())
+    try:
+        if args.command == 'migrate':
+            moved = migrate(conn, args.partitions)
+            print(f"Partitioned customer graph into {args.partitions} partitions ({moved} customer(s) moved).")
+        else:
+            with conn.cursor() as cursor:
+                for table, partition_count, rows in status(cursor):
+                    print(f"  - {table}: {partition_count} partition(s), ~{rows} row(s)")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+"""
+Politically-exposed-person screening of customer names against public_official_details.
+
+    python pep_screening.py batch [--workers 4] [--chunk-size 5000] [--threshold 0.8]
+
+Names are normalized (accents, punctuation and honorifics removed, abbreviations expanded,
+surname particles joined) and indexed in memory by character trigram, so spelling variants such as
+"Ma. Cristina Dela Cruz" / "Maria Christina de la Cruz" still meet as candidates. Candidates are
+scored with a blend of trigram Dice similarity and per-token Soundex overlap; matches at or above
+the threshold go to pep_screening_match for review.
+
+The app screens each new registration online against a per-worker index (OfficialIndex.screen(),
+no database round trip); the nightly batch re-screens every customer across a process pool.
+"""
+import argparse
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import psycopg2
+import psycopg2.extras
+
+from db_config import get_db_url
+
+DEFAULT_THRESHOLD = 0.8
+TRIGRAM_WEIGHT = 0.6
+PHONETIC_WEIGHT = 0.4
+
+HONORIFICS = {
+    'hon', 'honorable', 'atty', 'attorney', 'dr', 'engr', 'mr', 'mrs', 'ms', 'sen', 'senator', 'rep',
+    'gov', 'governor', 'mayor', 'vice', 'cong', 'congressman', 'congresswoman', 'sec', 'secretary',
+    'gen', 'general', 'col', 'judge', 'justice', 'jr', 'sr', 'ii', 'iii', 'iv',
+}
+# Common Filipino name abbreviations expanded before matching.
+ABBREVIATIONS = {'ma': 'maria', 'jo': 'jose', 'fco': 'francisco', 'sto': 'santo', 'sta': 'santa'}
+# Surname particles are glued to the following token, so "de la Cruz", "dela Cruz" and "Delacruz" agree.
+PARTICLES = {'de', 'del', 'la', 'las', 'los', 'dela', 'delos', 'delas', 'van', 'von'}
+
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS pep_screening_match (
+        match_id UUID PRIMARY KEY DEFAULT uuid_generate_v7(),
+        cust_no UUID NOT NULL REFERENCES customer (cust_no) ON DELETE CASCADE,
+        gov_int_id UUID NOT NULL REFERENCES public_official_details (gov_int_id) ON DELETE CASCADE,
+        customer_name VARCHAR(255),
+        official_name VARCHAR(255),
+        score NUMERIC(5, 4) NOT NULL,
+        source VARCHAR(20) NOT NULL,
+        review_status VARCHAR(50) NOT NULL DEFAULT 'Pending',
+        screened_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        UNIQUE (cust_no, gov_int_id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_pep_screening_match_review ON pep_screening_match (review_status, screened_at);
+"""
+
+# Re-screening refreshes the score but never resets a decision a reviewer already made.
+UPSERT_MATCHES_SQL = """
+    INSERT INTO pep_screening_match (cust_no, gov_int_id, customer_name, official_name, score, source)
+    VALUES %s
+    ON CONFLICT (cust_no, gov_int_id) DO UPDATE
+    SET score = EXCLUDED.score, customer_name = EXCLUDED.customer_name, official_name = EXCLUDED.official_name,
+        source = EXCLUDED.source, screened_at = now();
+"""
+
+
+def normalize_name(name):
+    """Lowercases, strips accents/punctuation/honorifics and expands abbreviations. Returns a list of tokens."""
+    if not name:
+        return []
+    text = unicodedata.normalize('NFKD', name)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    tokens = [ABBREVIATIONS.get(token, token) for token in re.findall(r'[a-z0-9]+', text) if token not in HONORIFICS]
+    merged = []
+    prefix = ''
+    for token in tokens:
+        if token in PARTICLES:
+            prefix += token
+        else:
+            merged.append(prefix + token)
+            prefix = ''
+    if prefix:
+        merged.append(prefix)
+    return merged
+
+
+def soundex(token):
+    codes = {c: d for d, letters in (('1', 'bfpv'), ('2', 'cgjkqsxz'), ('3', 'dt'), ('4', 'l'), ('5', 'mn'), ('6', 'r'))
+             for c in letters}
+    if not token:
+        return ''
+    result = token[0]
+    previous = codes.get(token[0], '')
+    for ch in token[1:]:
+        code = codes.get(ch, '')
+        if code and code != previous:
+            result += code
+        if ch not in 'hw':
+            previous = code
+    return (result + '000')[:4]
+
+
+def trigrams(tokens):
+    # Joined without spaces so "dela cruz" and "delacruz" produce the same grams.
+    text = '  ' + ''.join(tokens) + ' '
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class OfficialIndex:
+    """In-memory n-gram + phonetic index over official names. Safe to share between request threads."""
+
+    REFRESH_SECONDS = 600
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self.officials = {}          # gov_int_id -> (display name, trigram set, soundex set)
+        self.by_trigram = defaultdict(set)
+        self.built_at = 0
+        self._lock = threading.Lock()
+
+    def add(self, gov_int_id, name):
+        tokens = normalize_name(name)
+        if not tokens:
+            return
+        grams = trigrams(tokens)
+        sounds = {soundex(token) for token in tokens}
+        with self._lock:
+            self.officials[gov_int_id] = (name, grams, sounds)
+            for gram in grams:
+                self.by_trigram[gram].add(gov_int_id)
+
+    def load(self, rows):
+        for gov_int_id, name in rows:
+            self.add(str(gov_int_id), name)
+        self.built_at = time.monotonic()
+
+    def build(self, conn):
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT gov_int_id, gov_int_name FROM public_official_details WHERE gov_int_name IS NOT NULL;")
+            rows = cursor.fetchall()
+        conn.rollback()
+        fresh = OfficialIndex(self.threshold)
+        fresh.load(rows)
+        with self._lock:
+            self.officials, self.by_trigram = fresh.officials, fresh.by_trigram
+            self.built_at = fresh.built_at
+
+    def is_stale(self):
+        return time.monotonic() - self.built_at > self.REFRESH_SECONDS
+
+    def screen(self, name):
+        """Returns [(gov_int_id, official_name, score)] at or above the threshold, best first."""
+        tokens = normalize_name(name)
+        if not tokens:
+            return []
+        grams = trigrams(tokens)
+        sounds = {soundex(token) for token in tokens}
+
+        # Prefix filtering: phonetic overlap adds at most PHONETIC_WEIGHT, so a match needs Dice of at
+        # least min_dice, i.e. at least `needed` shared trigrams. Any such official must then share one
+        # of the query's (len(grams) - needed + 1) rarest trigrams, so only those postings are read;
+        # the common grams (first names, "dela") still count in the score but never drive the scan.
+        min_dice = (self.threshold - PHONETIC_WEIGHT) / TRIGRAM_WEIGHT
+        needed = max(math.ceil(min_dice * len(grams) / (2 - min_dice)), 1) if min_dice > 0 else 1
+        postings = sorted((self.by_trigram.get(gram, ()) for gram in grams), key=len)
+        candidates = set()
+        for posting in postings[:len(grams) - needed + 1]:
+            candidates.update(posting)
+
+        matches = []
+        for gov_int_id in candidates:
+            official_name, official_grams, official_sounds = self.officials[gov_int_id]
+            dice = 2 * len(grams & official_grams) / (len(grams) + len(official_grams))
+            phonetic = len(sounds & official_sounds) / max(len(sounds), len(official_sounds))
+            score = TRIGRAM_WEIGHT * dice + PHONETIC_WEIGHT * phonetic
+            if score >= self.threshold:
+                matches.append((gov_int_id, official_name, round(score, 4)))
+        matches.sort(key=lambda match: match[2], reverse=True)
+        return matches
+
+
+def ensure_schema(cursor):
+    cursor.execute(SCHEMA_SQL)
+
+
+def record_matches(cursor, cust_no, customer_name, matches, source):
+    """Writes matches for one customer to the review table (call inside the caller's transaction)."""
+    if matches:
+        psycopg2.extras.execute_values(cursor, UPSERT_MATCHES_SQL, [
+            (str(cust_no), gov_int_id, customer_name, official_name, score, source)
+            for gov_int_id, official_name, score in matches
+        ])
+
+
+# --- Nightly batch ---
+
+_worker_index = None
+
+
+def _init_worker(official_rows, threshold):
+    global _worker_index
+    _worker_index = OfficialIndex(threshold)
+    _worker_index.load(official_rows)
+
+
+def _screen_chunk(customers):
+    results = []
+    for cust_no, custname in customers:
+        for gov_int_id, official_name, score in _worker_index.screen(custname):
+            results.append((cust_no, gov_int_id, custname, official_name, score, 'batch'))
+    return len(customers), results
+
+
+def run_batch(conn, workers, chunk_size, threshold):
+    """
+    Screens every customer. The main process streams customers with a server-side cursor and
+    hands fixed-size chunks to a process pool, at most 2 x workers chunks in flight, so memory
+    stays bounded by chunk_size rather than the table; each worker builds its own index once.
+    Returns (customers_screened, matches_written, seconds).
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT gov_int_id::text, gov_int_name FROM public_official_details WHERE gov_int_name IS NOT NULL;")
+        official_rows = cursor.fetchall()
+    conn.commit()
+
+    started = time.perf_counter()
+    screened = 0
+    written = 0
+    read_conn = psycopg2.connect(get_db_url())
+    try:
+        with read_conn.cursor(name='pep_screening_batch') as stream, \
+                ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                    initargs=(official_rows, threshold)) as pool:
+            stream.itersize = chunk_size
+            stream.execute("SELECT cust_no::text, custname FROM customer WHERE custname IS NOT NULL;")
+
+            def drain(future):
+                nonlocal screened, written
+                count, results = future.result()
+                screened += count
+                if results:
+                    with conn.cursor() as cursor:
+                        psycopg2.extras.execute_values(cursor, UPSERT_MATCHES_SQL, results, page_size=1000)
+                    conn.commit()
+                    written += len(results)
+
+            in_flight = deque()
+            while True:
+                rows = stream.fetchmany(chunk_size)
+                if not rows:
+                    break
+                in_flight.append(pool.submit(_screen_chunk, rows))
+                if len(in_flight) >= 2 * workers:
+                    drain(in_flight.popleft())
+            while in_flight:
+                drain(in_flight.popleft())
+    finally:
+        read_conn.close()
+    return screened, written, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Screen customers against public official names.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    batch_parser = subparsers.add_parser('batch', help="Screen all customers (nightly job).")
+    batch_parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    batch_parser.add_argument('--chunk-size', type=int, default=5000)
+    batch_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(get_db_url())
+    try:
+        screened, written, seconds = run_batch(conn, args.workers, args.chunk_size, args.threshold)
+    finally:
+        conn.close()
+    rate = screened / seconds if seconds else 0
+    print(f"Screened {screened} customer(s) in {seconds:.1f}s ({rate:,.0f} customers/sec); "
+          f"{written} match(es) written for review.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Named server-side prepared statements for the hot queries in app.py.
+
+    LOGIN_SQL = prepared.register('login_credentials', "SELECT ... WHERE cred.username = %s;")
+    prepared.execute(cursor, 'login_credentials', (username,))
+
+Each statement is PREPAREd lazily, the first time it runs on a given pooled connection
+(connection_pool.PooledConnection), in the same round trip as its first EXECUTE; afterwards only
+EXECUTE is sent, so Postgres skips parsing and, once it settles on a generic plan, planning.
+On connections that do not track prepared statements (replicas, scripts) the SQL runs as usual.
+
+After a schema change, call invalidate_all(): every pooled connection then DEALLOCATEs and
+re-prepares on its next use. A statement that fails because its plan went stale or the server lost
+it (DISCARD ALL, a proxy) invalidates all connections the same way and, if it was the first
+statement of its transaction, is retried once.
+"""
+import re
+import threading
+
+import psycopg2
+import psycopg2.extensions
+
+# 26000: prepared statement does not exist; 42P05: already exists; 0A000: cached plan must not change result type
+_RESYNC_PGCODES = {'26000', '42P05', '0A000'}
+
+STATEMENTS = {}
+_generation = 1
+_generation_lock = threading.Lock()
+
+
+class Statement:
+    __slots__ = ('name', 'sql', 'prepare_sql', 'execute_sql')
+
+    def __init__(self, name, sql):
+        self.name = name
+        self.sql = sql
+        # %s placeholders become $1..$n in the PREPARE body, which is then sent through psycopg2's
+        # formatting along with the EXECUTE half, so its literal % signs stay doubled.
+        parts = sql.strip().rstrip(';').split('%s')
+        numbered = parts[0] + ''.join(f"${index}{part}" for index, part in enumerate(parts[1:], start=1))
+        self.prepare_sql = f"PREPARE {name} AS {numbered}"
+        count = len(parts) - 1
+        self.execute_sql = f"EXECUTE {name} ({', '.join(['%s'] * count)})" if count else f"EXECUTE {name}"
+
+
+def register(name, sql):
+    """Names a hot statement (psycopg2 %s placeholders, no %(name)s). Returns the SQL for reference."""
+    if not re.fullmatch(r'[a-z_][a-z0-9_]*', name):
+        raise ValueError(f"Invalid prepared statement name: {name!r}")
+    STATEMENTS[name] = Statement(name, sql)
+    return sql
+
+
+def invalidate_all():
+    """Makes every pooled connection drop and re-prepare its statements on next use (after DDL)."""
+    global _generation
+    with _generation_lock:
+        _generation += 1
+
+
+def _run(cursor, conn, statement, params):
+    if conn.prepared_generation != _generation:
+        if conn.prepared_statements:
+            cursor.execute("DEALLOCATE ALL;")
+            conn.prepared_statements.clear()
+        conn.prepared_generation = _generation
+    if statement.name in conn.prepared_statements:
+        cursor.execute(statement.execute_sql, params)
+    else:
+        # PREPARE is not transactional, so it is recorded before the EXECUTE half can fail.
+        conn.prepared_statements.add(statement.name)
+        cursor.execute(f"{statement.prepare_sql}; {statement.execute_sql}", params)
+
+
+def execute(cursor, name, params=()):
+    """Executes a registered statement on the cursor; fetch results from the cursor as usual."""
+    statement = STATEMENTS[name]
+    conn = cursor.connection
+    if getattr(conn, 'prepared_statements', None) is None:
+        cursor.execute(statement.sql, params)
+        return
+    was_idle = conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    try:
+        _run(cursor, conn, statement, params)
+    except psycopg2.Error as err:
+        if err.pgcode not in _RESYNC_PGCODES or (err.pgcode == '0A000' and 'cached plan' not in str(err)):
+            raise
+        print(f"Prepared statement '{name}' out of sync ({err.pgcode}); re-preparing on all connections.")
+        invalidate_all()
+        if not was_idle:
+            raise  # earlier work in this transaction is already lost; let the caller's error handling run
+        conn.rollback()
+        _run(cursor, conn, statement, params)
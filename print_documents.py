@@ -0,0 +1,302 @@
+"""
+Batch generation of printable customer information sheets (templates/customer_print_sheet.html).
+
+    python print_documents.py --out sheets/ [--format dir|zip] [--status Active] [--since 2025-01-01]
+                              [--workers 4] [--chunk-size 500] [--part-size 10000] [--resume]
+
+Profiles are streamed from a server-side cursor in cust_no order (one row per customer; employers,
+banks, affiliations and public-official relations are aggregated into JSON lists), rendered in a
+process pool, and written as they come back:
+  - dir: one <cust_no>.html file per customer in --out;
+  - zip: --out/sheets-00001.zip, sheets-00002.zip, ... with up to --part-size sheets each.
+Only a bounded number of chunks is ever in flight, so memory stays flat however many customers
+there are. Progress is checkpointed in --out/checkpoint.json (last cust_no written, and for zip the
+last closed part); --resume continues after it, so an interrupted run does not start over.
+"""
+import argparse
+import collections
+import datetime
+import json
+import os
+import resource
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import jinja2
+import psycopg2
+import psycopg2.extras
+
+from db_config import get_db_url
+
+TEMPLATE_NAME = 'customer_print_sheet.html'
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+CHECKPOINT_NAME = 'checkpoint.json'
+
+SHEET_SQL = """
+    SELECT
+        c.cust_no::text AS cust_no, c.custname, c.datebirth, c.nationality, c.citizenship, c.custsex,
+        c.placebirth, c.civilstatus, c.num_children, c.mmaiden_name, c.cust_address, c.email_address,
+        c.contact_no, c.registration_status,
+        o.occ_type, o.bus_nature,
+        f.source_wealth, f.mon_income, f.ann_income,
+        s.sp_name, s.sp_datebirth, s.sp_profession,
+        COALESCE(emp.items, '[]') AS employers,
+        COALESCE(bank.items, '[]') AS banks,
+        COALESCE(comp.items, '[]') AS companies,
+        COALESCE(pol.items, '[]') AS officials
+    FROM customer c
+    LEFT JOIN occupation o ON c.occ_id = o.occ_id
+    LEFT JOIN financial_record f ON c.fin_code = f.fin_code
+    LEFT JOIN spouse s ON c.cust_no = s.cust_no
+    LEFT JOIN LATERAL (
+        SELECT json_agg(json_build_object(
+            'empname', e.empname, 'job_title', e.job_title, 'tin_id', e.tin_id, 'emp_date', e.emp_date,
+            'emp_address', e.emp_address, 'phonefax_no', e.phonefax_no) ORDER BY e.emp_date) AS items
+        FROM employment_details emd JOIN employer_details e ON emd.emp_id = e.emp_id
+        WHERE emd.cust_no = c.cust_no
+    ) emp ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT json_agg(json_build_object(
+            'bank_code', eb.bank_code, 'bank_name', bd.bank_name, 'branch', bd.branch, 'acc_type', eb.acc_type)
+            ORDER BY eb.bank_code, eb.acc_type) AS items
+        FROM existing_bank eb LEFT JOIN bank_details bd ON eb.bank_code = bd.bank_code
+        WHERE eb.cust_no = c.cust_no
+    ) bank ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT json_agg(json_build_object('depositor_role', ca.depositor_role, 'dep_compname', ca.dep_compname)
+            ORDER BY ca.depositor_role) AS items
+        FROM company_affiliation ca
+        WHERE ca.cust_no = c.cust_no
+    ) comp ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT json_agg(json_build_object(
+            'gov_int_name', po.gov_int_name, 'official_position', po.official_position,
+            'branch_orgname', po.branch_orgname, 'relation_desc', cpr.relation_desc) ORDER BY po.gov_int_name) AS items
+        FROM cust_po_relationship cpr JOIN public_official_details po ON cpr.gov_int_id = po.gov_int_id
+        WHERE cpr.cust_no = c.cust_no
+    ) pol ON TRUE
+    WHERE {where}
+    ORDER BY c.cust_no;
+"""
+
+_environment = None
+
+
+def template_environment():
+    """The Jinja environment the sheets are rendered with; no Flask app context is needed."""
+    return jinja2.Environment(
+        loader=jinja2.FileSystemLoader(TEMPLATE_DIR),
+        autoescape=jinja2.select_autoescape(['html']),
+    )
+
+
+def fetch_sheet(cursor, cust_no):
+    """One customer's sheet data (a RealDictCursor row) or None; used by the single-sheet print view."""
+    cursor.execute(SHEET_SQL.format(where="c.cust_no = %(cust_no)s"), {'cust_no': str(cust_no)})
+    return cursor.fetchone()
+
+
+def render_sheet(template, profile, generated_at):
+    return template.render(c=profile, generated_at=generated_at)
+
+
+def _init_worker():
+    global _environment
+    _environment = template_environment()
+
+
+def _render_chunk(args):
+    profiles, generated_at = args
+    template = _environment.get_template(TEMPLATE_NAME)
+    return [(profile['cust_no'], render_sheet(template, profile, generated_at).encode('utf-8'))
+            for profile in profiles]
+
+
+class DirectoryWriter:
+    """One <cust_no>.html per customer; each file is written to a temp name and renamed into place."""
+
+    def __init__(self, out_dir, checkpoint):
+        self.out_dir = out_dir
+        self.documents = checkpoint.get('documents', 0)
+        self.bytes_written = 0
+        # (last cust_no, documents) that a resumed run can rely on
+        self.committed = (checkpoint.get('last_cust_no'), self.documents)
+
+    def write(self, cust_no, document):
+        path = os.path.join(self.out_dir, f"{cust_no}.html")
+        with open(path + '.tmp', 'wb') as handle:
+            handle.write(document)
+        os.replace(path + '.tmp', path)
+        self.documents += 1
+        self.bytes_written += len(document)
+        self.committed = (cust_no, self.documents)
+
+    def close(self):
+        pass
+
+    def state(self):
+        return {}
+
+
+class ZipPartWriter(DirectoryWriter):
+    """
+    Sheets go into numbered zip parts of up to part_size entries. Only closed parts count as
+    committed, so a resumed run rewrites the part that was open when the previous run stopped.
+    """
+
+    def __init__(self, out_dir, checkpoint, part_size):
+        super().__init__(out_dir, checkpoint)
+        self.part_size = part_size
+        self.part = checkpoint.get('parts', 0)
+        self.archive = None
+        self.entries = 0
+        self.last_cust_no = None
+
+    def write(self, cust_no, document):
+        if self.archive is None:
+            self.part += 1
+            path = os.path.join(self.out_dir, f"sheets-{self.part:05d}.zip")
+            self.archive = zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED)
+            self.entries = 0
+        self.archive.writestr(f"{cust_no}.html", document)
+        self.entries += 1
+        self.documents += 1
+        self.bytes_written += len(document)
+        self.last_cust_no = cust_no
+        if self.entries >= self.part_size:
+            self.close()
+
+    def close(self):
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
+            self.committed = (self.last_cust_no, self.documents)
+
+    def state(self):
+        # While a part is open, the checkpoint still points at the last closed one.
+        return {'parts': self.part if self.archive is None else self.part - 1}
+
+
+def load_checkpoint(out_dir):
+    path = os.path.join(out_dir, CHECKPOINT_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def save_checkpoint(out_dir, checkpoint):
+    path = os.path.join(out_dir, CHECKPOINT_NAME)
+    with open(path + '.tmp', 'w') as handle:
+        json.dump(checkpoint, handle)
+    os.replace(path + '.tmp', path)
+
+
+def stream_profiles(conn, after, status, since, chunk_size):
+    """Yields lists of up to chunk_size profiles with cust_no > after, in cust_no order."""
+    conditions = ["c.cust_no > %(after)s::uuid"]
+    params = {'after': after or '00000000-0000-0000-0000-000000000000'}
+    if status:
+        conditions.append("c.registration_status = %(status)s")
+        params['status'] = status
+    if since:
+        conditions.append("c.registered_at >= %(since)s")
+        params['since'] = since
+    with conn.cursor(name='print_documents', cursor_factory=psycopg2.extras.RealDictCursor) as stream:
+        stream.itersize = chunk_size
+        stream.execute(SHEET_SQL.format(where=' AND '.join(conditions)), params)
+        while True:
+            rows = stream.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield [dict(row) for row in rows]
+
+
+def generate(conn, out_dir, output_format='dir', workers=2, chunk_size=500, part_size=10000,
+             status=None, since=None, resume=False):
+    """
+    Renders and writes every matching customer's sheet. Returns (documents, bytes_written, seconds).
+    At most 2 * workers chunks are rendered or waiting to be written at any time; the checkpoint is
+    saved after each chunk whose output is committed.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    checkpoint = load_checkpoint(out_dir) if resume else {}
+    if checkpoint:
+        print(f"Resuming after {checkpoint['last_cust_no']} ({checkpoint['documents']} sheet(s) already written).")
+    if output_format == 'zip':
+        writer = ZipPartWriter(out_dir, checkpoint, part_size)
+    else:
+        writer = DirectoryWriter(out_dir, checkpoint)
+    saved = writer.committed
+    generated_at = datetime.datetime.now().strftime('%Y-%m-%d %H:%M')
+    started = time.perf_counter()
+
+    def save_if_committed():
+        nonlocal saved
+        if writer.committed != saved:
+            last_cust_no, documents = writer.committed
+            save_checkpoint(out_dir, {'last_cust_no': last_cust_no, 'documents': documents, **writer.state()})
+            saved = writer.committed
+
+    def drain(future):
+        for cust_no, document in future.result():
+            writer.write(cust_no, document)
+        save_if_committed()
+
+    in_flight = collections.deque()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            for profiles in stream_profiles(conn, checkpoint.get('last_cust_no'), status, since, chunk_size):
+                in_flight.append(pool.submit(_render_chunk, (profiles, generated_at)))
+                if len(in_flight) >= 2 * workers:
+                    drain(in_flight.popleft())
+            while in_flight:
+                drain(in_flight.popleft())
+        writer.close()
+        save_if_committed()
+    finally:
+        writer.close()  # an interrupted zip part is still closed readable, but left uncommitted
+    return writer.documents - checkpoint.get('documents', 0), writer.bytes_written, time.perf_counter() - started
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and of the largest reaped worker, in MB (Linux reports KB)."""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return own, children
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate printable customer information sheets in bulk.")
+    parser.add_argument('--out', required=True, help="Output directory (sheets or zip parts, plus checkpoint.json).")
+    parser.add_argument('--format', choices=('dir', 'zip'), default='dir')
+    parser.add_argument('--status', help="Only customers with this registration_status, e.g. Active.")
+    parser.add_argument('--since', help="Only customers registered on or after this date (YYYY-MM-DD).")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--chunk-size', type=int, default=500)
+    parser.add_argument('--part-size', type=int, default=10000, help="Sheets per zip part.")
+    parser.add_argument('--resume', action='store_true', help="Continue after the last checkpoint in --out.")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(get_db_url())
+    conn.set_session(readonly=True)
+    try:
+        documents, written, seconds = generate(
+            conn, args.out, args.format, args.workers, args.chunk_size, args.part_size,
+            args.status, args.since, args.resume,
+        )
+    except psycopg2.Error as err:
+        print(f"Sheet generation failed: {err}")
+        sys.exit(1)
+    finally:
+        conn.close()
+    rate = documents / seconds if seconds else 0
+    own, children = peak_rss_mb()
+    print(f"Wrote {documents} sheet(s), {written / 1e6:.1f} MB, in {seconds:.1f}s ({rate:,.0f} docs/sec); "
+          f"peak RSS {own:.0f} MB main, {children:.0f} MB largest worker.")
+
+
+if __name__ == '__main__':
+    main()
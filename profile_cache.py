@@ -0,0 +1,195 @@
+"""
+Bounded in-process cache of assembled customer profiles (repository.CustomerProfile).
+
+The details page, the edit form and the dashboard modals load the same profile repeatedly, and
+each load is the 13-table profile join. A worker keeps recently loaded profiles keyed by cust_no,
+each tagged with the customer's row_version (bumped by a trigger on every UPDATE of the row).
+
+Invalidation:
+  - write-through: the write paths in app.py call invalidate() after they commit, so the worker
+    that made a change never serves the old profile;
+  - across workers: every change records an outbox event (outbox.py), whose NOTIFY carries
+    "<event_type> <cust_no> [<row_version>]". One listener thread per database in every worker
+    drops the entry and remembers the version as the customer's floor: a profile loaded from an
+    older snapshot (a slow request, a lagging replica) is refused by put() instead of being cached
+    after the invalidation. A delete's floor is infinite.
+  - while a listener is disconnected nothing is cached, and the cache is cleared when it
+    reconnects (notifications may have been missed); ttl_seconds bounds staleness regardless.
+
+Limits: max_entries profiles and max_bytes of estimated memory (the tuple plus its field values);
+least recently used entries go first. metrics() reports hits, misses, hit rate and size.
+"""
+import math
+import select
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+
+import psycopg2
+import psycopg2.extensions
+
+import outbox
+
+
+def profile_size(profile):
+    """Estimated bytes a cached profile keeps alive (shared objects such as None are counted too)."""
+    return sys.getsizeof(profile) + sum(sys.getsizeof(value) for value in profile)
+
+
+class ProfileCache:
+    """sources maps a name to a database URL ({'primary': url}, or the shard URLs) to listen on."""
+
+    def __init__(self, sources, config):
+        self.sources = dict(sources)
+        self.max_entries = config['max_entries']
+        self.max_bytes = config['max_bytes']
+        self.ttl_seconds = config['ttl_seconds']
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # cust_no -> (profile, size, expires_at), least recently used first
+        self._floors = OrderedDict()   # cust_no -> lowest row_version that may be cached
+        self._bytes = 0
+        self._stats = Counter()
+        self._connected = set()
+        self._started = False
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def _start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for name in self.sources:
+            threading.Thread(target=self._listen, args=(name,), name=f"profile-cache-{name}", daemon=True).start()
+
+    # --- lookups ---
+
+    def get(self, cust_no):
+        """The cached profile or None."""
+        if not self.enabled:
+            return None
+        self._start()
+        key = str(cust_no)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            if entry[2] <= time.monotonic():
+                self._remove(key)
+                self._stats['expired'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[0]
+
+    def put(self, cust_no, profile):
+        """Caches a freshly loaded profile. Returns False if it was refused (stale, too big, not listening)."""
+        if not self.enabled or profile is None:
+            return False
+        key = str(cust_no)
+        size = profile_size(profile)
+        with self._lock:
+            if len(self._connected) < len(self.sources):
+                self._stats['refused'] += 1
+                return False
+            if profile.row_version < self._floors.get(key, 0) or size > self.max_bytes:
+                self._stats['refused'] += 1
+                return False
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (profile, size, time.monotonic() + self.ttl_seconds)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+            return True
+
+    # --- invalidation ---
+
+    def invalidate(self, cust_no, row_version=None):
+        """
+        Drops a customer's profile. row_version, when known, is the version now committed: older
+        loads of the profile will not be cached any more (math.inf for a deleted customer).
+        """
+        key = str(cust_no)
+        with self._lock:
+            self._stats['invalidations'] += 1
+            if key in self._entries:
+                self._remove(key)
+            if row_version is not None:
+                self._floors[key] = max(self._floors.pop(key, 0), row_version)
+                while len(self._floors) > max(self.max_entries, 1):
+                    self._floors.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _apply_notification(self, payload):
+        parts = payload.split()
+        if len(parts) < 2:
+            return
+        if parts[0] == outbox.DELETED:
+            self.invalidate(parts[1], math.inf)
+        else:
+            self.invalidate(parts[1], int(parts[2]) if len(parts) > 2 else None)
+
+    def _listen(self, name):
+        """Listener thread for one database: applies outbox notifications, reconnecting on errors."""
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(self.sources[name])
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                conn.cursor().execute(f"LISTEN {outbox.NOTIFY_CHANNEL};")
+                # Changes made while nobody listened are unknown: start empty
+                self.clear()
+                with self._lock:
+                    self._connected.add(name)
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        conn.cursor().execute("SELECT 1;")  # notice a dead connection
+                        continue
+                    conn.poll()
+                    for notify in conn.notifies:
+                        self._apply_notification(notify.payload)
+                    conn.notifies.clear()
+            except psycopg2.Error as err:
+                print(f"Profile cache listener for '{name}' failed: {err}; not caching until it reconnects.")
+            finally:
+                with self._lock:
+                    self._connected.discard(name)
+                self.clear()
+                if conn:
+                    conn.close()
+            time.sleep(1)
+
+    def metrics(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                'enabled': self.enabled,
+                'hits': self._stats['hits'],
+                'misses': self._stats['misses'],
+                'hit_rate': round(self._stats['hits'] / lookups, 4) if lookups else None,
+                'expired': self._stats['expired'],
+                'evictions': self._stats['evictions'],
+                'invalidations': self._stats['invalidations'],
+                'refused': self._stats['refused'],
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'listeners_connected': len(self._connected),
+                'listeners': len(self.sources),
+            }
@@ -0,0 +1,113 @@
+"""
+Optional online re-keying of existing random (v4) primary keys to time-ordered v7 keys.
+
+    python rekey_uuid7.py [--tables customer,occupation,...] [--batch-size 500] [--sleep 0.05] [--dry-run]
+
+Each table is processed in small committed batches, so normal traffic keeps running:
+  1. Foreign keys that reference the table are switched to ON UPDATE CASCADE (added NOT VALID,
+     then validated, so the child table is not locked for a full scan).
+  2. Keys whose version nibble is not 7 are rewritten with uuid_generate_v7(); customers use
+     their registered_at so the new keys follow registration order.
+
+Logged-in sessions hold cust_no as a string, so affected users must log in again afterwards.
+"""
+import argparse
+import re
+import time
+
+import psycopg2
+
+from db_config import get_db_url
+
+# table -> (primary key column, timestamp expression used for the new key)
+REKEY_TABLES = {
+    'occupation': ('occ_id', 'clock_timestamp()'),
+    'financial_record': ('fin_code', 'clock_timestamp()'),
+    'public_official_details': ('gov_int_id', 'clock_timestamp()'),
+    'employer_details': ('emp_id', 'clock_timestamp()'),
+    'customer': ('cust_no', 'COALESCE(registered_at, clock_timestamp())'),
+}
+
+
+def ensure_update_cascade(conn, table_name):
+    """Re-creates every FK referencing table_name with ON UPDATE CASCADE, keeping its ON DELETE action."""
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT con.conname, child.relname, pg_get_constraintdef(con.oid)
+            FROM pg_constraint con
+            JOIN pg_class child ON child.oid = con.conrelid
+            WHERE con.contype = 'f' AND con.confrelid = %s::regclass AND con.confupdtype <> 'c';
+        """, (table_name,))
+        constraints = cursor.fetchall()
+    for conname, child_table, definition in constraints:
+        definition = re.sub(r'\s+ON UPDATE (NO ACTION|RESTRICT|SET NULL|SET DEFAULT)', '', definition)
+        print(f"  - {child_table}.{conname}: adding ON UPDATE CASCADE")
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f'ALTER TABLE {child_table} DROP CONSTRAINT "{conname}", '
+                f'ADD CONSTRAINT "{conname}" {definition} ON UPDATE CASCADE NOT VALID;'
+            )
+            conn.commit()
+            cursor.execute(f'ALTER TABLE {child_table} VALIDATE CONSTRAINT "{conname}";')
+            conn.commit()
+
+
+def rekey_table(conn, table_name, batch_size, sleep_seconds, dry_run=False):
+    """Rewrites non-v7 keys of one table in keyset-paginated batches. Returns the number of rows re-keyed."""
+    key_column, ts_expression = REKEY_TABLES[table_name]
+    last_key = '00000000-0000-0000-0000-000000000000'
+    rekeyed = 0
+    while True:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f"SELECT {key_column} FROM {table_name} WHERE {key_column} > %s "
+                f"ORDER BY {key_column} LIMIT %s;",
+                (last_key, batch_size),
+            )
+            keys = [row[0] for row in cursor.fetchall()]
+            if not keys:
+                conn.commit()
+                break
+            last_key = keys[-1]
+            # Keys already rewritten in this run sort after the cursor as v7 and are skipped here.
+            old_keys = [key for key in keys if key[14] != '7']
+            if old_keys and not dry_run:
+                cursor.execute(
+                    f"UPDATE {table_name} SET {key_column} = uuid_generate_v7({ts_expression}) "
+                    f"WHERE {key_column} = ANY(%s::uuid[]);",
+                    (old_keys,),
+                )
+            conn.commit()
+        rekeyed += len(old_keys)
+        if sleep_seconds:
+            time.sleep(sleep_seconds)
+    return rekeyed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-key existing v4 UUID primary keys to time-ordered v7 keys.")
+    parser.add_argument('--tables', default=','.join(REKEY_TABLES), help="Comma-separated tables to re-key.")
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--sleep', type=float, default=0.05, help="Pause between batches, in seconds.")
+    parser.add_argument('--dry-run', action='store_true', help="Count the keys that would change without writing.")
+    args = parser.parse_args()
+
+    tables = [t.strip() for t in args.tables.split(',') if t.strip()]
+    unknown = [t for t in tables if t not in REKEY_TABLES]
+    if unknown:
+        parser.error(f"Unknown table(s): {', '.join(unknown)}")
+
+    conn = psycopg2.connect(get_db_url())
+    try:
+        for table_name in tables:
+            print(f"Re-keying {table_name}...")
+            if not args.dry_run:
+                ensure_update_cascade(conn, table_name)
+            count = rekey_table(conn, table_name, args.batch_size, args.sleep, dry_run=args.dry_run)
+            print(f"  - {count} key(s) {'would be ' if args.dry_run else ''}re-keyed in {table_name}.")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+"""
+Read-side data access for the customer graph.
+
+The admin pages, exports and batch jobs get their customer rows from here instead of building SQL
+and DictCursor rows themselves. Rows come back as compact namedtuples, one type per projection:
+  - CustomerListRow: the columns the customer list shows (dashboard, exports);
+  - CustomerProfile: the full profile join (details, edit and print pages).
+A namedtuple row is a plain tuple plus a shared class, so it costs a fraction of a DictCursor row
+(which carries its own index dict) and is built without per-row dict work; attribute access
+(`row.custname`) works in code and templates alike.
+
+Call the functions with an ordinary (tuple) cursor from the caller's connection; the caller keeps
+owning the connection and the transaction, as everywhere else in app.py.
+"""
+from collections import namedtuple
+
+import prepared
+
+LIST_COLUMNS = ('cust_no', 'custname', 'email_address', 'contact_no', 'registration_status')
+
+PROFILE_COLUMNS = (
+    'cust_no', 'custname', 'datebirth', 'nationality', 'citizenship', 'custsex', 'placebirth',
+    'civilstatus', 'num_children', 'mmaiden_name', 'cust_address', 'email_address',
+    'contact_no', 'registration_status', 'row_version',
+    'occ_type', 'bus_nature',
+    'source_wealth', 'mon_income', 'ann_income', 'source_wealth_items',
+    'tin_id', 'empname', 'emp_address', 'phonefax_no', 'job_title', 'emp_date',
+    'sp_name', 'sp_datebirth', 'sp_profession',
+    'depositor_role', 'dep_compname',
+    'bank_code', 'acc_type',
+    'gov_int_name', 'official_position', 'branch_orgname',
+    'relation_desc',
+)
+
+
+class CustomerListRow(namedtuple('CustomerListRow', LIST_COLUMNS)):
+    __slots__ = ()
+
+
+class CustomerProfile(namedtuple('CustomerProfile', PROFILE_COLUMNS)):
+    __slots__ = ()
+
+    def get(self, name, default=None):
+        """Dict-style lookup, for code written against DictCursor rows."""
+        return getattr(self, name, default)
+
+
+DASHBOARD_LIST_SQL = prepared.register('dashboard_customer_list', f"""
+    SELECT {', '.join(LIST_COLUMNS)} FROM customer ORDER BY custname;
+""")
+
+# The same list in byte order ("C" collation, cust_no as tie-break), so per-shard lists can be
+# merged in Python with bytewise_sort_key (see sharding.list_customers).
+DASHBOARD_LIST_BYTEWISE_SQL = prepared.register('dashboard_customer_list_bytewise', f"""
+    SELECT {', '.join(LIST_COLUMNS)} FROM customer ORDER BY custname COLLATE "C", cust_no;
+""")
+
+_PROFILE_SELECT = """
+    SELECT
+        c.cust_no, c.custname, c.datebirth, c.nationality, c.citizenship, c.custsex, c.placebirth,
+        c.civilstatus, c.num_children, c.mmaiden_name, c.cust_address, c.email_address,
+        c.contact_no, c.registration_status, c.row_version,
+        o.occ_type, o.bus_nature,
+        f.source_wealth, f.mon_income, f.ann_income, f.source_wealth_items,
+        e.tin_id, e.empname, e.emp_address, e.phonefax_no, e.job_title, e.emp_date,
+        s.sp_name, s.sp_datebirth, s.sp_profession,
+        comp.depositor_role, comp.dep_compname,
+        eb.bank_code, eb.acc_type,
+        po.gov_int_name, po.official_position, po.branch_orgname,
+        cpr.relation_desc
+    FROM customer c
+    LEFT JOIN occupation o ON c.occ_id = o.occ_id
+    LEFT JOIN financial_record f ON c.fin_code = f.fin_code
+    LEFT JOIN employment_details emd ON c.cust_no = emd.cust_no
+    LEFT JOIN employer_details e ON emd.emp_id = e.emp_id
+    LEFT JOIN spouse s ON c.cust_no = s.cust_no
+    LEFT JOIN company_affiliation comp ON c.cust_no = comp.cust_no
+    LEFT JOIN existing_bank eb ON c.cust_no = eb.cust_no
+    LEFT JOIN cust_po_relationship cpr ON c.cust_no = cpr.cust_no
+    LEFT JOIN public_official_details po ON cpr.gov_int_id = po.gov_int_id
+"""
+
+CUSTOMER_PROFILE_SQL = prepared.register('customer_profile', _PROFILE_SELECT + " WHERE c.cust_no = %s;")
+
+# One profile per customer for the batch fetch (the joins can fan out to several rows per customer;
+# the single-customer pages have always shown the first).
+_PROFILES_SQL = _PROFILE_SELECT.replace("SELECT", "SELECT DISTINCT ON (c.cust_no)", 1) + """
+    WHERE c.cust_no = ANY(%s::uuid[])
+    ORDER BY c.cust_no;
+"""
+
+
+def list_customers(cursor, bytewise=False):
+    """
+    Every customer as a CustomerListRow, ordered by name (the admin dashboard list).
+    With bytewise=True the order is the one bytewise_sort_key() gives.
+    """
+    prepared.execute(cursor, 'dashboard_customer_list_bytewise' if bytewise else 'dashboard_customer_list')
+    return [CustomerListRow._make(row) for row in cursor.fetchall()]
+
+
+def bytewise_sort_key(row):
+    """Python sort key matching ORDER BY custname COLLATE "C", cust_no (NULL names last)."""
+    return (row.custname is None, row.custname or '', str(row.cust_no))
+
+
+def iter_customers(conn, batch_size=10000, status=None):
+    """
+    Streams CustomerListRows in cust_no order through a server-side cursor, batch_size rows per
+    round trip, for exports and jobs that must not hold the whole table in memory.
+    Runs inside the connection's current transaction.
+    """
+    sql = f"SELECT {', '.join(LIST_COLUMNS)} FROM customer"
+    params = ()
+    if status:
+        sql += " WHERE registration_status = %s"
+        params = (status,)
+    with conn.cursor(name='repository_iter_customers') as stream:
+        stream.itersize = batch_size
+        stream.execute(sql + " ORDER BY cust_no;", params)
+        while True:
+            rows = stream.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from map(CustomerListRow._make, rows)
+
+
+def fetch_list_rows(cursor, cust_nos):
+    """CustomerListRows for the given keys in one round trip, in the order given; unknown keys are skipped."""
+    keys = [str(cust_no) for cust_no in cust_nos]
+    if not keys:
+        return []
+    cursor.execute(f"""
+        SELECT {', '.join('c.' + column for column in LIST_COLUMNS)}
+        FROM unnest(%s::uuid[]) WITH ORDINALITY AS k (cust_no, position)
+        JOIN customer c ON c.cust_no = k.cust_no
+        ORDER BY k.position;
+    """, (keys,))
+    return [CustomerListRow._make(row) for row in cursor.fetchall()]
+
+
+def fetch_profile(cursor, cust_no):
+    """The CustomerProfile of one customer, or None (prepared statement 'customer_profile')."""
+    prepared.execute(cursor, 'customer_profile', (str(cust_no),))
+    row = cursor.fetchone()
+    return CustomerProfile._make(row) if row else None
+
+
+def fetch_profiles(cursor, cust_nos, page_size=1000):
+    """{cust_no (str): CustomerProfile} for many customers, page_size keys per round trip."""
+    keys = [str(cust_no) for cust_no in cust_nos]
+    profiles = {}
+    for start in range(0, len(keys), page_size):
+        cursor.execute(_PROFILES_SQL, (keys[start:start + page_size],))
+        for row in cursor.fetchall():
+            profile = CustomerProfile._make(row)
+            profiles[str(profile.cust_no)] = profile
+    return profiles
+
+
+# Sections of the JSON view of a profile (the shape the dashboard modals and the edit form read)
+_DOCUMENT_SECTIONS = (
+    ('occupation', ('occ_type', 'bus_nature')),
+    ('financial_record', ('source_wealth', 'mon_income', 'ann_income', 'source_wealth_items')),
+    ('employer_details', ('tin_id', 'empname', 'emp_address', 'phonefax_no', 'job_title', 'emp_date')),
+    ('spouse', ('sp_name', 'sp_datebirth', 'sp_profession')),
+)
+_DOCUMENT_LISTS = (
+    ('company_affiliations', ('depositor_role', 'dep_compname')),
+    ('existing_banks', ('bank_code', 'acc_type')),
+    ('public_official_relationships', ('gov_int_name', 'official_position', 'branch_orgname', 'relation_desc')),
+)
+
+
+def profile_document(profile):
+    """
+    A CustomerProfile as a JSON-ready dict: {'customer': {...}, 'occupation': {...}, ...,
+    'company_affiliations': [...], 'row_version': n}, dates as ISO strings. A list is empty when the
+    customer has no such row.
+    """
+    values = {column: value.isoformat() if hasattr(value, 'isoformat') else value
+              for column, value in profile._asdict().items()}
+    grouped = set()
+    document = {}
+    for section, columns in _DOCUMENT_SECTIONS + _DOCUMENT_LISTS:
+        grouped.update(columns)
+        part = {column: values[column] for column in columns}
+        if section in dict(_DOCUMENT_LISTS):
+            part = [part] if any(value is not None for value in part.values()) else []
+        document[section] = part
+    document['customer'] = {column: value for column, value in values.items() if column not in grouped}
+    document['customer']['cust_no'] = str(profile.cust_no)
+    document['row_version'] = profile.row_version
+    return document
@@ -0,0 +1,142 @@
+"""
+Registration review queue: pending self-registrations, oldest first, worked by many admins at once.
+
+A reviewer claims a batch (claim()); the claim locks the customer rows with FOR UPDATE SKIP LOCKED,
+so concurrent claims never block on or hand out the same customers, and records a lease in
+registration_review_lease so the batch stays with that reviewer across requests until it is
+decided, released or the lease expires. decide() then approves or rejects a whole selection with
+one UPDATE ... WHERE cust_no = ANY(%s), limited to customers the reviewer still holds.
+"""
+import uuid
+
+LEASE_MINUTES = 15
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Decisions map onto the statuses the admin forms already use.
+DECISION_STATUSES = {'approve': 'Active', 'reject': 'Inactive'}
+
+# The queue is read in (registered_at, cust_no) order. Rows from before registered_at existed have
+# NULL there and sort first as -infinity; the partial index only covers pending customers.
+QUEUE_ORDER_SQL = "COALESCE(c.registered_at, '-infinity'::timestamptz)"
+
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS registration_review_lease (
+        cust_no UUID PRIMARY KEY REFERENCES customer (cust_no) ON DELETE CASCADE,
+        reviewer VARCHAR(255) NOT NULL,
+        lease_expires_at TIMESTAMPTZ NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_registration_review_lease_reviewer
+        ON registration_review_lease (reviewer, lease_expires_at);
+    CREATE INDEX IF NOT EXISTS idx_customer_pending_queue
+        ON customer ((COALESCE(registered_at, '-infinity'::timestamptz)), cust_no)
+        WHERE registration_status = 'Pending';
+"""
+
+
+def ensure_schema(cursor):
+    cursor.execute(SCHEMA_SQL)
+
+
+def parse_cust_nos(value):
+    """
+    The posted selection as canonical cust_no strings (the form RETURNING c.cust_no::text gives).
+    Raises ValueError unless it is a list of UUID strings, at most MAX_PAGE_SIZE of them.
+    """
+    if not isinstance(value, list) or len(value) > MAX_PAGE_SIZE:
+        raise ValueError(f"cust_nos must be a list of at most {MAX_PAGE_SIZE} customer numbers")
+    try:
+        return [str(uuid.UUID(cust_no)) for cust_no in value]
+    except (TypeError, ValueError, AttributeError):
+        raise ValueError("cust_nos must contain customer numbers (UUIDs)") from None
+
+
+def fetch_page(cursor, after=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    One page of the pending queue, oldest first. `after` is the (queue_key, cust_no) pair of the last
+    row of the previous page (keyset pagination, so deep pages cost the same as the first).
+    Rows: (cust_no, custname, email_address, contact_no, registered_at, queue_key, reviewer, lease_expires_at);
+    queue_key is the text form of the sort key to pass back as `after`, reviewer/lease_expires_at are
+    NULL unless someone currently holds the customer.
+    """
+    keyset = f"AND ({QUEUE_ORDER_SQL}, c.cust_no) > (%(after_at)s::timestamptz, %(after_no)s::uuid)" if after else ""
+    cursor.execute(f"""
+        SELECT c.cust_no::text, c.custname, c.email_address, c.contact_no, c.registered_at,
+               {QUEUE_ORDER_SQL}::text AS queue_key,
+               l.reviewer, l.lease_expires_at
+        FROM customer c
+        LEFT JOIN registration_review_lease l ON l.cust_no = c.cust_no AND l.lease_expires_at > now()
+        WHERE c.registration_status = 'Pending' {keyset}
+        ORDER BY {QUEUE_ORDER_SQL}, c.cust_no
+        LIMIT %(limit)s;
+    """, {
+        'after_at': after[0] if after else None,
+        'after_no': after[1] if after else None,
+        'limit': limit,
+    })
+    return cursor.fetchall()
+
+
+def claim(cursor, reviewer, limit=DEFAULT_PAGE_SIZE):
+    """
+    Leases up to `limit` of the oldest pending customers nobody else holds to `reviewer` and returns
+    their cust_nos. Rows locked by a concurrent claim are skipped rather than waited on.
+    The reviewer's own live leases are renewed and included.
+    """
+    cursor.execute(f"""
+        WITH picked AS (
+            SELECT c.cust_no
+            FROM customer c
+            WHERE c.registration_status = 'Pending'
+              AND NOT EXISTS (
+                  SELECT 1 FROM registration_review_lease l
+                  WHERE l.cust_no = c.cust_no AND l.lease_expires_at > now() AND l.reviewer <> %(reviewer)s
+              )
+            ORDER BY {QUEUE_ORDER_SQL}, c.cust_no
+            LIMIT %(limit)s
+            FOR UPDATE OF c SKIP LOCKED
+        )
+        INSERT INTO registration_review_lease (cust_no, reviewer, lease_expires_at)
+        SELECT cust_no, %(reviewer)s, now() + make_interval(mins => %(minutes)s) FROM picked
+        ON CONFLICT (cust_no) DO UPDATE
+        SET reviewer = EXCLUDED.reviewer, lease_expires_at = EXCLUDED.lease_expires_at
+        -- A claim that committed after this statement's snapshot still wins its rows.
+        WHERE registration_review_lease.reviewer = EXCLUDED.reviewer
+           OR registration_review_lease.lease_expires_at <= now()
+        RETURNING cust_no::text;
+    """, {'reviewer': reviewer, 'limit': limit, 'minutes': LEASE_MINUTES})
+    return [row[0] for row in cursor.fetchall()]
+
+
+def decide(cursor, reviewer, cust_nos, decision):
+    """
+    Applies `decision` ('approve' or 'reject') to every selected customer the reviewer still holds a
+    live lease on, in a single UPDATE, and drops their leases. Returns the cust_nos actually updated;
+    customers whose lease lapsed or was taken over are left alone for the caller to report.
+    """
+    status = DECISION_STATUSES[decision]
+    cursor.execute("""
+        UPDATE customer c
+        SET registration_status = %(status)s
+        WHERE c.cust_no = ANY(%(cust_nos)s::uuid[])
+          AND c.registration_status = 'Pending'
+          AND EXISTS (
+              SELECT 1 FROM registration_review_lease l
+              WHERE l.cust_no = c.cust_no AND l.reviewer = %(reviewer)s AND l.lease_expires_at > now()
+          )
+        RETURNING c.cust_no::text;
+    """, {'status': status, 'cust_nos': list(cust_nos), 'reviewer': reviewer})
+    updated = [row[0] for row in cursor.fetchall()]
+    if updated:
+        cursor.execute("DELETE FROM registration_review_lease WHERE cust_no = ANY(%s::uuid[]);", (updated,))
+    return updated
+
+
+def release(cursor, reviewer, cust_nos=None):
+    """Gives back the reviewer's leases (all of them, or just `cust_nos`). Returns the number released."""
+    if cust_nos is None:
+        cursor.execute("DELETE FROM registration_review_lease WHERE reviewer = %s;", (reviewer,))
+    else:
+        cursor.execute("DELETE FROM registration_review_lease WHERE reviewer = %s AND cust_no = ANY(%s::uuid[]);",
+                       (reviewer, list(cust_nos)))
+    return cursor.rowcount
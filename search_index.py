@@ -0,0 +1,132 @@
+import re
+import sys
+
+import psycopg2
+
+from db_config import get_db_url
+
+# One denormalized row per customer, written by the customer write paths in app.py in the same
+# transaction as the change (refresh_document()), so searches never join the five source tables.
+SCHEMA_SQL = """
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+    CREATE TABLE IF NOT EXISTS customer_search (
+        cust_no UUID PRIMARY KEY REFERENCES customer (cust_no) ON DELETE CASCADE,
+        document TEXT NOT NULL,
+        search_vector TSVECTOR NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_customer_search_vector ON customer_search USING GIN (search_vector);
+    CREATE INDEX IF NOT EXISTS idx_customer_search_document_trgm ON customer_search USING GIN (document gin_trgm_ops);
+"""
+
+# Builds the document for the customers selected by the WHERE clause appended by the caller.
+# Names weigh most, then contact details, then related people/employer, then the address.
+_DOCUMENT_SELECT = """
+    SELECT
+        c.cust_no,
+        lower(concat_ws(' ', c.custname, c.email_address, c.contact_no, e.empname, s.sp_name,
+                        c.mmaiden_name, c.cust_address)),
+        setweight(to_tsvector('simple', coalesce(c.custname, '')), 'A') ||
+        setweight(to_tsvector('simple', concat_ws(' ', c.email_address, c.contact_no)), 'B') ||
+        setweight(to_tsvector('simple', concat_ws(' ', e.empname, s.sp_name, c.mmaiden_name)), 'C') ||
+        setweight(to_tsvector('simple', coalesce(c.cust_address, '')), 'D')
+    FROM customer c
+    LEFT JOIN LATERAL (
+        SELECT string_agg(ed.empname, ' ') AS empname
+        FROM employment_details emd JOIN employer_details ed ON ed.emp_id = emd.emp_id
+        WHERE emd.cust_no = c.cust_no
+    ) e ON TRUE
+    LEFT JOIN spouse s ON s.cust_no = c.cust_no
+"""
+
+_UPSERT = """
+    ON CONFLICT (cust_no) DO UPDATE
+    SET document = EXCLUDED.document, search_vector = EXCLUDED.search_vector;
+"""
+
+
+def ensure_schema(cursor):
+    cursor.execute(SCHEMA_SQL)
+
+
+def refresh_document(cursor, cust_no):
+    """Rebuilds one customer's search document. Call inside the write transaction, after all inserts/updates."""
+    cursor.execute(
+        "INSERT INTO customer_search (cust_no, document, search_vector) "
+        + _DOCUMENT_SELECT + " WHERE c.cust_no = %s " + _UPSERT,
+        (str(cust_no),),
+    )
+
+
+def refresh_documents(cursor, cust_nos):
+    """refresh_document() for several customers in one statement (batch creation)."""
+    if cust_nos:
+        cursor.execute(
+            "INSERT INTO customer_search (cust_no, document, search_vector) "
+            + _DOCUMENT_SELECT + " WHERE c.cust_no = ANY(%s::uuid[]) " + _UPSERT,
+            ([str(cust_no) for cust_no in cust_nos],),
+        )
+
+
+def rebuild(conn, batch_size=5000):
+    """(Re)builds documents for all customers in keyset-paginated, separately committed batches."""
+    last_cust_no = '00000000-0000-0000-0000-000000000000'
+    total = 0
+    while True:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO customer_search (cust_no, document, search_vector) "
+                + _DOCUMENT_SELECT
+                + " WHERE c.cust_no IN (SELECT cust_no FROM customer WHERE cust_no > %s ORDER BY cust_no LIMIT %s) "
+                + _UPSERT.replace(';', ' RETURNING cust_no;'),
+                (last_cust_no, batch_size),
+            )
+            keys = [row[0] for row in cursor.fetchall()]
+        conn.commit()
+        if not keys:
+            return total
+        total += len(keys)
+        last_cust_no = max(keys)
+
+
+def build_tsquery(text):
+    """Turns free text into a prefix-matching tsquery string ("juan dela" -> "juan:* & dela:*"), or None."""
+    tokens = re.findall(r'\w+', text.lower())
+    return ' & '.join(f"{token}:*" for token in tokens) if tokens else None
+
+
+def search(cursor, text, limit=20):
+    """
+    Ranked customer search over name, email, phone, employer, spouse, mother's maiden name and address.
+    Whole-word prefixes match through the tsvector index; arbitrary fragments ("gmail", "0917")
+    through the trigram index. Returns (cust_no, custname, email_address, contact_no, registration_status, score) rows.
+    """
+    tsquery = build_tsquery(text)
+    if not tsquery:
+        return []
+    cursor.execute("""
+        SELECT c.cust_no, c.custname, c.email_address, c.contact_no, c.registration_status,
+               ts_rank(s.search_vector, to_tsquery('simple', %(tsquery)s)) + word_similarity(%(text)s, s.document) AS score
+        FROM customer_search s
+        JOIN customer c ON c.cust_no = s.cust_no
+        WHERE s.search_vector @@ to_tsquery('simple', %(tsquery)s)
+           OR s.document LIKE %(fragment)s
+        ORDER BY score DESC, c.custname
+        LIMIT %(limit)s;
+    """, {
+        'tsquery': tsquery,
+        'text': text.lower(),
+        'fragment': '%' + text.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%',
+        'limit': limit,
+    })
+    return cursor.fetchall()
+
+
+if __name__ == '__main__':
+    # Full rebuild: python search_index.py [batch_size]
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    conn = psycopg2.connect(get_db_url())
+    try:
+        print(f"Rebuilt search documents for {rebuild(conn, batch_size=size)} customer(s).")
+    finally:
+        conn.close()
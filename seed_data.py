@@ -0,0 +1,388 @@
+"""
+Synthetic customer data for benchmarks: complete, referentially consistent customer graphs.
+
+    python seed_data.py --customers 10000000 [--workers 8] [--seed 42] [--chunk-size 50000]
+                        [--married-share 0.45] [--employed-share 0.6] [--banks-per-customer 1.2]
+                        [--pep-share 0.02] [--affiliation-share 0.1] [--credentials-share 0.5]
+                        [--status-mix Active=0.7,Pending=0.25,Inactive=0.05]
+                        [--days 1095] [--end-date 2026-01-31] [--officials 5000] [--skip-derived]
+
+Every customer gets an occupation, a financial record and a customer row; depending on the shares,
+also an employer (employer_details + employment_details), a spouse (married customers), bank
+accounts (Poisson-distributed count over bank_details), company affiliations, credentials and
+relations to public officials. bank_details and public_official_details are reference data
+written once by the parent process.
+
+The customers are cut into chunks of --chunk-size. Each chunk is generated by a pool worker from
+its own Random(seed, chunk index), so the same --seed, --end-date and sizes give the same data
+whatever --workers is. Keys are UUIDv7 built from the registration time and the seeded generator,
+so they stay time-ordered like the ones the app creates. Workers stream each chunk into Postgres
+with COPY, one table after the other in foreign-key order, and commit once per chunk.
+
+The row trigger behind dashboard_stat would make parallel loaders contend on the same summary
+rows, so it is disabled during the load and the statistics are recomputed afterwards
+(dashboard_stats.reconcile). customer_search is rebuilt at the end as well. Pass --skip-derived to
+leave both for later. The other derived tables (merge candidates, PEP matches) are left to their
+own batch jobs.
+"""
+import argparse
+import datetime
+import io
+import math
+import os
+import random
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import psycopg2
+
+import dashboard_stats
+import income
+import search_index
+from db_config import get_db_url
+
+FIRST_NAMES = [
+    'Juan', 'Maria', 'Jose', 'Ana', 'Pedro', 'Rosa', 'Mark', 'Grace', 'Paolo', 'Liza', 'Ramon', 'Cristina',
+    'Antonio', 'Josefina', 'Miguel', 'Carmela', 'Rafael', 'Teresa', 'Gabriel', 'Angelica', 'Daniel', 'Patricia',
+    'Carlo', 'Kristine', 'Joshua', 'Michelle', 'Renato', 'Lourdes', 'Emmanuel', 'Rowena', 'Noel', 'Janet',
+]
+MIDDLE_INITIALS = 'ABCDEFGHIJLMNOPRSTV'
+LAST_NAMES = [
+    'Dela Cruz', 'Santos', 'Reyes', 'Garcia', 'Mendoza', 'Bautista', 'Villanueva', 'Ramos', 'Aquino', 'Castillo',
+    'Rivera', 'Flores', 'Gonzales', 'Torres', 'Navarro', 'Domingo', 'Mercado', 'Fernandez', 'Soriano', 'Manalo',
+    'Pascual', 'Salazar', 'Aguilar', 'Valdez', 'Ocampo', 'Lim', 'Tan', 'Sy', 'Cruz', 'Del Rosario',
+]
+CITIES = [
+    'Quezon City', 'Manila', 'Makati', 'Pasig', 'Taguig', 'Cebu City', 'Davao City', 'Iloilo City',
+    'Baguio', 'Cagayan de Oro', 'Bacolod', 'Zamboanga City', 'Batangas City', 'Lucena', 'Tacloban',
+]
+STREETS = ['Rizal St.', 'Mabini St.', 'Bonifacio Ave.', 'Luna St.', 'Quezon Ave.', 'Del Pilar St.', 'Burgos St.']
+OCCUPATIONS = ['Employed', 'Self-employed', 'OFW/Overseas Filipino', 'Retired', 'Farmer/Fisher', 'Student/Minor',
+               'Unemployed', 'Housewife', 'Lawyers/Notary/Independent Legal Professional/Accountant',
+               'Government Official']
+EMPLOYED_OCCUPATIONS = ['Employed', 'OFW/Overseas Filipino', 'Government Official',
+                        'Lawyers/Notary/Independent Legal Professional/Accountant']
+OTHER_OCCUPATIONS = [item for item in OCCUPATIONS if item not in EMPLOYED_OCCUPATIONS]
+BUSINESS_NATURES = ['A0103', 'C1033', 'F4143', 'G4547', 'H4953', 'I5556', 'J5863', 'K6466', 'M6975', 'N7782',
+                    'O6400', 'P8500', 'Q8688', 'S9496', 'V0000', 'V0001', 'V0002']
+SOURCES_OF_WEALTH = ['Salary/Honoraria', 'Business', 'Pension', 'Regular Remittance', 'Interest/Commission',
+                     'Donations/Inheritance', 'Allowance', 'Professional Fees - Others', 'Sale of Assets']
+MONTHLY_BRACKETS = list(income.MONTHLY_INCOME_BRACKETS)
+ANNUAL_BRACKETS = list(income.ANNUAL_INCOME_BRACKETS)
+INCOME_WEIGHTS = [40, 30, 18, 10, 2]
+EMPLOYERS = ['Landbank', 'Jollibee Foods Corp.', 'Ayala Land', 'SM Prime Holdings', 'Globe Telecom', 'Meralco',
+             'DepEd', 'Petron', 'San Miguel Corp.', 'PLDT', 'BDO Unibank', 'Accenture PH', 'DOH', 'Robinsons Land']
+JOB_TITLES = ['Clerk', 'Engineer', 'Teacher', 'Nurse', 'Manager', 'Analyst', 'Technician', 'Supervisor', 'Driver',
+              'Accountant', 'Sales Associate', 'Developer']
+DEPOSITOR_ROLES = ['Director', 'Officer', 'Stockholder', 'Partner', 'Treasurer']
+ACCOUNT_TYPES = ['Savings', 'Checking', 'Time Deposit']
+RELATIONS = ['Father', 'Mother', 'Son', 'Daughter', 'Brother', 'Sister', 'Uncle', 'Aunt', 'Cousin', 'Spouse']
+POSITIONS = ['Mayor', 'Vice Mayor', 'Councilor', 'Governor', 'Board Member', 'Barangay Captain', 'Congressman',
+             'Senator', 'Secretary', 'Undersecretary', 'Director', 'Judge']
+BANKS = [
+    ('LBP', 'Land Bank of the Philippines'), ('DBP', 'Development Bank of the Philippines'), ('BDO', 'BDO Unibank'),
+    ('BPI', 'Bank of the Philippine Islands'), ('MBTC', 'Metrobank'), ('PNB', 'Philippine National Bank'),
+    ('SECB', 'Security Bank'), ('UBP', 'UnionBank'), ('RCBC', 'RCBC'), ('CBC', 'China Bank'),
+    ('EWB', 'EastWest Bank'), ('PSB', 'PSBank'), ('AUB', 'Asia United Bank'), ('PBCOM', 'PBCom'),
+]
+
+# (table, columns) in foreign-key load order; the generator fills one COPY buffer per table.
+TABLES = [
+    ('occupation', ('occ_id', 'occ_type', 'bus_nature')),
+    ('financial_record', ('fin_code', 'source_wealth', 'mon_income', 'ann_income', 'source_wealth_items',
+                          'mon_income_min', 'mon_income_max', 'ann_income_min', 'ann_income_max')),
+    ('customer', ('cust_no', 'custname', 'datebirth', 'nationality', 'citizenship', 'custsex', 'placebirth',
+                  'civilstatus', 'num_children', 'mmaiden_name', 'cust_address', 'email_address', 'contact_no',
+                  'occ_id', 'fin_code', 'registration_status', 'registered_at')),
+    ('employer_details', ('emp_id', 'occ_id', 'tin_id', 'empname', 'emp_address', 'phonefax_no', 'job_title',
+                          'emp_date')),
+    ('employment_details', ('cust_no', 'emp_id')),
+    ('credentials', ('cust_no', 'username', 'password')),
+    ('spouse', ('cust_no', 'sp_name', 'sp_datebirth', 'sp_profession')),
+    ('company_affiliation', ('cust_no', 'depositor_role', 'dep_compname')),
+    ('existing_bank', ('cust_no', 'bank_code', 'acc_type')),
+    ('cust_po_relationship', ('cust_no', 'gov_int_id', 'relation_desc')),
+]
+
+_COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def copy_field(value):
+    """One value in COPY text format."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, str):
+        return value.translate(_COPY_ESCAPES)
+    if isinstance(value, list):
+        return '{' + ','.join('"' + item.replace('\\', '\\\\').replace('"', '\\"') + '"' for item in value) + '}'
+    return str(value)
+
+
+def seeded_uuid7(rng, timestamp_ms):
+    """A UUIDv7 for the given millisecond whose random bits come from rng (uuid7.py layout)."""
+    value = ((timestamp_ms & 0xFFFFFFFFFFFF) << 80) | (0x7 << 76) | (rng.getrandbits(12) << 64) \
+        | (0b10 << 62) | rng.getrandbits(62)
+    return str(uuid.UUID(int=value))
+
+
+def official_ids(seed, count):
+    """The public officials' keys, derived from the seed so every worker can pick from them without a query."""
+    rng = random.Random(f"{seed}:officials")
+    base_ms = 1_600_000_000_000
+    return [seeded_uuid7(rng, base_ms + index) for index in range(count)]
+
+
+def _poisson(rng, mean):
+    # Knuth's method; means here are small (about 1-3)
+    limit, k, p = math.exp(-mean), 0, 1.0
+    while True:
+        p *= rng.random()
+        if p <= limit:
+            return k
+        k += 1
+
+
+def _weighted(rng, mix):
+    return rng.choices(mix[0], weights=mix[1])[0]
+
+
+def generate_chunk(options, chunk_index):
+    """
+    Builds the COPY buffers for customers [chunk_index * chunk_size, ...) and returns
+    {table: (text_buffer, row_count)}. Deterministic for (options['seed'], chunk_index).
+    """
+    seed = options['seed']
+    rng = random.Random(f"{seed}:{chunk_index}")
+    start = chunk_index * options['chunk_size']
+    stop = min(start + options['chunk_size'], options['customers'])
+    end_ms = options['end_ms']
+    span_ms = options['days'] * 86_400_000
+    officials = options['officials']
+    bank_codes = [code for code, _ in BANKS]
+    statuses = options['status_mix']
+
+    buffers = {table: [] for table, _ in TABLES}
+
+    def row(table, *values):
+        buffers[table].append('\t'.join(copy_field(value) for value in values))
+
+    for n in range(start, stop):
+        # Registration times rise with n, so keys stay roughly in insertion order like the app's.
+        registered_ms = end_ms - span_ms + (n * span_ms) // options['customers'] + rng.randrange(1000)
+        registered_at = datetime.datetime.fromtimestamp(registered_ms / 1000, datetime.timezone.utc)
+        cust_no = seeded_uuid7(rng, registered_ms)
+        occ_id = seeded_uuid7(rng, registered_ms)
+        fin_code = seeded_uuid7(rng, registered_ms)
+
+        sex = rng.choice(('Male', 'Female'))
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        custname = f"{first} {rng.choice(MIDDLE_INITIALS)}. {last}"
+        age_days = rng.randrange(18 * 365, 80 * 365)
+        datebirth = (registered_at - datetime.timedelta(days=age_days)).date()
+        married = rng.random() < options['married_share']
+        if married:
+            civilstatus = 'Married'
+        else:
+            civilstatus = rng.choices(('Single', 'Widowed', 'Separated'), weights=(85, 8, 7))[0]
+        employed = rng.random() < options['employed_share']
+        occupation = rng.choice(EMPLOYED_OCCUPATIONS if employed else OTHER_OCCUPATIONS)
+        city = rng.choice(CITIES)
+        address = f"{rng.randrange(1, 2000)} {rng.choice(STREETS)}, {city}"
+        handle = f"{first}.{last}".lower().replace(' ', '')
+        email = f"{handle}.{seed}.{n}@example.com"
+        contact_no = f"09{rng.randrange(10**9):09d}"
+
+        row('occupation', occ_id, occupation, rng.choice(BUSINESS_NATURES))
+        bracket = rng.choices(range(len(INCOME_WEIGHTS)), weights=INCOME_WEIGHTS)[0]
+        sources = rng.sample(SOURCES_OF_WEALTH, rng.choice((1, 1, 1, 2, 3)))
+        source_wealth = ', '.join(sources)
+        mon_income, ann_income = MONTHLY_BRACKETS[bracket], ANNUAL_BRACKETS[bracket]
+        row('financial_record', fin_code, source_wealth, mon_income, ann_income,
+            *income.financial_record_values(source_wealth, mon_income, ann_income))
+        row('customer', cust_no, custname, datebirth, 'Filipino', 'Filipino', sex, rng.choice(CITIES), civilstatus,
+            _poisson(rng, 1.5) if married else 0, f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            address, email, contact_no, occ_id, fin_code, _weighted(rng, statuses), registered_at.isoformat())
+
+        if employed:
+            emp_id = seeded_uuid7(rng, registered_ms)
+            employer = rng.choice(EMPLOYERS)
+            emp_date = (registered_at - datetime.timedelta(days=rng.randrange(30, 20 * 365))).date()
+            row('employer_details', emp_id, occ_id, f"{rng.randrange(10**12):012d}", employer,
+                f"{rng.choice(STREETS)}, {rng.choice(CITIES)}", f"02{rng.randrange(10**7):07d}",
+                rng.choice(JOB_TITLES), max(emp_date, datebirth + datetime.timedelta(days=18 * 365)))
+            row('employment_details', cust_no, emp_id)
+        if rng.random() < options['credentials_share']:
+            row('credentials', cust_no, f"{handle}{seed}_{n}", f"{rng.getrandbits(64):016x}")
+        if married:
+            sp_datebirth = datebirth + datetime.timedelta(days=rng.randrange(-5 * 365, 5 * 365))
+            row('spouse', cust_no, f"{rng.choice(FIRST_NAMES)} {last}", sp_datebirth, rng.choice(JOB_TITLES + ['None']))
+        if rng.random() < options['affiliation_share']:
+            for role in rng.sample(DEPOSITOR_ROLES, rng.choice((1, 1, 2))):
+                row('company_affiliation', cust_no, role, f"{rng.choice(LAST_NAMES)} {rng.choice(('Trading', 'Holdings', 'Corp.', 'Enterprises'))}")
+        banks = min(_poisson(rng, options['banks_per_customer']), len(bank_codes))
+        for code in rng.sample(bank_codes, banks):
+            row('existing_bank', cust_no, code, rng.choice(ACCOUNT_TYPES))
+        if officials and rng.random() < options['pep_share']:
+            for gov_int_id in rng.sample(officials, rng.choice((1, 1, 1, 2))):
+                row('cust_po_relationship', cust_no, gov_int_id, rng.choice(RELATIONS))
+
+    return {table: ('\n'.join(lines) + '\n' if lines else '', len(lines)) for table, lines in buffers.items()}
+
+
+_options = None
+
+
+def _init_worker(options):
+    global _options
+    _options = options
+
+
+def _load_chunk(chunk_index):
+    """Generates one chunk and COPYs it in a single transaction. Returns {table: rows}."""
+    buffers = generate_chunk(_options, chunk_index)
+    conn = psycopg2.connect(_options['db_url'])
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SET synchronous_commit = off;")  # a lost chunk on crash is simply re-seeded
+            for table, columns in TABLES:
+                text, rows = buffers[table]
+                if rows:
+                    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN;", io.StringIO(text))
+        conn.commit()
+    except psycopg2.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return {table: rows for table, (_, rows) in buffers.items()}
+
+
+def seed_reference_data(conn, seed, officials):
+    """Writes bank_details and the seeded public officials (idempotent)."""
+    rng = random.Random(f"{seed}:official-names")
+    with conn.cursor() as cursor:
+        cursor.executemany(
+            "INSERT INTO bank_details (bank_code, bank_name, branch) VALUES (%s, %s, %s) ON CONFLICT DO NOTHING;",
+            [(code, name, rng.choice(CITIES)) for code, name in BANKS],
+        )
+        rows = [
+            (gov_int_id, f"{rng.choice(FIRST_NAMES)} {rng.choice(MIDDLE_INITIALS)}. {rng.choice(LAST_NAMES)}",
+             rng.choice(POSITIONS), f"{rng.choice(CITIES)} Government")
+            for gov_int_id in official_ids(seed, officials)
+        ]
+        buffer = io.StringIO(''.join('\t'.join(copy_field(value) for value in row) + '\n' for row in rows))
+        cursor.execute("CREATE TEMP TABLE seed_official (LIKE public_official_details) ON COMMIT DROP;")
+        cursor.copy_expert("COPY seed_official (gov_int_id, gov_int_name, official_position, branch_orgname) FROM STDIN;",
+                           buffer)
+        cursor.execute("INSERT INTO public_official_details SELECT * FROM seed_official ON CONFLICT DO NOTHING;")
+    conn.commit()
+
+
+def _set_stat_trigger(conn, enabled):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_trigger WHERE tgname = 'dashboard_stat_customer';")
+        if cursor.fetchone():
+            cursor.execute(f"ALTER TABLE customer {'ENABLE' if enabled else 'DISABLE'} TRIGGER dashboard_stat_customer;")
+    conn.commit()
+
+
+def parse_mix(text):
+    """'Active=0.7,Pending=0.3' -> (['Active', 'Pending'], [0.7, 0.3])"""
+    names, weights = [], []
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        names.append(name.strip())
+        weights.append(float(weight))
+    return names, weights
+
+
+def seed(conn, options, workers):
+    """Loads options['customers'] customers with `workers` processes. Returns ({table: rows}, seconds)."""
+    started = time.perf_counter()
+    seed_reference_data(conn, options['seed'], len(options['officials']))
+    chunks = math.ceil(options['customers'] / options['chunk_size'])
+    totals = {table: 0 for table, _ in TABLES}
+    _set_stat_trigger(conn, enabled=False)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(options,)) as pool:
+            for done, counts in enumerate(pool.map(_load_chunk, range(chunks)), start=1):
+                for table, rows in counts.items():
+                    totals[table] += rows
+                elapsed = time.perf_counter() - started
+                print(f"  chunk {done}/{chunks}: {totals['customer']:,} customers, "
+                      f"{totals['customer'] / elapsed:,.0f} customers/sec")
+    finally:
+        _set_stat_trigger(conn, enabled=True)
+    return totals, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load synthetic, referentially consistent customer data.")
+    parser.add_argument('--customers', type=int, required=True)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--chunk-size', type=int, default=50000)
+    parser.add_argument('--married-share', type=float, default=0.45)
+    parser.add_argument('--employed-share', type=float, default=0.6)
+    parser.add_argument('--banks-per-customer', type=float, default=1.2, help="Mean of a Poisson distribution.")
+    parser.add_argument('--pep-share', type=float, default=0.02)
+    parser.add_argument('--affiliation-share', type=float, default=0.1)
+    parser.add_argument('--credentials-share', type=float, default=0.5)
+    parser.add_argument('--status-mix', default='Active=0.7,Pending=0.25,Inactive=0.05')
+    parser.add_argument('--days', type=int, default=3 * 365, help="Registrations are spread over this many days.")
+    parser.add_argument('--end-date', default=datetime.date.today().isoformat(),
+                        help="Last registration day (YYYY-MM-DD); fix it to reproduce a data set exactly.")
+    parser.add_argument('--officials', type=int, default=5000)
+    parser.add_argument('--skip-derived', action='store_true',
+                        help="Do not recompute dashboard_stat or rebuild customer_search afterwards.")
+    args = parser.parse_args()
+
+    end = datetime.datetime.combine(datetime.date.fromisoformat(args.end_date), datetime.time(23, 59),
+                                    tzinfo=datetime.timezone.utc)
+    options = {
+        'db_url': get_db_url(),
+        'customers': args.customers,
+        'chunk_size': args.chunk_size,
+        'seed': args.seed,
+        'married_share': args.married_share,
+        'employed_share': args.employed_share,
+        'banks_per_customer': args.banks_per_customer,
+        'pep_share': args.pep_share,
+        'affiliation_share': args.affiliation_share,
+        'credentials_share': args.credentials_share,
+        'status_mix': parse_mix(args.status_mix),
+        'days': args.days,
+        'end_ms': int(end.timestamp() * 1000),
+        'officials': official_ids(args.seed, args.officials),
+    }
+
+    conn = psycopg2.connect(options['db_url'])
+    try:
+        totals, seconds = seed(conn, options, args.workers)
+        print(f"Loaded {totals['customer']:,} customers in {seconds:.1f}s "
+              f"({totals['customer'] / seconds:,.0f} customers/sec, {sum(totals.values()) / seconds:,.0f} rows/sec):")
+        for table, rows in totals.items():
+            print(f"  - {table}: {rows:,}")
+        if not args.skip_derived:
+            started = time.perf_counter()
+            mismatches = dashboard_stats.reconcile(conn, repair=True)
+            print(f"Recomputed {len(mismatches)} dashboard statistic(s) in {time.perf_counter() - started:.1f}s.")
+            started = time.perf_counter()
+            try:
+                documents = search_index.rebuild(conn)
+                print(f"Rebuilt {documents:,} search document(s) in {time.perf_counter() - started:.1f}s.")
+            except psycopg2.Error as err:
+                conn.rollback()
+                print(f"Skipped the search index rebuild: {err}")
+    except psycopg2.Error as err:
+        conn.rollback()
+        print(f"Seeding failed: {err}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,667 @@
+"""
+Optional hash sharding of the customer graph across several PostgreSQL instances.
+
+    python sharding.py init
+    python sharding.py status
+    python sharding.py sync-reference
+    python sharding.py move --slot 17 --to s2 [--batch-size 500]
+    python sharding.py rebalance --to s2 --slots 256 [--batch-size 500]
+
+Each customer belongs to one of SLOTS hash slots (CRC-32 of the cust_no bytes), and each slot is
+assigned to a shard in the shard_slot table. Everything keyed by cust_no lives on that customer's
+shard: the customer row and its occupation, financial_record, employer, spouse, affiliation, bank,
+official-relationship, credentials, search, blocking-key and PEP-match rows, and its
+customer_archive row once archived (archive.py). A registration is
+therefore one shard-local transaction, exactly as on a single database. New cust_nos are generated
+in the app (uuid7) so the shard is known before the first insert.
+
+The DATABASE_URL database is the directory. It holds:
+  - shard_slot, the slot map, cached by every worker for map_refresh_seconds;
+  - shard_email_registry / shard_username_registry, which keep emails and usernames unique across
+    shards. A write claims the email here (autocommit) before its shard transaction and gives the
+    claim back if that transaction fails;
+  - the master copy of the reference tables bank_details and public_official_details. Every shard
+    keeps a full copy under the same keys: new officials are written to the directory and then to
+    all shards before the registration that names them, and `sync-reference` pushes admin changes
+    to the reference tables out to the shards.
+The directory may also be one of the shards.
+
+Admin pages that list or search all customers scatter the query to every shard in parallel and
+merge the sorted per-shard results (list_customers, search, fetch_stats below). Job workers,
+PEP batches and duplicate detection run per shard: start them with DATABASE_URL set to each shard
+URL in turn. Duplicate candidates are only found within a shard.
+
+Moving slots is online. A slot being moved is marked 'moving': workers keep reading it from the
+old shard but refuse writes to its customers. After every worker has seen the mark (twice
+map_refresh_seconds), the slot's customer graphs are copied to the target with COPY in batches,
+the map is flipped, and after another wait the old copies are deleted. New customers never get a
+cust_no in a moving slot. Use docker-compose.shards.yml for a local multi-instance setup.
+"""
+import argparse
+import heapq
+import io
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+import psycopg2.extras
+
+import dashboard_stats
+import repository
+import search_index
+from connection_pool import ConnectionPool, PooledConnection
+from db_config import get_db_url, get_shard_urls, shard_config, pool_config
+from uuid7 import uuid7
+
+SLOTS = 1024
+
+DIRECTORY_SCHEMA_SQL = f"""
+    CREATE TABLE IF NOT EXISTS shard_slot (
+        slot INTEGER PRIMARY KEY CHECK (slot >= 0 AND slot < {SLOTS}),
+        shard_name VARCHAR(64) NOT NULL,
+        state VARCHAR(16) NOT NULL DEFAULT 'active' CHECK (state IN ('active', 'moving')),
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    CREATE TABLE IF NOT EXISTS shard_email_registry (
+        email_address VARCHAR(255) PRIMARY KEY,
+        cust_no UUID NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS shard_username_registry (
+        username VARCHAR(255) PRIMARY KEY,
+        cust_no UUID NOT NULL
+    );
+"""
+
+# Tables copied when a slot moves, in foreign-key order, with the rows that belong to a batch of
+# customers. Occupation, financial and employer rows are created per customer by every write path,
+# so they move (and are deleted) with their customer. Tables missing on either side are skipped.
+MOVE_TABLES = [
+    ('occupation', "occ_id IN (SELECT occ_id FROM customer WHERE cust_no = ANY(%(keys)s::uuid[]))"),
+    ('financial_record', "fin_code IN (SELECT fin_code FROM customer WHERE cust_no = ANY(%(keys)s::uuid[]))"),
+    ('customer', "cust_no = ANY(%(keys)s::uuid[])"),
+    ('employer_details', "emp_id IN (SELECT emp_id FROM employment_details WHERE cust_no = ANY(%(keys)s::uuid[]))"),
+    ('employment_details', "cust_no = ANY(%(keys)s::uuid[])"),
+    ('credentials', "cust_no = ANY(%(keys)s::uuid[])"),
+    ('spouse', "cust_no = ANY(%(keys)s::uuid[])"),
+    ('company_affiliation', "cust_no = ANY(%(keys)s::uuid[])"),
+    ('existing_bank', "cust_no = ANY(%(keys)s::uuid[])"),
+    ('cust_po_relationship', "cust_no = ANY(%(keys)s::uuid[])"),
+    ('pep_screening_match', "cust_no = ANY(%(keys)s::uuid[])"),
+    ('customer_blocking_key', "cust_no = ANY(%(keys)s::uuid[])"),
+    ('customer_search', "cust_no = ANY(%(keys)s::uuid[])"),
+    ('customer_archive', "cust_no = ANY(%(keys)s::uuid[])"),
+]
+
+REFERENCE_TABLES = [('bank_details', 'bank_code'), ('public_official_details', 'gov_int_id')]
+
+
+class SlotUnavailable(Exception):
+    """Raised for a write to a customer whose slot is being moved, or while the slot map cannot be refreshed."""
+
+
+def slot_of(cust_no):
+    """The hash slot of a customer number (uuid.UUID or string)."""
+    if not isinstance(cust_no, uuid.UUID):
+        cust_no = uuid.UUID(str(cust_no))
+    return zlib.crc32(cust_no.bytes) % SLOTS
+
+
+def default_assignment(shard_names):
+    """The initial slot map: slots dealt round-robin over the shards in name order."""
+    names = sorted(shard_names)
+    return [names[slot % len(names)] for slot in range(SLOTS)]
+
+
+def ensure_directory_schema(cursor):
+    cursor.execute(DIRECTORY_SCHEMA_SQL)
+
+
+def _duplicate_error(constraint):
+    # Same wording and constraint names as the single-database unique violations, so the
+    # IntegrityError handlers in app.py recognise a cross-shard duplicate unchanged.
+    return psycopg2.IntegrityError(f'duplicate key value violates unique constraint "{constraint}"')
+
+
+class ShardRouter:
+    """
+    Routes customer-scoped work to the shard that owns the customer's slot.
+    Shared by all requests in a worker: the slot map is cached and reloaded from the directory at
+    most every map_refresh_seconds, and each shard gets its own lazily opened connection pool.
+    """
+
+    def __init__(self, shard_urls, directory_url, config=None):
+        self.shard_urls = dict(shard_urls)
+        self.names = sorted(self.shard_urls)
+        self.directory_url = directory_url
+        self.config = config or shard_config
+        self._pools = {}
+        self._executor = None
+        self._slots = None  # [(shard_name, state)] indexed by slot
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    # --- connections ---
+
+    def _pool(self, url):
+        if pool_config['max_connections'] <= 0:
+            return None
+        with self._lock:
+            if url not in self._pools:
+                self._pools[url] = ConnectionPool(url, pool_config['min_connections'], pool_config['max_connections'])
+            return self._pools[url]
+
+    def _connect_url(self, url):
+        pool = self._pool(url)
+        if pool:
+            return pool.connect()
+        return psycopg2.connect(url, connection_factory=PooledConnection, connect_timeout=self.config['connect_timeout'])
+
+    def connect(self, shard_name):
+        """A connection to the named shard (pooled; close() hands it back)."""
+        return self._connect_url(self.shard_urls[shard_name])
+
+    def connect_directory(self):
+        """An autocommit connection to the directory database."""
+        conn = self._connect_url(self.directory_url)
+        conn.autocommit = True
+        return conn
+
+    # --- slot map ---
+
+    def _load_map(self):
+        conn = self.connect_directory()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT slot, shard_name, state FROM shard_slot;")
+                rows = cursor.fetchall()
+        finally:
+            conn.close()
+        slots = [(name, 'active') for name in default_assignment(self.names)]
+        for slot, shard_name, state in rows:
+            slots[slot] = (shard_name, state)
+        return slots
+
+    def _slot_map(self):
+        """Returns (slots, fresh). A map older than twice the refresh interval is not fresh enough for writes."""
+        now = time.monotonic()
+        if self._slots is None or now - self._loaded_at > self.config['map_refresh_seconds']:
+            try:
+                slots = self._load_map()
+                with self._lock:
+                    self._slots, self._loaded_at = slots, now
+            except psycopg2.Error as err:
+                print(f"Error refreshing shard map: {err}")
+                if self._slots is None:
+                    raise SlotUnavailable("The shard map could not be loaded.")
+        fresh = now - self._loaded_at <= 2 * self.config['map_refresh_seconds']
+        return self._slots, fresh
+
+    def shard_for(self, cust_no, for_write=False):
+        """Name of the shard that owns cust_no. Raises SlotUnavailable for writes to a moving slot."""
+        slots, fresh = self._slot_map()
+        shard_name, state = slots[slot_of(cust_no)]
+        if for_write and (state != 'active' or not fresh):
+            raise SlotUnavailable(f"Slot {slot_of(cust_no)} is being moved; writes are paused.")
+        return shard_name
+
+    def connect_for(self, cust_no, for_write=False):
+        return self.connect(self.shard_for(cust_no, for_write))
+
+    def new_cust_no(self):
+        """A fresh uuid7 customer number whose slot currently accepts writes."""
+        slots, fresh = self._slot_map()
+        if not fresh:
+            raise SlotUnavailable("The shard map is stale; writes are paused.")
+        for _ in range(100):
+            cust_no = uuid7()
+            if slots[slot_of(cust_no)][1] == 'active':
+                return cust_no
+        raise SlotUnavailable("No writable slot found for a new customer.")
+
+    # --- scatter-gather ---
+
+    def scatter(self, fn):
+        """
+        Runs fn(conn) on every shard in parallel and returns the results in shard-name order.
+        Each call gets its own pooled connection; an error on any shard is raised to the caller.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=len(self.names), thread_name_prefix='shard')
+
+        def run(shard_name):
+            conn = self.connect(shard_name)
+            try:
+                return fn(conn)
+            finally:
+                conn.close()
+
+        return list(self._executor.map(run, self.names))
+
+    # --- global unique registries ---
+
+    def claim_email(self, email_address, cust_no):
+        """
+        Reserves email_address for cust_no in the directory. Claiming an email the customer already
+        holds is a no-op; an email held by another customer raises the IntegrityError a duplicate
+        insert would. Returns True when a new claim was made (and must be released on failure).
+        """
+        if not email_address:
+            return False
+        conn = self.connect_directory()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT cust_no FROM shard_email_registry WHERE email_address = %s;", (email_address,))
+                row = cursor.fetchone()
+                if row:
+                    if str(row[0]) != str(cust_no):
+                        raise _duplicate_error('customer_email_address_key')
+                    return False
+                cursor.execute("""
+                    INSERT INTO shard_email_registry (email_address, cust_no) VALUES (%s, %s)
+                    ON CONFLICT (email_address) DO NOTHING;
+                """, (email_address, str(cust_no)))
+                if cursor.rowcount == 0:
+                    raise _duplicate_error('customer_email_address_key')
+                return True
+        finally:
+            conn.close()
+
+    def release_email(self, email_address, cust_no):
+        """Gives back an email claim of cust_no (after a failed write, an email change or a delete)."""
+        if not email_address:
+            return
+        conn = self.connect_directory()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("DELETE FROM shard_email_registry WHERE email_address = %s AND cust_no = %s;",
+                               (email_address, str(cust_no)))
+        finally:
+            conn.close()
+
+    def username_owner(self, username):
+        """cust_no of the customer holding username, or None."""
+        conn = self.connect_directory()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT cust_no FROM shard_username_registry WHERE username = %s;", (username,))
+                row = cursor.fetchone()
+                return row[0] if row else None
+        finally:
+            conn.close()
+
+    # --- reference data ---
+
+    def replicate_official(self, gov_int_name, official_position, branch_orgname):
+        """
+        Makes sure a public official exists in the directory and on every shard under one
+        gov_int_id, so any shard's find-by-name lookup links customers to the same official.
+        """
+        conn = self.connect_directory()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT gov_int_id, gov_int_name, official_position, branch_orgname FROM public_official_details
+                    WHERE gov_int_name = %s AND official_position = %s;
+                """, (gov_int_name, official_position))
+                row = cursor.fetchone()
+                if not row:
+                    row = (str(uuid7()), gov_int_name, official_position, branch_orgname)
+                    cursor.execute("""
+                        INSERT INTO public_official_details (gov_int_id, gov_int_name, official_position, branch_orgname)
+                        VALUES (%s, %s, %s, %s);
+                    """, row)
+        finally:
+            conn.close()
+
+        def upsert(shard_conn):
+            with shard_conn.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO public_official_details (gov_int_id, gov_int_name, official_position, branch_orgname)
+                    VALUES (%s, %s, %s, %s) ON CONFLICT (gov_int_id) DO NOTHING;
+                """, (str(row[0]),) + tuple(row[1:]))
+            shard_conn.commit()
+
+        self.scatter(upsert)
+        return row[0]
+
+
+# --- scatter-gather reads for the admin pages ---
+
+def list_customers(router):
+    """The dashboard list from every shard, merged into one list ordered by (custname, cust_no) in "C" collation."""
+    per_shard = router.scatter(lambda conn: repository.list_customers(conn.cursor(), bytewise=True))
+    return list(heapq.merge(*per_shard, key=repository.bytewise_sort_key))
+
+
+def search(router, query, limit=20):
+    """search_index.search() on every shard; the best `limit` rows overall, by score, then name."""
+    def shard_search(conn):
+        with conn.cursor() as cursor:
+            return search_index.search(cursor, query, limit=limit)
+
+    rows = [row for shard_rows in router.scatter(shard_search) for row in shard_rows]
+    return heapq.nsmallest(limit, rows, key=lambda row: (-row[5], row[1] or ''))
+
+
+def fetch_stats(router, days=30):
+    """dashboard_stats.fetch_stats() summed over the shards (every statistic is a count)."""
+    def shard_stats(conn):
+        with conn.cursor() as cursor:
+            return dashboard_stats.fetch_stats(cursor, days=days)
+
+    totals = defaultdict(Counter)
+    for stats in router.scatter(shard_stats):
+        for dimension, buckets in stats.items():
+            totals[dimension].update(buckets)
+    return {dimension: dict(sorted(buckets.items())) for dimension, buckets in sorted(totals.items())}
+
+
+# --- administration (CLI) ---
+
+def _existing_tables(cursor, tables):
+    cursor.execute("SELECT relname FROM pg_class WHERE relkind IN ('r', 'p') AND relname = ANY(%s) "
+                   "AND relnamespace = 'public'::regnamespace;", (list(tables),))
+    return {row[0] for row in cursor.fetchall()}
+
+
+def _insertable_columns(cursor, table):
+    cursor.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = %s AND is_generated = 'NEVER'
+        ORDER BY ordinal_position;
+    """, (table,))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _copy_rows(source_cursor, target_cursor, table, where, params):
+    """Streams the rows of table matching where from source to target through COPY; returns the row count."""
+    columns = ', '.join(_insertable_columns(target_cursor, table))
+    query = source_cursor.mogrify(f"SELECT {columns} FROM {table} WHERE {where}", params).decode()
+    buffer = io.StringIO()
+    source_cursor.copy_expert(f"COPY ({query}) TO STDOUT", buffer)
+    buffer.seek(0)
+    target_cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN", buffer)
+    return target_cursor.rowcount
+
+
+def _delete_customers(cursor, keys):
+    """
+    Deletes the customer graphs of keys (cascades to the cust_no tables) and their archived copies.
+    Returns the live customers deleted.
+    """
+    if _existing_tables(cursor, ['customer_archive']):
+        cursor.execute("DELETE FROM customer_archive WHERE cust_no = ANY(%s::uuid[]);", (keys,))
+    cursor.execute("SELECT emp_id FROM employment_details WHERE cust_no = ANY(%s::uuid[]);", (keys,))
+    emp_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute("DELETE FROM customer WHERE cust_no = ANY(%s::uuid[]) RETURNING occ_id, fin_code;", (keys,))
+    owned = cursor.fetchall()
+    occ_ids = [occ_id for occ_id, _ in owned if occ_id]
+    fin_codes = [fin_code for _, fin_code in owned if fin_code]
+    cursor.execute("DELETE FROM employer_details WHERE emp_id = ANY(%s::uuid[]);", (emp_ids,))
+    cursor.execute("DELETE FROM occupation WHERE occ_id = ANY(%s::uuid[]);", (occ_ids,))
+    cursor.execute("DELETE FROM financial_record WHERE fin_code = ANY(%s::uuid[]);", (fin_codes,))
+    return len(owned)
+
+
+def _slot_keys(source_conn, slots):
+    """
+    All cust_nos on source_conn's shard that fall in `slots`, live or archived, read through a
+    server-side cursor.
+    """
+    keys = []
+    with source_conn.cursor() as cursor:
+        archived = bool(_existing_tables(cursor, ['customer_archive']))
+    with source_conn.cursor(name='shard_move_keys') as stream:
+        stream.itersize = 50000
+        stream.execute("SELECT cust_no FROM customer"
+                       + (" UNION ALL SELECT cust_no FROM customer_archive;" if archived else ";"))
+        for (cust_no,) in stream:
+            if slot_of(cust_no) in slots:
+                keys.append(str(cust_no))
+    source_conn.rollback()
+    return keys
+
+
+def _copy_batch(source_conn, target_conn, tables, keys):
+    """Copies one batch of customer graphs in one target transaction, replacing leftovers of an earlier attempt."""
+    copied = Counter()
+    with source_conn.cursor() as source_cursor, target_conn.cursor() as target_cursor:
+        _delete_customers(target_cursor, keys)
+        for table, where in MOVE_TABLES:
+            if table not in tables:
+                continue
+            copied[table] += _copy_rows(source_cursor, target_cursor, table, where, {'keys': keys})
+    source_conn.rollback()
+    target_conn.commit()
+    return copied
+
+
+def _wait_for_workers(config, reason):
+    seconds = 2 * config['map_refresh_seconds']
+    print(f"Waiting {seconds:.0f}s for every worker to see {reason}...")
+    time.sleep(seconds)
+
+
+def move_slots(router, slots, target, batch_size=500):
+    """
+    Moves `slots` to shard `target` online (see the module docstring). Returns a Counter of rows
+    copied per table. On failure the slots go back to 'active' on their old shard.
+    """
+    if target not in router.shard_urls:
+        raise ValueError(f"Unknown shard {target!r}; configured: {', '.join(router.names)}")
+    directory = router.connect_directory()
+    moving = {}
+    copied = Counter()
+    try:
+        with directory.cursor() as cursor:
+            cursor.execute("""
+                UPDATE shard_slot SET state = 'moving', updated_at = now()
+                WHERE slot = ANY(%s) AND state = 'active' AND shard_name <> %s
+                RETURNING slot, shard_name;
+            """, (list(slots), target))
+            moving = dict(cursor.fetchall())
+        if not moving:
+            print("Nothing to move: the slots are already on the target or being moved.")
+            return copied
+        by_source = defaultdict(set)
+        for slot, source in moving.items():
+            by_source[source].add(slot)
+        _wait_for_workers(router.config, f"{len(moving)} slot(s) marked as moving")
+
+        started = time.perf_counter()
+        moved_keys = {}
+        target_conn = router.connect(target)
+        try:
+            for source, source_slots in sorted(by_source.items()):
+                source_conn = router.connect(source)
+                try:
+                    with source_conn.cursor() as source_cursor, target_conn.cursor() as target_cursor:
+                        tables = _existing_tables(source_cursor, [t for t, _ in MOVE_TABLES]) & \
+                            _existing_tables(target_cursor, [t for t, _ in MOVE_TABLES])
+                    target_conn.commit()
+                    keys = _slot_keys(source_conn, source_slots)
+                    moved_keys[source] = keys
+                    for start in range(0, len(keys), batch_size):
+                        copied += _copy_batch(source_conn, target_conn, tables, keys[start:start + batch_size])
+                        print(f"  {source} -> {target}: {min(start + batch_size, len(keys))}/{len(keys)} customers copied")
+                finally:
+                    source_conn.close()
+        finally:
+            target_conn.close()
+
+        with directory.cursor() as cursor:
+            cursor.execute("""
+                UPDATE shard_slot SET shard_name = %s, state = 'active', updated_at = now()
+                WHERE slot = ANY(%s);
+            """, (target, list(moving)))
+        elapsed = time.perf_counter() - started
+        print(f"Slot map flipped: {len(moving)} slot(s) now on {target} "
+              f"({copied['customer']} customers, {sum(copied.values())} rows copied in {elapsed:.1f}s).")
+        moving = {}
+
+        _wait_for_workers(router.config, "the new slot owner")
+        for source, keys in moved_keys.items():
+            source_conn = router.connect(source)
+            try:
+                for start in range(0, len(keys), batch_size):
+                    with source_conn.cursor() as cursor:
+                        _delete_customers(cursor, keys[start:start + batch_size])
+                    source_conn.commit()
+            finally:
+                source_conn.close()
+            print(f"Deleted {len(keys)} moved customer(s) from {source}.")
+        return copied
+    finally:
+        if moving:
+            with directory.cursor() as cursor:
+                cursor.execute("UPDATE shard_slot SET state = 'active', updated_at = now() WHERE slot = ANY(%s);",
+                               (list(moving),))
+            print(f"Move aborted: {len(moving)} slot(s) left on their old shard.")
+        directory.close()
+
+
+def plan_rebalance(assignment, target, count):
+    """Picks `count` slots for `target`, taking each from the shard that currently holds the most."""
+    owned = defaultdict(list)
+    for slot, shard_name in enumerate(assignment):
+        if shard_name != target:
+            owned[shard_name].append(slot)
+    picked = []
+    for _ in range(count):
+        if not owned:
+            break
+        donor = max(owned, key=lambda name: (len(owned[name]), name))
+        picked.append(owned[donor].pop())
+        if not owned[donor]:
+            del owned[donor]
+    return picked
+
+
+def prepare_directory(router):
+    """Creates the directory tables and, on first use, writes the default slot map (run at app startup)."""
+    conn = router.connect_directory()
+    try:
+        with conn.cursor() as cursor:
+            ensure_directory_schema(cursor)
+            cursor.execute("SELECT count(*) FROM shard_slot;")
+            if cursor.fetchone()[0] == 0:
+                rows = list(enumerate(default_assignment(router.names)))
+                psycopg2.extras.execute_values(cursor, "INSERT INTO shard_slot (slot, shard_name) VALUES %s;", rows)
+                print(f"Assigned {SLOTS} slots round-robin to {', '.join(router.names)}.")
+    finally:
+        conn.close()
+
+
+def init(router):
+    """prepare_directory(), then backfills the registries from the shards and copies the reference tables out."""
+    prepare_directory(router)
+
+    def registry_rows(shard_conn):
+        with shard_conn.cursor() as cursor:
+            cursor.execute("SELECT email_address, cust_no::text FROM customer WHERE email_address IS NOT NULL;")
+            emails = cursor.fetchall()
+            cursor.execute("SELECT username, cust_no::text FROM credentials;")
+            return emails, cursor.fetchall()
+
+    conn = router.connect_directory()
+    try:
+        with conn.cursor() as cursor:
+            for emails, usernames in router.scatter(registry_rows):
+                psycopg2.extras.execute_values(cursor, """
+                    INSERT INTO shard_email_registry (email_address, cust_no) VALUES %s
+                    ON CONFLICT (email_address) DO NOTHING;""", emails, page_size=5000)
+                psycopg2.extras.execute_values(cursor, """
+                    INSERT INTO shard_username_registry (username, cust_no) VALUES %s
+                    ON CONFLICT (username) DO NOTHING;""", usernames, page_size=5000)
+            cursor.execute("SELECT (SELECT count(*) FROM shard_email_registry), (SELECT count(*) FROM shard_username_registry);")
+            print("Registries hold {} email(s) and {} username(s).".format(*cursor.fetchone()))
+    finally:
+        conn.close()
+    sync_reference(router)
+
+
+def sync_reference(router):
+    """Upserts the directory's bank_details and public_official_details into every shard."""
+    conn = router.connect_directory()
+    try:
+        with conn.cursor() as cursor:
+            reference = {}
+            for table, key in REFERENCE_TABLES:
+                columns = _insertable_columns(cursor, table)
+                cursor.execute(f"SELECT {', '.join(columns)} FROM {table};")
+                reference[table] = (key, columns, cursor.fetchall())
+    finally:
+        conn.close()
+
+    def upsert(shard_conn):
+        with shard_conn.cursor() as cursor:
+            for table, (key, columns, rows) in reference.items():
+                updates = ', '.join(f"{column} = EXCLUDED.{column}" for column in columns if column != key)
+                psycopg2.extras.execute_values(cursor, f"""
+                    INSERT INTO {table} ({', '.join(columns)}) VALUES %s
+                    ON CONFLICT ({key}) DO UPDATE SET {updates};""", rows, page_size=5000)
+        shard_conn.commit()
+
+    router.scatter(upsert)
+    print("Reference tables synced to every shard: " +
+          ', '.join(f"{table} ({len(rows)} rows)" for table, (_, _, rows) in reference.items()))
+
+
+def status(router):
+    slots, _ = router._slot_map()
+    per_shard = Counter(name for name, _ in slots)
+    moving = Counter(name for name, state in slots if state != 'active')
+
+    def count(conn):
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM customer;")
+            return cursor.fetchone()[0]
+
+    counts = router.scatter(count)
+    print(f"{'shard':<10}{'slots':>8}{'moving':>8}{'customers':>12}")
+    for name, customers in zip(router.names, counts):
+        print(f"{name:<10}{per_shard[name]:>8}{moving[name]:>8}{customers:>12,}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Administer the customer shards (see sharding.py).")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('init', help='Create the directory tables, slot map and registries.')
+    sub.add_parser('status', help='Slots and customers per shard.')
+    sub.add_parser('sync-reference', help='Copy bank_details and public_official_details to every shard.')
+    move = sub.add_parser('move', help='Move one slot to another shard.')
+    move.add_argument('--slot', type=int, required=True)
+    move.add_argument('--to', required=True)
+    move.add_argument('--batch-size', type=int, default=500)
+    rebalance = sub.add_parser('rebalance', help='Move slots from the fullest shards to one shard (e.g. a new one).')
+    rebalance.add_argument('--to', required=True)
+    rebalance.add_argument('--slots', type=int, required=True)
+    rebalance.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+
+    shard_urls = get_shard_urls()
+    if not shard_urls:
+        parser.error("DATABASE_SHARD_URLS is not set.")
+    router = ShardRouter(shard_urls, get_db_url())
+    if args.command == 'init':
+        init(router)
+    elif args.command == 'status':
+        status(router)
+    elif args.command == 'sync-reference':
+        sync_reference(router)
+    elif args.command == 'move':
+        move_slots(router, [args.slot], args.to, args.batch_size)
+    elif args.command == 'rebalance':
+        slots, _ = router._slot_map()
+        picked = plan_rebalance([name for name, _ in slots], args.to, args.slots)
+        print(f"Moving {len(picked)} slot(s) to {args.to}.")
+        move_slots(router, picked, args.to, args.batch_size)
+
+
+if __name__ == '__main__':
+    main()
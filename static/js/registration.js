@@ -285,6 +285,26 @@ function handleFormSubmit(event, nextPage) {
     window.location.href = nextPage;
 }
 
+// Asks the backend whether a field value (email/username) is still free.
+// Resolves to true/false, or null if the check could not be made (the final submit still enforces uniqueness).
+function checkAvailability(field, value) {
+    if (!value) return Promise.resolve(null);
+    return fetch(`/checkAvailability?${field}=${encodeURIComponent(value)}`)
+        .then(response => response.ok ? response.json() : null)
+        .then(result => result ? result[`${field}_available`] : null)
+        .catch(() => null);
+}
+
+function attachAvailabilityCheck(input, field, takenMessage) {
+    input.addEventListener('blur', function() {
+        checkAvailability(field, input.value.trim()).then(available => {
+            input.setCustomValidity(available === false ? takenMessage : '');
+            if (available === false) input.reportValidity();
+        });
+    });
+    input.addEventListener('input', () => input.setCustomValidity(''));
+}
+
 function handleBack() {
     const currentPage = window.location.pathname.split('/').pop();
     const backPages = {
@@ -343,6 +363,16 @@ document.addEventListener('DOMContentLoaded', function() {
             if (backBtn) {
                 backBtn.addEventListener('click', handleBack);
             }
+
+            // Warn about taken emails/usernames while the user is still on the step
+            const emailInput = form.querySelector('input[name="email"]');
+            if (emailInput) {
+                attachAvailabilityCheck(emailInput, 'email', 'This email address is already registered.');
+            }
+            const usernameInput = form.querySelector('input[name="username"]');
+            if (usernameInput) {
+                attachAvailabilityCheck(usernameInput, 'username', 'This username is already taken.');
+            }
         }
     }
 });
\ No newline at end of file
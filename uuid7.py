@@ -0,0 +1,57 @@
+import os
+import threading
+import time
+import uuid
+
+# Database-side generator, installed by _ensure_database_schema() and used as the column default
+# for every UUID primary key. Same layout as uuid7() below: 48-bit Unix-millisecond timestamp,
+# version 7, random remainder. Takes an optional timestamp so existing rows can be re-keyed
+# in registration order (see rekey_uuid7.py).
+UUID7_FUNCTION_SQL = """
+    CREATE OR REPLACE FUNCTION uuid_generate_v7(p_ts TIMESTAMPTZ DEFAULT clock_timestamp())
+    RETURNS uuid AS $$
+        SELECT encode(
+            set_bit(
+                set_bit(
+                    overlay(uuid_send(gen_random_uuid())
+                            PLACING substring(int8send(floor(extract(epoch FROM p_ts) * 1000)::bigint) FROM 3)
+                            FROM 1 FOR 6),
+                    52, 1),
+                53, 1),
+            'hex')::uuid;
+    $$ LANGUAGE sql VOLATILE;
+"""
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+
+def uuid7(timestamp_ms=None):
+    """
+    Returns a time-ordered (version 7) UUID.
+    Consecutive calls in one process are strictly increasing: within the same millisecond the
+    12-bit rand_a field is used as a counter, and on overflow the timestamp is advanced.
+    """
+    global _last_ms, _counter
+    if timestamp_ms is None:
+        with _lock:
+            ms = time.time_ns() // 1_000_000
+            if ms > _last_ms:
+                # Start each millisecond at a random point in the lower half so the counter has room.
+                _counter = int.from_bytes(os.urandom(2), 'big') & 0x7FF
+            else:
+                ms = _last_ms
+                _counter += 1
+                if _counter > 0xFFF:
+                    ms += 1
+                    _counter = 0
+            _last_ms = ms
+            rand_a = _counter
+    else:
+        ms = int(timestamp_ms)
+        rand_a = int.from_bytes(os.urandom(2), 'big') & 0xFFF
+
+    rand_b = int.from_bytes(os.urandom(8), 'big') & 0x3FFFFFFFFFFFFFFF
+    value = ((ms & 0xFFFFFFFFFFFF) << 80) | (0x7 << 76) | (rand_a << 64) | (0b10 << 62) | rand_b
+    return uuid.UUID(int=value)
@@ -0,0 +1,365 @@
+"""
+Validation and normalization of customer payloads, before any connection is taken.
+
+Three write paths post the same customer fields: the registration JSON (submit_registration;
+{"registration1": {...}, "registration2": {...}, "registration3": {...}}, built by registration.js)
+and the admin add/edit forms (flat form fields, or the same names as a JSON object). Each path
+used to parse them itself, differently, and bad input (a non-numeric children count, a malformed
+date) only surfaced as a Postgres error halfway through the inserts.
+
+validate_registration(data) and validate_customer_form(fields) read either shape into one
+CustomerPayload of column values: trimmed strings (empty -> None), datetime.date, int, and the
+sources of wealth as a list. Invalid input raises ValidationError with every field error at once,
+keyed by the posted name ('registration1.dob' for the registration JSON, 'dob' for forms).
+
+Rules, besides types and the column lengths of _ensure_database_schema:
+  - a name is required (first and last; the admin forms may post custname instead), and an email;
+  - the registration also requires what registration.js requires (date of birth, nationality,
+    address, occupation, nature of business, income brackets);
+  - dates of birth are not in the future; children is a whole number 0-99;
+  - sex, civil status and registration status are one of the forms' options; at most three
+    sources of wealth (the forms' limit);
+  - monthly and annual income are one of the forms' bracket codes (income.py), or a label or
+    amount income.parse_income_bracket() reads (the admin edit form posts a plain amount) with
+    finite bounds from 0 to below MAX_INCOME_AMOUNT, so the structured income columns are never
+    left empty by a value that cannot be read nor fail on one they cannot hold;
+  - spouse fields only count when Married, employer fields only when Employed; once any is
+    filled, the spouse's name / the employer's name is required;
+  - a bank needs both code and account type; a public-official relationship needs the name.
+
+FIELDS is compiled once, at import, into a flat tuple of steps per input shape, so validating a
+payload is one pass with no schema work per call (benchmarks/bench_validation.py measures it).
+"""
+import datetime
+import re
+from collections import namedtuple
+from decimal import Decimal
+
+import income
+
+SEXES = ('Male', 'Female')
+CIVIL_STATUSES = ('Single', 'Married', 'Widowed', 'Separated')
+REGISTRATION_STATUSES = ('Pending', 'Active', 'Inactive')
+MAX_SOURCES_OF_WEALTH = 3
+MAX_CHILDREN = 99
+MAX_INCOME_AMOUNT = Decimal('1e12')
+CENT = Decimal('0.01')
+
+REGISTRATION_SECTIONS = ('registration1', 'registration2', 'registration3')
+
+_EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+_DATE_RE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+_INT_RE = re.compile(r'^\d+$')
+
+# (value, registration section, posted name, form name when it differs, kind, max length, required in)
+# kind: text, date, int, email, list, a tuple of allowed values or an income bracket dict. required in: 'registration',
+# 'form' or both. Values not stored as such (first/last names) are combined in _combine().
+FIELDS = (
+    ('first_name', 'registration1', 'firstName', None, 'text', 255, ('registration',)),
+    ('last_name', 'registration1', 'lastName', None, 'text', 255, ('registration',)),
+    ('custname', None, 'custname', None, 'text', 255, ()),
+    ('datebirth', 'registration1', 'dob', None, 'date', None, ('registration',)),
+    ('nationality', 'registration1', 'nationality', None, 'text', 255, ('registration',)),
+    ('citizenship', 'registration1', 'citizenship', None, 'text', 255, ()),
+    ('custsex', 'registration1', 'sex', None, SEXES, None, ()),
+    ('placebirth', 'registration1', 'placeOfBirth', None, 'text', 255, ()),
+    ('civilstatus', 'registration1', 'civilStatus', None, CIVIL_STATUSES, None, ()),
+    ('num_children', 'registration1', 'children', None, 'int', None, ()),
+    ('mmaiden_name', 'registration1', 'motherMaidenName', None, 'text', 255, ()),
+    ('cust_address', 'registration1', 'address', None, 'text', None, ('registration',)),
+    ('email_address', 'registration1', 'email', None, 'email', 255, ('registration', 'form')),
+    ('contact_no', 'registration1', 'telephone', None, 'text', 20, ()),
+    ('registration_status', None, 'registrationStatus', None, REGISTRATION_STATUSES, None, ()),
+    ('sp_first_name', 'registration1', 'spouseFirstName', None, 'text', 255, ()),
+    ('sp_last_name', 'registration1', 'spouseLastName', None, 'text', 255, ()),
+    ('sp_datebirth', 'registration1', 'spouseDob', None, 'date', None, ()),
+    ('sp_profession', 'registration1', 'spouseProfession', None, 'text', 255, ()),
+    ('occ_type', 'registration2', 'occupation', None, 'text', 255, ('registration',)),
+    ('bus_nature', 'registration2', 'natureOfBusiness', None, 'text', 255, ('registration',)),
+    ('source_wealth_items', 'registration2', 'sourceOfWealth', None, 'list', 255, ()),
+    ('mon_income', 'registration2', 'monthlyIncome', None, income.MONTHLY_INCOME_BRACKETS, None, ('registration',)),
+    ('ann_income', 'registration2', 'annualIncome', None, income.ANNUAL_INCOME_BRACKETS, None, ('registration',)),
+    ('tin_id', 'registration2', 'tinId', None, 'text', 50, ()),
+    ('empname', 'registration2', 'companyName', None, 'text', 255, ()),
+    ('emp_address', 'registration2', 'employerAddress', None, 'text', None, ()),
+    ('phonefax_no', 'registration2', 'employerPhone', None, 'text', 50, ()),
+    ('emp_date', 'registration2', 'employmentDate', None, 'date', None, ()),
+    ('job_title', 'registration2', 'jobTitle', None, 'text', 255, ()),
+    ('depositor_role', 'registration3', 'depositorRole', None, 'text', 255, ()),
+    ('dep_compname', 'registration3', 'companyName', 'companyNameAffiliation', 'text', 255, ()),
+    ('bank_code', 'registration3', 'bankCode', None, 'text', 10, ()),
+    ('acc_type', 'registration3', 'accountType', None, 'text', 255, ()),
+    ('gov_int_name', 'registration3', 'governmentOfficialName', None, 'text', 255, ()),
+    ('official_position', 'registration3', 'officialPosition', None, 'text', 255, ()),
+    ('branch_orgname', 'registration3', 'branchOrgName', None, 'text', 255, ()),
+    ('relation_desc', 'registration3', 'relationshipNature', None, 'text', 255, ()),
+)
+
+PAYLOAD_COLUMNS = (
+    'custname', 'datebirth', 'nationality', 'citizenship', 'custsex', 'placebirth', 'civilstatus',
+    'num_children', 'mmaiden_name', 'cust_address', 'email_address', 'contact_no', 'registration_status',
+    'occ_type', 'bus_nature',
+    'source_wealth_items', 'source_wealth', 'mon_income', 'ann_income',
+    'tin_id', 'empname', 'emp_address', 'phonefax_no', 'job_title', 'emp_date',
+    'sp_name', 'sp_datebirth', 'sp_profession',
+    'depositor_role', 'dep_compname',
+    'bank_code', 'acc_type',
+    'gov_int_name', 'official_position', 'branch_orgname', 'relation_desc',
+)
+
+_EMPLOYER = ('tin_id', 'empname', 'emp_address', 'phonefax_no', 'emp_date', 'job_title')
+_OFFICIAL = ('gov_int_name', 'official_position', 'branch_orgname', 'relation_desc')
+
+
+class CustomerPayload(namedtuple('CustomerPayload', PAYLOAD_COLUMNS)):
+    """A validated customer payload; field names are the database columns."""
+    __slots__ = ()
+
+
+class ValidationError(Exception):
+    """errors maps each invalid posted field to a message; all of a payload's errors at once."""
+
+    def __init__(self, errors):
+        super().__init__('; '.join(f"{field}: {message}" for field, message in errors.items()))
+        self.errors = errors
+
+
+class _Invalid(Exception):
+    pass
+
+
+# --- converters: raw posted value -> column value, raising _Invalid ---
+
+def _text(max_length):
+    def convert(raw):
+        if raw is None:
+            return None
+        if isinstance(raw, (int, float)) and not isinstance(raw, bool):
+            raw = str(raw)
+        elif not isinstance(raw, str):
+            raise _Invalid('must be text')
+        value = raw.strip()
+        if not value:
+            return None
+        if max_length and len(value) > max_length:
+            raise _Invalid(f"must be at most {max_length} characters")
+        return value
+    return convert
+
+
+def _date(raw):
+    value = _text(None)(raw)
+    if value is None:
+        return None
+    if _DATE_RE.match(value):
+        try:
+            return datetime.date.fromisoformat(value)
+        except ValueError:
+            pass
+    raise _Invalid('must be a date (YYYY-MM-DD)')
+
+
+def _int(raw):
+    if raw is None or raw == '':
+        return 0
+    if isinstance(raw, int) and not isinstance(raw, bool):
+        value = raw
+    elif isinstance(raw, str) and _INT_RE.match(raw.strip()):
+        value = int(raw.strip())
+    else:
+        raise _Invalid('must be a whole number')
+    if not 0 <= value <= MAX_CHILDREN:
+        raise _Invalid(f"must be between 0 and {MAX_CHILDREN}")
+    return value
+
+
+def _email(max_length):
+    text = _text(max_length)
+
+    def convert(raw):
+        value = text(raw)
+        if value is not None and not _EMAIL_RE.match(value):
+            raise _Invalid('must be an email address')
+        return value
+    return convert
+
+
+def _choice(options):
+    text = _text(None)
+
+    def convert(raw):
+        value = text(raw)
+        if value is not None and value not in options:
+            raise _Invalid(f"must be one of: {', '.join(options)}")
+        return value
+    return convert
+
+
+def _income(brackets):
+    text = _text(None)
+
+    def convert(raw):
+        value = text(raw)
+        if value is None:
+            return None
+        bounds = income.parse_income_bracket(value, brackets)
+        if bounds == (None, None):
+            raise _Invalid(f"must be one of: {', '.join(brackets)}")
+        # The bounds go to NUMERIC(14, 2) columns, which reject NaN/infinity and overflow once
+        # rounded to cents they reach 1e12.
+        for amount in bounds:
+            if amount is not None and not (amount.is_finite()
+                                           and 0 <= amount.quantize(CENT) < MAX_INCOME_AMOUNT):
+                raise _Invalid(f"must be an amount from 0 to below {MAX_INCOME_AMOUNT:,.0f}")
+        return value
+    return convert
+
+
+def _list(max_length):
+    text = _text(max_length)
+
+    def convert(raw):
+        if raw is None:
+            return []
+        if isinstance(raw, str):
+            raw = raw.split(',')
+        elif not isinstance(raw, (list, tuple)):
+            raise _Invalid('must be a list')
+        values = [value for value in map(text, raw) if value is not None]
+        if len(values) > MAX_SOURCES_OF_WEALTH:
+            raise _Invalid(f"select at most {MAX_SOURCES_OF_WEALTH}")
+        return values
+    return convert
+
+
+def _converter(kind, max_length):
+    if isinstance(kind, tuple):
+        return _choice(kind)
+    if isinstance(kind, dict):
+        return _income(kind)
+    if kind == 'date':
+        return _date
+    if kind == 'int':
+        return _int
+    return {'text': _text, 'email': _email, 'list': _list}[kind](max_length)
+
+
+def _compile(shape):
+    """The (value, section, posted name, error key, is_list, required, convert) steps for one input shape."""
+    steps = []
+    for value, section, name, form_name, kind, max_length, required_in in FIELDS:
+        if shape == 'registration':
+            if section is None:
+                continue
+            key, error_key = name, f"{section}.{name}"
+        else:
+            section, key = None, form_name or name
+            error_key = key
+        steps.append((value, section, key, error_key, kind == 'list', shape in required_in,
+                      _converter(kind, max_length)))
+    return tuple(steps)
+
+
+_REGISTRATION_STEPS = _compile('registration')
+_FORM_STEPS = _compile('form')
+_ERROR_KEYS = {shape: {step[0]: step[3] for step in steps}
+               for shape, steps in (('registration', _REGISTRATION_STEPS), ('form', _FORM_STEPS))}
+
+
+def _run(steps, lookup):
+    values = {}
+    errors = {}
+    for value, section, key, error_key, is_list, required, convert in steps:
+        try:
+            converted = convert(lookup(section, key, is_list))
+        except _Invalid as err:
+            errors[error_key] = str(err)
+            converted = None
+        if required and converted in (None, []) and error_key not in errors:
+            errors[error_key] = 'is required'
+        values[value] = converted
+    return values, errors
+
+
+def _combine(values, errors, shape):
+    """Cross-field rules; returns the CustomerPayload or raises ValidationError."""
+    keys = _ERROR_KEYS[shape]
+    today = datetime.date.today()
+
+    first, last = values.pop('first_name'), values.pop('last_name')
+    custname = values.pop('custname', None)
+    if first and last:
+        custname = f"{first} {last}"
+    elif not custname:
+        for part, present in (('first_name', first), ('last_name', last)):
+            if not present:
+                errors.setdefault(keys[part], 'is required')
+    values['custname'] = custname
+
+    for column in ('datebirth', 'sp_datebirth'):
+        if values[column] and values[column] > today:
+            errors.setdefault(keys[column], 'cannot be in the future')
+
+    if shape == 'registration':
+        values['registration_status'] = 'Pending'  # new registrations always start pending
+    elif not values['registration_status']:
+        values['registration_status'] = 'Pending'
+
+    sp_first, sp_last = values.pop('sp_first_name'), values.pop('sp_last_name')
+    values['sp_name'] = f"{sp_first or ''} {sp_last or ''}".strip() or None
+    if values['civilstatus'] != 'Married':
+        values.update(sp_name=None, sp_datebirth=None, sp_profession=None)
+    elif (values['sp_datebirth'] or values['sp_profession']) and not values['sp_name']:
+        errors.setdefault(keys['sp_first_name'], "is required (the spouse's name)")
+
+    if values['occ_type'] != 'Employed':
+        values.update(dict.fromkeys(_EMPLOYER))
+    elif any(values[column] for column in _EMPLOYER) and not values['empname']:
+        errors.setdefault(keys['empname'], "is required (the employer's name)")
+
+    if bool(values['bank_code']) != bool(values['acc_type']):
+        missing = 'acc_type' if values['bank_code'] else 'bank_code'
+        errors.setdefault(keys[missing], 'is required with the other bank field')
+
+    if any(values[column] for column in _OFFICIAL) and not values['gov_int_name']:
+        errors.setdefault(keys['gov_int_name'], "is required (the official's name)")
+
+    if errors:
+        raise ValidationError(errors)
+    values['source_wealth'] = ', '.join(values['source_wealth_items'])
+    return CustomerPayload(**values)
+
+
+def validate_registration(data):
+    """The CustomerPayload of a submit_registration JSON body; raises ValidationError."""
+    if not isinstance(data, dict):
+        raise ValidationError({'registration': 'must be a JSON object'})
+    sections = {}
+    errors = {}
+    for section in REGISTRATION_SECTIONS:
+        part = data.get(section) or {}
+        if not isinstance(part, dict):
+            errors[section] = 'must be a JSON object'
+            part = {}
+        sections[section] = part
+    values, field_errors = _run(_REGISTRATION_STEPS, lambda section, key, is_list: sections[section].get(key))
+    errors.update(field_errors)
+    return _combine(values, errors, 'registration')
+
+
+def validate_customer_form(fields):
+    """
+    The CustomerPayload of an admin add/edit submission: request.form (a MultiDict, lists via
+    getlist) or a JSON object with the same names. Raises ValidationError.
+    """
+    if not isinstance(fields, dict):
+        raise ValidationError({'form': 'must be a JSON object'})
+    getlist = getattr(fields, 'getlist', None)
+
+    def lookup(section, key, is_list):
+        if is_list and getlist is not None:
+            return getlist(key)
+        return fields.get(key)
+
+    values, errors = _run(_FORM_STEPS, lookup)
+    return _combine(values, errors, 'form')